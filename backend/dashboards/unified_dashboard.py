@@ -7,6 +7,18 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import random
 import os
+import sys
+import time
+
+# Add the scripts directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+# Embedded store that the ingest gateway writes, for live sensor figures
+try:
+    from rpi_config import STORE_DIR
+    from ts_store import STORE_FILE, TimeSeriesStore
+except ImportError:
+    TimeSeriesStore = None
 
 # Import Google Maps API key
 try:
@@ -124,6 +136,39 @@ def generate_sensor_data(forest_locations):
         sensors.append(sensor)
     return sensors
 
+# Today's sensor figures from the store's daily rollups
+@st.cache_data(ttl=60)
+def load_today_rollups():
+    """
+    Today's detections and battery per device and for the fleet, read from
+    the store's daily rollups instead of summed from raw points. Returns
+    (None, {}) when there is no store.
+    """
+    if TimeSeriesStore is None or not os.path.exists(os.path.join(STORE_DIR, STORE_FILE)):
+        return None, {}
+    store = TimeSeriesStore(STORE_DIR, read_only=True)
+    today = int(time.time()) // 86400 * 86400
+    fleet = store.rollup(today, None, 86400, "fleet")
+    devices = store.rollup(today, None, 86400, "device")
+    per_device = {
+        row.device_id: {
+            "detections_today": int(row.detections),
+            "battery": None if pd.isna(row.mean_battery) else round(float(row.mean_battery), 1),
+        }
+        for row in devices.itertuples()
+    }
+    return (int(fleet["detections"].sum()) if len(fleet) else 0), per_device
+
+def apply_today_rollups(sensors, per_device):
+    """Replace the generated figures of sensors that report to the store"""
+    for sensor in sensors:
+        live = per_device.get(sensor["id"])
+        if live is not None:
+            sensor["detections_today"] = live["detections_today"]
+            if live["battery"] is not None:
+                sensor["battery"] = live["battery"]
+    return sensors
+
 # Mock deforestation data
 def generate_deforestation_data():
     """Generate mock deforestation data"""
@@ -171,8 +216,9 @@ for _, row in risk_data.iterrows():
     if row['forest'] in FOREST_LOCATIONS:
         FOREST_LOCATIONS[row['forest']]['risk_score'] = row['risk_score']
 
-# Generate mock data
-sensor_data = generate_sensor_data(FOREST_LOCATIONS)
+# Generate mock data, with today's figures from the store where sensors report to it
+fleet_detections_today, device_rollups = load_today_rollups()
+sensor_data = apply_today_rollups(generate_sensor_data(FOREST_LOCATIONS), device_rollups)
 carbon_data = generate_carbon_data(FOREST_LOCATIONS)
 deforestation_data = generate_deforestation_data()
 
@@ -223,7 +269,9 @@ if current_page == "Overview":
         )
     
     with col3:
-        total_detections = sum([s["detections_today"] for s in sensor_data])
+        total_detections = fleet_detections_today
+        if total_detections is None:
+            total_detections = sum([s["detections_today"] for s in sensor_data])
         st.metric(
             label="Total Detections", 
             value=total_detections,
@@ -691,7 +739,9 @@ elif current_page == "Sensor Network":
         )
     
     with col4:
-        total_detections = sum([s["detections_today"] for s in sensor_data])
+        total_detections = fleet_detections_today
+        if total_detections is None:
+            total_detections = sum([s["detections_today"] for s in sensor_data])
         st.metric(
             label="Today's Detections", 
             value=total_detections,
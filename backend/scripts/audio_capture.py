@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Audio Capture
+
+Continuous audio capture for the Digital Hummingbird sensor node.
+
+A dedicated capture thread reads AUDIO_BUFFER_SIZE frames at a time from a
+microphone (or a WAV file when testing without hardware) and writes them into
+a preallocated NumPy ring buffer. The detector reads overlapping windows out of
+the ring buffer as views, so every sample is analysed without copying and the
+memory footprint stays fixed no matter how long the node runs.
+"""
+
+import time
+import wave
+import threading
+import logging
+
+import numpy as np
+
+from rpi_config import (
+    SAMPLE_RATE,
+    AUDIO_BUFFER_SIZE,
+    AUDIO_INPUT_DEVICE,
+    AUDIO_SOURCE,
+    AUDIO_RING_SECONDS,
+    AUDIO_WINDOW_SECONDS,
+    AUDIO_WINDOW_HOP_SECONDS,
+)
+
+logger = logging.getLogger("AcousticGuardian")
+
+
+class AudioRingBuffer:
+    """
+    Fixed-size ring buffer of float32 audio samples
+
+    The storage is mirrored: every block is written twice, once at its ring
+    position and once `capacity` samples later. Any window of up to `capacity`
+    samples is therefore contiguous in memory and can be returned as a view,
+    even when it wraps around the end of the ring.
+    """
+
+    def __init__(self, capacity, dtype=np.float32):
+        """
+        Args:
+            capacity (int): Number of samples of history to keep
+            dtype: NumPy dtype of the stored samples
+        """
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        self.capacity = int(capacity)
+        self._buffer = np.zeros(2 * self.capacity, dtype=dtype)
+        self._total_written = 0
+        self._lock = threading.Lock()
+        self._data_available = threading.Condition(self._lock)
+
+    @property
+    def total_written(self):
+        """Total number of samples written since the buffer was created"""
+        return self._total_written
+
+    @property
+    def oldest_available(self):
+        """Absolute index of the oldest sample still held in the buffer"""
+        return max(0, self._total_written - self.capacity)
+
+    def write(self, samples):
+        """
+        Append samples to the ring, overwriting the oldest history
+
+        Args:
+            samples (np.ndarray): 1-D block of samples
+        """
+        samples = np.asarray(samples, dtype=self._buffer.dtype).reshape(-1)
+        received = len(samples)
+        if received > self.capacity:
+            samples = samples[-self.capacity:]
+        count = len(samples)
+        if count == 0:
+            return
+
+        with self._lock:
+            # Samples older than the ring still advance the stream position
+            self._total_written += received - count
+            start = self._total_written % self.capacity
+            first = min(count, self.capacity - start)
+            rest = count - first
+
+            self._buffer[start:start + first] = samples[:first]
+            self._buffer[start + self.capacity:start + self.capacity + first] = samples[:first]
+            if rest:
+                self._buffer[:rest] = samples[first:]
+                self._buffer[self.capacity:self.capacity + rest] = samples[first:]
+
+            self._total_written += count
+            self._data_available.notify_all()
+
+    def view(self, start, length):
+        """
+        Return a read-only view of `length` samples starting at absolute index `start`
+
+        The view aliases the ring storage, so it stays valid only until the
+        writer laps it; callers should finish with it well within
+        `capacity` samples of new audio.
+
+        Args:
+            start (int): Absolute sample index of the first sample
+            length (int): Number of samples
+
+        Returns:
+            np.ndarray: View of the requested samples
+        """
+        if length > self.capacity:
+            raise ValueError(f"Window of {length} samples exceeds ring capacity {self.capacity}")
+        if start < self.oldest_available or start + length > self._total_written:
+            raise IndexError(f"Samples {start}-{start + length} are not available in the ring buffer")
+
+        offset = start % self.capacity
+        window = self._buffer[offset:offset + length]
+        window.flags.writeable = False
+        return window
+
+    def latest(self, length):
+        """
+        Return a view of the most recent `length` samples
+
+        Args:
+            length (int): Number of samples
+
+        Returns:
+            np.ndarray: View of the newest samples
+        """
+        length = min(length, self._total_written)
+        return self.view(self._total_written - length, length)
+
+    def wait_for(self, total, timeout=None):
+        """
+        Block until at least `total` samples have been written
+
+        Args:
+            total (int): Absolute sample count to wait for
+            timeout (float): Maximum time to wait in seconds
+
+        Returns:
+            bool: True if the samples are available
+        """
+        with self._data_available:
+            return self._data_available.wait_for(lambda: self._total_written >= total, timeout)
+
+
+class WindowReader:
+    """
+    Reads overlapping analysis windows from an AudioRingBuffer
+
+    The reader keeps its own cursor, so several consumers can read the same
+    ring buffer independently. If a reader falls more than a full ring behind
+    the writer, it skips ahead to the oldest available audio and counts an
+    overrun.
+    """
+
+    def __init__(self, ring_buffer, window_size, hop_size):
+        """
+        Args:
+            ring_buffer (AudioRingBuffer): Buffer to read from
+            window_size (int): Samples per window
+            hop_size (int): Samples between the starts of consecutive windows
+        """
+        if window_size > ring_buffer.capacity:
+            raise ValueError("Window size must not exceed the ring buffer capacity")
+        if hop_size <= 0:
+            raise ValueError("Hop size must be positive")
+        self.ring_buffer = ring_buffer
+        self.window_size = int(window_size)
+        self.hop_size = int(hop_size)
+        self.cursor = ring_buffer.oldest_available
+        self.overruns = 0
+
+    def pending(self):
+        """Number of complete windows ready to be read"""
+        available = self.ring_buffer.total_written - max(self.cursor, self.ring_buffer.oldest_available)
+        if available < self.window_size:
+            return 0
+        return 1 + (available - self.window_size) // self.hop_size
+
+    def windows(self, max_windows=None):
+        """
+        Yield every complete window written since the last call
+
+        Args:
+            max_windows (int): Optional limit on the number of windows yielded
+
+        Yields:
+            tuple: (start_index, window view)
+        """
+        yielded = 0
+        while max_windows is None or yielded < max_windows:
+            oldest = self.ring_buffer.oldest_available
+            if self.cursor < oldest:
+                skipped = oldest - self.cursor
+                self.overruns += 1
+                logger.warning(f"Audio reader overrun, skipped {skipped} samples")
+                # Realign to the hop grid so window boundaries stay consistent
+                self.cursor += -(-skipped // self.hop_size) * self.hop_size
+
+            if self.cursor + self.window_size > self.ring_buffer.total_written:
+                return
+
+            yield self.cursor, self.ring_buffer.view(self.cursor, self.window_size)
+            self.cursor += self.hop_size
+            yielded += 1
+
+
+class MicrophoneSource:
+    """
+    Blocking audio source backed by a sounddevice input stream
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, block_size=AUDIO_BUFFER_SIZE, device=AUDIO_INPUT_DEVICE):
+        """
+        Args:
+            sample_rate (int): Capture sample rate in Hz
+            block_size (int): Frames returned per read
+            device (int): Audio input device index
+        """
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.device = device
+        self._stream = None
+        self.overflows = 0
+
+    def open(self):
+        """Open the input stream"""
+        import sounddevice as sd
+
+        self._stream = sd.InputStream(
+            samplerate=self.sample_rate,
+            blocksize=self.block_size,
+            device=self.device,
+            channels=1,
+            dtype="float32",
+        )
+        self._stream.start()
+        logger.info(f"Microphone opened on device {self.device} at {self.sample_rate} Hz")
+
+    def read(self):
+        """
+        Read one block of audio
+
+        Returns:
+            np.ndarray: Block of float32 samples, or None when the source is exhausted
+        """
+        frames, overflowed = self._stream.read(self.block_size)
+        if overflowed:
+            self.overflows += 1
+            logger.warning("Microphone input overflow, samples were dropped by the driver")
+        return frames[:, 0]
+
+    def close(self):
+        """Close the input stream"""
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class WavFileSource:
+    """
+    Audio source that plays back a mono 16-bit WAV file
+
+    Used to exercise the capture path without a microphone. With `realtime`
+    enabled, reads are paced to the file's sample rate like a live device.
+    """
+
+    def __init__(self, path, block_size=AUDIO_BUFFER_SIZE, realtime=True, loop=False):
+        """
+        Args:
+            path (str): Path to the WAV file
+            block_size (int): Frames returned per read
+            realtime (bool): Pace reads to the sample rate
+            loop (bool): Restart from the beginning when the file ends
+        """
+        self.path = path
+        self.block_size = block_size
+        self.realtime = realtime
+        self.loop = loop
+        self.sample_rate = None
+        self._wav = None
+        self._next_read_time = None
+
+    def open(self):
+        """Open the WAV file"""
+        self._wav = wave.open(self.path, "rb")
+        if self._wav.getsampwidth() != 2:
+            raise ValueError(f"{self.path}: only 16-bit PCM WAV files are supported")
+        self.sample_rate = self._wav.getframerate()
+        self.channels = self._wav.getnchannels()
+        if self.sample_rate != SAMPLE_RATE:
+            logger.warning(f"{self.path} is sampled at {self.sample_rate} Hz, expected {SAMPLE_RATE} Hz")
+        self._next_read_time = time.monotonic()
+        logger.info(f"WAV source opened: {self.path}")
+
+    def read(self):
+        """
+        Read one block of audio
+
+        Returns:
+            np.ndarray: Block of float32 samples, or None when the file is exhausted
+        """
+        raw = self._wav.readframes(self.block_size)
+        if not raw and self.loop:
+            self._wav.rewind()
+            raw = self._wav.readframes(self.block_size)
+        if not raw:
+            return None
+
+        samples = np.frombuffer(raw, dtype="<i2")
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels)[:, 0]
+        block = samples.astype(np.float32) / 32768.0
+
+        if self.realtime:
+            self._next_read_time += len(block) / self.sample_rate
+            delay = self._next_read_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return block
+
+    def close(self):
+        """Close the WAV file"""
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+
+
+class ArraySource:
+    """
+    Audio source that plays back samples already in memory, e.g. from a .npy file
+
+    Reads are not paced, so a recording is consumed as fast as it is read.
+    """
+
+    def __init__(self, samples, sample_rate=SAMPLE_RATE, block_size=AUDIO_BUFFER_SIZE):
+        """
+        Args:
+            samples (np.ndarray): Mono float samples in -1.0..1.0, or int16 PCM
+            sample_rate (int): Sample rate of the recording in Hz
+            block_size (int): Frames returned per read
+        """
+        samples = np.asarray(samples)
+        if samples.ndim > 1:
+            samples = samples[:, 0]
+        if samples.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768.0
+        self.samples = samples.astype(np.float32, copy=False)
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self._position = 0
+
+    def open(self):
+        """Rewind to the start of the recording"""
+        self._position = 0
+
+    def read(self):
+        """
+        Read one block of audio
+
+        Returns:
+            np.ndarray: Block of float32 samples, or None when the recording is exhausted
+        """
+        if self._position >= len(self.samples):
+            return None
+        block = self.samples[self._position:self._position + self.block_size]
+        self._position += len(block)
+        return block
+
+    def close(self):
+        """Nothing to release"""
+
+
+class AudioCapture:
+    """
+    Background thread that moves audio from a source into a ring buffer
+    """
+
+    def __init__(self, source, ring_buffer, clock=time.time):
+        """
+        Args:
+            source: Object with open(), read() and close() methods
+            ring_buffer (AudioRingBuffer): Destination buffer
+            clock (callable): Returns the current Unix time, used to timestamp samples
+        """
+        self.source = source
+        self.ring_buffer = ring_buffer
+        self.clock = clock
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.finished = threading.Event()
+        self.start_time = None
+
+    def start(self, background=True):
+        """
+        Open the source and start the capture thread
+
+        Args:
+            background (bool): Start the capture thread; with False the caller
+                pumps capture_block() itself, as the replay harness does
+        """
+        self.source.open()
+        self.start_time = self.clock()
+        if background:
+            self._thread = threading.Thread(target=self._capture_loop, name="audio-capture", daemon=True)
+            self._thread.start()
+        logger.info("Audio capture started")
+
+    def capture_block(self):
+        """
+        Move one block from the source into the ring buffer
+
+        Returns:
+            int: Samples written, 0 once the source is exhausted
+        """
+        block = self.source.read()
+        if block is None:
+            return 0
+        self.ring_buffer.write(block)
+        return len(block)
+
+    def _capture_loop(self):
+        try:
+            while not self._stop_event.is_set():
+                if not self.capture_block():
+                    logger.info("Audio source exhausted")
+                    break
+        except Exception as e:
+            logger.error(f"Audio capture failed: {e}")
+        finally:
+            self.source.close()
+            self.finished.set()
+
+    def stop(self, timeout=2.0):
+        """Stop the capture thread and close the source"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            self.source.close()
+        logger.info("Audio capture stopped")
+
+    def timestamp_of(self, index):
+        """
+        Wall-clock time of an absolute sample index
+
+        Args:
+            index (int): Absolute sample index in the ring buffer
+
+        Returns:
+            float: Unix timestamp at which the sample was captured
+        """
+        return self.start_time + index / self.source.sample_rate
+
+    @property
+    def running(self):
+        """True while the capture thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+
+def create_audio_capture(source=None, sample_rate=SAMPLE_RATE, clock=time.time):
+    """
+    Build a ring buffer, capture thread and window reader from configuration
+
+    Args:
+        source: "microphone", a path to a WAV file, or a source object
+        sample_rate (int): Capture sample rate in Hz
+        clock (callable): Returns the current Unix time
+
+    Returns:
+        tuple: (AudioCapture, WindowReader)
+    """
+    source = source or AUDIO_SOURCE
+    if not isinstance(source, str):
+        audio_source = source
+    elif source == "microphone":
+        audio_source = MicrophoneSource(sample_rate=sample_rate)
+    else:
+        audio_source = WavFileSource(source)
+
+    ring_buffer = AudioRingBuffer(int(AUDIO_RING_SECONDS * sample_rate))
+    reader = WindowReader(
+        ring_buffer,
+        window_size=int(AUDIO_WINDOW_SECONDS * sample_rate),
+        hop_size=int(AUDIO_WINDOW_HOP_SECONDS * sample_rate),
+    )
+    return AudioCapture(audio_source, ring_buffer, clock), reader
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Audio Features
+
+Streaming log-mel feature extraction for chainsaw detection.
+
+Audio windows from the capture ring buffer are split into short frames using
+strided views, windowed, and transformed with one batched real FFT per call.
+The power spectrum is projected onto a mel filterbank with a single matrix
+multiply. Intermediate and output arrays are allocated once per window shape
+and reused on every call, so steady-state extraction does not allocate.
+"""
+
+import logging
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from rpi_config import SAMPLE_RATE, FEATURE_FRAME_MS, FEATURE_HOP_MS, FEATURE_MEL_BANDS
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Floor applied before taking the log so silent frames do not produce -inf
+LOG_FLOOR = 1e-10
+
+
+def hz_to_mel(hz):
+    """Convert frequency in Hz to the HTK mel scale"""
+    return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+
+def mel_to_hz(mel):
+    """Convert HTK mel values back to Hz"""
+    return 700.0 * (10.0 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels, fmin=0.0, fmax=None):
+    """
+    Build a triangular mel filterbank
+
+    Args:
+        sample_rate (int): Audio sample rate in Hz
+        n_fft (int): FFT size
+        n_mels (int): Number of mel bands
+        fmin (float): Lowest band edge in Hz
+        fmax (float): Highest band edge in Hz, defaults to Nyquist
+
+    Returns:
+        np.ndarray: Filterbank of shape (n_fft // 2 + 1, n_mels), float32
+    """
+    fmax = fmax or sample_rate / 2.0
+    fft_freqs = np.linspace(0.0, sample_rate / 2.0, n_fft // 2 + 1)
+    mel_edges = np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2)
+    hz_edges = mel_to_hz(mel_edges)
+
+    lower = hz_edges[:-2, np.newaxis]
+    center = hz_edges[1:-1, np.newaxis]
+    upper = hz_edges[2:, np.newaxis]
+
+    rising = (fft_freqs - lower) / (center - lower)
+    falling = (upper - fft_freqs) / (upper - center)
+    weights = np.maximum(0.0, np.minimum(rising, falling))
+    return np.ascontiguousarray(weights.T, dtype=np.float32)
+
+
+class LogMelExtractor:
+    """
+    Vectorized log-mel spectrogram extractor for fixed-size audio windows
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=FEATURE_FRAME_MS, hop_ms=FEATURE_HOP_MS,
+                 n_mels=FEATURE_MEL_BANDS, fmin=50.0, fmax=None):
+        """
+        Args:
+            sample_rate (int): Audio sample rate in Hz
+            frame_ms (float): Frame length in milliseconds
+            hop_ms (float): Frame step in milliseconds
+            n_mels (int): Number of mel bands
+            fmin (float): Lowest mel band edge in Hz
+            fmax (float): Highest mel band edge in Hz, defaults to Nyquist
+        """
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.hop_length = int(sample_rate * hop_ms / 1000)
+        self.n_fft = 1 << (self.frame_length - 1).bit_length()
+        self.n_mels = n_mels
+
+        self.window = np.hanning(self.frame_length).astype(np.float32)
+        self.filterbank = mel_filterbank(sample_rate, self.n_fft, n_mels, fmin, fmax)
+
+        # Work buffers keyed by input shape, allocated on first use
+        self._buffers = {}
+
+    def n_frames(self, num_samples):
+        """Number of frames produced for a window of `num_samples` samples"""
+        if num_samples < self.frame_length:
+            return 0
+        return 1 + (num_samples - self.frame_length) // self.hop_length
+
+    def _get_buffers(self, batch_shape, num_samples):
+        key = (batch_shape, num_samples)
+        buffers = self._buffers.get(key)
+        if buffers is None:
+            frames_shape = batch_shape + (self.n_frames(num_samples),)
+            buffers = (
+                np.empty(frames_shape + (self.frame_length,), dtype=np.float32),
+                np.empty(frames_shape + (self.n_fft // 2 + 1,), dtype=np.float32),
+                np.empty(frames_shape + (self.n_mels,), dtype=np.float32),
+            )
+            self._buffers[key] = buffers
+        return buffers
+
+    def _extract(self, frames, batch_shape, num_samples):
+        framed, power, mel = self._get_buffers(batch_shape, num_samples)
+
+        np.multiply(frames, self.window, out=framed)
+        spectrum = np.fft.rfft(framed, n=self.n_fft, axis=-1)
+        np.abs(spectrum, out=power)
+        np.square(power, out=power)
+        np.matmul(power, self.filterbank, out=mel)
+        np.maximum(mel, LOG_FLOOR, out=mel)
+        np.log(mel, out=mel)
+        return mel
+
+    def transform(self, audio_window):
+        """
+        Compute log-mel frames for one audio window
+
+        The returned array is reused by the next call with the same window
+        size; copy it if it has to outlive that call.
+
+        Args:
+            audio_window (np.ndarray): 1-D float32 audio samples
+
+        Returns:
+            np.ndarray: Log-mel features of shape (n_frames, n_mels)
+        """
+        num_samples = audio_window.shape[-1]
+        if num_samples < self.frame_length:
+            raise ValueError(f"Audio window of {num_samples} samples is shorter than one frame")
+        frames = sliding_window_view(audio_window, self.frame_length)[::self.hop_length]
+        return self._extract(frames, (), num_samples)
+
+    def transform_batch(self, audio_windows):
+        """
+        Compute log-mel frames for a batch of equally sized audio windows
+
+        Every frame of every window goes through a single FFT call. The
+        returned array is reused by the next call with the same batch shape.
+
+        Args:
+            audio_windows (np.ndarray): Array of shape (n_windows, window_size)
+
+        Returns:
+            np.ndarray: Log-mel features of shape (n_windows, n_frames, n_mels)
+        """
+        audio_windows = np.asarray(audio_windows, dtype=np.float32)
+        num_windows, num_samples = audio_windows.shape
+        if num_samples < self.frame_length:
+            raise ValueError(f"Audio windows of {num_samples} samples are shorter than one frame")
+        frames = sliding_window_view(audio_windows, self.frame_length, axis=-1)[:, ::self.hop_length]
+        return self._extract(frames, (num_windows,), num_samples)
+
+    def band_energy(self, log_mel):
+        """
+        Collapse log-mel frames into a mean energy per band
+
+        Args:
+            log_mel (np.ndarray): Log-mel features of shape (..., n_frames, n_mels)
+
+        Returns:
+            np.ndarray: Mean log energy per band of shape (..., n_mels)
+        """
+        return log_mel.mean(axis=-2)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the log-mel feature extractor
+
+Runs synthetic audio through LogMelExtractor window by window, as the sensor
+node does, and in batches, then reports frames per second, per-window latency
+and how many times faster than real time the extractor runs.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from rpi_config import SAMPLE_RATE, AUDIO_WINDOW_SECONDS, AUDIO_WINDOW_HOP_SECONDS
+from audio_features import LogMelExtractor
+
+
+def make_test_audio(seconds, sample_rate=SAMPLE_RATE):
+    """
+    Generate noise with an intermittent chainsaw-like harmonic tone
+    """
+    rng = np.random.default_rng(42)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = 0.3 * np.sign(np.sin(2 * np.pi * 110 * t)) * (np.sin(2 * np.pi * 0.2 * t) > 0)
+    return (tone + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def benchmark_per_window(extractor, windows):
+    """
+    Time one transform() call per window
+    """
+    latencies = np.empty(len(windows))
+    for i, window in enumerate(windows):
+        start = time.perf_counter()
+        extractor.transform(window)
+        latencies[i] = time.perf_counter() - start
+    return latencies
+
+
+def benchmark_batched(extractor, windows, batch_size):
+    """
+    Time transform_batch() over consecutive batches of windows
+    """
+    latencies = []
+    for i in range(0, len(windows) - batch_size + 1, batch_size):
+        start = time.perf_counter()
+        extractor.transform_batch(windows[i:i + batch_size])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def report(label, latencies, windows_per_call, frames_per_window, hop_seconds):
+    """
+    Print throughput and latency for one benchmark run
+    """
+    total_time = latencies.sum()
+    windows = len(latencies) * windows_per_call
+    per_window_ms = latencies / windows_per_call * 1000
+    print(f"{label}")
+    print(f"  Frames/sec:          {windows * frames_per_window / total_time:,.0f}")
+    print(f"  Window latency mean: {per_window_ms.mean():.3f} ms")
+    print(f"  Window latency p95:  {np.percentile(per_window_ms, 95):.3f} ms")
+    print(f"  Real-time factor:    {windows * hop_seconds / total_time:,.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the log-mel feature extractor")
+    parser.add_argument("--seconds", type=float, default=120.0, help="Seconds of synthetic audio")
+    parser.add_argument("--batch-size", type=int, default=8, help="Windows per batched call")
+    args = parser.parse_args()
+
+    extractor = LogMelExtractor()
+    audio = make_test_audio(args.seconds)
+    window_size = int(AUDIO_WINDOW_SECONDS * SAMPLE_RATE)
+    hop_size = int(AUDIO_WINDOW_HOP_SECONDS * SAMPLE_RATE)
+    windows = np.lib.stride_tricks.sliding_window_view(audio, window_size)[::hop_size]
+    frames_per_window = extractor.n_frames(window_size)
+
+    print("Log-mel feature extractor benchmark")
+    print("=" * 40)
+    print(f"Audio: {args.seconds:.0f} s at {SAMPLE_RATE} Hz, {len(windows)} windows of {AUDIO_WINDOW_SECONDS} s")
+    print(f"Frames per window: {frames_per_window}, mel bands: {extractor.n_mels}, FFT size: {extractor.n_fft}")
+    print("=" * 40)
+
+    # Warm up so buffer allocation is not timed
+    extractor.transform(windows[0])
+    extractor.transform_batch(windows[:args.batch_size])
+
+    report("Per-window", benchmark_per_window(extractor, windows), 1, frames_per_window,
+           AUDIO_WINDOW_HOP_SECONDS)
+    report(f"Batched ({args.batch_size} windows/call)",
+           benchmark_batched(extractor, windows, args.batch_size), args.batch_size, frames_per_window,
+           AUDIO_WINDOW_HOP_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
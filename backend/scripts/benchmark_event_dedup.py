@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the gateway's detection dedup
+
+Generates millions of chainsaw detections for a grid fleet: chainsaws
+start at random points and times over a day, and every node within
+hearing range reports each one, a few seconds late and out of order as
+LoRa and GSM uplinks deliver them. The detections go through
+DetectionDedup in receive order on a simulated clock.
+
+Reports the check rate, how many rows are stored against the number of
+chainsaws, the chainsaws stored more than once or not at all (merged
+into a neighbour's row), and the keys held as the run goes on, which
+should level off rather than grow with the number of detections.
+
+Usage:
+    python benchmark_event_dedup.py
+    python benchmark_event_dedup.py --chainsaws 2000000 --max-keys 5000
+"""
+
+import time
+import argparse
+import resource
+
+import numpy as np
+
+from event_dedup import DetectionDedup
+from event_fusion import METRES_PER_DEGREE, SPEED_OF_SOUND
+from rpi_config import GATEWAY_DEDUP_CELL, GATEWAY_DEDUP_BUCKET, GATEWAY_DEDUP_HORIZON, GATEWAY_DEDUP_MAX_KEYS
+
+NOW = 1760000000
+ORIGIN = (-1.0, 36.5)
+
+
+def make_detections(grid, spacing, chainsaws, hearing, duration, delay, seed=4):
+    """
+    Detections of random chainsaws by a grid of nodes
+
+    Returns:
+        tuple: (latitude, longitude, timestamp, receive time and chainsaw
+        index of each detection, in receive order)
+    """
+    rng = np.random.default_rng(seed)
+    side = grid * spacing
+    x = rng.uniform(0, side, chainsaws)
+    y = rng.uniform(0, side, chainsaws)
+    start = NOW + np.sort(rng.uniform(0, duration, chainsaws))
+    reach = int(np.ceil(hearing / spacing))
+    offsets = np.arange(-reach, reach + 2)
+    rows = (y // spacing).astype(np.int64)[:, None, None] + offsets[None, :, None]
+    columns = (x // spacing).astype(np.int64)[:, None, None] + offsets[None, None, :]
+    rows, columns = np.broadcast_arrays(rows, columns)
+    distance = np.hypot(columns * spacing - x[:, None, None], rows * spacing - y[:, None, None])
+    heard = (distance <= hearing) & (rows >= 0) & (rows < grid) & (columns >= 0) & (columns < grid)
+    source = np.broadcast_to(np.arange(chainsaws)[:, None, None], heard.shape)[heard]
+    rows, columns, distance = rows[heard], columns[heard], distance[heard]
+
+    timestamp = start[source] + distance / SPEED_OF_SOUND
+    received = timestamp + rng.exponential(delay, len(source))
+    order = np.argsort(received, kind="stable")
+    lat = ORIGIN[0] + rows * spacing / METRES_PER_DEGREE
+    lng = ORIGIN[1] + columns * spacing / (METRES_PER_DEGREE * np.cos(np.radians(ORIGIN[0])))
+    return lat[order], lng[order], timestamp[order].astype(np.int64), received[order], source[order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection dedup benchmark")
+    parser.add_argument("--grid", type=int, default=300, help="Nodes per side of the grid")
+    parser.add_argument("--spacing", type=float, default=500.0, help="Metres between nodes")
+    parser.add_argument("--chainsaws", type=int, default=500000)
+    parser.add_argument("--hearing", type=float, default=700.0, help="Metres a chainsaw is heard at")
+    parser.add_argument("--duration", type=float, default=86400.0, help="Seconds the chainsaws start over")
+    parser.add_argument("--delay", type=float, default=3.0, help="Mean seconds from detection to receipt")
+    parser.add_argument("--cell", type=float, default=GATEWAY_DEDUP_CELL)
+    parser.add_argument("--bucket", type=int, default=GATEWAY_DEDUP_BUCKET)
+    parser.add_argument("--horizon", type=int, default=GATEWAY_DEDUP_HORIZON)
+    parser.add_argument("--max-keys", type=int, default=GATEWAY_DEDUP_MAX_KEYS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    lat, lng, timestamp, received, source = make_detections(args.grid, args.spacing, args.chainsaws,
+                                                             args.hearing, args.duration, args.delay)
+    count = len(source)
+    print(f"{args.grid ** 2} nodes {args.spacing:.0f} m apart, {args.chainsaws} chainsaws over "
+          f"{args.duration:.0f} s, {count} detections ({count / args.chainsaws:.1f} per chainsaw), "
+          f"generated in {time.perf_counter() - start:.1f} s")
+
+    clock = [float(NOW)]
+    dedup = DetectionDedup(args.cell, args.bucket, args.horizon, args.max_keys, clock=lambda: clock[0])
+    stored = np.zeros(count, dtype=bool)
+    keys = []
+    quarter = max(count // 4, 1)
+    inputs = list(zip(lat.tolist(), lng.tolist(), timestamp.tolist(), received.tolist()))
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    check = dedup.check
+    start = time.perf_counter()
+    for index, (point_lat, point_lng, point_time, now) in enumerate(inputs):
+        clock[0] = now
+        stored[index] = not check(point_lat, point_lng, point_time)
+        if index % quarter == quarter - 1:
+            keys.append(dedup.keys)
+    seconds = time.perf_counter() - start
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory
+    del inputs
+
+    rows = np.bincount(source[stored], minlength=args.chainsaws)
+    stats = dedup.stats()
+    print(f"  checked {count} detections in {seconds:.2f} s ({count / seconds:,.0f}/s, "
+          f"{seconds / count * 1e6:.2f} us each)")
+    print(f"  stored {stored.sum()} rows for {args.chainsaws} chainsaws ({count / stored.sum():.1f}x fewer than "
+          f"without dedup); {np.count_nonzero(rows > 1)} chainsaws stored more than once, "
+          f"{np.count_nonzero(rows == 0)} merged into a neighbour's row")
+    print(f"  keys held after each quarter: {', '.join(str(held) for held in keys)} "
+          f"(cap {args.max_keys}, {stats['evicted']} evicted); peak RSS grew {growth / 1024:.1f} MB while checking")
+
+    # The whole per-point cost on the gateway, parsing the position from the fields
+    sample = min(count, 200000)
+    points = [({"device_id": "AG-001"}, {"gps_coordinates": f"{point_lat:.6f},{point_lng:.6f}"}, point_time, now)
+              for point_lat, point_lng, point_time, now in zip(lat[:sample].tolist(), lng[:sample].tolist(),
+                                                               timestamp[:sample].tolist(),
+                                                               received[:sample].tolist())]
+    dedup = DetectionDedup(args.cell, args.bucket, args.horizon, args.max_keys, clock=lambda: clock[0])
+    start = time.perf_counter()
+    for tags, fields, point_time, now in points:
+        clock[0] = now
+        dedup.duplicate(tags, fields, point_time)
+    seconds = time.perf_counter() - start
+    print(f"  with the position parsed from gps_coordinates: {sample / seconds:,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Flux query engine
+
+Loads a simulated fleet into the embedded store, then times Flux queries
+like the dashboards' through flux_query: latest detections and status, a
+device's hourly battery, fleet windows, and counts per forest. As a
+reference, each also runs as pandas filters and groupbys over one
+in-memory DataFrame holding every point.
+
+Usage:
+    python benchmark_flux_query.py
+    python benchmark_flux_query.py --devices 500 --days 30
+"""
+
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+import flux_query
+from benchmark_ts_store import NOW, make_heartbeats, make_detections, columns_frame, timed
+from ts_store import TimeSeriesStore
+
+BUCKET = 'from(bucket: "acoustic-guardian")'
+
+
+def queries(device):
+    """(label, Flux query, pandas reference over the frames) of each query timed"""
+    def window(frame, start, stop):
+        return frame[(frame["time"] >= start) & (frame["time"] < stop)]
+
+    def latest(frame):
+        return frame.sort_values("time").groupby("device_id").tail(1)
+
+    def hourly(frame, keys, every):
+        return frame.groupby([*keys, frame["time"] // every]).mean(numeric_only=True)
+
+    return [
+        ("last detection, 1h",
+         f'{BUCKET} |> range(start: -1h) '
+         '|> filter(fn: (r) => r._measurement == "acoustic_guardian" and r.threat_detected == true) |> last()',
+         lambda frames: latest(window(frames["acoustic_guardian"], NOW - 3600, NOW)
+                               .query("threat_detected"))),
+        ("sensor status, 10m",
+         f'{BUCKET} |> range(start: -10m) |> filter(fn: (r) => r._measurement == "device_status") |> last()',
+         lambda frames: latest(window(frames["device_status"], NOW - 600, NOW))),
+        ("one device hourly, 7d",
+         f'{BUCKET} |> range(start: -7d) |> filter(fn: (r) => r._measurement == "device_status" '
+         f'and r.device_id == "{device}" and r._field == "battery_level") '
+         '|> aggregateWindow(every: 1h, fn: mean, createEmpty: false)',
+         lambda frames: hourly(window(frames["device_status"], NOW - 7 * 86400, NOW)
+                               .query(f"device_id == '{device}'")[["time", "battery_level"]], [], 3600)),
+        ("fleet hourly, 1d",
+         f'{BUCKET} |> range(start: -1d) |> filter(fn: (r) => r._measurement == "device_status") '
+         '|> aggregateWindow(every: 1h, fn: mean, createEmpty: false)',
+         lambda frames: hourly(window(frames["device_status"], NOW - 86400, NOW), ["device_id"], 3600)),
+        ("low battery, 30d",
+         f'{BUCKET} |> range(start: -30d) |> filter(fn: (r) => r._measurement == "device_status" '
+         'and r._field == "battery_level" and r._value < 20)',
+         lambda frames: window(frames["device_status"], NOW - 30 * 86400, NOW)
+         .query("battery_level < 20")[["time", "device_id", "battery_level"]]),
+        ("detections by forest, 30d",
+         f'{BUCKET} |> range(start: -30d) '
+         '|> filter(fn: (r) => r._measurement == "acoustic_guardian" and r.threat_detected) '
+         '|> group(columns: ["location"]) |> count()',
+         lambda frames: window(frames["acoustic_guardian"], NOW - 30 * 86400, NOW)
+         .query("threat_detected").groupby("location").count()),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flux query engine benchmark")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=300, help="Heartbeat interval in seconds")
+    args = parser.parse_args()
+
+    heartbeats = make_heartbeats(args.devices, args.days, args.interval)
+    detections = make_detections(heartbeats, 0.01)
+    print(f"{args.devices} devices, {args.days} days: {len(heartbeats)} heartbeats, {len(detections)} detections")
+    frames = {"device_status": columns_frame(heartbeats), "acoustic_guardian": columns_frame(detections)}
+    frames["acoustic_guardian"]["location"] = detections.tags["location"]
+
+    directory = tempfile.mkdtemp(prefix="ecoguard-flux-")
+    try:
+        store = TimeSeriesStore(directory, head_points=200000, retention={})
+        for batch in (heartbeats, detections):
+            store.write_columns({batch.measurement: batch})
+        store.flush()
+        store.compact()
+
+        print(f"  {'query':<26} {'rows':>9} {'parse':>9} {'engine':>10} {'pandas':>10}")
+        for label, text, reference in queries("AG-HB-007"):
+            parse_seconds, plan = timed(lambda: flux_query.parse(text))
+            seconds, frame = timed(lambda: plan.run(store, now=NOW))
+            reference_seconds, expected = timed(lambda: reference(frames))
+            if len(frame) != len(expected):
+                raise AssertionError(f"{label}: {len(frame)} rows, pandas has {len(expected)}")
+            print(f"  {label:<26} {len(frame):>9} {parse_seconds * 1e6:>7.0f}us "
+                  f"{seconds * 1000:>8.2f}ms {reference_seconds * 1000:>8.2f}ms")
+
+        text = queries("AG-HB-007")[2][1]
+        start = time.perf_counter()
+        frame = flux_query.execute(store, text, now=NOW)
+        expected = queries("AG-HB-007")[2][2](frames)
+        if not np.allclose(frame["battery_level"].to_numpy(), expected["battery_level"].to_numpy()):
+            raise AssertionError("hourly battery differs from pandas")
+        print(f"Hourly battery matches pandas ({(time.perf_counter() - start) * 1000:.1f} ms with the check)")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Gorilla column codec
+
+Encodes simulated fleet heartbeats and detections the way the store's
+segments hold them: one day per segment, rows sorted by device and then
+time, and a run per device. For each column it reports the size against
+the raw 8-byte values, and the encode and decode rates. Decoding is timed
+both for whole columns, as fleet queries read them, and for one device's
+run, as device queries do. Every column is checked to decode bit for bit.
+
+Usage:
+    python benchmark_gorilla_codec.py
+    python benchmark_gorilla_codec.py --devices 500 --days 30 --interval 60
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+import gorilla_codec
+from benchmark_ts_store import make_heartbeats, make_detections, timed
+from line_protocol import format_columns
+
+
+def day_segments(columns, names):
+    """(values of each named column, run starts) for each day, sorted by device and time"""
+    devices = columns.tags["device_id"]
+    order = np.lexsort((columns.time, devices))
+    days = columns.time[order] // 86400
+    segments = []
+    for day in np.unique(days):
+        rows = order[days == day]
+        ids = devices[rows]
+        starts = np.flatnonzero(np.append(True, ids[1:] != ids[:-1]))
+        values = {"time": columns.time[rows]}
+        values.update({name: columns.fields[name][rows] for name in names})
+        segments.append((values, starts))
+    return segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gorilla column codec benchmark")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=300, help="Heartbeat interval in seconds")
+    args = parser.parse_args()
+
+    heartbeats = make_heartbeats(args.devices, args.days, args.interval)
+    detections = make_detections(heartbeats, 0.01)
+    print(f"{args.devices} devices, {args.days} days: {len(heartbeats)} heartbeats, {len(detections)} detections")
+
+    sets = [
+        ("device_status", day_segments(heartbeats, ["battery_level", "signal_strength", "uptime"])),
+        ("acoustic_guardian", day_segments(detections, ["confidence", "time_safe"])),
+    ]
+    print(f"  {'column':<34} {'raw':>9} {'encoded':>9} {'ratio':>7} {'bits/value':>10} "
+          f"{'encode':>11} {'decode':>11} {'one device':>11}")
+    total_raw = total_encoded = 0
+    for measurement, segments in sets:
+        for name in segments[0][0]:
+            count = raw = encoded = 0
+            encode_seconds = decode_seconds = run_seconds = 0.0
+            runs = 0
+            for values, starts in segments:
+                column = values[name]
+                seconds, (meta, arrays) = timed(lambda: gorilla_codec.encode(column, starts), repeat=1)
+                encode_seconds += seconds
+                seconds, decoded = timed(lambda: gorilla_codec.decode(meta, arrays), repeat=3)
+                decode_seconds += seconds
+                if not np.array_equal(decoded.view(np.uint64), column.view(np.uint64)):
+                    raise AssertionError(f"{measurement}.{name} did not decode to the values encoded")
+                seconds, _ = timed(lambda: gorilla_codec.decode(meta, arrays, [len(starts) // 2]), repeat=3)
+                run_seconds += seconds
+                runs += 1
+                count += len(column)
+                raw += column.nbytes
+                encoded += gorilla_codec.encoded_size(arrays)
+            total_raw += raw
+            total_encoded += encoded
+            print(f"  {measurement + '.' + name:<34} {raw / 2**20:>7.2f}Mi {encoded / 2**20:>7.2f}Mi "
+                  f"{raw / encoded:>6.1f}x {encoded * 8 / count:>10.2f} "
+                  f"{count / encode_seconds / 1e6:>9.1f}M/s {count / decode_seconds / 1e6:>9.1f}M/s "
+                  f"{run_seconds / runs * 1e6:>9.0f}us")
+    print(f"  {'all columns':<34} {total_raw / 2**20:>7.2f}Mi {total_encoded / 2**20:>7.2f}Mi "
+          f"{total_raw / total_encoded:>6.1f}x")
+
+    start = time.perf_counter()
+    text = sum(len(line) + 1 for batch in (heartbeats, detections) for line in format_columns(batch))
+    print(f"Line protocol for the same points, tags and strings included: {text / 2**20:.1f} MiB "
+          f"({text / total_encoded:.0f}x the encoded columns, "
+          f"formatted in {time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the ingest gateway
+
+Generates line protocol and LoRa frames for a simulated fleet and pushes
+them through the gateway three ways: straight into IngestGateway
+(validation and canonicalisation only), over UDP to the LoRa listener, and
+over HTTP to the Flask write endpoint. Reports points per second for each
+path and what reached the storage sink.
+
+Usage:
+    python benchmark_ingest_gateway.py
+    python benchmark_ingest_gateway.py --devices 500 --points 200000 --sink file
+"""
+
+import gzip
+import time
+import random
+import socket
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+from lora_codec import encode_frames
+from ingest_gateway import IngestGateway, LoraUdpListener, LineFileSink, create_app
+
+NOW = 1760000000
+
+
+class CountingSink:
+    """Storage stand-in that only counts what it is given"""
+
+    name = "null"
+
+    def __init__(self):
+        self.points = 0
+
+    def write_batch(self, lines):
+        self.points += len(lines)
+        return True
+
+    def close(self):
+        pass
+
+
+def make_lines(devices, count, seed=1):
+    """
+    Line protocol in the shape the nodes send: heartbeats and detections, old
+    and new style
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        device = f"AG-HB-{rng.randrange(devices):03d}"
+        timestamp = NOW + i // devices
+        kind = i % 10
+        if kind < 6:
+            lines.append(
+                f"device_status,device_id={device} battery_level={rng.uniform(20, 100):.1f},"
+                f"signal_strength={rng.randint(-110, -60)}i,uptime={rng.randint(0, 10**6)}i {timestamp}"
+            )
+        elif kind < 9:
+            lines.append(
+                f"acoustic_guardian,device_id={device} gps_coordinates=\"-1.{rng.randint(0, 999999):06d},"
+                f"36.{rng.randint(0, 999999):06d}\",threat_type=\"chainsaw\",confidence={rng.random():.4f},"
+                f"threat_detected={'true' if rng.random() < 0.1 else 'false'},time_safe={rng.randint(0, 86400)} "
+                f"{timestamp}"
+            )
+        else:
+            lines.append(
+                f"node_metrics,device_id={device} detection_windows_total={rng.randint(0, 10**6)},"
+                f"feature_extraction_seconds_p95={rng.random() / 100:.5f} {timestamp}"
+            )
+    return lines
+
+
+def make_frames(devices, count, seed=2):
+    """LoRa frames of one heartbeat and one detection each"""
+    rng = random.Random(seed)
+    frames = []
+    for i in range(count):
+        device = f"AG-HB-{rng.randrange(1, devices + 1):03d}"
+        timestamp = NOW + i // devices
+        records = [
+            {"timestamp": timestamp, "battery_level": rng.uniform(20, 100),
+             "signal_strength": rng.randint(-110, -60), "uptime": rng.randint(0, 10**6),
+             "time_safe": rng.randint(0, 86400)},
+            {"timestamp": timestamp, "event": "started", "is_chainsaw": True, "confidence": rng.random(),
+             "gps_coordinates": f"-1.{rng.randint(0, 999999):06d},36.{rng.randint(0, 999999):06d}"},
+        ]
+        frames.extend(encode_frames(device, records))
+    return frames
+
+
+def wait_for(sink_points, target, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while sink_points() < target and time.perf_counter() < deadline:
+        time.sleep(0.005)
+
+
+def bench_direct(gateway, sink_points, lines, batch_size):
+    start_points = sink_points()
+    start = time.perf_counter()
+    accepted = 0
+    for offset in range(0, len(lines), batch_size):
+        accepted += gateway.ingest_lines("\n".join(lines[offset:offset + batch_size]), "s")[0]
+    ingest_seconds = time.perf_counter() - start
+    wait_for(sink_points, start_points + accepted)
+    total_seconds = time.perf_counter() - start
+    return accepted, ingest_seconds, total_seconds
+
+
+def bench_udp(gateway, sink_points, frames, points_per_frame):
+    listener = LoraUdpListener(gateway, "127.0.0.1", 0)
+    listener.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_points = sink_points()
+    start_frames = gateway.frames.get()
+    start = time.perf_counter()
+    for i, frame in enumerate(frames, 1):
+        sender.sendto(frame, ("127.0.0.1", listener.port))
+        if i % 256 == 0:
+            # Keep at most a few hundred frames in flight, as a real
+            # forwarder would, instead of overrunning the socket buffer
+            deadline = time.perf_counter() + 1.0
+            while gateway.frames.get() - start_frames < i - 512 and time.perf_counter() < deadline:
+                time.sleep(0.0005)
+    wait_for(sink_points, start_points + len(frames) * points_per_frame, timeout=5.0)
+    seconds = time.perf_counter() - start
+    sender.close()
+    listener.stop()
+    return int(gateway.frames.get() - start_frames), sink_points() - start_points, seconds
+
+
+def bench_http(gateway, sink_points, lines, batch_size, use_gzip):
+    import requests
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, create_app(gateway, token=""), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/api/v2/write?precision=s"
+
+    session = requests.Session()
+    bodies = []
+    for offset in range(0, len(lines), batch_size):
+        body = "\n".join(lines[offset:offset + batch_size]).encode("utf-8")
+        bodies.append(gzip.compress(body, compresslevel=6) if use_gzip else body)
+    headers = {"Content-Encoding": "gzip"} if use_gzip else {}
+
+    start_points = sink_points()
+    start = time.perf_counter()
+    for body in bodies:
+        response = session.post(url, data=body, headers=headers)
+        if response.status_code != 204:
+            raise RuntimeError(f"Gateway returned {response.status_code}: {response.text[:200]}")
+    request_seconds = time.perf_counter() - start
+    wait_for(sink_points, start_points + len(lines))
+    total_seconds = time.perf_counter() - start
+
+    session.close()
+    server.shutdown()
+    return len(bodies), request_seconds, total_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for the ingest gateway")
+    parser.add_argument("--devices", type=int, default=200, help="Simulated fleet size")
+    parser.add_argument("--points", type=int, default=100000, help="Line protocol points per run")
+    parser.add_argument("--frames", type=int, default=20000, help="LoRa frames for the UDP run")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Lines per HTTP write")
+    parser.add_argument("--sink", choices=("null", "file"), default="null",
+                        help="Count points only, or write them to line protocol files")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="ecoguard-gateway-")
+    if args.sink == "file":
+        sink = LineFileSink(data_dir)
+        written = lambda: gateway.workers[0].written
+    else:
+        sink = CountingSink()
+        written = lambda: sink.points
+
+    gateway = IngestGateway([sink], clock=lambda: NOW + 10**6)
+    gateway.start()
+    try:
+        lines = make_lines(args.devices, args.points)
+        print(f"Fleet of {args.devices} devices, {len(lines)} line protocol points, sink: {args.sink}")
+
+        accepted, ingest_seconds, total_seconds = bench_direct(gateway, written, lines, args.batch_size)
+        print(f"  direct: {accepted} points validated in {ingest_seconds:.3f} s "
+              f"({accepted / ingest_seconds:,.0f} points/s), stored after {total_seconds:.3f} s "
+              f"({accepted / total_seconds:,.0f} points/s end to end)")
+
+        frames = make_frames(args.devices, args.frames)
+        received, stored, seconds = bench_udp(gateway, written, frames, points_per_frame=3)
+        print(f"  udp:    {received} of {len(frames)} LoRa frames -> {stored} points stored in {seconds:.3f} s "
+              f"({stored / seconds:,.0f} points/s, {received / seconds:,.0f} frames/s)")
+
+        try:
+            import flask  # noqa: F401
+        except ImportError:
+            print("  http:   skipped, Flask is not installed")
+        else:
+            for use_gzip in (False, True):
+                requests_made, request_seconds, total_seconds = bench_http(
+                    gateway, written, lines, args.batch_size, use_gzip)
+                label = "http+gz" if use_gzip else "http"
+                print(f"  {label + ':':<8}{requests_made} writes of {args.batch_size} lines in "
+                      f"{request_seconds:.3f} s ({len(lines) / request_seconds:,.0f} points/s), "
+                      f"stored after {total_seconds:.3f} s")
+    finally:
+        gateway.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    stats = gateway.stats()
+    print(f"Accepted {stats['accepted']}, rejected {stats['rejected']}, "
+          f"invalid frames {stats['lora_frames_invalid']}")
+
+
+if __name__ == "__main__":
+    main()
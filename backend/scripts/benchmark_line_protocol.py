@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the line protocol module
+
+Measures points per second in both directions for a batch shaped like fleet
+traffic (heartbeats, detections with quoted GPS strings, metrics):
+
+    serialize: format_line per point, and format_columns per batch
+    parse:     parse_line per point, and parse_lines into NumPy columns
+
+and checks that a batch survives a parse -> format -> parse round trip.
+
+Usage:
+    python benchmark_line_protocol.py
+    python benchmark_line_protocol.py --points 500000 --devices 1000
+"""
+
+import time
+import random
+import argparse
+
+import numpy as np
+
+from line_protocol import format_line, parse_line, parse_lines, format_columns
+
+NOW = 1760000000
+
+
+def make_points(devices, count, seed=1):
+    """Points as (measurement, tags, fields, timestamp) tuples"""
+    rng = random.Random(seed)
+    points = []
+    for i in range(count):
+        tags = {"device_id": f"AG-HB-{rng.randrange(devices):03d}"}
+        timestamp = NOW + i // devices
+        kind = i % 10
+        if kind < 6:
+            points.append(("device_status", tags, {
+                "battery_level": round(rng.uniform(20, 100), 1),
+                "signal_strength": rng.randint(-110, -60),
+                "uptime": rng.randint(0, 10**6),
+            }, timestamp))
+        elif kind < 9:
+            points.append(("acoustic_guardian", {**tags, "location": "Karura Forest"}, {
+                "gps_coordinates": f"-1.{rng.randint(0, 999999):06d}, 36.{rng.randint(0, 999999):06d}",
+                "threat_type": "chainsaw",
+                "confidence": round(rng.random(), 4),
+                "threat_detected": rng.random() < 0.1,
+                "time_safe": rng.randint(0, 86400),
+            }, timestamp))
+        else:
+            points.append(("node_metrics", tags, {
+                "detection_windows_total": float(rng.randint(0, 10**6)),
+                "feature_extraction_seconds_p95": round(rng.random() / 100, 6),
+            }, timestamp))
+    return points
+
+
+def timed(function, repeat):
+    """Best wall time of several runs, and the last result"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def report(label, count, seconds):
+    print(f"  {label:<34} {seconds * 1000:9.1f} ms  {count / seconds:>12,.0f} points/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Line protocol serializer and parser benchmark")
+    parser.add_argument("--points", type=int, default=200000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    points = make_points(args.devices, args.points)
+    count = len(points)
+    print(f"{count} points from {args.devices} devices")
+
+    print("Serialize")
+    seconds, lines = timed(lambda: [format_line(*point) for point in points], args.repeat)
+    report("format_line per point", count, seconds)
+    text = "\n".join(lines)
+
+    columns = parse_lines(text)
+    seconds, formatted = timed(
+        lambda: [line for batch in columns.values() for line in format_columns(batch)], args.repeat)
+    report("format_columns per batch", count, seconds)
+
+    print("Parse")
+    seconds, _ = timed(lambda: [parse_line(line) for line in lines], args.repeat)
+    report("parse_line per point", count, seconds)
+    seconds, columns = timed(lambda: parse_lines(text), args.repeat)
+    report("parse_lines into columns", count, seconds)
+    print(f"  ({len(text) / seconds / 1e6:.1f} MB/s of line protocol)")
+
+    # Round trip: columns -> lines -> columns must give the same values
+    again = parse_lines("\n".join(formatted))
+    for measurement, batch in columns.items():
+        other = again[measurement]
+        order = np.lexsort((batch.tags["device_id"].astype(str), batch.time))
+        other_order = np.lexsort((other.tags["device_id"].astype(str), other.time))
+        for name, values in batch.fields.items():
+            if not np.array_equal(values[order], other.fields[name][other_order]):
+                raise SystemExit(f"Round trip changed {measurement}.{name}")
+    print(f"Round trip OK for {', '.join(f'{m} ({len(b)})' for m, b in columns.items())}")
+
+
+if __name__ == "__main__":
+    main()
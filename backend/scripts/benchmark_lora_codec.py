@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the LoRa payload codec
+
+Compares the binary codec with the JSON payloads previously sent over LoRa,
+reporting encoded size, time on air at the configured radio settings, and
+encode/decode throughput.
+"""
+
+import json
+import time
+
+from rpi_config import DEVICE_ID, LORA_SPREADING_FACTOR, LORA_BANDWIDTH, LORA_CODING_RATE
+from lora_codec import encode_frames, decode_frame, lora_airtime
+
+NOW = 1760000000
+
+SAMPLE_RECORDS = {
+    "heartbeat": {
+        "device_id": DEVICE_ID,
+        "timestamp": NOW + 0.123456,
+        "battery_level": 87.53412,
+        "signal_strength": -71,
+        "uptime": 86400,
+        "time_safe": 3600,
+    },
+    "detection started": {
+        "event": "started",
+        "event_id": f"{DEVICE_ID}-{NOW}-1",
+        "is_chainsaw": True,
+        "confidence": 0.9731,
+        "timestamp": NOW + 30.5,
+        "gps_coordinates": "-1.272300,36.808000",
+    },
+    "detection ended": {
+        "event": "ended",
+        "event_id": f"{DEVICE_ID}-{NOW}-1",
+        "is_chainsaw": False,
+        "confidence": 0.9912,
+        "mean_confidence": 0.9504,
+        "positive_windows": 412,
+        "windows": 450,
+        "start": NOW + 30.5,
+        "duration": 225.0,
+        "timestamp": NOW + 255.5,
+        "gps_coordinates": "-1.272300,36.808000",
+    },
+    "tree health": {
+        "type": "tree_health",
+        "health_score": 0.8734,
+        "saplings_count": 37,
+        "survival_rate": 0.9123,
+        "timestamp": NOW + 300.0,
+    },
+}
+
+
+def compare(label, records):
+    """
+    Print JSON vs binary size and airtime for a set of records
+    """
+    json_frames = [json.dumps(record).encode() for record in records]
+    binary_frames = encode_frames(DEVICE_ID, records)
+
+    json_bytes = sum(len(frame) for frame in json_frames)
+    binary_bytes = sum(len(frame) for frame in binary_frames)
+    json_airtime = sum(lora_airtime(len(frame)) for frame in json_frames)
+    binary_airtime = sum(lora_airtime(len(frame)) for frame in binary_frames)
+
+    print(f"{label:<28} {json_bytes:>7} B {json_airtime * 1000:>9.1f} ms   "
+          f"{binary_bytes:>5} B {binary_airtime * 1000:>8.1f} ms   {json_airtime / binary_airtime:>5.1f}x")
+
+
+def throughput(records, iterations=2000):
+    """
+    Print encode and decode rates in records per second
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        frames = encode_frames(DEVICE_ID, records)
+    encode_rate = iterations * len(records) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for frame in frames:
+            decode_frame(frame)
+    decode_rate = iterations * len(records) / (time.perf_counter() - start)
+
+    print(f"Encode: {encode_rate:,.0f} records/sec")
+    print(f"Decode: {decode_rate:,.0f} records/sec")
+
+
+def main():
+    print("LoRa payload codec benchmark")
+    print("=" * 80)
+    print(f"Radio: SF{LORA_SPREADING_FACTOR}, {LORA_BANDWIDTH / 1000:.0f} kHz, CR 4/{LORA_CODING_RATE}")
+    print("=" * 80)
+    print(f"{'Payload':<28} {'JSON size':>9} {'JSON air':>12}   {'Binary':>7} {'Bin air':>11}   {'Saving':>6}")
+
+    for label, record in SAMPLE_RECORDS.items():
+        compare(label, [record])
+
+    heartbeats = [dict(SAMPLE_RECORDS["heartbeat"], timestamp=NOW + i * 300, uptime=86400 + i * 300)
+                  for i in range(12)]
+    compare("12 queued heartbeats (1 h)", heartbeats)
+    compare("mixed outbox batch", list(SAMPLE_RECORDS.values()) * 3)
+
+    print("=" * 80)
+    throughput(list(SAMPLE_RECORDS.values()))
+
+
+if __name__ == "__main__":
+    main()
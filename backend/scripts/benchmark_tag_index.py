@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the store's tag index
+
+Builds stores for fleets of growing size in which Karura Forest always
+has the same number of devices, then times the dashboards' forest queries
+over the last hour: detections at location Karura Forest, and the status
+of every device in the forest. Each runs through the tag index, and as a
+reference as a scan of the whole fleet with the rows masked by location
+afterwards, which is how they ran before the index. With the index, the
+time should stay flat as the fleet grows; the reference grows with it.
+
+Usage:
+    python benchmark_tag_index.py
+    python benchmark_tag_index.py --fleets 100 1000 4000 --karura 20
+"""
+
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+import flux_query
+from benchmark_ts_store import FORESTS, NOW, make_heartbeats, make_detections, timed
+from ts_store import TimeSeriesStore
+
+KARURA = "Karura Forest"
+
+
+def forests_of(devices, karura):
+    """Forest of each device in name order: karura of them in Karura Forest, the rest spread over the others"""
+    others = [forest for forest in FORESTS if forest != KARURA]
+    return [KARURA] * karura + [others[n % len(others)] for n in range(devices - karura)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tag index benchmark")
+    parser.add_argument("--fleets", type=int, nargs="+", default=[100, 400, 1600], help="Fleet sizes")
+    parser.add_argument("--karura", type=int, default=20, help="Devices in Karura Forest")
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--interval", type=int, default=300, help="Heartbeat interval in seconds")
+    parser.add_argument("--rate", type=float, default=0.05, help="Share of heartbeats with a detection")
+    args = parser.parse_args()
+
+    flux = ('from(bucket: "acoustic-guardian") |> range(start: -1h) '
+            f'|> filter(fn: (r) => r._measurement == "acoustic_guardian" and r.location == "{KARURA}")')
+    print(f"{args.karura} devices in {KARURA}, {args.days} days, queries over the last hour")
+    print(f"  {'devices':>7} {'series':>7} {'query':<20} {'rows':>6} {'lookup':>8} {'index':>9} "
+          f"{'full scan':>10}")
+    for devices in args.fleets:
+        heartbeats = make_heartbeats(devices, args.days, args.interval)
+        detections = make_detections(heartbeats, args.rate, forests=forests_of(devices, args.karura))
+        directory = tempfile.mkdtemp(prefix="ecoguard-tags-")
+        try:
+            store = TimeSeriesStore(directory, head_points=10**7, retention={})
+            for batch in (detections, heartbeats):
+                store.write_columns({batch.measurement: batch})
+            store.flush()
+            store.compact()
+            store.close()
+            start = time.perf_counter()
+            store = TimeSeriesStore(directory, read_only=True)
+            opened = time.perf_counter() - start
+            series = store.stats()["series"]
+
+            # Reference filters over the fleet's rows; each device reports from one forest here
+            karura = np.unique(detections.tags["device_id"][detections.tags["location"] == KARURA])
+            cases = [
+                ("detections, location", "acoustic_guardian", {"location": KARURA},
+                 lambda rows: rows.columns["location"] == KARURA),
+                ("status, forest", "device_status", {"forest": KARURA},
+                 lambda rows: np.isin(rows.device_id, karura)),
+            ]
+            for label, measurement, tags, matches in cases:
+                lookup_seconds, _ = timed(lambda: store._index.devices(store._index.select(measurement, tags)))
+                seconds, block = timed(lambda: store.scan(measurement, NOW - 3600, NOW, tags=tags))
+
+                def full_scan():
+                    rows = store.scan(measurement, NOW - 3600, NOW)
+                    return rows.take(matches(rows))
+
+                full_seconds, expected = timed(full_scan)
+                if len(block) != len(expected):
+                    raise AssertionError(f"{label}: {len(block)} rows, the full scan has {len(expected)}")
+                print(f"  {devices:>7} {series:>7} {label:<20} {len(block):>6} {lookup_seconds * 1e6:>6.0f}us "
+                      f"{seconds * 1000:>7.2f}ms {full_seconds * 1000:>8.2f}ms")
+            seconds, frame = timed(lambda: flux_query.execute(store, flux, now=NOW))
+            print(f"  {devices:>7} {series:>7} {'Flux, location':<20} {len(frame):>6} {'':>8} "
+                  f"{seconds * 1000:>7.2f}ms   (opening the store and its index: {opened * 1000:.0f} ms)")
+            store.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the embedded time-series store
+
+Loads heartbeats and detections for a simulated fleet, then times the
+dashboard queries against the store: one device over a day, the whole
+fleet over the last hour, the latest status of every device, and one
+column for the whole fleet over the full period. As a reference, the same
+filters run as boolean masks over one in-memory pandas DataFrame holding
+every point. Chart queries over the rollups (detection counts and battery
+levels per bucket) are compared with a pandas groupby over the points.
+Last, partitions older than --hot-days move to the Parquet archive, and the
+queries run again over both tiers, checked against the results from
+segments alone.
+
+Usage:
+    python benchmark_ts_store.py
+    python benchmark_ts_store.py --devices 500 --days 90 --interval 300
+    python benchmark_ts_store.py --no-compression
+    python benchmark_ts_store.py --hot-days 2
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from line_protocol import MeasurementColumns
+from ts_store import ARCHIVE_DIR, TimeSeriesStore
+
+NOW = 1760000000
+
+# Forests the simulated devices are spread over
+FORESTS = ("Karura Forest", "Ngong Forest", "Kakamega Forest", "Mau Forest", "Aberdare Forest")
+
+
+def make_heartbeats(devices, days, interval, seed=1):
+    """
+    device_status columns, one point per device every interval seconds
+
+    Each node reports at its own phase with a second or two of jitter. Its
+    battery drains slowly with a daily solar swing, its signal wanders a
+    few dB around its own level, and its uptime counts from the last of
+    occasional reboots.
+    """
+    rng = np.random.default_rng(seed)
+    steps = days * 86400 // interval
+    start = NOW - steps * interval
+    shape = (steps, devices)
+    names = np.array([f"AG-HB-{i:03d}" for i in range(devices)], dtype=object)
+    times = (start + np.arange(steps, dtype=np.int64)[:, None] * interval
+             + rng.integers(0, interval // 2, devices) + rng.integers(0, 3, shape))
+
+    elapsed_days = (times - start) / 86400
+    battery = (rng.uniform(70, 100, devices) - rng.uniform(0.5, 2, devices) * elapsed_days
+               + 5 * np.sin(2 * np.pi * (times % 86400) / 86400))
+    signal = rng.integers(-105, -65, devices) + rng.integers(-2, 3, shape)
+
+    step = np.arange(steps)[:, None]
+    reboots = rng.random(shape) < interval / (7 * 86400)
+    booted = np.maximum.accumulate(np.where(reboots, step, 0), axis=0)
+    boot_time = np.take_along_axis(times, booted, axis=0) - np.where(booted == 0, rng.integers(0, 10**6, devices), 0)
+    return MeasurementColumns(
+        "device_status",
+        times.ravel(),
+        {"device_id": np.tile(names, steps)},
+        {
+            "battery_level": np.round(np.clip(battery, 5, 100), 1).ravel(),
+            "signal_strength": signal.ravel(),
+            "uptime": (times - boot_time).ravel(),
+        },
+    )
+
+
+def make_detections(heartbeats, rate, seed=2, forests=FORESTS):
+    """
+    acoustic_guardian columns for a fraction of the heartbeats
+
+    The n-th device, in name order, reports from forests[n % len(forests)].
+    """
+    rng = np.random.default_rng(seed)
+    picked = np.flatnonzero(rng.random(len(heartbeats)) < rate)
+    count = len(picked)
+    times = heartbeats.time[picked]
+    devices = heartbeats.tags["device_id"][picked]
+    names, codes = np.unique(heartbeats.tags["device_id"], return_inverse=True)
+    locations = np.array(forests, dtype=object)[np.arange(len(names)) % len(forests)][codes.reshape(-1)[picked]]
+    # Seconds since the device's previous detection
+    order = np.lexsort((times, devices))
+    since = np.zeros(count, dtype=np.int64)
+    first = np.append(True, devices[order][1:] != devices[order][:-1])
+    since[order] = np.where(first, times[order] - heartbeats.time.min(), np.diff(times[order], prepend=0))
+    return MeasurementColumns(
+        "acoustic_guardian",
+        times,
+        {
+            "device_id": devices,
+            "location": locations,
+        },
+        {
+            "gps_coordinates": np.full(count, "-1.2345, 36.8123", dtype=object),
+            "threat_type": np.full(count, "chainsaw", dtype=object),
+            "confidence": rng.random(count),
+            "threat_detected": rng.random(count) < 0.5,
+            "time_safe": since,
+        },
+    )
+
+
+def timed(function, repeat=5):
+    """Best wall time of several runs, and the result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded time-series store benchmark")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=300, help="Heartbeat interval in seconds")
+    parser.add_argument("--batch", type=int, default=5000, help="Points per write, as the gateway sink sends them")
+    parser.add_argument("--no-compression", action="store_true", help="Write segments without gorilla_codec")
+    parser.add_argument("--hot-days", type=int, default=7, help="Days kept in segments when archiving")
+    args = parser.parse_args()
+
+    heartbeats = make_heartbeats(args.devices, args.days, args.interval)
+    detections = make_detections(heartbeats, 0.01)
+    total = len(heartbeats) + len(detections)
+    print(f"{args.devices} devices, {args.days} days: {len(heartbeats)} heartbeats, {len(detections)} detections")
+
+    directory = tempfile.mkdtemp(prefix="ecoguard-store-")
+    try:
+        store = TimeSeriesStore(directory, head_points=200000, compression=not args.no_compression,
+                                retention={"acoustic_guardian": args.hot_days, "device_status": args.hot_days})
+        start = time.perf_counter()
+        for batch in (heartbeats, detections):
+            for lo in range(0, len(batch), args.batch):
+                hi = lo + args.batch
+                store.write_columns({batch.measurement: MeasurementColumns(
+                    batch.measurement, batch.time[lo:hi],
+                    {name: values[lo:hi] for name, values in batch.tags.items()},
+                    {name: values[lo:hi] for name, values in batch.fields.items()},
+                )})
+        store.flush()
+        write_seconds = time.perf_counter() - start
+        segments = store.stats()["segments"]
+        start = time.perf_counter()
+        store.compact()
+        compact_seconds = time.perf_counter() - start
+        print(f"Write:   {total / write_seconds:,.0f} points/s, {segments} segments; "
+              f"compaction to {store.stats()['segments']} segments in {compact_seconds:.2f} s")
+        size = directory_size(directory)
+        print(f"On disk: {size / 2**20:.1f} MiB, {size / total:.1f} bytes/point")
+
+        device = "AG-HB-007"
+        queries = [
+            ("one device, 1 day", "device_status", NOW - 86400, NOW, device, None, False),
+            ("one device, 14 days", "device_status", NOW - 14 * 86400, NOW, device, None, False),
+            ("fleet, last hour", "device_status", NOW - 3600, NOW, None, None, False),
+            ("fleet latest status", "device_status", NOW - 600, NOW, None, None, True),
+            ("fleet detections, 7 days", "acoustic_guardian", NOW - 7 * 86400, NOW, None, None, False),
+            (f"fleet battery, {args.days} days", "device_status", None, None, None, ["battery_level"], False),
+        ]
+        frames = {
+            "device_status": columns_frame(heartbeats),
+            "acoustic_guardian": columns_frame(detections),
+        }
+        print(f"  {'query':<26} {'rows':>9} {'store':>10} {'DataFrame':>10}")
+        results = []
+        for label, measurement, lo, hi, devices, columns, last in queries:
+            scan = store.last if last else store.scan
+            seconds, block = timed(lambda: scan(measurement, lo, hi, devices, columns))
+            frame = frames[measurement]
+            reference, _ = timed(lambda: filter_frame(frame, lo, hi, devices, columns, last))
+            print(f"  {label:<26} {len(block):>9} {seconds * 1000:>8.2f}ms {reference * 1000:>8.2f}ms")
+            results.append((seconds, block))
+
+        today = NOW // 86400 * 86400
+        charts = [
+            (f"fleet daily, {args.days} days", None, 86400, "fleet", None),
+            ("forests hourly, 7 days", today - 7 * 86400, 3600, "forest", None),
+            ("one device hourly, 7 days", today - 7 * 86400, 3600, "device", device),
+            ("one device by minute, 1 day", today - 86400, 60, "device", device),
+        ]
+        print(f"  {'rollup':<26} {'rows':>9} {'store':>10} {'groupby':>10}")
+        for label, lo, step, by, devices in charts:
+            seconds, frame = timed(lambda: store.rollup(lo, None, step, by, devices))
+            reference, _ = timed(lambda: aggregate_frames(frames, lo, step, devices))
+            print(f"  {label:<26} {len(frame):>9} {seconds * 1000:>8.2f}ms {reference * 1000:>8.2f}ms")
+
+        start = time.perf_counter()
+        archived = store.archive(now=NOW)
+        archive_seconds = time.perf_counter() - start
+        cold = directory_size(os.path.join(directory, ARCHIVE_DIR))
+        print(f"Archive: {archived} partitions older than {args.hot_days} days in {archive_seconds:.2f} s; "
+              f"{(directory_size(directory) - cold) / 2**20:.1f} MiB in segments, {cold / 2**20:.1f} MiB in Parquet")
+        print(f"  {'query':<26} {'rows':>9} {'tiered':>10} {'segments':>10}")
+        for (label, measurement, lo, hi, devices, columns, last), (before, expected) in zip(queries, results):
+            scan = store.last if last else store.scan
+            seconds, block = timed(lambda: scan(measurement, lo, hi, devices, columns))
+            if not block.to_dataframe().equals(expected.to_dataframe()):
+                raise AssertionError(f"{label} changed after archiving")
+            print(f"  {label:<26} {len(block):>9} {seconds * 1000:>8.2f}ms {before * 1000:>8.2f}ms")
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def columns_frame(columns):
+    import pandas as pd
+
+    data = {"time": columns.time, "device_id": columns.tags["device_id"]}
+    data.update(columns.fields)
+    return pd.DataFrame(data)
+
+
+def aggregate_frames(frames, start, step, devices):
+    """Detection counts and battery levels per bucket, grouped from the points"""
+    heartbeats = filter_frame(frames["device_status"], start, NOW + 1, devices, ["battery_level"], False)
+    detections = filter_frame(frames["acoustic_guardian"], start, NOW + 1, devices, ["confidence", "threat_detected"], False)
+    detections = detections[detections["threat_detected"]]
+    battery = heartbeats.groupby(heartbeats["time"] // step * step)["battery_level"].agg(["min", "mean"])
+    return battery.join(detections.groupby(detections["time"] // step * step)["confidence"].agg(["count", "max"]),
+                        how="outer")
+
+
+def filter_frame(frame, start, stop, devices, columns, last):
+    mask = np.ones(len(frame), dtype=bool)
+    if start is not None:
+        mask &= (frame["time"] >= start).to_numpy() & (frame["time"] < stop).to_numpy()
+    if devices is not None:
+        mask &= (frame["device_id"] == devices).to_numpy()
+    result = frame[mask]
+    if columns is not None:
+        result = result[["time", "device_id", *columns]]
+    if last:
+        result = result.sort_values("time").groupby("device_id").tail(1)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Camera Pipeline
+
+Scheduled frame capture and preprocessing for tree health monitoring.
+
+One frame is grabbed per assessment, from the camera via OpenCV or from a
+directory of images when testing without hardware. The frame is downscaled
+into a reused buffer and masked with a region-of-interest mask that is
+loaded and resized once. A cheap grey-level difference against the last
+assessed frame decides whether anything changed: if not, the previous
+assessment is reused and the visual model is not run, saving CPU and power
+on the 5-minute cadence.
+"""
+
+import os
+import time
+import logging
+
+import numpy as np
+
+from rpi_config import (
+    CAMERA_DEVICE,
+    CAMERA_RESOLUTION,
+    CAMERA_FPS,
+    CAMERA_SOURCE,
+    CAMERA_PROCESS_WIDTH,
+    CAMERA_PROCESS_HEIGHT,
+    CAMERA_ROI_MASK,
+    CAMERA_CHANGE_THRESHOLD,
+    CAMERA_WARMUP_FRAMES,
+)
+
+logger = logging.getLogger("AcousticGuardian")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Excess-green index (2G - R - B) above which a pixel counts as healthy foliage
+FOLIAGE_EXG_THRESHOLD = 20
+
+
+class OpenCVCameraSource:
+    """
+    Grabs single frames from a camera, opening it only for each capture
+    """
+
+    def __init__(self, device=CAMERA_DEVICE, resolution=CAMERA_RESOLUTION, fps=CAMERA_FPS,
+                 warmup_frames=CAMERA_WARMUP_FRAMES):
+        """
+        Args:
+            device (int): OpenCV camera index
+            resolution (tuple): Capture (width, height)
+            fps (int): Capture frame rate
+            warmup_frames (int): Frames discarded while auto exposure settles
+        """
+        self.device = device
+        self.resolution = resolution
+        self.fps = fps
+        self.warmup_frames = warmup_frames
+
+    def capture(self):
+        """
+        Capture one BGR frame
+
+        Returns:
+            np.ndarray: Frame of shape (height, width, 3), or None on failure
+        """
+        import cv2
+
+        camera = cv2.VideoCapture(self.device)
+        try:
+            if not camera.isOpened():
+                logger.error(f"Failed to open camera {self.device}")
+                return None
+            camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+            camera.set(cv2.CAP_PROP_FPS, self.fps)
+            for _ in range(self.warmup_frames):
+                camera.grab()
+            ok, frame = camera.read()
+            return frame if ok else None
+        finally:
+            # Release between captures so the sensor is powered down for the
+            # minutes between assessments
+            camera.release()
+
+
+class ImageDirectorySource:
+    """
+    Serves images from a directory in name order, looping at the end
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Directory of .jpg/.png/.bmp images
+        """
+        self.paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            raise ValueError(f"No images found in {directory}")
+        self._next = 0
+
+    def capture(self):
+        """
+        Load the next image
+
+        Returns:
+            np.ndarray: BGR frame, or None if the image could not be read
+        """
+        import cv2
+
+        path = self.paths[self._next]
+        self._next = (self._next + 1) % len(self.paths)
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is None:
+            logger.error(f"Failed to read image {path}")
+        return frame
+
+
+class FramePipeline:
+    """
+    Downscales, masks and change-gates frames before visual inference
+    """
+
+    def __init__(self, source, visual_engine=None, size=(CAMERA_PROCESS_WIDTH, CAMERA_PROCESS_HEIGHT),
+                 roi_mask_path=CAMERA_ROI_MASK, change_threshold=CAMERA_CHANGE_THRESHOLD):
+        """
+        Args:
+            source: Object with a capture() method returning a BGR frame
+            visual_engine (InferenceEngine): Tree health model, or None to use the foliage index
+            size (tuple): Processing (width, height); the model input size takes precedence
+            roi_mask_path (str): Greyscale mask image, non-zero where trees are; empty for the full frame
+            change_threshold (float): Mean absolute grey difference (0-1) below which inference is skipped
+        """
+        import cv2
+
+        self.source = source
+        self.visual_engine = visual_engine
+        self.change_threshold = change_threshold
+        if visual_engine is not None:
+            height, width = visual_engine.model.input_shape[:2]
+            size = (width, height)
+        self.size = size
+        width, height = size
+
+        # Buffers reused for every frame
+        self._small = np.empty((height, width, 3), dtype=np.uint8)
+        self._gray = np.empty((height, width), dtype=np.uint8)
+        self._last_gray = np.empty((height, width), dtype=np.uint8)
+        self._diff = np.empty((height, width), dtype=np.uint8)
+        self._model_input = np.empty((height, width, 3), dtype=np.float32)
+
+        self.roi_mask = self._load_roi_mask(roi_mask_path, cv2)
+        self._roi_float = (self.roi_mask > 0).astype(np.float32)[..., np.newaxis]
+        self._roi_pixels = max(1, int(np.count_nonzero(self.roi_mask)))
+
+        self.last_assessment = None
+        self.frames_captured = 0
+        self.inferences_skipped = 0
+
+    def _load_roi_mask(self, path, cv2):
+        width, height = self.size
+        if path:
+            mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if mask is not None:
+                mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+                logger.info(f"Loaded camera region-of-interest mask from {path}")
+                return np.where(mask > 0, 255, 0).astype(np.uint8)
+            logger.warning(f"Failed to read region-of-interest mask {path}, using the full frame")
+        return np.full((height, width), 255, dtype=np.uint8)
+
+    def change_score(self):
+        """
+        Mean absolute grey-level difference to the last assessed frame, inside the ROI
+
+        Returns:
+            float: Change score from 0.0 (identical) to 1.0
+        """
+        import cv2
+
+        cv2.absdiff(self._gray, self._last_gray, dst=self._diff)
+        return cv2.mean(self._diff, mask=self.roi_mask)[0] / 255.0
+
+    def _foliage_score(self):
+        """Fraction of ROI pixels that are green foliage (excess-green index)"""
+        blue, green, red = (self._small[..., channel].astype(np.int16) for channel in range(3))
+        foliage = (2 * green - red - blue) > FOLIAGE_EXG_THRESHOLD
+        return float(np.count_nonzero(foliage & (self.roi_mask > 0))) / self._roi_pixels
+
+    def assess(self):
+        """
+        Capture a frame and assess tree health, skipping inference if nothing changed
+
+        Returns:
+            dict: health_score, change_score and whether inference ran, or None if capture failed
+        """
+        import cv2
+
+        frame = self.source.capture()
+        if frame is None:
+            return None
+        self.frames_captured += 1
+
+        cv2.resize(frame, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+        if self.last_assessment is not None:
+            change = self.change_score()
+            if change < self.change_threshold:
+                self.inferences_skipped += 1
+                logger.info(f"Camera view unchanged (score {change:.3f}), reusing last tree health assessment")
+                return {**self.last_assessment, "change_score": change, "inference_run": False,
+                        "timestamp": time.time()}
+        else:
+            change = 1.0
+
+        if self.visual_engine is not None:
+            np.multiply(self._small, self._roi_float, out=self._model_input)
+            self._model_input /= 255.0
+            health_score = self.visual_engine.predict(self._model_input)
+        else:
+            health_score = self._foliage_score()
+
+        self._last_gray[...] = self._gray
+        self.last_assessment = {"health_score": float(health_score)}
+        return {**self.last_assessment, "change_score": change, "inference_run": True, "timestamp": time.time()}
+
+
+def create_camera_pipeline(visual_engine=None, source=CAMERA_SOURCE):
+    """
+    Build a FramePipeline from configuration
+
+    Args:
+        visual_engine (InferenceEngine): Tree health model, or None
+        source (str): "camera" or a directory of images
+
+    Returns:
+        FramePipeline: The configured pipeline
+    """
+    if source == "camera":
+        frame_source = OpenCVCameraSource()
+    else:
+        frame_source = ImageDirectorySource(source)
+    return FramePipeline(frame_source, visual_engine)
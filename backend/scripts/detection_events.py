@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Detection Events
+
+Hysteresis state machine that turns per-window chainsaw scores into logging
+events.
+
+A single window crossing DETECTION_THRESHOLD is not enough to raise an alert:
+an event starts when at least k of the last n windows are positive, continues
+while positives keep arriving, and ends once no positive window has been seen
+for DETECTION_EVENT_GAP seconds. Each event produces exactly one "started"
+message and one "ended" summary, however long the logging goes on.
+
+The "started" message also carries the onset: the capture time
+(arrival_time) and sound level (sound_level) of the first positive window
+in the vote, which the gateway's fusion stage locates the chainsaw from.
+"""
+
+import logging
+from collections import deque
+
+from rpi_config import DETECTION_THRESHOLD, DETECTION_VOTE_K, DETECTION_VOTE_N, DETECTION_EVENT_GAP
+
+logger = logging.getLogger("AcousticGuardian")
+
+IDLE = "idle"
+ACTIVE = "active"
+
+EVENT_STARTED = "started"
+EVENT_ENDED = "ended"
+
+
+class DetectionEventTracker:
+    """
+    k-of-n voting state machine over consecutive detection windows
+    """
+
+    def __init__(self, device_id, votes_required=DETECTION_VOTE_K, vote_window=DETECTION_VOTE_N,
+                 event_gap=DETECTION_EVENT_GAP, threshold=DETECTION_THRESHOLD):
+        """
+        Args:
+            device_id (str): Device identifier, used to build event IDs
+            votes_required (int): Positive windows (k) needed to start an event
+            vote_window (int): Number of recent windows (n) that are voted over
+            event_gap (float): Seconds without a positive window that end an event
+            threshold (float): Minimum confidence for a window to count as positive
+        """
+        if not 0 < votes_required <= vote_window:
+            raise ValueError("votes_required must be between 1 and vote_window")
+        self.device_id = device_id
+        self.votes_required = votes_required
+        self.event_gap = event_gap
+        self.threshold = threshold
+
+        self.state = IDLE
+        self._votes = deque(maxlen=vote_window)
+        # (timestamp, sound_level) of each voted window, None for a negative one
+        self._onsets = deque(maxlen=vote_window)
+        self._event_count = 0
+        self._event = None
+
+    def update(self, detection_result):
+        """
+        Feed one window's detection result into the state machine
+
+        Args:
+            detection_result (dict): Result with is_chainsaw, confidence and timestamp,
+                and optionally the window's sound_level
+
+        Returns:
+            list: Event messages produced by this window (usually empty)
+        """
+        timestamp = detection_result["timestamp"]
+        confidence = detection_result["confidence"]
+        positive = bool(detection_result["is_chainsaw"]) and confidence >= self.threshold
+
+        events = self.check_timeout(timestamp)
+        # Each vote holds the window's confidence, or 0.0 for a negative window
+        self._votes.append(confidence if positive else 0.0)
+        self._onsets.append((timestamp, detection_result.get("sound_level")) if positive else None)
+
+        if self.state == ACTIVE:
+            if positive:
+                self._event["last_positive"] = timestamp
+                self._event["positive_windows"] += 1
+                self._event["confidence_sum"] += confidence
+                self._event["peak_confidence"] = max(self._event["peak_confidence"], confidence)
+            self._event["windows"] += 1
+        elif positive and self._positive_votes() >= self.votes_required:
+            events.append(self._start_event(timestamp, confidence))
+
+        return events
+
+    def check_timeout(self, now):
+        """
+        End the active event if the gap since its last positive window has passed
+
+        Called for every window and once per loop tick, so events also end
+        when the audio stops arriving.
+
+        Args:
+            now (float): Current time in seconds
+
+        Returns:
+            list: The "ended" message, if the event ended
+        """
+        if self.state == ACTIVE and now - self._event["last_positive"] >= self.event_gap:
+            return [self._end_event()]
+        return []
+
+    def _positive_votes(self):
+        return sum(1 for vote in self._votes if vote)
+
+    def _start_event(self, timestamp, confidence):
+        self._event_count += 1
+        positives = self._positive_votes()
+        self._event = {
+            "event_id": f"{self.device_id}-{int(timestamp)}-{self._event_count}",
+            "start": timestamp,
+            "last_positive": timestamp,
+            "windows": positives,
+            "positive_windows": positives,
+            "confidence_sum": sum(self._votes),
+            "peak_confidence": max(self._votes),
+        }
+        self.state = ACTIVE
+        logger.info(f"Detection event {self._event['event_id']} started")
+
+        arrival_time, sound_level = next(onset for onset in self._onsets if onset)
+        event = {
+            "event": EVENT_STARTED,
+            "event_id": self._event["event_id"],
+            "is_chainsaw": True,
+            "confidence": confidence,
+            "timestamp": timestamp,
+            "arrival_time": arrival_time,
+        }
+        if sound_level is not None:
+            event["sound_level"] = sound_level
+        return event
+
+    def _end_event(self):
+        event = self._event
+        self._event = None
+        self._votes.clear()
+        self._onsets.clear()
+        self.state = IDLE
+        duration = event["last_positive"] - event["start"]
+        logger.info(f"Detection event {event['event_id']} ended after {duration:.0f} s")
+
+        return {
+            "event": EVENT_ENDED,
+            "event_id": event["event_id"],
+            "is_chainsaw": False,
+            "confidence": event["peak_confidence"],
+            "mean_confidence": event["confidence_sum"] / event["positive_windows"],
+            "positive_windows": event["positive_windows"],
+            "windows": event["windows"],
+            "start": event["start"],
+            "duration": duration,
+            "timestamp": event["last_positive"],
+        }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Duty Cycling
+
+Power-aware gating and cadence for the sensor node.
+
+EnergyGate is a cheap RMS check that runs before the log-mel and model path:
+windows quieter than ENERGY_GATE_DBFS cannot contain a chainsaw within
+range, so they are scored 0.0 without computing features. AdaptiveCadence
+stretches a task's period as the battery drains and tightens it for a while
+after a detection, so quiet nights cost little power while an active event
+is reported promptly.
+
+Neither class imports numpy; windows only need a dot() method, so this
+module can be imported before the audio stack is loaded.
+"""
+
+import math
+import logging
+
+from rpi_config import (
+    ENERGY_GATE_DBFS,
+    BATTERY_NORMAL_LEVEL,
+    BATTERY_CRITICAL_LEVEL,
+    CADENCE_MAX_STRETCH,
+    CADENCE_ALERT_FACTOR,
+    CADENCE_ALERT_WINDOW,
+)
+
+logger = logging.getLogger("AcousticGuardian")
+
+
+class EnergyGate:
+    """
+    Skips the feature and model path for windows below an energy threshold
+    """
+
+    def __init__(self, threshold_dbfs=ENERGY_GATE_DBFS):
+        """
+        Args:
+            threshold_dbfs (float): RMS level below which a window is gated
+        """
+        self.threshold_dbfs = threshold_dbfs
+        # Compare mean power directly so no logarithm is needed per window
+        self._threshold_power = 10 ** (threshold_dbfs / 10)
+        self.passed = 0
+        self.gated = 0
+
+    def passes(self, window):
+        """
+        Decide whether a window is loud enough to analyse
+
+        Args:
+            window (np.ndarray): Float samples in -1.0..1.0
+
+        Returns:
+            bool: True if the window should go through the full path
+        """
+        power = float(window.dot(window)) / len(window) if len(window) else 0.0
+        if power >= self._threshold_power:
+            self.passed += 1
+            return True
+        self.gated += 1
+        return False
+
+    @staticmethod
+    def level(window):
+        """
+        RMS level of a window, on the same scale as the gate threshold
+
+        Only taken for windows that reach the model, so the logarithm is
+        not paid for the quiet windows the gate drops.
+
+        Args:
+            window (np.ndarray): Float samples in -1.0..1.0
+
+        Returns:
+            float: Level in dBFS, or -200.0 for silence
+        """
+        power = float(window.dot(window)) / len(window) if len(window) else 0.0
+        return 10 * math.log10(power) if power > 1e-20 else -200.0
+
+
+class AdaptiveCadence:
+    """
+    Period for a periodic task, scaled by battery level and recent detections
+    """
+
+    def __init__(self, base_period, battery_normal=BATTERY_NORMAL_LEVEL, battery_critical=BATTERY_CRITICAL_LEVEL,
+                 max_stretch=CADENCE_MAX_STRETCH, alert_factor=CADENCE_ALERT_FACTOR,
+                 alert_window=CADENCE_ALERT_WINDOW):
+        """
+        Args:
+            base_period (float): Period in seconds on a healthy battery with no recent detection
+            battery_normal (float): Battery percentage at or above which the period is not stretched
+            battery_critical (float): Battery percentage at which the stretch reaches max_stretch
+            max_stretch (float): Largest multiple of the base period
+            alert_factor (float): Multiple applied while a detection is recent
+            alert_window (float): Seconds after a detection that count as recent
+        """
+        if battery_critical >= battery_normal:
+            raise ValueError("battery_critical must be below battery_normal")
+        self.base_period = base_period
+        self.battery_normal = battery_normal
+        self.battery_critical = battery_critical
+        self.max_stretch = max_stretch
+        self.alert_factor = alert_factor
+        self.alert_window = alert_window
+
+    def battery_stretch(self, battery_level):
+        """
+        Multiple of the base period for a battery level
+
+        Args:
+            battery_level (float): Battery percentage, or None if unknown
+
+        Returns:
+            float: 1.0 on a healthy battery, rising linearly to max_stretch at the critical level
+        """
+        if battery_level is None or battery_level >= self.battery_normal:
+            return 1.0
+        depletion = (self.battery_normal - battery_level) / (self.battery_normal - self.battery_critical)
+        return 1.0 + (self.max_stretch - 1.0) * min(1.0, depletion)
+
+    def period(self, battery_level=None, seconds_since_detection=None):
+        """
+        Current period
+
+        A recent detection tightens the period even on a low battery, but
+        the two combine, so a critical node reporting an event still runs
+        no faster than its base period.
+
+        Args:
+            battery_level (float): Battery percentage, or None if unknown
+            seconds_since_detection (float): Seconds since the last positive window, or None
+
+        Returns:
+            float: Seconds until the next run
+        """
+        period = self.base_period * self.battery_stretch(battery_level)
+        if seconds_since_detection is not None and seconds_since_detection < self.alert_window:
+            period *= self.alert_factor
+        return period
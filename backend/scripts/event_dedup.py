@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Detection Dedup
+
+Server-side stage on the ingest gateway's write path that stores one
+acoustic_guardian row per chainsaw instead of one per node that heard it.
+The fusion stage (event_fusion.py) still sees every node's detection and
+records which nodes heard it in the fused_detection point; dedup only
+decides which raw rows reach storage.
+
+A chainsaw detection is keyed on its spatial cell, a square of
+GATEWAY_DEDUP_CELL metres on the node's position, and its time bucket of
+GATEWAY_DEDUP_BUCKET seconds. The first detection of a key is stored. A
+later one of the same key is a duplicate, counted and dropped. So is one
+within a cell's width and a bucket's time of the first detection of a
+neighbouring key, in the eight cells around and the buckets either side,
+so a chainsaw near a cell or bucket edge is not stored twice.
+
+Seen keys are held in a time wheel: one dict of cells per bucket, for the
+GATEWAY_DEDUP_HORIZON buckets before the gateway clock's. As the clock
+moves into a new bucket, the buckets that fall off the wheel are dropped
+whole. Detections older than the wheel are stored unchecked, and those
+stamped ahead of the clock by more than a bucket are never keyed. Memory
+follows the number of cells with detections in the horizon, and never
+passes GATEWAY_DEDUP_MAX_KEYS: past that, the oldest bucket is dropped
+early.
+
+Usage:
+    python benchmark_event_dedup.py
+"""
+
+import math
+import time
+import logging
+import threading
+
+from rpi_config import GATEWAY_DEDUP_CELL, GATEWAY_DEDUP_BUCKET, GATEWAY_DEDUP_HORIZON, GATEWAY_DEDUP_MAX_KEYS
+from event_fusion import METRES_PER_DEGREE, gps_position
+
+logger = logging.getLogger("AcousticGuardian")
+
+_NEIGHBOURS = tuple((dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1))
+
+
+class DetectionDedup:
+    """
+    Drops chainsaw detections of a spatial cell and time bucket already seen
+    """
+
+    def __init__(self, cell=GATEWAY_DEDUP_CELL, bucket=GATEWAY_DEDUP_BUCKET, horizon=GATEWAY_DEDUP_HORIZON,
+                 max_keys=GATEWAY_DEDUP_MAX_KEYS, clock=time.time):
+        """
+        Args:
+            cell (float): Metres per side of a spatial cell
+            bucket (int): Seconds per time bucket
+            horizon (int): Buckets held before the current one
+            max_keys (int): Most cells held across all buckets
+            clock (callable): Time source that moves the wheel on
+        """
+        if cell <= 0 or bucket <= 0 or horizon < 1 or max_keys < 1:
+            raise ValueError("cell, bucket, horizon and max_keys must be positive")
+        self.cell = cell
+        self.bucket = bucket
+        self.horizon = horizon
+        self.max_keys = max_keys
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        # Time bucket -> cell (row, column) -> (timestamp, y, x) of its first detection
+        self._wheel = {}
+        self._current = None
+        self._keys = 0
+
+        self.checked = 0
+        self.duplicates = 0
+        self.unchecked = 0
+        self.evicted = 0
+
+    def _turn(self, current):
+        """Move the wheel to the current bucket, dropping the buckets that fall off it"""
+        self._current = current
+        for bucket in [bucket for bucket in self._wheel if bucket < current - self.horizon]:
+            self._keys -= len(self._wheel.pop(bucket))
+
+    def check(self, lat, lng, timestamp):
+        """
+        Key one detection and say whether its key has been seen
+
+        Args:
+            lat (float): Latitude of the node
+            lng (float): Longitude of the node
+            timestamp (int): Seconds since the epoch
+
+        Returns:
+            bool: True if it duplicates a detection already stored
+        """
+        bucket = int(timestamp // self.bucket)
+        y = lat * METRES_PER_DEGREE
+        x = lng * METRES_PER_DEGREE * math.cos(math.radians(lat))
+        row = math.floor(y / self.cell)
+        column = math.floor(x / self.cell)
+        current = int(self.clock() // self.bucket)
+
+        with self._lock:
+            if current != self._current:
+                self._turn(current)
+            if not current - self.horizon <= bucket <= current + 1:
+                self.unchecked += 1
+                return False
+            self.checked += 1
+            wheel = self._wheel
+            cells = wheel.get(bucket)
+            if cells is not None and (row, column) in cells:
+                self.duplicates += 1
+                return True
+            reach = self.cell * self.cell
+            for near in (bucket, bucket - 1, bucket + 1):
+                near_cells = wheel.get(near)
+                if not near_cells:
+                    continue
+                for dy, dx in _NEIGHBOURS:
+                    first = near_cells.get((row + dy, column + dx))
+                    if (first is not None and abs(timestamp - first[0]) <= self.bucket
+                            and (y - first[1]) ** 2 + (x - first[2]) ** 2 <= reach):
+                        self.duplicates += 1
+                        return True
+
+            if cells is None:
+                cells = wheel[bucket] = {}
+            cells[(row, column)] = (timestamp, y, x)
+            self._keys += 1
+            if self._keys > self.max_keys:
+                # A burst beyond the cap: forget the oldest bucket early
+                oldest = min(wheel)
+                dropped = len(wheel.pop(oldest))
+                self._keys -= dropped
+                self.evicted += dropped
+                logger.debug(f"Dedup key cap reached, dropped {dropped} keys of bucket {oldest}")
+            return False
+
+    def duplicate(self, tags, fields, timestamp):
+        """
+        Whether a chainsaw detection duplicates one already stored
+
+        Args:
+            tags (dict): The point's tags
+            fields (dict): Its fields, with gps_coordinates
+            timestamp (int): Seconds since the epoch
+
+        Returns:
+            bool: True if it should not be stored; detections without a
+            position are always stored
+        """
+        position = gps_position(fields.get("gps_coordinates"))
+        if position is None:
+            with self._lock:
+                self.unchecked += 1
+            return False
+        return self.check(position[0], position[1], timestamp)
+
+    @property
+    def keys(self):
+        """Cells held across all buckets"""
+        return self._keys
+
+    def stats(self):
+        """Counts for monitoring"""
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "unchecked": self.unchecked,
+                "evicted": self.evicted,
+                "keys": self._keys,
+                "buckets": len(self._wheel),
+            }
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Detection Fusion
+
+Server-side stage on the ingest gateway's write path that turns the
+detections of one chainsaw, heard by several nodes, into one event with an
+estimated source location, instead of one alert per node at the node's
+own coordinates.
+
+Grouping: each chainsaw detection (an acoustic_guardian point with
+threat_detected) joins the nearest open cluster whose first detection is
+within GATEWAY_FUSION_RADIUS metres and GATEWAY_FUSION_WINDOW seconds of
+it, or opens a new one. Open clusters are kept in a grid of cells one
+radius wide, so a detection only looks at the clusters of its own and the
+eight neighbouring cells, however many are open across the fleet. A
+cluster closes GATEWAY_FUSION_WINDOW seconds after it opened, and its
+detections are fused then.
+
+Location: nodes may report the onset's arrival time (arrival_time, Unix
+seconds with sub-second precision from the GPS clock) and the sound level
+(sound_level, dB). The source at (x, y) is heard at node i at
+
+    t_i = t0 + d_i / SPEED_OF_SOUND
+    L_i = L0 - 20 log10(d_i)
+
+with d_i the distance from the source and t0, L0 unknown. With three or
+more nodes reporting either, the position is the least-squares fit of
+both, weighted by ARRIVAL_SIGMA and LEVEL_SIGMA, found with
+Levenberg-Marquardt steps. Every cluster closed together is solved at
+once: the Jacobians and normal equations are stacked arrays and each
+step is one batched np.linalg.solve, so there is no Python code per
+cluster in the iterations. Fewer nodes, or a fit that strays more than a
+radius from the nodes, give the confidence-weighted centroid of the nodes
+instead.
+
+Fused events are written as the fused_detection measurement, tagged with
+the node that heard the chainsaw first (or most confidently), and carry
+the estimate in gps_coordinates with its standard error in metres.
+
+Usage:
+    python benchmark_event_fusion.py
+"""
+
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+from rpi_config import GATEWAY_FUSION_WINDOW, GATEWAY_FUSION_RADIUS
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Measurement that fused events are written as
+FUSED_MEASUREMENT = "fused_detection"
+
+# Metres per degree of latitude, and of longitude at the equator
+METRES_PER_DEGREE = 111320.0
+
+SPEED_OF_SOUND = 343.0  # m/s in air at 20 C
+
+# Expected error of a reported arrival time (s) and sound level (dB)
+ARRIVAL_SIGMA = 0.02
+LEVEL_SIGMA = 3.0
+
+# Distance below which a node counts as at the source, so levels stay finite
+NEAR_FIELD = 1.0
+
+# Nodes of a cluster used in the fit, the most confident first
+MAX_NODES = 16
+
+# Most Levenberg-Marquardt steps per fit, and the step in metres below
+# which a fit has converged
+ITERATIONS = 25
+TOLERANCE = 0.01
+
+# dB per natural log of distance for spherical spreading, 20 log10(d)
+_SPREADING = 20.0 / math.log(10.0)
+
+
+def gps_position(gps_coordinates):
+    """(latitude, longitude) of a "lat,lng" string, or None if missing or 0,0"""
+    try:
+        lat, lng = (float(part) for part in gps_coordinates.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if lat == 0.0 and lng == 0.0:
+        return None
+    return lat, lng
+
+
+def _distance(lat1, lng1, lat2, lng2):
+    """Metres between two nearby points, on a local flat projection"""
+    dy = (lat2 - lat1) * METRES_PER_DEGREE
+    dx = (lng2 - lng1) * METRES_PER_DEGREE * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(dx, dy)
+
+
+def multilaterate(positions, arrivals, levels, initial, iterations=ITERATIONS):
+    """
+    Least-squares source positions of many clusters at once
+
+    Args:
+        positions (np.ndarray): (clusters, nodes, 2) node x and y in metres
+        arrivals (np.ndarray): (clusters, nodes) arrival times in seconds,
+            NaN where unknown or for padding
+        levels (np.ndarray): (clusters, nodes) sound levels in dB, NaN where
+            unknown or for padding
+        initial (np.ndarray): (clusters, 2) starting x and y
+        iterations (int): Most Levenberg-Marquardt steps
+
+    Returns:
+        tuple: ((clusters, 2) source x and y; (clusters,) standard error of
+        the position in metres)
+    """
+    count = len(initial)
+    has_time = ~np.isnan(arrivals)
+    has_level = ~np.isnan(levels)
+    times = np.where(has_time, arrivals, 0.0)
+    decibels = np.where(has_level, levels, 0.0)
+    time_weight = has_time / ARRIVAL_SIGMA
+    level_weight = has_level / LEVEL_SIGMA
+    node_x, node_y = positions[..., 0], positions[..., 1]
+    zeros = np.zeros_like(times)
+    ones = np.ones_like(times)
+    diagonal = np.arange(4)
+
+    def residuals(theta):
+        dx = theta[:, 0, None] - node_x
+        dy = theta[:, 1, None] - node_y
+        d = np.sqrt(dx * dx + dy * dy + NEAR_FIELD ** 2)
+        time_residual = (times - theta[:, 2, None] - d / SPEED_OF_SOUND) * time_weight
+        level_residual = (decibels - theta[:, 3, None] + _SPREADING * np.log(d)) * level_weight
+        cost = (time_residual ** 2).sum(axis=1) + (level_residual ** 2).sum(axis=1)
+        return dx, dy, d, np.concatenate([time_residual, level_residual], axis=1), cost
+
+    def normal_equations(dx, dy, d, residual):
+        jacobian = np.concatenate([
+            np.stack([-dx / (d * SPEED_OF_SOUND), -dy / (d * SPEED_OF_SOUND), -ones, zeros], axis=-1)
+            * time_weight[..., None],
+            np.stack([_SPREADING * dx / d ** 2, _SPREADING * dy / d ** 2, zeros, -ones], axis=-1)
+            * level_weight[..., None],
+        ], axis=1)
+        return (np.einsum("cmi,cmj->cij", jacobian, jacobian),
+                np.einsum("cmi,cm->ci", jacobian, residual))
+
+    # Start from the given position, with the onset time and source level
+    # that fit it best
+    d = np.sqrt((initial[:, 0, None] - node_x) ** 2 + (initial[:, 1, None] - node_y) ** 2 + NEAR_FIELD ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t0 = np.nan_to_num(((times - d / SPEED_OF_SOUND) * has_time).sum(axis=1) / has_time.sum(axis=1))
+        l0 = np.nan_to_num(((decibels + _SPREADING * np.log(d)) * has_level).sum(axis=1) / has_level.sum(axis=1))
+    theta = np.column_stack([initial, t0, l0])
+    dx, dy, d, residual, cost = residuals(theta)
+    damping = np.full(count, 1e-3)
+
+    for _ in range(iterations):
+        matrix, gradient = normal_equations(dx, dy, d, residual)
+        damped = matrix.copy()
+        # Parameters no node informs (t0 without arrival times, L0 without
+        # levels) have a zero row; the small constant keeps the system solvable
+        damped[:, diagonal, diagonal] += damping[:, None] * matrix[:, diagonal, diagonal] + 1e-9
+        step = np.linalg.solve(damped, -gradient[..., None])[..., 0]
+        trial = theta + step
+        trial_dx, trial_dy, trial_d, trial_residual, trial_cost = residuals(trial)
+        better = trial_cost < cost
+        theta = np.where(better[:, None], trial, theta)
+        dx = np.where(better[:, None], trial_dx, dx)
+        dy = np.where(better[:, None], trial_dy, dy)
+        d = np.where(better[:, None], trial_d, d)
+        residual = np.where(better[:, None], trial_residual, residual)
+        cost = np.where(better, trial_cost, cost)
+        damping = np.clip(np.where(better, damping * 0.3, damping * 10.0), 1e-9, 1e9)
+        if (np.abs(step[:, :2]) < TOLERANCE).all():
+            break
+
+    matrix, _ = normal_equations(dx, dy, d, residual)
+    matrix[:, diagonal, diagonal] += 1e-9
+    covariance = np.linalg.inv(matrix)
+    measurements = has_time.sum(axis=1) + has_level.sum(axis=1)
+    parameters = 2 + has_time.any(axis=1) + has_level.any(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = np.where(measurements > parameters, cost / (measurements - parameters), 1.0)
+    error = np.sqrt(np.maximum(variance * (covariance[:, 0, 0] + covariance[:, 1, 1]), 0.0))
+    return theta[:, :2], error
+
+
+class _Cluster:
+    """Detections of one sound: nodes near the first that reported it, within the window"""
+
+    def __init__(self, detection, cell, opened):
+        self.time = detection[6]
+        self.lat = detection[1]
+        self.lng = detection[2]
+        self.cell = cell
+        self.opened = opened
+        # Device ID -> (device, lat, lng, confidence, arrival, level, timestamp, location)
+        self.detections = {detection[0]: detection}
+
+
+class DetectionFusion:
+    """
+    Groups chainsaw detections from nearby nodes and fuses each group into one located event
+    """
+
+    def __init__(self, window=GATEWAY_FUSION_WINDOW, radius=GATEWAY_FUSION_RADIUS, clock=time.time):
+        """
+        Args:
+            window (float): Seconds between detections of one sound, and
+                that a cluster stays open for
+            radius (float): Max metres between the nodes of a cluster
+            clock (callable): Time source for closing clusters
+        """
+        if window <= 0 or radius <= 0:
+            raise ValueError("window and radius must be positive")
+        self.window = window
+        self.radius = radius
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        # Grid cell -> open clusters whose first node is in it
+        self._cells = {}
+        # Open clusters, oldest first
+        self._open = deque()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.detections = 0
+        self.unplaced = 0
+        self.repeats = 0
+        self.events = 0
+        self.located = 0
+
+    def _cell(self, lat, lng):
+        y = lat * METRES_PER_DEGREE
+        x = lng * METRES_PER_DEGREE * math.cos(math.radians(lat))
+        return math.floor(y / self.radius), math.floor(x / self.radius)
+
+    def add(self, tags, fields, timestamp):
+        """
+        Add one detection to the cluster of its sound
+
+        Args:
+            tags (dict): The point's tags, with device_id
+            fields (dict): Its fields: gps_coordinates, and optionally
+                confidence, arrival_time and sound_level
+            timestamp (int): Seconds since the epoch
+
+        Returns:
+            bool: False if the detection has no position and cannot be fused
+        """
+        position = gps_position(fields.get("gps_coordinates"))
+        if position is None:
+            self.unplaced += 1
+            return False
+        lat, lng = position
+        device = tags["device_id"]
+        detection = (device, lat, lng, float(fields.get("confidence", 0.0)), fields.get("arrival_time"),
+                     fields.get("sound_level"), timestamp, tags.get("location"))
+        row, column = self._cell(lat, lng)
+        opened = self.clock()
+
+        with self._lock:
+            self.detections += 1
+            nearest = None
+            nearest_distance = self.radius
+            for cell in ((row + dy, column + dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1)):
+                for cluster in self._cells.get(cell, ()):
+                    if abs(timestamp - cluster.time) > self.window:
+                        continue
+                    distance = _distance(lat, lng, cluster.lat, cluster.lng)
+                    if distance <= nearest_distance:
+                        nearest, nearest_distance = cluster, distance
+            if nearest is None:
+                cluster = _Cluster(detection, (row, column), opened)
+                self._cells.setdefault(cluster.cell, []).append(cluster)
+                self._open.append(cluster)
+            elif device in nearest.detections:
+                # The same node again, e.g. a resent event: keep its first report
+                self.repeats += 1
+                if timestamp < nearest.detections[device][6]:
+                    nearest.detections[device] = detection
+            else:
+                nearest.detections[device] = detection
+        return True
+
+    def flush(self, now=None):
+        """
+        Close the clusters that have been open for the window and fuse them
+
+        Args:
+            now (float): Current time, or None for the clock; math.inf closes every cluster
+
+        Returns:
+            list: (measurement, tags, fields, timestamp) of each fused event
+        """
+        now = self.clock() if now is None else now
+        closed = []
+        with self._lock:
+            while self._open and self._open[0].opened + self.window <= now:
+                cluster = self._open.popleft()
+                cell = self._cells[cluster.cell]
+                cell.remove(cluster)
+                if not cell:
+                    del self._cells[cluster.cell]
+                closed.append(cluster)
+        if not closed:
+            return []
+        events = self.fuse(closed)
+        self.events += len(events)
+        return events
+
+    def fuse(self, clusters):
+        """
+        One located event per cluster
+
+        Args:
+            clusters (list): Closed clusters
+
+        Returns:
+            list: (measurement, tags, fields, timestamp) of each event
+        """
+        count = len(clusters)
+        width = min(MAX_NODES, max(len(cluster.detections) for cluster in clusters))
+        lat = np.zeros((count, width))
+        lng = np.zeros((count, width))
+        confidence = np.zeros((count, width))
+        arrivals = np.full((count, width), np.nan)
+        levels = np.full((count, width), np.nan)
+        present = np.zeros((count, width), dtype=bool)
+        nodes = []
+        for row, cluster in enumerate(clusters):
+            detections = sorted(cluster.detections.values(), key=lambda detection: -detection[3])[:width]
+            size = len(detections)
+            _, lats, lngs, confidences, times, decibels, _, _ = zip(*detections)
+            lat[row, :size] = lats
+            lng[row, :size] = lngs
+            confidence[row, :size] = confidences
+            arrivals[row, :size] = [np.nan if value is None else value for value in times]
+            levels[row, :size] = [np.nan if value is None else value for value in decibels]
+            present[row, :size] = True
+            nodes.append(detections)
+
+        # Metres east and north of each cluster's most confident node
+        origin_lat, origin_lng = lat[:, 0], lng[:, 0]
+        scale = METRES_PER_DEGREE * np.cos(np.radians(origin_lat))
+        positions = np.stack([(lng - origin_lng[:, None]) * scale[:, None],
+                              (lat - origin_lat[:, None]) * METRES_PER_DEGREE], axis=-1)
+        positions[~present] = 0.0
+        # Arrival times relative to each cluster's first, for precision
+        first = np.min(np.where(np.isnan(arrivals), np.inf, arrivals), axis=1)
+        arrivals = arrivals - np.where(np.isfinite(first), first, 0.0)[:, None]
+
+        weights = np.maximum(confidence, 1e-3) * present
+        weights /= weights.sum(axis=1, keepdims=True)
+        centroid = np.einsum("cn,cni->ci", weights, positions)
+        spread = np.sqrt(np.einsum("cn,cn->c", weights, ((positions - centroid[:, None]) ** 2).sum(axis=-1)))
+        source, error = centroid, spread
+        located = (~np.isnan(arrivals) | ~np.isnan(levels)).sum(axis=1) >= 3
+        if located.any():
+            fitted, fitted_error = multilaterate(positions[located], arrivals[located], levels[located],
+                                                 centroid[located])
+            # A fit far outside the nodes is a bad solve, e.g. from nodes in a line
+            sane = np.isfinite(fitted).all(axis=1) & (np.hypot(*(fitted - centroid[located]).T) <= self.radius)
+            rows = np.flatnonzero(located)[sane]
+            source = centroid.copy()
+            error = spread.copy()
+            source[rows] = fitted[sane]
+            error[rows] = fitted_error[sane]
+            located[:] = False
+            located[rows] = True
+        self.located += int(located.sum())
+
+        source_lat = origin_lat + source[:, 1] / METRES_PER_DEGREE
+        source_lng = origin_lng + source[:, 0] / scale
+        events = []
+        for row, cluster in enumerate(clusters):
+            detections = nodes[row]
+            # Reported by the node that heard it first, else the most confident
+            heard = [detection for detection in detections if detection[4] is not None]
+            reporter = min(heard, key=lambda detection: detection[4]) if heard else detections[0]
+            tags = {"device_id": reporter[0]}
+            if reporter[7] is not None:
+                tags["location"] = reporter[7]
+            size = len(cluster.detections)
+            fields = {
+                "gps_coordinates": f"{source_lat[row]:.6f},{source_lng[row]:.6f}",
+                "threat_type": "chainsaw",
+                "confidence": max(detection[3] for detection in cluster.detections.values()),
+                "nodes": size,
+                "devices": ",".join(sorted(cluster.detections)),
+                "error_m": round(float(error[row]), 1),
+                "method": "multilateration" if located[row] else "centroid" if size > 1 else "single",
+            }
+            first = min(detection[6] for detection in cluster.detections.values())
+            events.append((FUSED_MEASUREMENT, tags, fields, int(first)))
+        return events
+
+    def start(self, emit, interval=1.0):
+        """
+        Close and fuse clusters on a background thread
+
+        Args:
+            emit (callable): Called with each non-empty list of fused events
+            interval (float): Seconds between checks
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(emit, interval), name="fusion", daemon=True)
+        self._thread.start()
+
+    def _run(self, emit, interval):
+        while not self._stop.wait(interval):
+            try:
+                events = self.flush()
+                if events:
+                    emit(events)
+            except Exception as e:
+                logger.error(f"Detection fusion failed: {e}")
+
+    def stop(self):
+        """
+        Stop the background thread
+
+        Returns:
+            list: Events of the clusters still open, fused now
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.flush(math.inf)
+
+    def stats(self):
+        """Counts for monitoring"""
+        with self._lock:
+            open_clusters = len(self._open)
+        return {
+            "detections": self.detections,
+            "unplaced": self.unplaced,
+            "repeats": self.repeats,
+            "events": self.events,
+            "located": self.located,
+            "open": open_clusters,
+        }
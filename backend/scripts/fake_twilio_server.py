@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Fake Twilio server for testing SMS alerts
+
+Accepts the Twilio REST "create message" call on a local port and records
+each message instead of sending it. It can fail the first N requests with a
+chosen status to exercise retries. Point a node at it with
+TWILIO_API_URL=http://127.0.0.1:<port>.
+
+Usage:
+    python fake_twilio_server.py --port 8089
+    python fake_twilio_server.py --port 8089 --fail-first 2 --fail-status 503
+"""
+
+import re
+import json
+import time
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MESSAGES_PATH = re.compile(r"^/2010-04-01/Accounts/([^/]+)/Messages\.json$")
+
+
+class FakeTwilioServer:
+    """
+    Records messages posted to the Twilio Messages endpoint
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, fail_first=0, fail_status=503, retry_after=None, echo=False):
+        """
+        Args:
+            host (str): Bind address
+            port (int): TCP port; 0 picks a free port
+            fail_first (int): Number of initial requests to fail
+            fail_status (int): HTTP status returned for failed requests
+            retry_after (float): Retry-After header sent with failures, if any
+            echo (bool): Print each message as it arrives
+        """
+        self.host = host
+        self.port = port
+        self.fail_remaining = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.echo = echo
+        self.messages = []
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to use as TWILIO_API_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    def _handle(self, handler):
+        match = MESSAGES_PATH.match(handler.path)
+        if handler.command != "POST" or not match:
+            return 404, {"code": 20404, "message": "The requested resource was not found"}, {}
+        if "Authorization" not in handler.headers:
+            return 401, {"code": 20003, "message": "Authenticate"}, {}
+
+        length = int(handler.headers.get("Content-Length", 0))
+        form = parse_qs(handler.rfile.read(length).decode("utf-8"))
+        with self._lock:
+            self.requests += 1
+            if self.fail_remaining > 0:
+                self.fail_remaining -= 1
+                headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+                return self.fail_status, {"code": 20500, "message": "Simulated failure"}, headers
+            message = {
+                "sid": f"SM{len(self.messages) + 1:032x}",
+                "account_sid": match.group(1),
+                "to": form.get("To", [""])[0],
+                "from": form.get("From", [""])[0],
+                "body": form.get("Body", [""])[0],
+                "status": "queued",
+                "received": time.time(),
+            }
+            self.messages.append(message)
+        if self.echo:
+            print(f"SMS to {message['to']}: {message['body']}")
+        return 201, message, {}
+
+    def start(self):
+        """Start serving in a background thread"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                status, payload, headers = fake._handle(self)
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_POST = _respond
+            do_GET = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-twilio", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Twilio Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--fail-first", type=int, default=0, help="Fail this many requests before accepting")
+    parser.add_argument("--fail-status", type=int, default=503, help="Status code for failed requests")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After header for failures")
+    args = parser.parse_args()
+
+    server = FakeTwilioServer(args.host, args.port, args.fail_first, args.fail_status, args.retry_after, echo=True)
+    server.start()
+    print(f"Fake Twilio listening on {server.url} (set TWILIO_API_URL to this)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
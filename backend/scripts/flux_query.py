@@ -0,0 +1,907 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Flux Query Engine
+
+Runs the Flux queries the dashboards use against the embedded store
+(ts_store.py), so they work as written on rigs without InfluxDB. The
+subset:
+
+    from(bucket: "acoustic-guardian")
+      |> range(start: -1h, stop: now())
+      |> filter(fn: (r) => r._measurement == "device_status" and r.device_id == "AG-001")
+      |> group(columns: ["location"])
+      |> aggregateWindow(every: 1h, fn: mean, createEmpty: false)
+      |> last()
+      |> count()
+
+range() takes durations (-1h30m), RFC3339 times, dates, Unix seconds and
+now(). filter() predicates compare r.<column> with literals using ==, !=,
+<, <=, > and >=, combined with and, or, not and parentheses. aggregateWindow
+takes fn mean, sum, count, min, max, first or last, and group() takes
+columns and mode "by" or "except". yield() is accepted and does nothing.
+
+A query is parsed into a plan (FluxQuery). The filters straight after
+range() are split at their top-level ands. Tests of _measurement,
+device_id and _field, possibly or-ed, become the scan's measurements,
+devices and columns, and range() its time bounds. Tests of other tags, such
+as location, are looked up in the store's tag index. Only matching
+partitions, device chunks and columns are read. The rest of the predicate and the
+later stages run as NumPy operations over whole columns, with no Python
+code per row.
+
+Results come as from InfluxDB with fields as columns (schema.fieldsAsCols()):
+one pandas DataFrame with _time, _measurement, device_id and the other
+tags, then a column per field. In predicates, r.<field> is that field's
+value in the row, as the dashboards write it, and r._value is the field
+selected by r._field. As in Flux, stages work per series (measurement and
+tags) unless group() sets other columns. aggregateWindow() stamps each
+window with its end, and count() and aggregateWindow() keep the group
+columns only.
+
+Usage:
+    python flux_query.py 'from(bucket: "acoustic-guardian") |> range(start: -1h) |> last()'
+    python flux_query.py --plan -f query.flux
+"""
+
+import re
+import sys
+import math
+import time
+import logging
+import argparse
+import calendar
+import operator
+
+import numpy as np
+
+from rpi_config import STORE_DIR
+from ts_store import MEASUREMENTS, ROLLUPS, SERIES_TAGS, TimeSeriesStore
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Seconds per duration unit
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+# Tags besides device_id whose tests are looked up in the store's tag index
+INDEXED_TAGS = tuple(sorted({name for tags in SERIES_TAGS.values() for name in tags}))
+
+# aggregateWindow() functions
+WINDOW_FUNCTIONS = ("mean", "sum", "count", "min", "max", "first", "last")
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|//[^\n]*)
+  | (?P<time>\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2}))?)
+  | (?P<duration>(?:\d+[a-z]+)+)
+  | (?P<number>\d+(?:\.\d*)?)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>\|>|=>|==|!=|<=|>=|[<>()\[\],:.\-])
+""", re.VERBOSE)
+_DURATION_PART = re.compile(r"(\d+)([a-z]+)")
+
+_COMPARE = {
+    "==": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+_FLIPPED = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+# Arguments each function accepts
+_ARGUMENTS = {
+    "from": {"bucket"},
+    "range": {"start", "stop"},
+    "filter": {"fn"},
+    "group": {"columns", "mode"},
+    "aggregateWindow": {"every", "fn", "createEmpty"},
+    "last": set(),
+    "count": set(),
+    "yield": {"name"},
+}
+
+
+class Duration:
+    """A Flux duration literal, in seconds"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __neg__(self):
+        return Duration(-self.seconds)
+
+    def __repr__(self):
+        return f"Duration({self.seconds})"
+
+
+class Now:
+    """now(), resolved when the query runs"""
+
+    def __repr__(self):
+        return "now()"
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"unexpected {text[position:position + 10]!r} at {position}")
+        position = match.end()
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+    tokens.append(("end", ""))
+    return tokens
+
+
+def _parse_time(text):
+    """Seconds since the epoch of an RFC3339 time or a date"""
+    seconds = calendar.timegm(time.strptime(text[:19], "%Y-%m-%dT%H:%M:%S" if "T" in text else "%Y-%m-%d"))
+    zone = text[19:].split(".", 1)[-1].lstrip("0123456789") if "T" in text else "Z"
+    if zone not in ("Z", ""):
+        sign = 1 if zone[0] == "+" else -1
+        seconds -= sign * (int(zone[1:3]) * 3600 + int(zone[4:6]) * 60)
+    return seconds
+
+
+def _parse_duration(text):
+    seconds = 0
+    for count, unit in _DURATION_PART.findall(text):
+        if unit not in DURATION_UNITS:
+            raise ValueError(f"duration unit {unit} is not supported; use s, m, h, d or w")
+        seconds += int(count) * DURATION_UNITS[unit]
+    return Duration(seconds)
+
+
+class _Parser:
+    """Recursive descent over the tokens of a query"""
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+        # Parameter name of the function being parsed, e.g. r
+        self.row = None
+
+    def peek(self, offset=0):
+        return self.tokens[self.position + offset]
+
+    def next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def accept(self, text):
+        if self.peek()[1] == text and self.peek()[0] in ("op", "name"):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            kind, found = self.peek()
+            raise ValueError(f"expected {text!r}, found {found or kind!r}")
+
+    def name(self):
+        kind, text = self.next()
+        if kind != "name":
+            raise ValueError(f"expected a name, found {text or kind!r}")
+        return text
+
+    def pipeline(self):
+        """[(function, arguments)] of the query, in order"""
+        calls = [self.call()]
+        while self.accept("|>"):
+            calls.append(self.call())
+        if self.peek()[0] != "end":
+            raise ValueError(f"unexpected {self.peek()[1]!r} after {calls[-1][0]}()")
+        return calls
+
+    def call(self):
+        function = self.name()
+        if function not in _ARGUMENTS:
+            raise ValueError(f"{function}() is not supported")
+        self.expect("(")
+        arguments = {}
+        while not self.accept(")"):
+            if arguments:
+                self.expect(",")
+            key = self.name()
+            if key not in _ARGUMENTS[function]:
+                raise ValueError(f"{function}() has no argument {key}")
+            self.expect(":")
+            arguments[key] = self.value()
+        return function, arguments
+
+    def value(self):
+        kind, text = self.peek()
+        if text == "(" and kind == "op":
+            return self.function()
+        if text == "[" and kind == "op":
+            self.next()
+            values = []
+            while not self.accept("]"):
+                if values:
+                    self.expect(",")
+                values.append(self.value())
+            return values
+        if text == "now" and self.peek(1)[1] == "(":
+            self.next()
+            self.expect("(")
+            self.expect(")")
+            return Now()
+        return self.literal()
+
+    def literal(self):
+        kind, text = self.next()
+        if kind == "op" and text == "-":
+            value = self.literal()
+            if isinstance(value, (bool, str)) or not isinstance(value, (int, float, Duration)):
+                raise ValueError(f"cannot negate {value!r}")
+            return -value
+        if kind == "string":
+            return re.sub(r"\\(.)", r"\1", text[1:-1])
+        if kind == "number":
+            return float(text) if "." in text else int(text)
+        if kind == "duration":
+            return _parse_duration(text)
+        if kind == "time":
+            return _parse_time(text)
+        if kind == "name" and text in ("true", "false"):
+            return text == "true"
+        if kind == "name":
+            # A function name such as mean
+            return text
+        raise ValueError(f"unexpected {text or kind!r}")
+
+    def function(self):
+        """(r) => predicate, as a predicate tree"""
+        self.expect("(")
+        row = self.name()
+        self.expect(")")
+        self.expect("=>")
+        self.row = row
+        return self.disjunction()
+
+    def disjunction(self):
+        node = self.conjunction()
+        while self.accept("or"):
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.accept("and"):
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.accept("not"):
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        if self.accept("("):
+            node = self.disjunction()
+            self.expect(")")
+            return node
+        left = self.operand()
+        op = self.peek()[1] if self.peek()[0] == "op" else None
+        if op not in _COMPARE:
+            if left[0] == "column":
+                return ("compare", "==", left[1], True)
+            if isinstance(left[1], bool):
+                return ("constant", left[1])
+            raise ValueError(f"{left[1]!r} is not a condition")
+        self.next()
+        right = self.operand()
+        if left[0] == "value" and right[0] == "column":
+            left, right, op = right, left, _FLIPPED[op]
+        if left[0] != "column" or right[0] != "value":
+            raise ValueError("a comparison needs one column and one literal")
+        return ("compare", op, left[1], right[1])
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == "name" and text == self.row:
+            self.next()
+            if self.accept("."):
+                return ("column", self.name())
+            self.expect("[")
+            kind, text = self.next()
+            if kind != "string":
+                raise ValueError(f"expected a column name, found {text!r}")
+            self.expect("]")
+            return ("column", text[1:-1])
+        return ("value", self.literal())
+
+
+def _equals_any(node, column):
+    """The literals a predicate tree tests column against with == (or-ed), or None if it does anything else"""
+    if node[0] == "compare" and node[1] == "==" and node[2] == column and isinstance(node[3], str):
+        return {node[3]}
+    if node[0] == "or":
+        left, right = _equals_any(node[1], column), _equals_any(node[2], column)
+        if left is not None and right is not None:
+            return left | right
+    return None
+
+
+def _conjuncts(node):
+    if node[0] == "and":
+        return _conjuncts(node[1]) + _conjuncts(node[2])
+    return [node]
+
+
+def _columns_of(node):
+    """Column names a predicate tree reads"""
+    if node[0] == "compare":
+        return {node[2]}
+    if node[0] == "constant":
+        return set()
+    return set().union(*map(_columns_of, node[1:]))
+
+
+def _rename(node, old, new):
+    if node[0] == "compare":
+        return node[:2] + (new if node[2] == old else node[2],) + node[3:]
+    if node[0] == "constant":
+        return node
+    return (node[0],) + tuple(_rename(child, old, new) for child in node[1:])
+
+
+def _resolve(bound, now):
+    """Seconds since the epoch of a range() bound"""
+    if isinstance(bound, Now):
+        return math.ceil(now)
+    if isinstance(bound, Duration):
+        return math.ceil(now + bound.seconds)
+    if isinstance(bound, (int, float)) and not isinstance(bound, bool):
+        return int(bound)
+    raise ValueError(f"range() bound {bound!r} is not a time")
+
+
+class FluxQuery:
+    """
+    A parsed query: what to scan, then the stages that run on the rows
+
+    Attributes:
+        bucket (str): Bucket named in from()
+        start, stop: range() bounds, resolved against the clock when the query runs
+        measurements (set): Measurements to read, or None for all but the
+            store's rollups, which are only read when named
+        devices (set): Device IDs to read, or None for all
+        fields (set): Fields to read, or None for all
+        tags (dict): Tag -> values to read, for tags in INDEXED_TAGS
+        predicate (tuple): What remains of the pushed-down filters, as a
+            tree, or None
+        stages (list): (function, arguments) run in order after the scan
+    """
+
+    def __init__(self, text):
+        """
+        Args:
+            text (str): Flux query
+
+        Raises:
+            ValueError: If the query is not in the subset
+        """
+        calls = _Parser(text).pipeline()
+        if calls[0][0] != "from" or len(calls) < 2 or calls[1][0] != "range":
+            raise ValueError("a query starts with from() |> range()")
+        if "start" not in calls[1][1]:
+            raise ValueError("range() needs a start")
+        self.bucket = calls[0][1].get("bucket")
+        self.start = calls[1][1]["start"]
+        self.stop = calls[1][1].get("stop", Now())
+        self.measurements = None
+        self.devices = None
+        self.fields = None
+        self.tags = {}
+        self.predicate = None
+
+        rest = calls[2:]
+        pushed = 0
+        residual = []
+        for function, arguments in rest:
+            if function != "filter":
+                break
+            pushed += 1
+            for node in _conjuncts(arguments["fn"]):
+                for column in ("_measurement", "device_id", "_field", *INDEXED_TAGS):
+                    values = _equals_any(node, column)
+                    if values is None:
+                        continue
+                    if column in INDEXED_TAGS:
+                        self.tags[column] = values & self.tags.get(column, values)
+                    else:
+                        attribute = {"_measurement": "measurements", "device_id": "devices", "_field": "fields"}[column]
+                        current = getattr(self, attribute)
+                        setattr(self, attribute, values if current is None else current & values)
+                    break
+                else:
+                    residual.append(node)
+        for node in residual:
+            self.predicate = node if self.predicate is None else ("and", self.predicate, node)
+        self.stages = []
+        for function, arguments in rest[pushed:]:
+            if function == "range" or function == "from":
+                raise ValueError(f"{function}() can only start a query")
+            self.stages.append((function, self._check(function, arguments)))
+        self.predicate = self._value_column(self.predicate)
+        self.stages = [
+            (function, dict(arguments, fn=self._value_column(arguments["fn"])) if function == "filter" else arguments)
+            for function, arguments in self.stages
+        ]
+
+    def _check(self, function, arguments):
+        if function == "aggregateWindow":
+            every = arguments.get("every")
+            if not isinstance(every, Duration) or every.seconds <= 0:
+                raise ValueError("aggregateWindow() needs every: a positive duration")
+            if arguments.get("fn") not in WINDOW_FUNCTIONS:
+                raise ValueError(f"aggregateWindow() fn must be one of {', '.join(WINDOW_FUNCTIONS)}")
+            arguments.setdefault("createEmpty", True)
+        elif function == "group":
+            columns = arguments.setdefault("columns", [])
+            if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+                raise ValueError("group() columns must be a list of strings")
+            if arguments.setdefault("mode", "by") not in ("by", "except"):
+                raise ValueError('group() mode must be "by" or "except"')
+        return arguments
+
+    def _value_column(self, node):
+        """A predicate with r._value read as the one field selected"""
+        if node is None or "_value" not in _columns_of(node):
+            return node
+        if self.fields is None or len(self.fields) != 1:
+            raise ValueError("r._value needs a filter on exactly one r._field")
+        return _rename(node, "_value", next(iter(self.fields)))
+
+    def explain(self):
+        """The plan as text, one step per line"""
+        lines = [
+            f"scan {', '.join(sorted(self.measurements)) if self.measurements is not None else 'all measurements'}",
+            f"  time {self.start!r} to {self.stop!r}",
+        ]
+        if self.devices is not None:
+            lines.append(f"  devices {', '.join(sorted(self.devices))}")
+        if self.fields is not None:
+            lines.append(f"  fields {', '.join(sorted(self.fields))}")
+        for tag, values in sorted(self.tags.items()):
+            lines.append(f"  {tag} {', '.join(sorted(values))} (tag index)")
+        if self.predicate is not None:
+            lines.append(f"filter {self.predicate!r}")
+        for function, arguments in self.stages:
+            lines.append(f"{function} {arguments!r}" if arguments else function)
+        return "\n".join(lines)
+
+    def run(self, store, now=None):
+        """
+        Run the query against a store
+
+        Args:
+            store (TimeSeriesStore): Store to read
+            now (float): Time that relative bounds count from, or None for the clock
+
+        Returns:
+            pd.DataFrame: _time, _measurement, tags, then fields
+        """
+        now = time.time() if now is None else now
+        start, stop = _resolve(self.start, now), _resolve(self.stop, now)
+        tables = []
+        measurements = self.measurements
+        if measurements is None:
+            measurements = [name for name in MEASUREMENTS if name not in ROLLUPS]
+        for measurement in sorted(measurements):
+            table = self._scan(store, measurement, start, stop)
+            if table is not None:
+                tables.append(table)
+        table = _Table.concat(tables)
+        for function, arguments in self.stages:
+            if function == "filter":
+                table = table.take(_evaluate(arguments["fn"], table)[0])
+            elif function == "group":
+                table = table.group(arguments["columns"], arguments["mode"])
+            elif function == "last":
+                table = table.last()
+            elif function == "count":
+                table = table.count()
+            elif function == "aggregateWindow":
+                table = table.aggregate_window(arguments["every"].seconds, arguments["fn"],
+                                               arguments["createEmpty"], start, stop)
+        return table.to_dataframe()
+
+    def _scan(self, store, measurement, start, stop):
+        """The measurement's rows that pass the pushed-down filters, or None"""
+        spec = MEASUREMENTS.get(measurement)
+        if spec is None:
+            return None
+        fields = [name for name in spec["fields"] if self.fields is None or name in self.fields]
+        if not fields:
+            return None
+        tags = list(spec["tags"])
+        if any(tag not in tags for tag in self.tags):
+            # Rows without the tag never equal a value
+            return None
+        read = set(tags) | set(fields)
+        if self.predicate is not None:
+            read |= _columns_of(self.predicate) & set(spec["fields"])
+        devices = None if self.devices is None else sorted(self.devices)
+        block = store.scan(measurement, start, stop, devices,
+                           [name for name in (*tags, *spec["fields"]) if name in read],
+                           {tag: sorted(values) for tag, values in self.tags.items()})
+        # Filling an empty object array is much faster than np.full
+        names = np.empty(len(block), dtype=object)
+        names[:] = measurement
+        columns = {"_time": block.time, "_measurement": names, "device_id": block.device_id}
+        columns.update(block.columns)
+        table = _Table(columns, dict(block.valid), ["_measurement", "device_id", *tags], fields)
+        if self.predicate is not None:
+            table = table.take(_evaluate(self.predicate, table)[0])
+        return table
+
+
+def _evaluate(node, table):
+    """
+    A predicate over every row, in three-valued logic
+
+    Returns:
+        tuple: (rows where it is true, rows where it is false); comparisons
+        with a missing value are neither, and filter() drops them
+    """
+    kind = node[0]
+    if kind == "constant":
+        return np.full(len(table), node[1]), np.full(len(table), not node[1])
+    if kind == "not":
+        true, false = _evaluate(node[1], table)
+        return false, true
+    if kind in ("and", "or"):
+        left, right = _evaluate(node[1], table), _evaluate(node[2], table)
+        if kind == "and":
+            return left[0] & right[0], left[1] | right[1]
+        return left[0] | right[0], left[1] & right[1]
+
+    _, op, name, value = node
+    values = table.columns.get(name)
+    if values is None:
+        nothing = np.zeros(len(table), dtype=bool)
+        return nothing, nothing
+    known = table.valid.get(name)
+    if known is None:
+        known = np.not_equal(values, None) if values.dtype == object else np.ones(len(table), dtype=bool)
+    if values.dtype == object:
+        if not isinstance(value, str):
+            raise ValueError(f"{name} holds strings, not {value!r}")
+        values = np.where(known, values, "")
+    elif isinstance(value, (str, Duration, Now)):
+        raise ValueError(f"{name} cannot be compared with {value!r}")
+    result = np.asarray(_COMPARE[op](values, value), dtype=bool)
+    return known & result, known & ~result
+
+
+def _factorize(values):
+    """Dense integer codes of a column in sorted order, with None first"""
+    import pandas as pd
+
+    codes, _ = pd.factorize(values, sort=True)
+    return codes.astype(np.int64) + 1
+
+
+class _Table:
+    """
+    Rows between stages, as columns
+
+    Attributes:
+        columns (dict): Column name -> array; _time is absent after count()
+        valid (dict): Column name -> bool mask, for columns missing from some rows
+        tags (list): Columns other than _time and the fields, in order
+        fields (list): Field columns, in order
+        key (list): Group key columns
+    """
+
+    def __init__(self, columns, valid, tags, fields, key=None):
+        self.columns = columns
+        self.valid = valid
+        self.tags = tags
+        self.fields = fields
+        self.key = list(tags) if key is None else key
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @classmethod
+    def concat(cls, tables):
+        """Stack the tables of several measurements; columns one lacks are missing from its rows"""
+        if not tables:
+            return cls({"_time": np.empty(0, dtype=np.int64)}, {}, ["_measurement", "device_id"], [])
+        if len(tables) == 1:
+            return tables[0]
+        names = list(dict.fromkeys(name for table in tables for name in table.columns))
+        columns = {}
+        valid = {}
+        for name in names:
+            sample = next(table.columns[name] for table in tables if name in table.columns)
+            pieces = []
+            masks = []
+            for table in tables:
+                count = len(table)
+                if name in table.columns:
+                    pieces.append(table.columns[name])
+                    masks.append(table.valid.get(name, np.ones(count, dtype=bool)))
+                else:
+                    pieces.append(np.full(count, None, dtype=object) if sample.dtype == object
+                                  else np.zeros(count, dtype=sample.dtype))
+                    masks.append(np.zeros(count, dtype=bool))
+            columns[name] = np.concatenate(pieces)
+            mask = np.concatenate(masks)
+            if not mask.all():
+                valid[name] = mask
+        tags = list(dict.fromkeys(name for table in tables for name in table.tags))
+        fields = list(dict.fromkeys(name for table in tables for name in table.fields))
+        return cls(columns, valid, tags, fields, tags)
+
+    def take(self, index):
+        return _Table(
+            {name: values[index] for name, values in self.columns.items()},
+            {name: mask[index] for name, mask in self.valid.items()},
+            self.tags, self.fields, self.key,
+        )
+
+    def _groups(self):
+        """Dense group code of each row, in group key order"""
+        codes = np.zeros(len(self), dtype=np.int64)
+        for name in self.key:
+            if name in self.columns:
+                column = _factorize(self.columns[name])
+                codes = codes * (int(column.max(initial=0)) + 1) + column
+        if not len(codes):
+            return codes
+        return np.unique(codes, return_inverse=True)[1].reshape(-1)
+
+    def _key_columns(self, rows):
+        """Group key columns of the given rows"""
+        columns = {}
+        valid = {}
+        for name in self.key:
+            if name in self.columns:
+                columns[name] = self.columns[name][rows]
+                if name in self.valid:
+                    valid[name] = self.valid[name][rows]
+        return columns, valid
+
+    def group(self, columns, mode):
+        """The same rows grouped by other columns, ordered by group and then time"""
+        key = list(columns) if mode == "by" else [
+            name for name in (*self.tags, *self.fields) if name not in columns]
+        table = _Table(self.columns, self.valid, self.tags, self.fields, key)
+        if "_time" not in self.columns:
+            return table.take(np.argsort(table._groups(), kind="stable"))
+        return table.take(np.lexsort((self.columns["_time"], table._groups())))
+
+    def last(self):
+        """The latest row of each group"""
+        if len(self) < 2:
+            return self
+        codes = self._groups()
+        order = np.lexsort((self.columns["_time"], codes)) if "_time" in self.columns else np.argsort(codes, kind="stable")
+        ends = np.append(codes[order][1:] != codes[order][:-1], True)
+        return self.take(order[ends])
+
+    def count(self):
+        """Values of each field per group, one row per group"""
+        codes = self._groups()
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.append(True, codes[order][1:] != codes[order][:-1])) if len(order) else order
+        columns, valid = self._key_columns(order[starts])
+        for name in self.fields:
+            present = self.valid.get(name)
+            present = np.ones(len(self), dtype=bool) if present is None else present
+            columns[name] = np.add.reduceat(present[order].astype(np.int64), starts) if len(order) else \
+                np.empty(0, dtype=np.int64)
+        return _Table(columns, valid, [name for name in self.key if name in columns], self.fields, self.key)
+
+    def aggregate_window(self, every, fn, create_empty, start, stop):
+        """
+        Each field reduced over windows of every seconds, per group
+
+        Windows are aligned to the epoch and clipped to the range; a
+        window's _time is its end. With create_empty, every group has a row
+        for every window in the range, with no values where it had no rows.
+        """
+        if "_time" not in self.columns:
+            raise ValueError("aggregateWindow() needs _time, which count() drops")
+        codes = self._groups()
+        windows = self.columns["_time"] // every
+        order = np.lexsort((self.columns["_time"], windows, codes))
+        codes, windows = codes[order], windows[order]
+        starts = np.flatnonzero(np.append(True, (codes[1:] != codes[:-1]) | (windows[1:] != windows[:-1]))) \
+            if len(order) else order
+
+        columns, valid = self._key_columns(order[starts])
+        fields = []
+        for name in self.fields:
+            values = self.columns[name][order]
+            present = self.valid.get(name)
+            present = None if present is None else present[order]
+            if values.dtype == object and values.size:
+                present = np.not_equal(values, None) if present is None else present
+            reduced = _reduce(fn, values, present, starts)
+            if reduced is not None:
+                columns[name], mask = reduced
+                if mask is not None:
+                    valid[name] = mask
+                fields.append(name)
+        window_starts = windows[starts]
+        group_codes = codes[starts]
+
+        if create_empty:
+            first, last = start // every, -(-stop // every)
+            count = last - first
+            groups = int(group_codes.max()) + 1 if len(group_codes) else 0
+            slots = group_codes * count + (window_starts - first)
+            representatives = np.searchsorted(group_codes, np.arange(groups))
+            grid = {}
+            grid_valid = {}
+            for name, values in columns.items():
+                if name in self.key:
+                    grid[name] = np.repeat(values[representatives], count)
+                    if name in valid:
+                        grid_valid[name] = np.repeat(valid[name][representatives], count)
+                    continue
+                filled = np.full(groups * count, None, dtype=object) if values.dtype == object else \
+                    np.zeros(groups * count, dtype=values.dtype)
+                filled[slots] = values
+                grid[name] = filled
+                if fn != "count":
+                    mask = np.zeros(groups * count, dtype=bool)
+                    mask[slots] = valid.get(name, True)
+                    grid_valid[name] = mask
+            columns, valid = grid, grid_valid
+            window_starts = np.tile(np.arange(first, last, dtype=np.int64), groups)
+
+        times = (window_starts + 1) * every
+        columns = {"_time": np.minimum(times, stop), **columns}
+        return _Table(columns, valid, [name for name in self.key if name in columns], fields, self.key)
+
+    def to_dataframe(self):
+        """
+        The rows as a pandas DataFrame: _time, tags, then fields
+
+        Integer and boolean columns with missing values use pandas' nullable
+        types, and missing floats are NaN.
+        """
+        import pandas as pd
+
+        data = {}
+        for name in ("_time", *self.tags, *self.fields):
+            if name not in self.columns:
+                continue
+            values = self.columns[name]
+            valid = self.valid.get(name)
+            if name == "_time":
+                values = pd.to_datetime(values, unit="s", utc=True)
+            elif valid is not None and values.dtype.kind == "i":
+                values = pd.arrays.IntegerArray(values, ~valid)
+            elif valid is not None and values.dtype.kind == "b":
+                values = pd.arrays.BooleanArray(values, ~valid)
+            elif valid is not None and values.dtype.kind == "f":
+                values = np.where(valid, values, np.nan)
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+def _reduce(fn, values, present, starts):
+    """
+    One aggregateWindow() function over runs of rows
+
+    Args:
+        fn (str): Function name
+        values (np.ndarray): Column, sorted into runs
+        present (np.ndarray): Rows that have a value, or None for all
+        starts (np.ndarray): First row of each run
+
+    Returns:
+        tuple: (value per run; valid mask, or None if every run has one),
+        or None if fn does not apply to the column's type
+    """
+    if not len(starts):
+        return np.empty(0, dtype=np.int64 if fn == "count" else values.dtype), None
+    ones = np.ones(len(values), dtype=bool) if present is None else present
+    counts = np.add.reduceat(ones.astype(np.int64), starts)
+    if fn == "count":
+        return counts, None
+    has_value = None if counts.all() else counts > 0
+
+    if fn in ("first", "last"):
+        positions = np.arange(len(values))
+        if fn == "first":
+            index = np.minimum.reduceat(np.where(ones, positions, len(values)), starts)
+        else:
+            index = np.maximum.reduceat(np.where(ones, positions, -1), starts)
+        return values[np.clip(index, 0, len(values) - 1)], has_value
+    if values.dtype == object:
+        return None
+    if values.dtype == bool:
+        values = values.astype(np.int64)
+
+    if fn in ("sum", "mean"):
+        totals = np.add.reduceat(np.where(ones, values, 0), starts)
+        if fn == "sum":
+            return totals, has_value
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totals / counts, has_value
+    if values.dtype.kind == "f":
+        fill = np.inf if fn == "min" else -np.inf
+    else:
+        limits = np.iinfo(values.dtype)
+        fill = limits.max if fn == "min" else limits.min
+    reduce = np.minimum if fn == "min" else np.maximum
+    return reduce.reduceat(np.where(ones, values, fill), starts), has_value
+
+
+def parse(text):
+    """
+    Parse a query into a plan
+
+    Args:
+        text (str): Flux query
+
+    Returns:
+        FluxQuery: The plan
+
+    Raises:
+        ValueError: If the query is not in the subset
+    """
+    return FluxQuery(text)
+
+
+def execute(store, query, now=None):
+    """
+    Run a Flux query against the embedded store
+
+    Args:
+        store (TimeSeriesStore): Store to read
+        query: Flux text, or a plan from parse()
+        now (float): Time that relative bounds count from, or None for the clock
+
+    Returns:
+        pd.DataFrame: _time, _measurement, tags, then fields
+
+    Raises:
+        ValueError: If the query is not in the subset
+    """
+    plan = query if isinstance(query, FluxQuery) else parse(query)
+    return plan.run(store, now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a Flux query against the embedded store")
+    parser.add_argument("query", nargs="?", help="Flux query; read from --file or stdin if omitted")
+    parser.add_argument("-f", "--file", help="File holding the query")
+    parser.add_argument("--dir", default=STORE_DIR, help="Store directory")
+    parser.add_argument("--plan", action="store_true", help="Print the plan instead of running it")
+    args = parser.parse_args()
+
+    if args.query is not None:
+        text = args.query
+    elif args.file is not None:
+        with open(args.file, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = sys.stdin.read()
+
+    plan = parse(text)
+    if args.plan:
+        print(plan.explain())
+        return
+
+    import pandas as pd
+
+    store = TimeSeriesStore(args.dir, read_only=True)
+    start = time.perf_counter()
+    frame = plan.run(store)
+    with pd.option_context("display.max_rows", 200, "display.width", 200):
+        print(frame)
+    print(f"{len(frame)} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
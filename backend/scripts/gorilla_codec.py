@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Gorilla Column Codec
+
+Compression for slowly varying sensor series, after Facebook's Gorilla
+time-series encoding. Timestamps and integers are stored as delta-of-delta,
+and floats as the XOR of each value with the one before. Heartbeat columns
+(time, battery_level, signal_strength, uptime, time_safe) mostly repeat
+or change by a little, so most values need a few bits instead of 64.
+
+The bits are laid out differently from Gorilla's single stream, so that
+both directions are whole-array NumPy operations rather than a loop per
+value:
+
+    codes    2 bits per value, packed: the class of each value
+    bits     the values' payloads, packed back to back, most significant bit first
+    windows  floats only: (trailing zeros, length) of each XOR window
+
+Integers: the first or second difference, whichever is smaller for the
+column, zigzag-encoded. Each value falls in one of four classes. Class 0
+is zero and has no payload. Classes 1 and 2 have two widths chosen per
+column from the histogram of value sizes. Class 3 takes 64 bits.
+
+Floats that are decimals with a few places, such as a battery level of
+83.7, are stored as integers of tenths, hundredths and so on, when that
+gives back every value bit for bit. Their XORs would be long, because
+0.1 has no short binary form. Other floats use code 0 for an XOR of
+zero, a repeated value. As in Gorilla, code 2
+opens a new window of meaningful bits and code 1 reuses the current one.
+A window covers the next WINDOW_GROUP non-zero XORs, which is what lets
+the encoder choose windows without a loop. The payload is the XOR's bits
+inside the window.
+
+NaNs, such as gaps in a float column, are kept as a bit mask, with the
+previous value encoded in their place.
+
+Values are split into runs, such as a device's rows in a store segment.
+Differences and XORs restart at each run, and each run's starting offsets
+are recorded, so a run can be decoded on its own.
+"""
+
+import numpy as np
+
+# Non-zero XORs that share one float window
+WINDOW_GROUP = 16
+
+# Most decimal places tried for storing floats as scaled integers
+MAX_DECIMALS = 6
+
+# Values per slice when packing payload bits, to bound the 64x bit matrix
+PACK_SLICE = 65536
+
+# Arrays an encoded column can have
+ARRAYS = ("codes", "bits", "windows", "nan")
+
+_NAN = np.float64(np.nan).view(np.uint64)
+_U1 = np.uint64(1)
+_U63 = np.uint64(63)
+
+
+def _bit_length(values):
+    """Bits needed for each uint64 value (0 for 0)"""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >= (_U1 << np.uint64(shift))
+        length[big] += shift
+        values[big] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+def _trailing_zeros(values):
+    """Trailing zero bits of each non-zero uint64 value"""
+    lowest = values & (~values + _U1)
+    return _bit_length(lowest) - 1
+
+
+def _zigzag(values):
+    signed = values.view(np.int64)
+    return ((signed << 1) ^ (signed >> 63)).view(np.uint64)
+
+
+def _unzigzag(values):
+    return ((values >> _U1) ^ (np.uint64(0) - (values & _U1))).view(np.int64)
+
+
+def _run_starts(count, run_starts):
+    if not count:
+        return np.empty(0, dtype=np.int64)
+    starts = np.asarray([0] if run_starts is None else run_starts, dtype=np.int64)
+    if len(starts) == 0 or starts[0] != 0:
+        raise ValueError("the first run must start at row 0")
+    return starts
+
+
+def _differences(values, starts):
+    """Difference from the previous value, restarting at each run (uint64, wrapping)"""
+    result = values.copy()
+    result[1:] -= values[:-1]
+    result[starts] = values[starts]
+    return result
+
+
+def _run_cumsum(values, starts):
+    """Inverse of _differences"""
+    total = np.cumsum(values, dtype=np.uint64)
+    if len(starts) > 1:
+        base = np.zeros(len(starts), dtype=np.uint64)
+        base[1:] = total[starts[1:] - 1]
+        total -= np.repeat(base, np.diff(np.append(starts, len(values))))
+    return total
+
+
+def _pack_codes(codes):
+    bits = np.empty((len(codes), 2), dtype=np.uint8)
+    bits[:, 0] = codes >> 1
+    bits[:, 1] = codes & 1
+    return np.packbits(bits.ravel())
+
+
+def _unpack_codes(packed, lo, hi):
+    bits = np.unpackbits(packed[lo // 4:-(-hi // 4)])
+    skip = 2 * (lo % 4)
+    bits = bits[skip:skip + 2 * (hi - lo)].reshape(-1, 2)
+    return (bits[:, 0] << 1) | bits[:, 1]
+
+
+def _pack_bits(values, widths):
+    """Concatenate the low `width` bits of each value into a packed stream"""
+    columns = np.arange(64)
+    pieces = []
+    for lo in range(0, len(values), PACK_SLICE):
+        width = widths[lo:lo + PACK_SLICE]
+        keep = width > 0
+        matrix = np.unpackbits(values[lo:lo + PACK_SLICE][keep].astype(">u8").view(np.uint8)).reshape(-1, 64)
+        pieces.append(matrix[columns >= (64 - width[keep])[:, None]])
+    if not pieces:
+        return np.empty(0, dtype=np.uint8)
+    return np.packbits(np.concatenate(pieces))
+
+
+def _unpack_bits(stream, offsets, widths):
+    """Read `width` bits at each (increasing) bit offset of a packed stream"""
+    if not len(offsets):
+        return np.empty(0, dtype=np.uint64)
+    # Only the bytes these values are in, as whole 64-bit words and spares
+    first = int(offsets[0]) >> 6 << 3
+    end = (int(offsets[-1] + widths[-1]) + 7) >> 3
+    size = (end - first + 7) >> 3
+    words = np.zeros(size + 2, dtype=">u8")
+    words.view(np.uint8)[:end - first] = stream[first:end]
+    words = words.astype(np.uint64)
+
+    offsets = offsets - first * 8
+    index = offsets >> 6
+    shift = (offsets & 63).astype(np.uint64)
+    # Shifting by 64 is undefined, so shifts that can reach it are split in two
+    word = (words[index] << shift) | ((words[index + 1] >> _U1) >> (_U63 - shift))
+    drop = (64 - widths).astype(np.uint64)
+    half = drop >> _U1
+    return (word >> half) >> (drop - half)
+
+
+def _offsets(widths, start=0):
+    ends = np.cumsum(widths) + start
+    return ends - widths, int(ends[-1]) if len(ends) else start
+
+
+def _integer_widths(lengths):
+    """Class widths [0, w1, w2, 64] that minimise the payload, and its size in bits"""
+    counts = np.bincount(lengths, minlength=65)
+    covered = np.cumsum(counts)
+    w = np.arange(65)
+    w1 = w[1:64, None]
+    w2 = w[None, 1:64]
+    # Values above w2 bits cost 64 bits each
+    cost = (w1 * (covered[1:64, None] - covered[0])
+            + w2 * (covered[None, 1:64] - covered[1:64, None])
+            + 64 * (covered[64] - covered[None, 1:64]))
+    cost = np.where(w2 > w1, cost, np.iinfo(np.int64).max)
+    i, j = np.unravel_index(np.argmin(cost), cost.shape)
+    return [0, int(w1[i, 0]), int(w2[0, j]), 64], int(cost[i, j])
+
+
+def encode(values, run_starts=None):
+    """
+    Encode an int64 or float64 column
+
+    Args:
+        values (np.ndarray): int64 or float64 values
+        run_starts (sequence): First row of each run, starting with 0; None for one run
+
+    Returns:
+        tuple: (meta dict, safe to store as JSON; dict of uint8 arrays)
+    """
+    values = np.ascontiguousarray(values)
+    count = len(values)
+    starts = _run_starts(count, run_starts)
+    if values.dtype == np.int64:
+        return _encode_integers(values.view(np.uint64), starts)
+    if values.dtype != np.float64:
+        raise TypeError(f"Cannot encode {values.dtype} values")
+
+    missing = np.isnan(values)
+    if missing.any() and (values[missing].view(np.uint64) == _NAN).all():
+        # Gaps take the previous value, which costs next to nothing, and a bit mask
+        filled = values[np.maximum.accumulate(np.where(missing, 0, np.arange(count)))]
+        values = np.where(np.isnan(filled), 0.0, filled)
+    else:
+        missing = None
+    decimals = _decimal_places(values)
+    if decimals is None:
+        meta, arrays = _encode_floats(values.view(np.uint64), starts)
+    else:
+        scaled = np.round(values * 10.0 ** decimals).astype(np.int64)
+        meta, arrays = _encode_integers(scaled.view(np.uint64), starts)
+        meta["decimals"] = decimals
+    if missing is not None:
+        arrays["nan"] = np.packbits(missing)
+    return meta, arrays
+
+
+def _decimal_places(values):
+    """Fewest decimal places that give back every value exactly, or None"""
+    if not len(values):
+        return None
+    bits = values.view(np.uint64)
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        # A sample rules most scales out before the whole column is tried
+        for part in (slice(0, 64), slice(None)):
+            scaled = np.round(values[part] * scale)
+            with np.errstate(invalid="ignore"):
+                if not (np.abs(scaled) < 2**53).all():
+                    return None
+            if not np.array_equal((scaled.astype(np.int64) / scale).view(np.uint64), bits[part]):
+                break
+        else:
+            return decimals
+    return None
+
+
+def _encode_integers(values, starts):
+    best = None
+    deltas = values
+    for order in (1, 2):
+        deltas = _differences(deltas, starts)
+        zigzag = _zigzag(deltas)
+        lengths = _bit_length(zigzag)
+        widths, size = _integer_widths(lengths)
+        if best is None or size < best[1]:
+            best = (order, size, widths, zigzag, lengths)
+    order, _, widths, zigzag, lengths = best
+
+    codes = np.full(len(values), 3, dtype=np.uint8)
+    codes[lengths <= widths[2]] = 2
+    codes[lengths <= widths[1]] = 1
+    codes[lengths == 0] = 0
+    payload_widths = np.asarray(widths)[codes]
+    offsets, _ = _offsets(payload_widths)
+    meta = {
+        "kind": "integer",
+        "count": len(values),
+        "order": order,
+        "widths": widths,
+        "runs": [[int(start), int(offsets[start]) if len(offsets) else 0, 0] for start in starts],
+    }
+    return meta, {"codes": _pack_codes(codes), "bits": _pack_bits(zigzag, payload_widths)}
+
+
+def _encode_floats(values, starts):
+    xors = values.copy()
+    xors[1:] ^= values[:-1]
+    xors[starts] = values[starts]
+
+    codes = np.zeros(len(values), dtype=np.uint8)
+    nonzero = np.flatnonzero(xors)
+    payload = xors[nonzero]
+    widths = np.zeros(len(values), dtype=np.int64)
+    windows = np.empty((0, 2), dtype=np.uint8)
+    window_rows = nonzero[:0]
+    if len(nonzero):
+        # A new window every WINDOW_GROUP non-zero values, and at the first in each run
+        run = np.searchsorted(starts, nonzero, side="right") - 1
+        rank = np.arange(len(nonzero)) - np.searchsorted(run, run, side="left")
+        group_starts = np.flatnonzero((rank % WINDOW_GROUP == 0))
+        trailing = np.minimum.reduceat(_trailing_zeros(payload), group_starts)
+        top = np.maximum.reduceat(_bit_length(payload), group_starts)
+        lengths = top - trailing
+        group = np.repeat(np.arange(len(group_starts)), np.diff(np.append(group_starts, len(nonzero))))
+        payload = payload >> trailing[group].astype(np.uint64)
+        codes[nonzero] = 1
+        window_rows = nonzero[group_starts]
+        codes[window_rows] = 2
+        widths[nonzero] = lengths[group]
+        windows = np.stack([trailing, lengths], axis=1).astype(np.uint8)
+
+    offsets, _ = _offsets(widths)
+    meta = {
+        "kind": "float",
+        "count": len(values),
+        "runs": [
+            [int(start), int(offsets[start]) if len(offsets) else 0, int(np.searchsorted(window_rows, start))]
+            for start in starts
+        ],
+    }
+    arrays = {
+        "codes": _pack_codes(codes),
+        "bits": _pack_bits(payload, widths[nonzero]),
+        "windows": windows.ravel(),
+    }
+    return meta, arrays
+
+
+def decode(meta, arrays, runs=None):
+    """
+    Decode a column, or some of its runs
+
+    Args:
+        meta (dict): Meta from encode()
+        arrays (dict): Arrays from encode(), e.g. views into a mapped file
+        runs (sequence): Indices of the runs to decode, or None for all
+
+    Returns:
+        np.ndarray: int64 or float64 values of the runs, concatenated in the order given
+    """
+    values = _decode(meta, arrays, runs)
+    if "decimals" in meta:
+        values = values / 10.0 ** meta["decimals"]
+    if "nan" in arrays:
+        missing = np.unpackbits(arrays["nan"], count=meta["count"]).view(bool)
+        if runs is not None:
+            missing = np.concatenate([missing[meta["runs"][index][0]:_run_end(meta, index)] for index in runs]
+                                     or [missing[:0]])
+        values[missing] = np.nan
+    return values
+
+
+def _run_end(meta, index):
+    """Row after the last of a run"""
+    runs = meta["runs"]
+    return runs[index + 1][0] if index + 1 < len(runs) else meta["count"]
+
+
+def _decode(meta, arrays, runs):
+    count = meta["count"]
+    if runs is None:
+        starts = np.asarray([run[0] for run in meta["runs"]], dtype=np.int64)
+        return _decode_range(meta, arrays, 0, count, 0, 0, starts)
+    # Looking up only the runs asked for keeps a few runs' cost independent of the column's run count
+    pieces = []
+    for index in runs:
+        start, bit_offset, window_offset = meta["runs"][index]
+        pieces.append(_decode_range(meta, arrays, start, _run_end(meta, index), bit_offset, window_offset,
+                                    np.zeros(1, dtype=np.int64)))
+    if not pieces:
+        return np.empty(0, dtype=np.int64 if meta["kind"] == "integer" else np.float64)
+    return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+
+def _decode_range(meta, arrays, lo, hi, bit_offset, window_offset, starts):
+    """Rows lo to hi, where lo starts a run; starts are run starts relative to lo"""
+    codes = _unpack_codes(arrays["codes"], lo, hi)
+    if meta["kind"] == "integer":
+        widths = np.asarray(meta["widths"], dtype=np.int64)[codes]
+        offsets, _ = _offsets(widths, bit_offset)
+        values = _unpack_bits(arrays["bits"], offsets, widths)
+        deltas = _unzigzag(values).view(np.uint64)
+        for _ in range(meta["order"]):
+            deltas = _run_cumsum(deltas, starts)
+        return deltas.view(np.int64)
+
+    windows = arrays["windows"].reshape(-1, 2)
+    window = window_offset + np.cumsum(codes == 2) - 1
+    nonzero = codes > 0
+    widths = np.zeros(len(codes), dtype=np.int64)
+    trailing = np.zeros(len(codes), dtype=np.uint64)
+    if nonzero.any():
+        used = windows[window[nonzero]]
+        widths[nonzero] = used[:, 1]
+        trailing[nonzero] = used[:, 0]
+    offsets, _ = _offsets(widths, bit_offset)
+    xors = _unpack_bits(arrays["bits"], offsets, widths) << trailing
+    values = np.bitwise_xor.accumulate(xors)
+    if len(starts) > 1:
+        base = np.zeros(len(starts), dtype=np.uint64)
+        base[1:] = values[starts[1:] - 1]
+        values ^= np.repeat(base, np.diff(np.append(starts, len(values))))
+    return values.view(np.float64)
+
+
+def encoded_size(arrays):
+    """Bytes taken by an encoded column's arrays"""
+    return sum(array.nbytes for array in arrays.values())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird GPS Reader
+
+Background NMEA reader for the sensor node's GPS module.
+
+A daemon thread reads sentences from GPS_SERIAL_PORT and keeps the last good
+fix in memory, so the detection loop reads a cached position instead of
+blocking on the serial port. Only GGA (position, fix quality, satellites,
+HDOP) and RMC (position, validity) are parsed; everything else is skipped
+after a prefix check. Fixes with an HDOP above GPS_MAX_HDOP are ignored, and
+a fix older than GPS_MAX_FIX_AGE is reported as stale. RMC carries no HDOP,
+so an RMC takes it from the GGA of the same UTC time or position, and is
+ignored with it if that GGA was; an RMC with no such GGA has no HDOP.
+
+The port may also be a regular file of recorded NMEA (read once) or a pty,
+which is how the reader is tested without a GPS module.
+"""
+
+import os
+import time
+import select
+import logging
+import threading
+from functools import reduce
+from operator import xor
+
+from rpi_config import GPS_SERIAL_PORT, GPS_BAUD_RATE, GPS_MAX_HDOP, GPS_MAX_FIX_AGE
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Longest wait between attempts to reopen a port that failed
+REOPEN_DELAY_MAX = 60.0
+
+
+class GpsFix:
+    """
+    One position fix and when it was received
+    """
+
+    __slots__ = ("latitude", "longitude", "hdop", "satellites", "received", "utc")
+
+    def __init__(self, latitude, longitude, hdop, satellites, received, utc=b""):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.hdop = hdop
+        self.satellites = satellites
+        self.received = received
+        # hhmmss.ss UTC time of the fix as sent, to pair a GGA with its RMC
+        self.utc = utc
+
+    def same_fix(self, other):
+        """True if other is the same fix from another sentence: same UTC time or same position"""
+        if self.utc and self.utc == other.utc:
+            return True
+        return self.latitude == other.latitude and self.longitude == other.longitude
+
+    def coordinates(self):
+        """Position formatted as "lat,lng" with six decimals"""
+        return f"{self.latitude:.6f},{self.longitude:.6f}"
+
+
+def _checksum_ok(line):
+    star = line.rfind(b"*")
+    if star < 0:
+        return False
+    try:
+        expected = int(line[star + 1:star + 3], 16)
+    except ValueError:
+        return False
+    return reduce(xor, line[1:star], 0) == expected
+
+
+def _degrees(value, hemisphere):
+    """Convert an NMEA ddmm.mmmm / dddmm.mmmm field to signed decimal degrees"""
+    raw = float(value)
+    degrees = int(raw // 100)
+    result = degrees + (raw - degrees * 100) / 60.0
+    return -result if hemisphere in (b"S", b"W") else result
+
+
+def parse_nmea(line, received=0.0):
+    """
+    Parse one NMEA sentence into a fix
+
+    Args:
+        line (bytes): Sentence, with or without the trailing CR/LF
+        received (float): Receive time stored on the fix
+
+    Returns:
+        GpsFix: Fix from a valid GGA or RMC sentence, otherwise None
+    """
+    line = line.strip()
+    # Talker ID (GP, GN, GL...) is ignored; only the sentence type matters
+    if len(line) < 7 or line[:1] != b"$" or line[3:6] not in (b"GGA", b"RMC"):
+        return None
+    if not _checksum_ok(line):
+        raise ValueError("NMEA checksum mismatch")
+
+    fields = line[:line.rfind(b"*")].split(b",")
+    try:
+        if line[3:6] == b"GGA":
+            # $--GGA,time,lat,N/S,lon,E/W,quality,satellites,hdop,altitude,...
+            if len(fields) < 9 or fields[6] in (b"", b"0") or not fields[2] or not fields[4]:
+                return None
+            return GpsFix(
+                _degrees(fields[2], fields[3]),
+                _degrees(fields[4], fields[5]),
+                float(fields[8]) if fields[8] else None,
+                int(fields[7]) if fields[7] else 0,
+                received,
+                fields[1],
+            )
+        # $--RMC,time,status,lat,N/S,lon,E/W,...
+        if len(fields) < 7 or fields[2] != b"A" or not fields[3] or not fields[5]:
+            return None
+        return GpsFix(_degrees(fields[3], fields[4]), _degrees(fields[5], fields[6]), None, 0, received, fields[1])
+    except ValueError:
+        return None
+
+
+class _TtyStream:
+    """
+    Line reader over a tty or pty with a read timeout, used when pyserial is not installed
+    """
+
+    def __init__(self, path, timeout=1.0):
+        self._fd = os.open(path, os.O_RDONLY | os.O_NOCTTY)
+        self._buffer = b""
+        self.timeout = timeout
+
+    def readline(self):
+        """Return the next line, or b"" if none arrives within the timeout"""
+        while b"\n" not in self._buffer:
+            ready, _, _ = select.select([self._fd], [], [], self.timeout)
+            if not ready:
+                return b""
+            chunk = os.read(self._fd, 256)
+            if not chunk:
+                raise OSError("port closed")
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line + b"\n"
+
+    def close(self):
+        os.close(self._fd)
+
+
+class GpsReader:
+    """
+    Reads NMEA from a serial port, file or pty in a background thread
+    """
+
+    def __init__(self, port=GPS_SERIAL_PORT, baud_rate=GPS_BAUD_RATE, max_hdop=GPS_MAX_HDOP,
+                 max_age=GPS_MAX_FIX_AGE, clock=time.monotonic):
+        """
+        Args:
+            port (str): Serial device, pty, or file of recorded NMEA sentences
+            baud_rate (int): Serial baud rate
+            max_hdop (float): Fixes with a higher HDOP are discarded
+            max_age (float): Seconds after which the cached fix is stale
+            clock (callable): Monotonic time source for fix ages
+        """
+        self.port = port
+        self.baud_rate = baud_rate
+        self.max_hdop = max_hdop
+        self.max_age = max_age
+        self.clock = clock
+
+        self.fix = None
+        # Last GGA fix, and whether its HDOP was accepted
+        self._gga = None
+        self._gga_accepted = False
+        # Last fix whose HDOP was checked, to fall back to when the GGA for
+        # an RMC already taken turns out to be rejected
+        self._checked = None
+        self.sentences = 0
+        self.checksum_errors = 0
+        self.rejected_fixes = 0
+
+        self._stream = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.finished = threading.Event()
+
+    def _open(self):
+        if os.path.isfile(self.port):
+            return open(self.port, "rb"), True
+        try:
+            import serial
+        except ImportError:
+            # Without pyserial a pty (or an already configured tty) can still be read
+            return _TtyStream(self.port), False
+        return serial.Serial(self.port, self.baud_rate, timeout=1.0), False
+
+    def start(self):
+        """Start the reader thread"""
+        self._thread = threading.Thread(target=self._run, name="gps-reader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = 1.0
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self._stream, is_file = self._open()
+                    logger.info(f"GPS reader opened {self.port}")
+                    delay = 1.0
+                    self._read_stream(is_file)
+                    if is_file:
+                        logger.info(f"GPS recording {self.port} exhausted")
+                        return
+                except (OSError, ValueError) as e:
+                    if self._stop_event.is_set():
+                        return
+                    if delay == 1.0:
+                        logger.error(f"GPS port {self.port} unavailable: {e}")
+                    else:
+                        logger.debug(f"GPS port {self.port} still unavailable: {e}")
+                finally:
+                    self._close_stream()
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, REOPEN_DELAY_MAX)
+        finally:
+            self.finished.set()
+
+    def _read_stream(self, is_file):
+        while not self._stop_event.is_set():
+            line = self._stream.readline()
+            if not line:
+                # EOF for a file; a read timeout for a serial port or pty
+                if is_file:
+                    return
+                continue
+            self.sentences += 1
+            try:
+                fix = parse_nmea(line, self.clock())
+            except ValueError:
+                self.checksum_errors += 1
+                continue
+            if fix is None:
+                continue
+            if fix.hdop is not None:
+                # GGA
+                self._gga = fix
+                self._gga_accepted = fix.hdop <= self.max_hdop
+                if not self._gga_accepted:
+                    self.rejected_fixes += 1
+                    current = self.fix
+                    if current is not None and current.hdop is None and current.same_fix(fix):
+                        # The RMC of this fix came first and was taken unchecked
+                        self.fix = self._checked
+                    continue
+                self._checked = fix
+            elif self._gga is not None and self._gga.same_fix(fix):
+                # RMC of the last GGA's fix: it shares that GGA's HDOP
+                if not self._gga_accepted:
+                    self.rejected_fixes += 1
+                    continue
+                fix.hdop = self._gga.hdop
+                fix.satellites = self._gga.satellites
+                self._checked = fix
+            # A single reference assignment, so readers never see a half-updated fix
+            self.fix = fix
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def age(self):
+        """
+        Seconds since the cached fix was received
+
+        Returns:
+            float: Age in seconds, or None without a fix
+        """
+        fix = self.fix
+        return self.clock() - fix.received if fix else None
+
+    def coordinates(self):
+        """
+        Cached position if it is fresh enough
+
+        Returns:
+            str: "lat,lng", or None without a fix or if it is stale
+        """
+        fix = self.fix
+        if fix is None or self.clock() - fix.received > self.max_age:
+            return None
+        return fix.coordinates()
+
+    def stop(self, timeout=2.0):
+        """Stop the reader thread and close the port"""
+        # Reads time out every second, so the thread notices the stop and
+        # closes the port itself
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
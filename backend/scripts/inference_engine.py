@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Inference Engine
+
+Batched model inference for the acoustic and visual detectors.
+
+Each model is loaded once and its tensors are allocated once for a fixed
+batch size. Feature windows are queued into a preallocated batch array and
+run through the interpreter several at a time, which amortises the per-invoke
+overhead of TensorFlow Lite on the Pi. Per-batch latency is recorded so the
+time spent waiting on the interpreter can be monitored.
+
+When no .tflite file or interpreter is available (for example in CI), a small
+NumPy model with the same interface stands in.
+"""
+
+import os
+import time
+import logging
+
+import numpy as np
+
+from rpi_config import INFERENCE_BATCH_SIZE, INFERENCE_THREADS
+
+logger = logging.getLogger("AcousticGuardian")
+
+
+def _load_interpreter_class():
+    """Return the TFLite Interpreter class from tflite_runtime or TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """
+    TensorFlow Lite model with tensors allocated once for a fixed batch size
+    """
+
+    def __init__(self, model_path, batch_size=INFERENCE_BATCH_SIZE, num_threads=INFERENCE_THREADS):
+        """
+        Args:
+            model_path (str): Path to the .tflite model
+            batch_size (int): Number of examples per invocation
+            num_threads (int): Interpreter threads
+        """
+        Interpreter = _load_interpreter_class()
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+
+        input_details = self.interpreter.get_input_details()[0]
+        self._input_index = input_details["index"]
+        self.input_shape = tuple(int(d) for d in input_details["shape"][1:])
+        self._input_dtype = input_details["dtype"]
+        self._input_scale, self._input_zero_point = input_details.get("quantization", (0.0, 0))
+
+        self.interpreter.resize_tensor_input(self._input_index, [batch_size, *self.input_shape])
+        self.interpreter.allocate_tensors()
+
+        output_details = self.interpreter.get_output_details()[0]
+        self._output_index = output_details["index"]
+        self._output_scale, self._output_zero_point = output_details.get("quantization", (0.0, 0))
+
+        self._input_buffer = np.zeros((batch_size, *self.input_shape), dtype=self._input_dtype)
+        # Quantized inputs saturate rather than wrap, so a loud window stays loud
+        if np.issubdtype(self._input_dtype, np.integer):
+            limits = np.iinfo(self._input_dtype)
+            self._input_range = (limits.min, limits.max)
+        else:
+            self._input_range = None
+        logger.info(f"Loaded TFLite model {model_path} with batch size {batch_size}")
+
+    def predict(self, batch):
+        """
+        Run one invocation over up to `batch_size` examples
+
+        Args:
+            batch (np.ndarray): Float32 array of shape (n, *input_shape)
+
+        Returns:
+            np.ndarray: Positive-class scores of shape (n,)
+        """
+        count = len(batch)
+        if self._input_scale:
+            np.round(batch / self._input_scale + self._input_zero_point, out=batch)
+        if self._input_range is not None:
+            np.clip(batch, *self._input_range, out=batch)
+        self._input_buffer[:count] = batch
+        self._input_buffer[count:] = 0
+
+        self.interpreter.set_tensor(self._input_index, self._input_buffer)
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output_index)[:count].astype(np.float32)
+        if self._output_scale:
+            output = (output - self._output_zero_point) * self._output_scale
+        return output.reshape(count, -1)[:, -1]
+
+
+class NumpyModel:
+    """
+    Logistic model over mean band energies, used where TFLite is unavailable
+
+    Shares the TFLiteModel interface so the engine and detection loop run
+    unchanged in CI and on development machines.
+    """
+
+    def __init__(self, input_shape, weights, bias, batch_size=INFERENCE_BATCH_SIZE):
+        """
+        Args:
+            input_shape (tuple): Per-example input shape, (n_frames, n_bands)
+            weights (np.ndarray): Weight per band, shape (n_bands,)
+            bias (float): Logit bias
+            batch_size (int): Number of examples per invocation
+        """
+        self.input_shape = tuple(input_shape)
+        self.batch_size = batch_size
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.float32(bias)
+        self._band_means = np.empty((batch_size, self.input_shape[-1]), dtype=np.float32)
+        self._logits = np.empty(batch_size, dtype=np.float32)
+
+    def predict(self, batch):
+        """
+        Score up to `batch_size` examples
+
+        Args:
+            batch (np.ndarray): Float32 array of shape (n, *input_shape)
+
+        Returns:
+            np.ndarray: Positive-class scores of shape (n,)
+        """
+        count = len(batch)
+        band_means = self._band_means[:count]
+        logits = self._logits[:count]
+        np.mean(batch, axis=-2, out=band_means)
+        np.matmul(band_means, self.weights, out=logits)
+        logits += self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    @classmethod
+    def reference_acoustic_model(cls, extractor, batch_size=INFERENCE_BATCH_SIZE, window_samples=None):
+        """
+        Build the stand-in chainsaw model for a feature extractor
+
+        Scores loud, sustained energy in the 100 Hz - 4 kHz bands where
+        two-stroke engine harmonics sit.
+
+        Args:
+            extractor (LogMelExtractor): Extractor producing the model input
+            batch_size (int): Number of examples per invocation
+            window_samples (int): Audio samples per window
+
+        Returns:
+            NumpyModel: The stand-in model
+        """
+        from audio_features import hz_to_mel, mel_to_hz
+
+        window_samples = window_samples or extractor.sample_rate
+        n_frames = extractor.n_frames(window_samples)
+        band_edges = mel_to_hz(np.linspace(hz_to_mel(50.0), hz_to_mel(extractor.sample_rate / 2),
+                                           extractor.n_mels + 2))[1:-1]
+        engine_bands = (band_edges >= 100.0) & (band_edges <= 4000.0)
+        weights = np.where(engine_bands, 1.0 / engine_bands.sum(), 0.0)
+        # A chainsaw within range puts the mean engine-band log power above +2,
+        # while forest background noise stays below -1; the midpoint scores 0.5
+        return cls((n_frames, extractor.n_mels), weights * 2.0, -1.0, batch_size)
+
+
+def load_model(model_path, batch_size=INFERENCE_BATCH_SIZE, fallback=None):
+    """
+    Load a TFLite model, or return the fallback if that is not possible
+
+    Args:
+        model_path (str): Path to the .tflite model
+        batch_size (int): Number of examples per invocation
+        fallback: Model to return when the file or interpreter is missing
+
+    Returns:
+        Model object with input_shape, batch_size and predict(), or the fallback
+    """
+    if not os.path.exists(model_path):
+        logger.warning(f"Model file {model_path} not found")
+        return fallback
+    try:
+        return TFLiteModel(model_path, batch_size)
+    except ImportError:
+        logger.warning("No TFLite interpreter installed (tflite_runtime or tensorflow)")
+        return fallback
+
+
+class InferenceEngine:
+    """
+    Queues feature windows and runs them through a model in batches
+    """
+
+    def __init__(self, model):
+        """
+        Args:
+            model: Object with input_shape, batch_size and predict()
+        """
+        self.model = model
+        self.batch_size = model.batch_size
+        self._batch = np.zeros((self.batch_size, *model.input_shape), dtype=np.float32)
+        self._metadata = [None] * self.batch_size
+        self._single = np.zeros((1, *model.input_shape), dtype=np.float32)
+        self._queued = 0
+
+        self.batches_run = 0
+        self.windows_run = 0
+        self.total_latency = 0.0
+        self.last_batch_latency = 0.0
+
+    @property
+    def queued(self):
+        """Number of windows waiting for the next batch"""
+        return self._queued
+
+    @property
+    def full(self):
+        """True when the next batch is ready to run"""
+        return self._queued == self.batch_size
+
+    def submit(self, features, metadata=None):
+        """
+        Copy a feature window into the next free batch slot
+
+        Args:
+            features (np.ndarray): Features matching the model input size
+            metadata: Value returned alongside this window's score
+
+        Returns:
+            list: Results of the batch if the submission filled it, otherwise empty
+        """
+        self._batch[self._queued] = features.reshape(self.model.input_shape)
+        self._metadata[self._queued] = metadata
+        self._queued += 1
+        if self.full:
+            return self.run_batch()
+        return []
+
+    def run_batch(self):
+        """
+        Run all queued windows through the model in one invocation
+
+        Returns:
+            list: (metadata, score) tuples in submission order
+        """
+        count = self._queued
+        if count == 0:
+            return []
+
+        start = time.perf_counter()
+        scores = self.model.predict(self._batch[:count])
+        self.last_batch_latency = time.perf_counter() - start
+
+        self.batches_run += 1
+        self.windows_run += count
+        self.total_latency += self.last_batch_latency
+        logger.debug(f"Inference batch of {count} windows took {self.last_batch_latency * 1000:.1f} ms")
+
+        results = list(zip(self._metadata[:count], scores.tolist()))
+        self._queued = 0
+        return results
+
+    def predict(self, features):
+        """
+        Score a single feature window immediately, bypassing the queue
+
+        Args:
+            features (np.ndarray): Features matching the model input size
+
+        Returns:
+            float: Model score
+        """
+        self._single[0] = features.reshape(self.model.input_shape)
+        return float(self.model.predict(self._single)[0])
+
+    def stats(self):
+        """
+        Summarise inference timing
+
+        Returns:
+            dict: Batch count, window count and latency figures in milliseconds
+        """
+        return {
+            "batches": self.batches_run,
+            "windows": self.windows_run,
+            "last_batch_ms": self.last_batch_latency * 1000,
+            "mean_batch_ms": self.total_latency / self.batches_run * 1000 if self.batches_run else 0.0,
+            "mean_window_ms": self.total_latency / self.windows_run * 1000 if self.windows_run else 0.0,
+        }
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - InfluxDB Line Protocol Writer
+
+Shared, batched writer for InfluxDB line protocol.
+
+Points are buffered and flushed as one newline-joined, gzip-compressed body
+once the buffer reaches INFLUX_BATCH_SIZE lines or its oldest line is
+INFLUX_FLUSH_INTERVAL seconds old. All requests go through one pooled
+requests.Session, so a metered GSM link pays for a TLS handshake once rather
+than once per point. 429 and 5xx responses are retried with exponential
+backoff, honouring Retry-After up to INFLUX_RETRY_MAX. A batch too large for the server (413) is
+split in half; if a later half fails, the halves already written are not
+sent again.
+
+Writers only hold the buffer lock to add lines; requests are made outside
+it, so a slow link or a retry backoff does not block the threads writing.
+"""
+
+import gzip
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rpi_config import (
+    INFLUXDB_URL,
+    INFLUXDB_TOKEN,
+    INFLUX_BATCH_SIZE,
+    INFLUX_FLUSH_INTERVAL,
+    INFLUX_GZIP,
+    INFLUX_MAX_RETRIES,
+    INFLUX_RETRY_MAX,
+)
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Bodies smaller than this are sent uncompressed; gzip overhead outweighs the saving
+GZIP_MIN_BYTES = 256
+
+
+class InfluxLineWriter:
+    """
+    Buffers line protocol and writes it to InfluxDB in batches
+    """
+
+    def __init__(self, url=INFLUXDB_URL, token=INFLUXDB_TOKEN, batch_size=INFLUX_BATCH_SIZE,
+                 flush_interval=INFLUX_FLUSH_INTERVAL, use_gzip=INFLUX_GZIP, max_retries=INFLUX_MAX_RETRIES,
+                 retry_base=1.0, retry_max=INFLUX_RETRY_MAX, timeout=30, max_buffer=None):
+        """
+        Args:
+            url (str): InfluxDB write endpoint including org, bucket and precision
+            token (str): InfluxDB API token
+            batch_size (int): Lines that trigger a flush
+            flush_interval (float): Age in seconds of the oldest line that triggers a flush
+            use_gzip (bool): Compress request bodies
+            max_retries (int): Retries for 429/5xx and connection errors
+            retry_base (float): Backoff before the first retry in seconds
+            retry_max (float): Longest wait between attempts, however long Retry-After asks for
+            timeout (float): Request timeout in seconds
+            max_buffer (int): Lines kept while InfluxDB is unreachable, defaults to 10 batches
+        """
+        self.url = url
+        self.token = token
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.use_gzip = use_gzip
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+        self.max_buffer = max_buffer or batch_size * 10
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.headers.update({
+            "Authorization": f"Token {token}",
+            "Content-Type": "text/plain; charset=utf-8",
+        })
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._oldest = None
+        # One flush at a time; the lines it is sending lead the buffer
+        self._flush_lock = threading.Lock()
+        self._sending = 0
+
+        self.requests_sent = 0
+        self.bytes_sent = 0
+        self.lines_written = 0
+        self.lines_dropped = 0
+
+    def write(self, lines):
+        """
+        Buffer one line or a list of lines, flushing if the batch is due
+
+        Args:
+            lines (str or list): Line protocol
+
+        Returns:
+            bool: False if a triggered flush failed, otherwise True
+        """
+        if isinstance(lines, str):
+            lines = [lines]
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(lines)
+
+            # Drop the oldest lines not being sent
+            overflow = min(len(self._buffer) - self.max_buffer, len(self._buffer) - self._sending)
+            if overflow > 0:
+                del self._buffer[self._sending:self._sending + overflow]
+                self.lines_dropped += overflow
+                logger.warning(f"InfluxDB write buffer full, dropped {overflow} oldest lines")
+
+            if len(self._buffer) < self.batch_size and not self._due():
+                return True
+        return self.flush(wait=False)
+
+    def _due(self):
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+
+    def flush_if_due(self):
+        """
+        Flush if the oldest buffered line has waited flush_interval seconds
+
+        Returns:
+            bool: False if the flush failed, otherwise True
+        """
+        with self._lock:
+            due = self._due()
+        return self.flush(wait=False) if due else True
+
+    def flush(self, wait=True):
+        """
+        Send everything in the buffer, in batches of batch_size lines
+
+        Lines stay buffered if InfluxDB cannot be reached.
+
+        Args:
+            wait (bool): If another thread is flushing, wait for it and flush
+                what is left, rather than leave the lines to that flush
+
+        Returns:
+            bool: True if the buffer was emptied, or another thread is flushing it
+        """
+        if not self._flush_lock.acquire(blocking=wait):
+            return True
+        try:
+            while True:
+                with self._lock:
+                    batch = self._buffer[:self.batch_size]
+                    if not batch:
+                        self._oldest = None
+                        return True
+                    self._sending = len(batch)
+                sent = 0
+                try:
+                    sent = self.post_prefix(batch)
+                finally:
+                    with self._lock:
+                        del self._buffer[:sent]
+                        self._sending = 0
+                if sent < len(batch):
+                    return False
+        finally:
+            self._flush_lock.release()
+
+    def post(self, lines):
+        """
+        Write a batch of lines, retrying transient failures
+
+        Args:
+            lines (list): Line protocol strings
+
+        Returns:
+            bool: True once InfluxDB has accepted (or permanently rejected) the batch
+        """
+        return self.post_prefix(lines) == len(lines)
+
+    def post_prefix(self, lines):
+        """
+        Write a batch of lines, retrying transient failures
+
+        Args:
+            lines (list): Line protocol strings
+
+        Returns:
+            int: Leading lines InfluxDB accepted (or permanently rejected);
+            after a failure the rest should be sent again, these should not
+        """
+        if not lines:
+            return 0
+
+        body = "\n".join(lines).encode("utf-8")
+        headers = {}
+        if self.use_gzip and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"InfluxDB write failed: {e}")
+            else:
+                self.requests_sent += 1
+                self.bytes_sent += len(body)
+                status = response.status_code
+
+                if 200 <= status < 300:
+                    self.lines_written += len(lines)
+                    logger.debug(f"Wrote {len(lines)} lines to InfluxDB in {len(body)} bytes")
+                    return len(lines)
+                if status == 400:
+                    # InfluxDB stores the valid points of a partial write; the
+                    # rejected ones will never succeed, so do not retry them
+                    logger.error(f"InfluxDB rejected part of a batch of {len(lines)} lines: {response.text}")
+                    self.lines_dropped += len(lines)
+                    return len(lines)
+                if status == 413:
+                    if len(lines) == 1:
+                        # One line too large for the server will never be accepted
+                        logger.error(f"InfluxDB rejected a {len(body)}-byte line as too large")
+                        self.lines_dropped += 1
+                        return 1
+                    middle = len(lines) // 2
+                    sent = self.post_prefix(lines[:middle])
+                    return sent if sent < middle else middle + self.post_prefix(lines[middle:])
+                if status not in RETRYABLE_STATUS:
+                    logger.error(f"Failed to send data to InfluxDB. Status code: {status}")
+                    return 0
+
+                retry_after = response.headers.get("Retry-After")
+                logger.warning(f"InfluxDB returned {status}, attempt {attempt + 1} of {self.max_retries + 1}")
+
+            if attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, retry_after))
+
+        return 0
+
+    def _retry_delay(self, attempt, retry_after):
+        if retry_after:
+            try:
+                return min(self.retry_max, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return min(self.retry_max, self.retry_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    def close(self):
+        """Flush remaining lines and close the HTTP session"""
+        self.flush()
+        self.session.close()
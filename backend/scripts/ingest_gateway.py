@@ -0,0 +1,903 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Ingest Gateway
+
+Local ingest service between the sensor fleet and storage.
+
+Nodes write to the gateway instead of InfluxDB Cloud, so a slow or
+unreachable cloud no longer holds up every node's uplink:
+
+- HTTP: POST /api/v2/write takes batched line protocol, optionally gzipped,
+  on the same path as InfluxDB. A node only changes the host in INFLUXDB_URL.
+- UDP: LoRa frames arrive on GATEWAY_PORT, either as raw lora_codec frames
+  or wrapped in the Semtech packet forwarder protocol (PUSH_DATA).
+
+Every point is checked against the schema in docs/influxdb_schema.md:
+known measurement, required and known tags, known fields of the right type
+and range, and a sane timestamp. Valid points are rewritten in canonical
+form (typed fields, sorted tags, second precision). Invalid lines are
+rejected with a 400 naming the line, but the valid lines in the same
+request are still stored, as InfluxDB does.
+
+Accepted points go to each storage sink on its own worker thread, in
+batches of GATEWAY_BATCH_SIZE. A slow sink only grows its own backlog.
+When a backlog reaches GATEWAY_MAX_PENDING, HTTP writes get a 503 with
+Retry-After, which the nodes' writers already honour. The sinks are the
+daily line protocol files, the embedded time-series store (ts_store.py)
+that the dashboards query, and optionally an upstream InfluxDB.
+
+Chainsaw detections also go to the fusion stage (event_fusion.py), which
+groups those of one chainsaw heard by nearby nodes and writes one
+fused_detection point per chainsaw, located from the nodes' arrival times
+and sound levels. The dedup stage (event_dedup.py) then keeps only the
+first detection of each spatial cell and time bucket for storage, so a
+chainsaw heard by five nodes is one acoustic_guardian row, not five. With
+an alert dispatcher (sms_dispatcher.py), each fused event is also one SMS
+to the rangers at the estimated location; without fusion, each detection
+dedup stores is. Either way nodes can leave alerting to the gateway
+(NODE_SMS_ALERTS=false), and a chainsaw heard by five nodes is one SMS.
+
+Usage:
+    python ingest_gateway.py
+    python ingest_gateway.py --http-port 8086 --udp-port 1680 --data-dir gateway_data
+"""
+
+import os
+import gzip
+import json
+import time
+import base64
+import socket
+import struct
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+from rpi_config import (
+    GATEWAY_BIND,
+    GATEWAY_PORT,
+    GATEWAY_HTTP_PORT,
+    GATEWAY_TOKEN,
+    GATEWAY_DATA_DIR,
+    GATEWAY_UPSTREAM_URL,
+    GATEWAY_BATCH_SIZE,
+    GATEWAY_FLUSH_INTERVAL,
+    GATEWAY_MAX_PENDING,
+    GATEWAY_MAX_FUTURE,
+    GATEWAY_FUSION_WINDOW,
+    GATEWAY_DEDUP_CELL,
+    INFLUXDB_TOKEN,
+    STORE_DIR,
+)
+from lora_codec import decode_frame
+from line_protocol import parse_line, format_line
+from node_metrics import MetricsRegistry
+
+logger = logging.getLogger("AcousticGuardian")
+
+FLOAT = "float"
+INTEGER = "integer"
+STRING = "string"
+BOOLEAN = "boolean"
+
+# Measurement -> tags (name: required) and fields (name: (type, min, max)).
+# Fields of None means any numeric fields are accepted.
+SCHEMA = {
+    "acoustic_guardian": {
+        "tags": {"device_id": True, "location": False},
+        "fields": {
+            "gps_coordinates": (STRING, None, None),
+            "threat_type": (STRING, None, None),
+            "confidence": (FLOAT, 0.0, 1.0),
+            "device_id": (STRING, None, None),
+            "threat_detected": (BOOLEAN, None, None),
+            "time_safe": (INTEGER, 0, None),
+            "arrival_time": (FLOAT, 0.0, None),
+            "sound_level": (FLOAT, -200.0, 200.0),
+        },
+    },
+    "device_status": {
+        "tags": {"device_id": True},
+        "fields": {
+            "battery_level": (FLOAT, 0.0, 100.0),
+            "signal_strength": (INTEGER, -150, 0),
+            "uptime": (INTEGER, 0, None),
+        },
+    },
+    "tree_health": {
+        "tags": {"device_id": True},
+        "fields": {
+            "health_score": (FLOAT, 0.0, 1.0),
+            "saplings_count": (INTEGER, 0, None),
+            "survival_rate": (FLOAT, 0.0, 1.0),
+        },
+    },
+    "node_metrics": {
+        "tags": {"device_id": True},
+        "fields": None,
+    },
+}
+
+# Divisor from a write request's precision to seconds
+PRECISION_DIVISORS = {"s": 1, "ms": 10**3, "us": 10**6, "ns": 10**9}
+
+# Errors listed in a 400 response; the rest are only counted
+MAX_REPORTED_ERRORS = 10
+
+# Semtech packet forwarder (UDP) identifiers
+SEMTECH_VERSION = 2
+PUSH_DATA = 0x00
+PUSH_ACK = 0x01
+PULL_DATA = 0x02
+PULL_ACK = 0x04
+
+def validate_point(measurement, tags, fields):
+    """
+    Check a point against SCHEMA and coerce its fields to the schema types
+
+    Args:
+        measurement (str): Measurement name
+        tags (dict): Tag values
+        fields (dict): Parsed field values
+
+    Returns:
+        dict: Fields with schema types
+
+    Raises:
+        ValueError: If the point does not match the schema
+    """
+    schema = SCHEMA.get(measurement)
+    if schema is None:
+        raise ValueError(f"unknown measurement {measurement}")
+    for name, required in schema["tags"].items():
+        if required and not tags.get(name):
+            raise ValueError(f"{measurement} requires tag {name}")
+    for name in tags:
+        if name not in schema["tags"]:
+            raise ValueError(f"unknown tag {name} for {measurement}")
+    if not fields:
+        raise ValueError("no fields")
+
+    specs = schema["fields"]
+    if specs is None:
+        for name, value in fields.items():
+            if isinstance(value, (str, bool)):
+                raise ValueError(f"{measurement} field {name} must be numeric")
+        return fields
+
+    typed = {}
+    for name, value in fields.items():
+        spec = specs.get(name)
+        if spec is None:
+            raise ValueError(f"unknown field {name} for {measurement}")
+        kind, low, high = spec
+        if kind == STRING or kind == BOOLEAN:
+            if type(value) is not (str if kind == STRING else bool):
+                raise ValueError(f"field {name} must be a {kind}")
+        else:
+            if isinstance(value, (str, bool)):
+                raise ValueError(f"field {name} must be a {kind}")
+            if kind == INTEGER:
+                # Older nodes write integers without the i suffix
+                if value != int(value):
+                    raise ValueError(f"field {name} must be an integer")
+                value = int(value)
+            else:
+                value = float(value)
+            if (low is not None and value < low) or (high is not None and value > high):
+                raise ValueError(f"field {name}={value} out of range")
+        typed[name] = value
+    return typed
+
+
+def lora_record_points(record):
+    """
+    Map a decoded LoRa record to schema points
+
+    Args:
+        record (dict): Record from lora_codec.decode_frame
+
+    Returns:
+        list: (measurement, tags, fields, timestamp) tuples
+    """
+    tags = {"device_id": record["device_id"]}
+    timestamp = int(record["timestamp"])
+    if "battery_level" in record:
+        return [
+            ("device_status", tags, {
+                "battery_level": float(record["battery_level"]),
+                "signal_strength": int(record["signal_strength"]),
+                "uptime": int(record["uptime"]),
+            }, timestamp),
+            ("acoustic_guardian", tags, {
+                "threat_detected": False,
+                "time_safe": int(record["time_safe"]),
+            }, timestamp),
+        ]
+    if record.get("type") == "tree_health":
+        return [("tree_health", tags, {
+            "health_score": float(record["health_score"]),
+            "saplings_count": int(record["saplings_count"]),
+            "survival_rate": float(record["survival_rate"]),
+        }, timestamp)]
+    fields = {
+        "gps_coordinates": record["gps_coordinates"],
+        "threat_type": "chainsaw",
+        "confidence": float(record["confidence"]),
+        "device_id": record["device_id"],
+        "threat_detected": bool(record["is_chainsaw"]),
+    }
+    for name in ("arrival_time", "sound_level"):
+        if name in record:
+            fields[name] = float(record[name])
+    return [("acoustic_guardian", tags, fields, timestamp)]
+
+
+class LineFileSink:
+    """
+    Appends line protocol to one file per UTC day under a directory
+    """
+
+    name = "file"
+
+    def __init__(self, directory=GATEWAY_DATA_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write_batch(self, lines):
+        path = os.path.join(self.directory, time.strftime("points-%Y-%m-%d.lp", time.gmtime()))
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+            f.write("\n")
+        return True
+
+    def close(self):
+        pass
+
+
+class InfluxSink:
+    """
+    Forwards batches to an InfluxDB write endpoint
+    """
+
+    name = "influxdb"
+
+    def __init__(self, url=GATEWAY_UPSTREAM_URL, token=INFLUXDB_TOKEN):
+        from influx_writer import InfluxLineWriter
+
+        # The sink worker does the batching and retrying, so one attempt per call
+        self.writer = InfluxLineWriter(url, token, max_retries=0)
+
+    def write_batch(self, lines):
+        return self.writer.post(lines)
+
+    def close(self):
+        self.writer.session.close()
+
+
+class StoreSink:
+    """
+    Writes acoustic_guardian and device_status points into the embedded
+    time-series store (ts_store.py); other measurements are skipped
+    """
+
+    name = "store"
+
+    def __init__(self, directory=STORE_DIR):
+        from ts_store import TimeSeriesStore
+
+        self.store = TimeSeriesStore(directory)
+        self.store.start()
+
+    def write_batch(self, lines):
+        try:
+            self.store.write_lines("\n".join(lines))
+        except ValueError as e:
+            # Canonical lines only fail on a type the store cannot hold, which a retry will not fix
+            logger.error(f"Store rejected a batch of {len(lines)} points: {e}")
+        return True
+
+    def close(self):
+        self.store.close()
+
+
+class SinkWorker:
+    """
+    Feeds one storage sink from its own backlog on a worker thread
+    """
+
+    def __init__(self, sink, batch_size=GATEWAY_BATCH_SIZE, flush_interval=GATEWAY_FLUSH_INTERVAL,
+                 max_pending=GATEWAY_MAX_PENDING, retry_max=60.0):
+        """
+        Args:
+            sink: Object with write_batch(lines) returning True on success, and close()
+            batch_size (int): Lines per write_batch call
+            flush_interval (float): Seconds a line waits before a partial batch is written
+            max_pending (int): Backlog at which the gateway sheds load
+            retry_max (float): Longest wait between attempts on a failing sink
+        """
+        self.sink = sink
+        self.name = getattr(sink, "name", type(sink).__name__)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_max = retry_max
+
+        self._backlog = []
+        self._in_flight = 0
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failures = 0
+
+    @property
+    def pending(self):
+        """Lines waiting to be written, including a batch being written"""
+        return len(self._backlog) + self._in_flight
+
+    @property
+    def full(self):
+        """True once the backlog has reached max_pending"""
+        return self.pending >= self.max_pending
+
+    def start(self):
+        """Start the worker thread"""
+        self._thread = threading.Thread(target=self._run, name=f"sink-{self.name}", daemon=True)
+        self._thread.start()
+
+    def offer(self, lines):
+        """
+        Add lines to the backlog
+
+        The newest lines are always kept; a backlog more than twice
+        max_pending drops its oldest lines, which only happens when callers
+        ignore the full flag.
+
+        Args:
+            lines (list): Canonical line protocol
+        """
+        with self._condition:
+            was_empty = not self._backlog
+            if was_empty:
+                self._oldest = time.monotonic()
+            self._backlog.extend(lines)
+            self._trim()
+            if was_empty or len(self._backlog) >= self.batch_size:
+                self._condition.notify()
+
+    def _trim(self):
+        overflow = len(self._backlog) - 2 * self.max_pending
+        if overflow > 0:
+            del self._backlog[:overflow]
+            self.dropped += overflow
+            logger.warning(f"Sink {self.name} backlog full, dropped {overflow} oldest points")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    if len(self._backlog) >= self.batch_size:
+                        break
+                    if self._oldest is not None:
+                        wait = self._oldest + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._condition.wait(wait)
+                batch = self._backlog[:self.batch_size]
+                del self._backlog[:len(batch)]
+                self._in_flight = len(batch)
+                stopping = self._stopping
+            if not batch:
+                if stopping:
+                    return
+                continue
+
+            if self._write(batch):
+                with self._condition:
+                    self._in_flight = 0
+                    self._oldest = time.monotonic() if self._backlog else None
+                continue
+
+            # Put the batch back in front of anything that arrived meanwhile
+            with self._condition:
+                self._backlog[:0] = batch
+                self._in_flight = 0
+                self._trim()
+                if stopping:
+                    logger.error(f"Sink {self.name} stopped with {len(self._backlog)} points unwritten")
+                    return
+                delay = min(self.retry_max, 2 ** min(self.failures, 10)) * random.uniform(0.5, 1.0)
+                self._condition.wait(delay)
+
+    def _write(self, batch):
+        try:
+            ok = self.sink.write_batch(batch)
+        except Exception as e:
+            logger.error(f"Sink {self.name} write failed: {e}")
+            ok = False
+        if not ok:
+            self.failures += 1
+            return False
+        self.failures = 0
+        self.written += len(batch)
+        self.batches += 1
+        return True
+
+    def stop(self, timeout=10.0):
+        """Write what is left in the backlog, then stop the thread and close the sink"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.sink.close()
+
+
+class IngestGateway:
+    """
+    Validates incoming points and hands them to the sink workers
+    """
+
+    def __init__(self, sinks, batch_size=GATEWAY_BATCH_SIZE, flush_interval=GATEWAY_FLUSH_INTERVAL,
+                 max_pending=GATEWAY_MAX_PENDING, max_future=GATEWAY_MAX_FUTURE, clock=time.time,
+                 fusion=None, dedup=None, alerts=None):
+        """
+        Args:
+            sinks (list): Storage sinks, each with write_batch(lines) and close()
+            batch_size (int): Points per sink write
+            flush_interval (float): Seconds a point waits before a partial batch is written
+            max_pending (int): Points buffered per sink before writes are refused
+            max_future (float): Seconds ahead of the gateway clock a timestamp may be
+            clock (callable): Time source for receive timestamps
+            fusion (DetectionFusion): Fuses chainsaw detections into located events, or None
+            dedup (DetectionDedup): Drops chainsaw detections already stored for their cell
+                and time bucket, or None
+            alerts (AlertDispatcher): Sends the rangers one SMS per fused event, or without
+                fusion per stored chainsaw detection, or None
+        """
+        self.workers = [SinkWorker(sink, batch_size, flush_interval, max_pending) for sink in sinks]
+        self.max_future = max_future
+        self.clock = clock
+        self.fusion = fusion
+        self.dedup = dedup
+        self.alerts = alerts
+
+        self.metrics = MetricsRegistry(prefix="ecoguard_gateway_")
+        self.accepted = {
+            source: self.metrics.counter("points_accepted_total", "Points accepted", {"source": source})
+            for source in ("http", "lora")
+        }
+        self.rejected = {
+            source: self.metrics.counter("points_rejected_total", "Points that failed validation",
+                                         {"source": source})
+            for source in ("http", "lora")
+        }
+        self.frames = self.metrics.counter("lora_frames_total", "LoRa frames received")
+        self.bad_frames = self.metrics.counter("lora_frames_invalid_total", "LoRa frames that could not be decoded")
+        self.refused = self.metrics.counter("writes_refused_total", "HTTP writes refused while sinks were backlogged")
+        self.parse_histogram = self.metrics.histogram("http_batch_seconds", "Time to validate one HTTP write")
+        self.fused = self.metrics.counter("fused_events_total", "Located events fused from chainsaw detections")
+        if fusion is not None:
+            self.metrics.counter("fusion_detections_total", "Chainsaw detections grouped for fusion",
+                                 func=lambda: fusion.detections)
+            self.metrics.gauge("fusion_open_clusters", "Groups of chainsaw detections still open",
+                               func=lambda: fusion.stats()["open"])
+        self.duplicates = self.metrics.counter("detections_deduplicated_total",
+                                               "Chainsaw detections not stored as duplicates of one already stored")
+        if dedup is not None:
+            self.metrics.gauge("dedup_keys", "Cell and time bucket keys held for dedup", func=lambda: dedup.keys)
+        for worker in self.workers:
+            labels = {"sink": worker.name}
+            self.metrics.counter("sink_points_written_total", "Points written to storage", labels,
+                                 func=lambda worker=worker: worker.written)
+            self.metrics.counter("sink_points_dropped_total", "Points dropped from a full backlog", labels,
+                                 func=lambda worker=worker: worker.dropped)
+            self.metrics.gauge("sink_backlog", "Points waiting to be written", labels,
+                               func=lambda worker=worker: worker.pending)
+
+    @property
+    def backlogged(self):
+        """True if any sink's backlog is full"""
+        return any(worker.full for worker in self.workers)
+
+    def start(self):
+        """Start the sink workers, the alert dispatcher and the fusion stage"""
+        for worker in self.workers:
+            worker.start()
+        if self.alerts is not None:
+            self.alerts.start()
+        if self.fusion is not None:
+            self.fusion.start(self._publish_fused)
+
+    def _publish(self, lines):
+        if lines:
+            for worker in self.workers:
+                worker.offer(lines)
+
+    def _store(self, measurement, tags, fields, timestamp):
+        """
+        Hand chainsaw detections to fusion and dedup; False if the point is a duplicate not to store
+
+        Without fusion, the detection dedup keeps is the one alerted on.
+        """
+        if measurement != "acoustic_guardian" or not fields.get("threat_detected"):
+            return True
+        if self.fusion is not None:
+            self.fusion.add(tags, fields, timestamp)
+        if self.dedup is not None and self.dedup.duplicate(tags, fields, timestamp):
+            return False
+        if self.fusion is None:
+            self._alert(tags, fields, timestamp)
+        return True
+
+    def _publish_fused(self, events):
+        self._publish([format_line(*event) for event in events])
+        self.fused.inc(len(events))
+        for _, tags, fields, timestamp in events:
+            self._alert(tags, fields, timestamp)
+
+    def _alert(self, tags, fields, timestamp):
+        """Queue one ranger SMS for a chainsaw, keyed on the node that reported it"""
+        if self.alerts is None:
+            return
+        nodes = fields.get("nodes", 1)
+        heard_by = f"{nodes} nodes ({fields['devices']})" if nodes > 1 else tags["device_id"]
+        error = f" ±{fields['error_m']:.0f} m" if nodes > 1 else ""
+        body = (
+            f"🚨 ALERT! Chainsaw heard by {heard_by} at {fields.get('gps_coordinates')}{error} "
+            f"with {float(fields.get('confidence', 0.0)) * 100:.1f}% confidence "
+            f"at {datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+        self.alerts.submit(tags["device_id"], body)
+
+    def _check_time(self, timestamp, now):
+        if timestamp > now + self.max_future:
+            raise ValueError(f"timestamp {timestamp} is in the future")
+        return timestamp
+
+    def ingest_lines(self, body, precision="s"):
+        """
+        Validate a batch of line protocol and queue the valid points
+
+        Args:
+            body (str): Newline-separated line protocol
+            precision (str): Timestamp precision of the batch (s, ms, us or ns)
+
+        Returns:
+            tuple: (points accepted, list of "line N: reason" errors)
+        """
+        divisor = PRECISION_DIVISORS.get(precision)
+        if divisor is None:
+            raise ValueError(f"unsupported precision {precision}")
+
+        now = self.clock()
+        received = int(now)
+        lines = []
+        errors = []
+        rejected = 0
+        duplicates = 0
+        with self.parse_histogram.time():
+            for number, line in enumerate(body.split("\n"), 1):
+                line = line.strip()
+                if not line or line[0] == "#":
+                    continue
+                try:
+                    measurement, tags, fields, timestamp = parse_line(line)
+                    fields = validate_point(measurement, tags, fields)
+                    timestamp = received if timestamp is None else self._check_time(timestamp // divisor, now)
+                    line = format_line(measurement, tags, fields, timestamp)
+                    if self._store(measurement, tags, fields, timestamp):
+                        lines.append(line)
+                    else:
+                        duplicates += 1
+                except ValueError as e:
+                    rejected += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(f"line {number}: {e}")
+
+        self._publish(lines)
+        self.accepted["http"].inc(len(lines) + duplicates)
+        self.rejected["http"].inc(rejected)
+        self.duplicates.inc(duplicates)
+        if rejected > len(errors):
+            errors.append(f"... and {rejected - len(errors)} more")
+        return len(lines) + duplicates, errors
+
+    def ingest_frame(self, frame):
+        """
+        Decode a raw lora_codec frame and queue its points
+
+        Args:
+            frame (bytes): Encoded frame
+
+        Returns:
+            int: Points accepted
+        """
+        self.frames.inc()
+        try:
+            records = decode_frame(frame)
+        except (ValueError, IndexError, struct.error) as e:
+            self.bad_frames.inc()
+            logger.debug(f"Invalid LoRa frame: {e}")
+            return 0
+
+        now = self.clock()
+        lines = []
+        duplicates = 0
+        for record in records:
+            for measurement, tags, fields, timestamp in lora_record_points(record):
+                try:
+                    fields = validate_point(measurement, tags, fields)
+                    line = format_line(measurement, tags, fields, self._check_time(timestamp, now))
+                except ValueError as e:
+                    self.rejected["lora"].inc()
+                    logger.debug(f"Rejected LoRa point from {tags['device_id']}: {e}")
+                    continue
+                if self._store(measurement, tags, fields, timestamp):
+                    lines.append(line)
+                else:
+                    duplicates += 1
+        self._publish(lines)
+        self.accepted["lora"].inc(len(lines) + duplicates)
+        self.duplicates.inc(duplicates)
+        return len(lines) + duplicates
+
+    def handle_datagram(self, datagram):
+        """
+        Handle one UDP datagram: a raw frame or a Semtech forwarder packet
+
+        Args:
+            datagram (bytes): Received payload
+
+        Returns:
+            bytes: Acknowledgement to send back, or None
+        """
+        if len(datagram) < 4 or datagram[0] != SEMTECH_VERSION:
+            self.ingest_frame(datagram)
+            return None
+
+        token, identifier = datagram[1:3], datagram[3]
+        if identifier == PULL_DATA:
+            return bytes([SEMTECH_VERSION]) + token + bytes([PULL_ACK])
+        if identifier != PUSH_DATA:
+            return None
+
+        try:
+            payload = json.loads(datagram[12:])
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            self.bad_frames.inc()
+            return None
+        packets = payload.get("rxpk", [])
+        for packet in packets:
+            if not isinstance(packet, dict) or packet.get("stat", 1) != 1:
+                # Malformed, or failed CRC on the radio side
+                self.bad_frames.inc()
+                continue
+            try:
+                frame = base64.b64decode(packet["data"])
+            except (KeyError, ValueError):
+                self.bad_frames.inc()
+                continue
+            self.ingest_frame(frame)
+        return bytes([SEMTECH_VERSION]) + token + bytes([PUSH_ACK])
+
+    def stats(self):
+        """
+        Summarise gateway activity
+
+        Returns:
+            dict: Accepted/rejected counts per source, per-sink progress, and fusion, dedup and
+                alert counts
+        """
+        stats = {
+            "accepted": {source: int(counter.get()) for source, counter in self.accepted.items()},
+            "rejected": {source: int(counter.get()) for source, counter in self.rejected.items()},
+            "lora_frames": int(self.frames.get()),
+            "lora_frames_invalid": int(self.bad_frames.get()),
+            "writes_refused": int(self.refused.get()),
+            "deduplicated": int(self.duplicates.get()),
+            "sinks": {
+                worker.name: {"written": worker.written, "batches": worker.batches,
+                              "pending": worker.pending, "dropped": worker.dropped}
+                for worker in self.workers
+            },
+        }
+        if self.fusion is not None:
+            stats["fusion"] = self.fusion.stats()
+        if self.dedup is not None:
+            stats["dedup"] = self.dedup.stats()
+        if self.alerts is not None:
+            stats["alerts"] = self.alerts.stats()
+        return stats
+
+    def stop(self):
+        """Fuse the open detection groups, write out remaining points and alerts, and stop the workers"""
+        if self.fusion is not None:
+            events = self.fusion.stop()
+            if events:
+                self._publish_fused(events)
+        if self.alerts is not None:
+            self.alerts.stop()
+        for worker in self.workers:
+            worker.stop()
+
+
+class LoraUdpListener:
+    """
+    Receives LoRa frames on a UDP port in a background thread
+    """
+
+    def __init__(self, gateway, host=GATEWAY_BIND, port=GATEWAY_PORT):
+        self.gateway = gateway
+        self.host = host
+        self.port = port
+        self._socket = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Bind the socket and start receiving"""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self._socket.bind((self.host, self.port))
+        self._socket.settimeout(1.0)
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._run, name="lora-udp", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                datagram, address = self._socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                reply = self.gateway.handle_datagram(datagram)
+                if reply:
+                    self._socket.sendto(reply, address)
+            except Exception as e:
+                logger.error(f"Failed to handle datagram from {address[0]}: {e}")
+
+    def stop(self):
+        """Stop receiving and close the socket"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def create_app(gateway, token=GATEWAY_TOKEN):
+    """
+    Build the Flask app for the HTTP side of the gateway
+
+    Args:
+        gateway (IngestGateway): Gateway that receives the points
+        token (str): Token required in the Authorization header, or empty for none
+
+    Returns:
+        Flask: The application
+    """
+    from flask import Flask, Response, jsonify, request
+
+    app = Flask(__name__)
+
+    @app.route("/api/v2/write", methods=["POST"])
+    def write():
+        if token and request.headers.get("Authorization", "") not in (f"Token {token}", f"Bearer {token}"):
+            return jsonify({"code": "unauthorized", "message": "invalid token"}), 401
+        if gateway.backlogged:
+            gateway.refused.inc()
+            response = jsonify({"code": "unavailable", "message": "storage backlogged, retry later"})
+            response.headers["Retry-After"] = "5"
+            return response, 503
+
+        body = request.get_data()
+        if request.headers.get("Content-Encoding") == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except OSError:
+                return jsonify({"code": "invalid", "message": "body is not valid gzip"}), 400
+        try:
+            accepted, errors = gateway.ingest_lines(body.decode("utf-8"), request.args.get("precision", "ns"))
+        except (ValueError, UnicodeDecodeError) as e:
+            return jsonify({"code": "invalid", "message": str(e)}), 400
+
+        if errors:
+            return jsonify({"code": "invalid", "message": "; ".join(errors), "accepted": accepted}), 400
+        return "", 204
+
+    @app.route("/health")
+    def health():
+        status = "backlogged" if gateway.backlogged else "pass"
+        return jsonify({"name": "ecoguard-gateway", "status": status}), 200 if status == "pass" else 503
+
+    @app.route("/stats")
+    def stats():
+        return jsonify(gateway.stats())
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(gateway.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    return app
+
+
+def build_sinks(data_dir=GATEWAY_DATA_DIR, upstream_url=GATEWAY_UPSTREAM_URL, store_dir=STORE_DIR):
+    """
+    Storage sinks from the configuration: local files, the embedded store if
+    a store directory is set, and InfluxDB if an upstream URL is set
+    """
+    sinks = [LineFileSink(data_dir)]
+    if store_dir:
+        sinks.append(StoreSink(store_dir))
+    if upstream_url:
+        sinks.append(InfluxSink(upstream_url))
+    return sinks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EcoGuard ingest gateway")
+    parser.add_argument("--host", default=GATEWAY_BIND)
+    parser.add_argument("--http-port", type=int, default=GATEWAY_HTTP_PORT)
+    parser.add_argument("--udp-port", type=int, default=GATEWAY_PORT, help="LoRa frames; 0 disables UDP")
+    parser.add_argument("--data-dir", default=GATEWAY_DATA_DIR)
+    parser.add_argument("--upstream", default=GATEWAY_UPSTREAM_URL, help="InfluxDB write URL to forward to")
+    parser.add_argument("--store-dir", default=STORE_DIR, help="Embedded time-series store; empty disables it")
+    parser.add_argument("--fusion-window", type=float, default=GATEWAY_FUSION_WINDOW,
+                        help="Seconds over which chainsaw detections are fused; 0 disables fusion")
+    parser.add_argument("--dedup-cell", type=float, default=GATEWAY_DEDUP_CELL,
+                        help="Metres per side of the dedup cells; 0 stores every detection")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    fusion = None
+    if args.fusion_window > 0:
+        from event_fusion import DetectionFusion
+        fusion = DetectionFusion(window=args.fusion_window)
+    dedup = None
+    if args.dedup_cell > 0:
+        from event_dedup import DetectionDedup
+        dedup = DetectionDedup(cell=args.dedup_cell)
+    alerts = None
+    if os.environ.get("TWILIO_ACCOUNT_SID") and os.environ.get("TWILIO_AUTH_TOKEN"):
+        from sms_dispatcher import AlertDispatcher, TwilioTransport
+        alerts = AlertDispatcher(TwilioTransport(os.environ["TWILIO_ACCOUNT_SID"], os.environ["TWILIO_AUTH_TOKEN"]))
+    else:
+        logger.warning("Twilio credentials not found in environment variables, the gateway sends no SMS alerts")
+    gateway = IngestGateway(build_sinks(args.data_dir, args.upstream, args.store_dir), fusion=fusion, dedup=dedup,
+                            alerts=alerts)
+    gateway.start()
+    listener = None
+    if args.udp_port:
+        listener = LoraUdpListener(gateway, args.host, args.udp_port)
+        listener.start()
+        logger.info(f"Listening for LoRa frames on UDP {args.host}:{listener.port}")
+
+    try:
+        create_app(gateway).run(host=args.host, port=args.http_port, threaded=True)
+    finally:
+        if listener:
+            listener.stop()
+        gateway.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ import requests
 from datetime import datetime
 import os
 
+from line_protocol import format_line
+
 # Data sources for Kenyan forests
 DATA_SOURCES = {
     "gazetted_forests": {
@@ -287,18 +289,24 @@ def generate_influxdb_line_protocol_examples():
     """
     print("Generating InfluxDB Line Protocol examples...")
     
+    timestamp = 1634567890
     examples = [
         # Example 1: Forest boundary data
-        'forest_boundaries,forest_name="Karura Forest",forest_type="Urban Forest" area_km2=17.5,lat=-1.2723,lng=36.8080 1634567890',
+        format_line("forest_boundaries", {"forest_name": "Karura Forest", "forest_type": "Urban Forest"},
+                    {"area_km2": 17.5, "lat": -1.2723, "lng": 36.8080}, timestamp),
         
         # Example 2: Deforestation risk data
-        'deforestation_risk,forest_name="Karura Forest" risk_score=0.67,urban_proximity=0.9,accessibility=0.8,historical_loss=0.3 1634567890',
+        format_line("deforestation_risk", {"forest_name": "Karura Forest"},
+                    {"risk_score": 0.67, "urban_proximity": 0.9, "accessibility": 0.8, "historical_loss": 0.3},
+                    timestamp),
         
         # Example 3: Biodiversity data
-        'biodiversity,forest_name="Kakamega Forest",species_type="Bird" species_count=200,conservation_status="High" 1634567890',
+        format_line("biodiversity", {"forest_name": "Kakamega Forest", "species_type": "Bird"},
+                    {"species_count": 200, "conservation_status": "High"}, timestamp),
         
         # Example 4: Sensor deployment recommendation
-        'sensor_deployment,forest_name="Uhuru Park" priority=9,reason="High risk urban area",recommended_sensors=3 1634567890'
+        format_line("sensor_deployment", {"forest_name": "Uhuru Park"},
+                    {"priority": 9, "reason": "High risk urban area", "recommended_sensors": 3}, timestamp)
     ]
     
     # Save examples to file
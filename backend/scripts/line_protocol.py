@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - InfluxDB Line Protocol
+
+One serializer and parser for line protocol, shared by the nodes, the
+simulators, the ingest gateway and storage.
+
+Escaping follows the InfluxDB rules. Measurements escape commas and spaces.
+Tag keys, tag values and field keys also escape equals signs. String field
+values are double-quoted with backslashes and quotes escaped. Tag values are
+never quoted: a quote in a tag value is a literal character. Python types
+choose the field type: bool -> boolean, int -> integer (i suffix),
+float -> float, str -> string.
+
+Three ways in and out:
+
+- format_line / parse_line: one point at a time.
+- parse_lines: a whole batch into NumPy columns per measurement. Rows are
+  grouped by their tag and field layout, and each column's values are cut
+  out of the joined text with slicing and converted with one NumPy cast.
+  No dict is built per point.
+- format_columns: the reverse, one template per layout.
+
+numpy is only imported by the batch functions, so the sensor node can use
+format_line without loading it.
+"""
+
+import re
+import math
+
+TRUE_VALUES = ("t", "T", "true", "True", "TRUE")
+FALSE_VALUES = ("f", "F", "false", "False", "FALSE")
+
+_MEASUREMENT_ESCAPES = str.maketrans({",": "\\,", " ": "\\ "})
+_KEY_ESCAPES = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ "})
+_STRING_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"'})
+
+_UNESCAPE = re.compile(r"\\(.)")
+
+# Parsing first swaps escape sequences for private-use characters, so the
+# text can be split with plain str methods and simple regexes; restoring a
+# value maps each placeholder to the character it stands for. Inside a
+# quoted string only backslashes and quotes are escaped, so there the
+# other placeholders go back to the backslash sequence they replaced
+_PROTECT = (("\\\\", "\ue000"), ("\\,", "\ue001"), ("\\=", "\ue002"), ("\\ ", "\ue003"), ('\\"', "\ue004"))
+_RESTORE = str.maketrans({"\ue000": "\\", "\ue001": ",", "\ue002": "=", "\ue003": " ", "\ue004": '"'})
+_RESTORE_STRING = str.maketrans({"\ue000": "\\", "\ue001": "\\,", "\ue002": "\\=", "\ue003": "\\ ", "\ue004": '"'})
+_PLACEHOLDERS = re.compile("[\ue000-\ue004]")
+
+# One whole line of protected text: measurement, tag set, field set, optional
+# timestamp. The measurement runs to the first unescaped comma, so an equals
+# sign in it is literal; the tag set is empty or starts with that comma
+_LINE = re.compile(
+    r'^[ \t]*(?![ #\n])([^ \n,]*)([^ \n]*) ([^ "\n]*(?:"[^"\n]*"[^ "\n]*)*)(?: (-?\d+))?[ \t]*$',
+    re.MULTILINE,
+)
+_CONTENT_LINE = re.compile(r"^[ \t]*[^#\s]", re.MULTILINE)
+_TAG_VALUE = re.compile(r"=[^,\n]*")
+_FIELD_VALUE = re.compile(r'=(?:"[^"\n]*"|[^,\n]*)')
+_FIELD_PAIR = re.compile(r'([^,=]+)=("[^"]*"|[^,]*)(?:,|$)')
+_FIELD_VALUES = re.compile(r'[^,=]+=("[^"]*"|[^,]*)')
+
+
+# The membership tests are much cheaper than translate, and names and
+# values rarely contain anything that needs escaping
+
+def escape_measurement(name):
+    """Escape a measurement name"""
+    if " " in name or "," in name:
+        return name.translate(_MEASUREMENT_ESCAPES)
+    return name
+
+
+def escape_key(text):
+    """Escape a tag key, tag value or field key"""
+    if " " in text or "," in text or "=" in text:
+        return text.translate(_KEY_ESCAPES)
+    return text
+
+
+def escape_string(text):
+    """Escape the contents of a string field value, without the surrounding quotes"""
+    if '"' in text or "\\" in text:
+        return text.translate(_STRING_ESCAPES)
+    return text
+
+
+def unescape(text):
+    """Remove line protocol backslash escapes"""
+    return _UNESCAPE.sub(r"\1", text) if "\\" in text else text
+
+
+def format_value(value):
+    """
+    Format one field value by its Python type
+
+    Args:
+        value: bool, int, float, str, or a NumPy scalar of those kinds
+
+    Returns:
+        str: Field value text, or None for a NaN or infinite float, which
+        InfluxDB cannot store
+    """
+    kind = type(value)
+    if kind is float:
+        return repr(value) if math.isfinite(value) else None
+    if kind is bool:
+        return "true" if value else "false"
+    if kind is int:
+        return f"{value}i"
+    if kind is str:
+        return f'"{escape_string(value)}"'
+    if hasattr(value, "item"):
+        # NumPy scalar
+        return format_value(value.item())
+    raise TypeError(f"Unsupported field type {kind.__name__}")
+
+
+def format_line(measurement, tags, fields, timestamp=None):
+    """
+    Serialize one point
+
+    Tags are written sorted by key, as InfluxDB prefers. Tags whose value is
+    None or empty are left out, and so are fields whose value is None or a
+    non-finite float.
+
+    Args:
+        measurement (str): Measurement name
+        tags (dict): Tag values
+        fields (dict): Field values
+        timestamp (int): Timestamp, or None to let the server stamp it
+
+    Returns:
+        str: One line of line protocol
+
+    Raises:
+        ValueError: If no field has a value
+    """
+    key = escape_measurement(measurement)
+    if tags:
+        for name in sorted(tags):
+            value = tags[name]
+            if value is not None and value != "":
+                key += f",{escape_key(name)}={escape_key(str(value))}"
+
+    parts = []
+    for name, value in fields.items():
+        if value is None:
+            continue
+        text = format_value(value)
+        if text is not None:
+            parts.append(f"{escape_key(name)}={text}")
+    if not parts:
+        raise ValueError(f"{measurement} point has no field values")
+
+    if timestamp is None:
+        return f"{key} {','.join(parts)}"
+    return f"{key} {','.join(parts)} {int(timestamp)}"
+
+
+def _protect(text):
+    if "\\" in text:
+        for escaped, placeholder in _PROTECT:
+            text = text.replace(escaped, placeholder)
+    return text
+
+
+def _restore(text):
+    return text.translate(_RESTORE)
+
+
+def _restore_string(text):
+    return text.translate(_RESTORE_STRING)
+
+
+def _restore_all(values, table=_RESTORE):
+    """Restore a list of protected strings with a single translate"""
+    joined = "\n".join(values)
+    if not _PLACEHOLDERS.search(joined):
+        return values
+    return joined.translate(table).split("\n")
+
+
+def _value(raw, restore=_restore):
+    if not raw:
+        raise ValueError("empty field value")
+    if raw[0] == '"':
+        if len(raw) < 2 or raw[-1] != '"':
+            raise ValueError(f"unterminated string {_restore(raw)}")
+        return _restore_string(raw[1:-1]) if restore is _restore else restore(raw[1:-1])
+    if raw[-1] in "iu":
+        return int(raw[:-1])
+    if raw in TRUE_VALUES:
+        return True
+    if raw in FALSE_VALUES:
+        return False
+    return float(raw)
+
+
+def parse_value(raw):
+    """
+    Parse one field value
+
+    Args:
+        raw (str): Field value text
+
+    Returns:
+        bool, int, float or str
+    """
+    return _value(_protect(raw))
+
+
+def _parse_tags(measurement, tag_set, restore=_restore):
+    measurement = restore(measurement)
+    if not measurement:
+        raise ValueError("missing measurement")
+    tags = {}
+    for part in tag_set.split(",")[1:]:
+        name, sep, value = part.partition("=")
+        if not sep or not name or not value:
+            raise ValueError(f"invalid tag {_restore(part)}")
+        tags[restore(name)] = restore(value)
+    return measurement, tags
+
+
+def parse_line(line):
+    """
+    Parse one line
+
+    Args:
+        line (str): Line without the trailing newline
+
+    Returns:
+        tuple: (measurement, tags dict, fields dict, timestamp or None)
+
+    Raises:
+        ValueError: If the line is malformed
+    """
+    line = line.strip()
+    if "\\" in line:
+        line = _protect(line)
+        restore = _restore
+    else:
+        # Nothing was protected, so there is nothing to restore
+        restore = str
+    match = _LINE.match(line)
+    if not match:
+        raise ValueError("malformed line")
+    measurement, tag_set, field_set, timestamp = match.groups()
+    measurement, tags = _parse_tags(measurement, tag_set, restore)
+
+    fields = {}
+    if '"' not in field_set:
+        for part in field_set.split(","):
+            name, sep, value = part.partition("=")
+            if not sep or not name:
+                raise ValueError(f"invalid field {_restore(part)}")
+            fields[restore(name)] = _value(value, restore)
+    else:
+        end = 0
+        for pair in _FIELD_PAIR.finditer(field_set):
+            if pair.start() != end:
+                break
+            fields[restore(pair.group(1))] = _value(pair.group(2), restore)
+            end = pair.end()
+        if end != len(field_set):
+            raise ValueError(f"invalid field set {_restore(field_set)}")
+    return measurement, tags, fields, int(timestamp) if timestamp else None
+
+
+class MeasurementColumns:
+    """
+    Points of one measurement as NumPy columns
+
+    Attributes:
+        measurement (str): Measurement name
+        time (np.ndarray): int64 timestamps
+        tags (dict): Tag name -> object array of values, None where a row lacks the tag
+        fields (dict): Field name -> array (float64, int64, bool or object for strings)
+        present (dict): Field name -> bool mask, only for fields missing from some rows;
+            missing float values are NaN, others are 0, False or ""
+    """
+
+    def __init__(self, measurement, time, tags, fields, present=None):
+        self.measurement = measurement
+        self.time = time
+        self.tags = tags
+        self.fields = fields
+        self.present = present or {}
+
+    def __len__(self):
+        return len(self.time)
+
+    def to_dataframe(self):
+        """
+        Columns as a pandas DataFrame with a UTC "time" column
+
+        Returns:
+            pd.DataFrame: One row per point
+        """
+        import pandas as pd
+
+        data = {"time": pd.to_datetime(self.time, unit="s", utc=True)}
+        data.update(self.tags)
+        data.update(self.fields)
+        return pd.DataFrame(data)
+
+
+def _convert_column(values, name):
+    import numpy as np
+
+    raw = np.array(values)
+    first = values[0]
+    if first[:1] == '"':
+        if not (np.char.startswith(raw, '"').all() and np.char.endswith(raw, '"').all()):
+            raise ValueError(f"field {name} mixes strings and other types")
+        column = np.empty(len(values), dtype=object)
+        column[:] = _restore_all([value[1:-1] for value in values], _RESTORE_STRING)
+        return column
+    if first[-1:] in ("i", "u"):
+        if not np.char.endswith(raw, first[-1]).all():
+            raise ValueError(f"field {name} mixes integers and other types")
+        return np.char.rstrip(raw, first[-1]).astype(np.int64)
+    if first in TRUE_VALUES or first in FALSE_VALUES:
+        truth = np.isin(raw, TRUE_VALUES)
+        if not (truth | np.isin(raw, FALSE_VALUES)).all():
+            raise ValueError(f"field {name} mixes booleans and other types")
+        return truth
+    try:
+        return raw.astype(np.float64)
+    except ValueError:
+        raise ValueError(f"field {name} has a value that is not a float")
+
+
+def _parse_group(tag_sets, field_sets, tag_names, field_names):
+    """Tag and field columns for rows of protected text that share one layout"""
+    count = len(tag_sets)
+    stride = 1 + 2 * len(tag_names)
+    field_count = len(field_names)
+
+    tags = {}
+    if tag_names:
+        # Each tag set starts with its comma, so a row is "", then name and value per tag
+        flat = ",".join(tag_sets).replace("=", ",").split(",")
+        if len(flat) != count * stride:
+            raise ValueError("tag set does not match its layout")
+        for j, name in enumerate(tag_names):
+            values = flat[2 + 2 * j::stride]
+            if "" in values:
+                raise ValueError(f"tag {name} has an empty value")
+            tags[name] = _restore_all(values)
+
+    joined = ",".join(field_sets)
+    if '"' not in joined:
+        values = joined.replace("=", ",").split(",")[1::2]
+    else:
+        values = _FIELD_VALUES.findall(joined)
+    if len(values) != count * field_count:
+        raise ValueError("field set does not match its layout")
+    fields = {name: values[j::field_count] for j, name in enumerate(field_names)}
+    return tags, fields
+
+
+def parse_lines(text, default_time=None):
+    """
+    Parse a batch of line protocol into columns per measurement
+
+    Args:
+        text (str): Newline-separated line protocol; blank and # lines are skipped
+        default_time (int): Timestamp for lines without one; if None such lines are an error
+
+    Returns:
+        dict: Measurement name -> MeasurementColumns, rows in input order
+
+    Raises:
+        ValueError: With the line number of the first malformed line
+    """
+    import numpy as np
+
+    original = text
+    if "\r" in text:
+        text = text.replace("\r", "")
+    text = _protect(text)
+    matches = _LINE.findall(text)
+    # Every line matching is the common case; only count content lines when it is not
+    if len(matches) != text.strip("\n").count("\n") + 1 and len(matches) != len(_CONTENT_LINE.findall(text)):
+        _raise_first_error(original)
+    if not matches:
+        return {}
+    measurements, tag_sets, field_sets, stamps = zip(*matches)
+
+    # Group rows by layout: measurement, tag keys and field keys
+    tag_layouts = _TAG_VALUE.sub("", "\n".join(tag_sets)).split("\n")
+    field_layouts = _FIELD_VALUE.sub("", "\n".join(field_sets)).split("\n")
+    groups = {}
+    for row, layout in enumerate(zip(measurements, tag_layouts, field_layouts)):
+        rows = groups.get(layout)
+        if rows is None:
+            groups[layout] = [row]
+        else:
+            rows.append(row)
+
+    if "" in stamps:
+        if default_time is None:
+            _raise_first_error(original, missing_time=True)
+        stamps = [stamp or default_time for stamp in stamps]
+    times = np.array(stamps).astype(np.int64)
+
+    by_measurement = {}
+    for (measurement, tag_layout, field_layout), rows in groups.items():
+        measurement = _restore(measurement)
+        tag_names = [_restore(name) for name in tag_layout.split(",")[1:]]
+        field_names = [_restore(name) for name in field_layout.split(",")]
+        if not measurement or "" in tag_names or "" in field_names:
+            raise ValueError(f"{measurement} line has an empty measurement, tag or field key")
+        if len(set(field_names)) != len(field_names):
+            raise ValueError(f"{measurement} line repeats a field")
+        if len(groups) == 1:
+            group_tag_sets, group_field_sets = tag_sets, field_sets
+        else:
+            group_tag_sets = [tag_sets[row] for row in rows]
+            group_field_sets = [field_sets[row] for row in rows]
+        tags, fields = _parse_group(group_tag_sets, group_field_sets, tag_names, field_names)
+        by_measurement.setdefault(measurement, []).append((rows, tags, fields))
+
+    result = {}
+    for measurement, parts in by_measurement.items():
+        result[measurement] = _merge_groups(measurement, parts, times, np)
+    return result
+
+
+def _merge_groups(measurement, parts, times, np):
+    """Combine the layout groups of one measurement, restoring input row order"""
+    if len(parts) == 1:
+        rows, tags, fields = parts[0]
+        index = np.asarray(rows)
+        tag_columns = {}
+        for name, values in tags.items():
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            tag_columns[name] = column
+        field_columns = {name: _convert_column(values, name) for name, values in fields.items()}
+        return MeasurementColumns(measurement, times[index], tag_columns, field_columns)
+
+    index = np.sort(np.concatenate([np.asarray(rows) for rows, _, _ in parts]))
+    count = len(index)
+    # Position of each original row within this measurement's output
+    position = np.empty(index[-1] + 1, dtype=np.int64)
+    position[index] = np.arange(count)
+
+    tag_columns = {}
+    field_columns = {}
+    present = {}
+    for rows, tags, fields in parts:
+        where = position[np.asarray(rows)]
+        for name, values in tags.items():
+            column = tag_columns.get(name)
+            if column is None:
+                column = tag_columns[name] = np.full(count, None, dtype=object)
+            column[where] = values
+        for name, values in fields.items():
+            converted = _convert_column(values, name)
+            column = field_columns.get(name)
+            if column is None:
+                if converted.dtype == np.float64:
+                    column = np.full(count, np.nan)
+                elif converted.dtype == object:
+                    column = np.full(count, "", dtype=object)
+                else:
+                    column = np.zeros(count, dtype=converted.dtype)
+                field_columns[name] = column
+                present[name] = np.zeros(count, dtype=bool)
+            elif column.dtype != converted.dtype:
+                raise ValueError(f"field {name} of {measurement} has mixed types")
+            column[where] = converted
+            present[name][where] = True
+
+    present = {name: mask for name, mask in present.items() if not mask.all()}
+    return MeasurementColumns(measurement, times[index], tag_columns, field_columns, present)
+
+
+def _raise_first_error(text, missing_time=False):
+    for number, line in enumerate(text.split("\n"), 1):
+        stripped = line.strip()
+        if not stripped or stripped[0] == "#":
+            continue
+        try:
+            _, _, _, timestamp = parse_line(stripped)
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}")
+        if missing_time and timestamp is None:
+            raise ValueError(f"line {number}: no timestamp")
+    raise ValueError("malformed line protocol")
+
+
+def format_columns(columns):
+    """
+    Serialize MeasurementColumns back to line protocol
+
+    Rows with missing fields or tags are written without them.
+
+    Args:
+        columns (MeasurementColumns): Points of one measurement
+
+    Returns:
+        list: One line per row
+    """
+    import numpy as np
+
+    count = len(columns)
+    if not count:
+        return []
+    prefix = escape_measurement(columns.measurement)
+    if columns.present or any(
+        any(value is None for value in values) for values in columns.tags.values()
+    ):
+        # Uneven rows: fall back to one format_line per point
+        return [
+            format_line(
+                columns.measurement,
+                {name: values[row] for name, values in columns.tags.items()},
+                {
+                    name: values[row].item() if hasattr(values[row], "item") else values[row]
+                    for name, values in columns.fields.items()
+                    if columns.present.get(name) is None or columns.present[name][row]
+                },
+                columns.time[row],
+            )
+            for row in range(count)
+        ]
+
+    template = prefix
+    cells = []
+    for name in sorted(columns.tags):
+        template += f",{escape_key(name)}={{}}"
+        cells.append([escape_key(str(value)) for value in columns.tags[name]])
+    separator = " "
+    for name, values in columns.fields.items():
+        template += f"{separator}{escape_key(name)}={{}}"
+        separator = ","
+        if values.dtype == np.float64:
+            if not np.isfinite(values).all():
+                raise ValueError(f"field {name} has NaN or infinite values")
+            cells.append(values.tolist())
+            template = template[:-2] + "{!r}"
+        elif values.dtype == np.bool_:
+            cells.append(np.where(values, "true", "false").tolist())
+        elif values.dtype.kind in "iu":
+            cells.append(values.tolist())
+            template += "i"
+        else:
+            cells.append([f'"{escape_string(str(value))}"' for value in values])
+    template += " {}"
+    cells.append(columns.time.tolist())
+    return [template.format(*row) for row in zip(*cells)]
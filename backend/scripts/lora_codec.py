@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - LoRa Payload Codec
+
+Compact, versioned binary encoding for LoRa uplinks.
+
+A frame carries one or more records from a single device:
+
+    Frame header (7 bytes plus the device ID, big-endian)
+        uint8   codec version
+        uint8   device ID length
+        bytes   device ID, ASCII, as in DEVICE_ID
+        uint32  base timestamp, Unix seconds
+        uint8   record count
+
+    Record header (3 bytes)
+        uint8   record type
+        uint16  seconds after the frame's base timestamp
+
+    Heartbeat body (10 bytes)
+        uint8   battery level, 0.5 % steps
+        int8    signal strength, dBm
+        uint32  uptime, seconds
+        uint32  time safe, seconds
+
+    Detection body (21 bytes)
+        uint8   event kind (window / started / ended)
+        uint8   peak confidence, 1/255 steps
+        uint8   mean confidence, 1/255 steps
+        uint16  event duration, seconds
+        uint16  positive windows
+        int32   latitude, micro-degrees
+        int32   longitude, micro-degrees
+        int32   onset arrival time, milliseconds after the record's timestamp
+        int16   onset sound level, 0.01 dB steps
+
+    Tree health body (4 bytes)
+        uint8   health score, 1/255 steps
+        uint16  saplings count
+        uint8   survival rate, 1/255 steps
+
+A heartbeat that costs ~145 bytes as JSON is 26 bytes here for AG-001, and
+several records share one header when the outbox drains a batch. The
+header carries the whole device ID, so the gateway stores points under the
+ID the node was configured with rather than rebuilding it from a number.
+Version 4 added the onset to the detection body, which the gateway's fusion
+stage locates the chainsaw from; the lowest value of either field means the
+node did not measure it. Frames of earlier versions are rejected.
+"""
+
+import math
+import struct
+
+from rpi_config import LORA_SPREADING_FACTOR, LORA_BANDWIDTH, LORA_CODING_RATE, LORA_MAX_PAYLOAD
+
+# Not 2: the gateway tells raw frames from Semtech packet forwarder
+# datagrams, which start with protocol version 2, by the first byte
+CODEC_VERSION = 4
+
+RECORD_HEARTBEAT = 1
+RECORD_DETECTION = 2
+RECORD_TREE_HEALTH = 3
+
+EVENT_KINDS = {None: 0, "started": 1, "ended": 2}
+EVENT_NAMES = {code: name for name, code in EVENT_KINDS.items()}
+
+FRAME_PREFIX = struct.Struct(">BB")
+FRAME_FIELDS = struct.Struct(">IB")
+
+# Longest device ID a frame header carries
+MAX_DEVICE_ID = 32
+RECORD_HEADER = struct.Struct(">BH")
+RECORD_BODIES = {
+    RECORD_HEARTBEAT: struct.Struct(">BbII"),
+    RECORD_DETECTION: struct.Struct(">BBBHHiiih"),
+    RECORD_TREE_HEALTH: struct.Struct(">BHB"),
+}
+
+# Largest record offset a frame can express; later records start a new frame
+MAX_TIME_OFFSET = 0xFFFF
+
+# Onset fields of a detection that did not measure them
+NO_ARRIVAL = -2**31
+NO_LEVEL = -2**15
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, int(round(value))))
+
+
+def _unit(value):
+    """Quantize a 0.0-1.0 value to one byte"""
+    return _clamp(value * 255, 0, 255)
+
+
+def _frame_prefix(device_id):
+    """
+    Start of a frame header: the codec version and the device ID
+
+    Args:
+        device_id (str): Device identifier, e.g. "AG-HB-001"
+
+    Returns:
+        bytes: Header bytes before the base timestamp
+    """
+    try:
+        encoded = device_id.encode("ascii")
+    except UnicodeEncodeError:
+        raise ValueError(f"Device ID {device_id!r} is not ASCII")
+    if not 0 < len(encoded) <= MAX_DEVICE_ID:
+        raise ValueError(f"Device ID {device_id!r} must be 1-{MAX_DEVICE_ID} characters")
+    return FRAME_PREFIX.pack(CODEC_VERSION, len(encoded)) + encoded
+
+
+def record_type(data):
+    """
+    Classify an uplink record
+
+    Args:
+        data (dict): Record as passed to send_data_via_lora
+
+    Returns:
+        int: One of the RECORD_* constants
+    """
+    if data.get("type") == "tree_health":
+        return RECORD_TREE_HEALTH
+    if "battery_level" in data:
+        return RECORD_HEARTBEAT
+    return RECORD_DETECTION
+
+
+def _parse_coordinates(gps_coordinates):
+    try:
+        lat, lng = (float(part) for part in gps_coordinates.split(","))
+    except (AttributeError, ValueError):
+        return 0, 0
+    return _clamp(lat * 1e6, -2**31, 2**31 - 1), _clamp(lng * 1e6, -2**31, 2**31 - 1)
+
+
+def _encode_body(kind, data, timestamp):
+    if kind == RECORD_HEARTBEAT:
+        return RECORD_BODIES[kind].pack(
+            _clamp(data.get("battery_level", 0) * 2, 0, 200),
+            _clamp(data.get("signal_strength", 0), -128, 127),
+            _clamp(data.get("uptime", 0), 0, 0xFFFFFFFF),
+            _clamp(data.get("time_safe", 0), 0, 0xFFFFFFFF),
+        )
+    if kind == RECORD_DETECTION:
+        lat, lng = _parse_coordinates(data.get("gps_coordinates"))
+        confidence = data.get("confidence", 0.0)
+        arrival_time = data.get("arrival_time")
+        sound_level = data.get("sound_level")
+        return RECORD_BODIES[kind].pack(
+            EVENT_KINDS.get(data.get("event"), 0),
+            _unit(confidence),
+            _unit(data.get("mean_confidence", confidence)),
+            _clamp(data.get("duration", 0), 0, 0xFFFF),
+            _clamp(data.get("positive_windows", 1 if data.get("is_chainsaw") else 0), 0, 0xFFFF),
+            lat,
+            lng,
+            NO_ARRIVAL if arrival_time is None
+            else _clamp((arrival_time - timestamp) * 1000, NO_ARRIVAL + 1, 2**31 - 1),
+            NO_LEVEL if sound_level is None else _clamp(sound_level * 100, NO_LEVEL + 1, 2**15 - 1),
+        )
+    return RECORD_BODIES[kind].pack(
+        _unit(data.get("health_score", 0.0)),
+        _clamp(data.get("saplings_count", 0), 0, 0xFFFF),
+        _unit(data.get("survival_rate", 0.0)),
+    )
+
+
+def encode_frames(device_id, records, max_payload=LORA_MAX_PAYLOAD):
+    """
+    Pack records into as few LoRa frames as fit the payload limit
+
+    Args:
+        device_id (str): Sending device identifier
+        records (list): Heartbeat, detection and tree health dicts, each with a timestamp
+        max_payload (int): Maximum frame size in bytes
+
+    Returns:
+        list: Encoded frames (bytes)
+    """
+    prefix = _frame_prefix(device_id)
+    header_size = len(prefix) + FRAME_FIELDS.size
+    frames = []
+    base = None
+    bodies = []
+    size = header_size
+
+    def finish():
+        frames.append(prefix + FRAME_FIELDS.pack(base, len(bodies)) + b"".join(bodies))
+
+    for data in sorted(records, key=lambda r: r.get("timestamp", 0)):
+        kind = record_type(data)
+        timestamp = _clamp(data.get("timestamp", 0), 0, 0xFFFFFFFF)
+        record = RECORD_HEADER.pack(kind, 0) + _encode_body(kind, data, timestamp)
+
+        if bodies and (size + len(record) > max_payload or timestamp - base > MAX_TIME_OFFSET or len(bodies) == 255):
+            finish()
+            bodies = []
+            size = header_size
+        if not bodies:
+            base = timestamp
+
+        bodies.append(RECORD_HEADER.pack(kind, timestamp - base) + record[RECORD_HEADER.size:])
+        size += len(record)
+
+    if bodies:
+        finish()
+    return frames
+
+
+def decode_frame(frame):
+    """
+    Decode a LoRa frame back into record dicts
+
+    Args:
+        frame (bytes): Encoded frame
+
+    Returns:
+        list: Record dicts with device_id and timestamp
+    """
+    if len(frame) < FRAME_PREFIX.size:
+        raise ValueError("LoRa frame shorter than its header")
+    version, length = FRAME_PREFIX.unpack_from(frame, 0)
+    if version != CODEC_VERSION:
+        raise ValueError(f"Unsupported LoRa codec version {version}")
+    offset = FRAME_PREFIX.size + length
+    if not 0 < length <= MAX_DEVICE_ID or len(frame) < offset + FRAME_FIELDS.size:
+        raise ValueError("LoRa frame shorter than its header")
+    try:
+        device_id = frame[FRAME_PREFIX.size:offset].decode("ascii")
+    except UnicodeDecodeError:
+        raise ValueError("LoRa frame device ID is not ASCII")
+    base, count = FRAME_FIELDS.unpack_from(frame, offset)
+
+    records = []
+    offset += FRAME_FIELDS.size
+    for _ in range(count):
+        if len(frame) < offset + RECORD_HEADER.size:
+            raise ValueError("LoRa frame shorter than its records")
+        kind, delta = RECORD_HEADER.unpack_from(frame, offset)
+        offset += RECORD_HEADER.size
+        body = RECORD_BODIES.get(kind)
+        if body is None:
+            raise ValueError(f"Unknown LoRa record type {kind}")
+        if len(frame) < offset + body.size:
+            raise ValueError("LoRa frame shorter than its records")
+        values = body.unpack_from(frame, offset)
+        offset += body.size
+
+        record = {"device_id": device_id, "timestamp": base + delta}
+        if kind == RECORD_HEARTBEAT:
+            battery, rssi, uptime, time_safe = values
+            record.update(battery_level=battery / 2, signal_strength=rssi, uptime=uptime, time_safe=time_safe)
+        elif kind == RECORD_DETECTION:
+            event, confidence, mean_confidence, duration, positives, lat, lng, arrival, level = values
+            record.update(
+                event=EVENT_NAMES.get(event),
+                is_chainsaw=event != EVENT_KINDS["ended"] and positives > 0,
+                confidence=confidence / 255,
+                mean_confidence=mean_confidence / 255,
+                duration=duration,
+                positive_windows=positives,
+                gps_coordinates=f"{lat / 1e6:.6f},{lng / 1e6:.6f}",
+            )
+            if arrival != NO_ARRIVAL:
+                record["arrival_time"] = record["timestamp"] + arrival / 1000
+            if level != NO_LEVEL:
+                record["sound_level"] = level / 100
+        else:
+            health, saplings, survival = values
+            record.update(type="tree_health", health_score=health / 255, saplings_count=saplings,
+                          survival_rate=survival / 255)
+        records.append(record)
+
+    if offset != len(frame):
+        raise ValueError(f"LoRa frame has {len(frame) - offset} trailing bytes")
+    return records
+
+
+def lora_airtime(payload_bytes, spreading_factor=LORA_SPREADING_FACTOR, bandwidth=LORA_BANDWIDTH,
+                 coding_rate=LORA_CODING_RATE, preamble_symbols=8, explicit_header=True, crc=True):
+    """
+    Time on air of one LoRa packet (Semtech AN1200.13)
+
+    Args:
+        payload_bytes (int): Payload size in bytes
+        spreading_factor (int): SF7-SF12
+        bandwidth (int): Bandwidth in Hz
+        coding_rate (int): Denominator of the 4/x coding rate, 5-8
+        preamble_symbols (int): Programmed preamble length
+        explicit_header (bool): Explicit header mode
+        crc (bool): Payload CRC enabled
+
+    Returns:
+        float: Airtime in seconds
+    """
+    symbol_time = (2 ** spreading_factor) / bandwidth
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    numerator = 8 * payload_bytes - 4 * spreading_factor + 28 + 16 * crc - 20 * (not explicit_header)
+    payload_symbols = 8 + max(
+        math.ceil(numerator / (4 * (spreading_factor - 2 * low_data_rate))) * coding_rate, 0
+    )
+    return (preamble_symbols + 4.25) * symbol_time + payload_symbols * symbol_time
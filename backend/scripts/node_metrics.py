@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Metrics
+
+Lightweight counters, gauges and histograms for the sensor node.
+
+Metrics are cheap enough to update on every window and uplink. They are
+exposed in the Prometheus text format on a local HTTP endpoint, and a
+compact summary rides along in the heartbeat so a node's health can be read
+from the field: high inference latency and loop jitter point to a CPU-bound
+node, a growing uplink queue to a link-bound one.
+"""
+
+import math
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rpi_config import METRICS_PORT, METRICS_BIND
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Latency buckets in seconds, from sub-millisecond feature extraction up to
+# GSM uploads that take tens of seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """
+    Monotonically increasing value, or one read from a function at collection time
+    """
+
+    kind = "counter"
+
+    def __init__(self, func=None):
+        """
+        Args:
+            func (callable): Returns the current value; inc() is then not used
+        """
+        self.func = func
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        """Add a non-negative amount"""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._value += amount
+
+    def get(self):
+        """Current value"""
+        return float(self.func()) if self.func else self._value
+
+
+class Gauge:
+    """
+    Value that can go up and down, or one read from a function at collection time
+    """
+
+    kind = "gauge"
+
+    def __init__(self, func=None):
+        """
+        Args:
+            func (callable): Returns the current value; set() is then not used
+        """
+        self.func = func
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        """Set the value"""
+        with self._lock:
+            self._value = float(value)
+
+    def inc(self, amount=1.0):
+        """Add to the value"""
+        with self._lock:
+            self._value += amount
+
+    def get(self):
+        """Current value"""
+        return float(self.func()) if self.func else self._value
+
+
+class Histogram:
+    """
+    Distribution of observations in cumulative buckets
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets (tuple): Increasing upper bounds; +Inf is added automatically
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one observation"""
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+            self.max = max(self.max, value)
+
+    def time(self):
+        """
+        Context manager that observes the duration of its block
+
+        Returns:
+            _Timer: Timer bound to this histogram
+        """
+        return _Timer(self)
+
+    def cumulative_counts(self):
+        """
+        Counts per bucket including all lower buckets
+
+        Returns:
+            list: (upper bound, count) tuples ending with +Inf
+        """
+        with self._lock:
+            counts = list(self._counts)
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by interpolating within its bucket
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: Estimated value, 0.0 before any observation
+        """
+        cumulative = self.cumulative_counts()
+        total = cumulative[-1][1]
+        if total == 0:
+            return 0.0
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0
+        for bound, count in cumulative:
+            if count >= rank:
+                if math.isinf(bound):
+                    return self.max
+                fraction = (rank - lower_count) / (count - lower_count) if count > lower_count else 1.0
+                return lower_bound + (bound - lower_bound) * fraction
+            lower_bound, lower_count = bound, count
+        return self.max
+
+    def mean(self):
+        """Mean observation, 0.0 before any observation"""
+        return self.sum / self.count if self.count else 0.0
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Named metric families, each with children keyed by their label values
+    """
+
+    def __init__(self, prefix="ecoguard_"):
+        """
+        Args:
+            prefix (str): Prepended to every metric name in the Prometheus output
+        """
+        self.prefix = prefix
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, metric_class, name, help_text, labels, **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.setdefault(name, {"kind": metric_class.kind, "help": help_text, "children": {}})
+            if family["kind"] != metric_class.kind:
+                raise ValueError(f"Metric {name} is already registered as a {family['kind']}")
+            metric = family["children"].get(key)
+            if metric is None:
+                metric = family["children"][key] = metric_class(**kwargs)
+            return metric
+
+    def counter(self, name, help_text="", labels=None, func=None):
+        """
+        Get or create a counter
+
+        Args:
+            name (str): Metric name, conventionally ending in _total
+            help_text (str): Description for the HELP line
+            labels (dict): Label names and values identifying this child
+            func (callable): Read the value from this function when collected
+
+        Returns:
+            Counter: The counter
+        """
+        return self._get(Counter, name, help_text, labels, func=func)
+
+    def gauge(self, name, help_text="", labels=None, func=None):
+        """
+        Get or create a gauge
+
+        Args:
+            name (str): Metric name
+            help_text (str): Description for the HELP line
+            labels (dict): Label names and values identifying this child
+            func (callable): Read the value from this function when collected
+
+        Returns:
+            Gauge: The gauge
+        """
+        return self._get(Gauge, name, help_text, labels, func=func)
+
+    def histogram(self, name, help_text="", labels=None, buckets=DEFAULT_BUCKETS):
+        """
+        Get or create a histogram
+
+        Args:
+            name (str): Metric name, conventionally ending in a unit such as _seconds
+            help_text (str): Description for the HELP line
+            labels (dict): Label names and values identifying this child
+            buckets (tuple): Bucket upper bounds
+
+        Returns:
+            Histogram: The histogram
+        """
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def _snapshot(self):
+        with self._lock:
+            return [(name, family["kind"], family["help"], list(family["children"].items()))
+                    for name, family in sorted(self._families.items())]
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        for name, kind, help_text, children in self._snapshot():
+            full_name = self.prefix + name
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, metric in children:
+                try:
+                    if kind == "histogram":
+                        for bound, count in metric.cumulative_counts():
+                            bucket_labels = labels + (("le", _format_value(bound)),)
+                            lines.append(f"{full_name}_bucket{_format_labels(bucket_labels)} {count}")
+                        lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(metric.sum)}")
+                        lines.append(f"{full_name}_count{_format_labels(labels)} {metric.count}")
+                    else:
+                        lines.append(f"{full_name}{_format_labels(labels)} {_format_value(metric.get())}")
+                except Exception as e:
+                    logger.warning(f"Failed to collect metric {name}: {e}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Flatten metrics into a compact dict for the heartbeat
+
+        Counters and gauges give their value; histograms give their
+        observation count, mean and 95th percentile.
+
+        Returns:
+            dict: Metric values keyed by name and label values
+        """
+        summary = {}
+        for name, kind, _, children in self._snapshot():
+            for labels, metric in children:
+                key = "_".join([name] + [str(value) for _, value in labels])
+                try:
+                    if kind == "histogram":
+                        summary[f"{key}_count"] = metric.count
+                        summary[f"{key}_mean"] = round(metric.mean(), 6)
+                        summary[f"{key}_p95"] = round(metric.quantile(0.95), 6)
+                    else:
+                        summary[key] = round(metric.get(), 6)
+                except Exception as e:
+                    logger.warning(f"Failed to collect metric {name}: {e}")
+        return summary
+
+
+class MetricsServer:
+    """
+    Serves a registry at /metrics from a background thread
+    """
+
+    def __init__(self, registry, port=METRICS_PORT, host=METRICS_BIND):
+        """
+        Args:
+            registry (MetricsRegistry): Metrics to serve
+            port (int): TCP port; 0 picks a free port
+            host (str): Bind address, localhost by default
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Bind the socket and start serving"""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics request: {format % args}")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread = None
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Task Scheduler
+
+Asyncio scheduler for the sensor node's periodic jobs.
+
+Each job (detection, uplink, heartbeat, tree health) runs as an independent
+task with its own period and timeout. Blocking jobs run on their own
+single-thread executor, so a GSM POST that hangs only delays its own task:
+detection keeps running on schedule. A job that is still running when its
+next tick comes round is skipped rather than queued.
+A task's period may be a callable; reschedule() makes a sleeping task pick
+up a changed period straight away instead of after its current wait.
+When given a metrics registry, each task's start lateness (loop jitter) and
+run duration are recorded as histograms.
+"""
+
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("AcousticGuardian")
+
+
+class PeriodicTask:
+    """
+    One scheduled job and its timing statistics
+    """
+
+    def __init__(self, name, func, period, timeout=None, blocking=True, initial_delay=0.0):
+        """
+        Args:
+            name (str): Task name used in logs
+            func (callable): Function (blocking=True) or coroutine function to run
+            period (float or callable): Seconds between runs, or a function returning them
+            timeout (float): Seconds after which a run is abandoned
+            blocking (bool): Run func on a dedicated executor thread
+            initial_delay (float): Seconds to wait before the first run
+        """
+        self.name = name
+        self.func = func
+        self.period = period
+        self.timeout = timeout
+        self.blocking = blocking
+        self.initial_delay = initial_delay
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name) if blocking else None
+        self.pending = None
+        self.runs = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_lateness = 0.0
+        self.lateness_histogram = None
+        self.duration_histogram = None
+        self.wake = None
+
+    def current_period(self):
+        """Seconds until the next run"""
+        return self.period() if callable(self.period) else self.period
+
+
+class NodeScheduler:
+    """
+    Runs PeriodicTasks concurrently on one asyncio event loop
+    """
+
+    def __init__(self, metrics=None):
+        """
+        Args:
+            metrics (MetricsRegistry): Registry for lateness and duration histograms, or None
+        """
+        self.tasks = {}
+        self.metrics = metrics
+        self._stop_event = None
+        self._loop = None
+
+    def add_task(self, name, func, period, timeout=None, blocking=True, initial_delay=0.0):
+        """
+        Register a periodic job
+
+        Args:
+            name (str): Task name used in logs
+            func (callable): Function (blocking=True) or coroutine function to run
+            period (float or callable): Seconds between runs, or a function returning them
+            timeout (float): Seconds after which a run is abandoned
+            blocking (bool): Run func on a dedicated executor thread
+            initial_delay (float): Seconds to wait before the first run
+
+        Returns:
+            PeriodicTask: The registered task
+        """
+        task = PeriodicTask(name, func, period, timeout, blocking, initial_delay)
+        self.tasks[name] = task
+        if self.metrics is not None:
+            labels = {"task": name}
+            task.lateness_histogram = self.metrics.histogram(
+                "task_lateness_seconds", "Delay between a task's scheduled and actual start", labels)
+            task.duration_histogram = self.metrics.histogram(
+                "task_duration_seconds", "Task run time", labels)
+            self.metrics.counter("task_skipped_total", "Ticks skipped because the last run was still going",
+                                 labels, func=lambda: task.skipped)
+            self.metrics.counter("task_timeouts_total", "Runs abandoned after the task timeout",
+                                 labels, func=lambda: task.timeouts)
+        return task
+
+    async def _run_once(self, task):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        try:
+            if task.blocking:
+                task.pending = loop.run_in_executor(task.executor, task.func)
+                # shield() keeps the executor future alive after a timeout so
+                # the next tick can see the job is still running
+                await asyncio.wait_for(asyncio.shield(task.pending), task.timeout)
+            else:
+                await asyncio.wait_for(task.func(), task.timeout)
+        except asyncio.TimeoutError:
+            task.timeouts += 1
+            logger.warning(f"Task {task.name} timed out after {task.timeout} s")
+        except Exception as e:
+            task.errors += 1
+            logger.error(f"Task {task.name} failed: {e}")
+        finally:
+            task.runs += 1
+            task.last_duration = time.monotonic() - start
+            if task.duration_histogram is not None:
+                task.duration_histogram.observe(task.last_duration)
+
+    async def _run_periodic(self, task):
+        loop = asyncio.get_running_loop()
+        task.wake = asyncio.Event()
+        next_run = loop.time() + task.initial_delay
+        scheduled = None
+
+        while True:
+            delay = next_run - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(task.wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                if task.wake.is_set():
+                    # The period changed: measure the new one from the last scheduled run
+                    task.wake.clear()
+                    if scheduled is not None:
+                        next_run = max(scheduled + task.current_period(), loop.time())
+                    continue
+            scheduled = next_run
+            lateness = loop.time() - next_run
+            task.max_lateness = max(task.max_lateness, lateness)
+            if task.lateness_histogram is not None:
+                task.lateness_histogram.observe(max(lateness, 0.0))
+
+            if task.pending is not None and not task.pending.done():
+                task.skipped += 1
+                logger.warning(f"Task {task.name} still running from its last tick, skipping")
+            else:
+                task.pending = None
+                await self._run_once(task)
+
+            # Keep to the period grid, but do not try to catch up on missed ticks
+            next_run = max(next_run + task.current_period(), loop.time())
+
+    async def run(self):
+        """Run all tasks until stop() is called"""
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        runners = [asyncio.create_task(self._run_periodic(task), name=task.name) for task in self.tasks.values()]
+        logger.info(f"Scheduler started with tasks: {', '.join(self.tasks)}")
+        try:
+            await self._stop_event.wait()
+        finally:
+            for runner in runners:
+                runner.cancel()
+            await asyncio.gather(*runners, return_exceptions=True)
+            for task in self.tasks.values():
+                if task.executor:
+                    task.executor.shutdown(wait=False, cancel_futures=True)
+            logger.info("Scheduler stopped")
+
+    def reschedule(self, name):
+        """
+        Recompute a task's next run from its current period; safe to call from any thread
+
+        Args:
+            name (str): Task name
+        """
+        task = self.tasks[name]
+        if self._loop is not None and task.wake is not None:
+            self._loop.call_soon_threadsafe(task.wake.set)
+
+    def stop(self):
+        """Ask run() to return; safe to call from any task"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def stats(self):
+        """
+        Summarise task timing
+
+        Returns:
+            dict: Per-task runs, skips, timeouts, errors and timings
+        """
+        return {
+            name: {
+                "runs": task.runs,
+                "skipped": task.skipped,
+                "timeouts": task.timeouts,
+                "errors": task.errors,
+                "last_duration": task.last_duration,
+                "max_lateness": task.max_lateness,
+            }
+            for name, task in self.tasks.items()
+        }
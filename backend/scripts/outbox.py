@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Digital Hummingbird Outbox
+
+Durable store-and-forward queue for uplink data.
+
+Records are appended as JSON lines to segment files in OUTBOX_DIR, and fsync
+is batched so heartbeats do not cost a flash write each. Detections are
+synced immediately. The sender drains records in order, in batches, and
+retries with exponential backoff while the link is down. An acknowledgement
+cursor is persisted so a reboot neither loses nor resends delivered records.
+
+The outbox is bounded by OUTBOX_MAX_BYTES. When it is full, the oldest
+heartbeats are evicted first, then tree health records, and detections only
+as a last resort.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+from rpi_config import (
+    OUTBOX_DIR,
+    OUTBOX_MAX_BYTES,
+    OUTBOX_SEGMENT_BYTES,
+    OUTBOX_FSYNC_BATCH,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_RETRY_BASE,
+    OUTBOX_RETRY_MAX,
+)
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Eviction order: lowest priority is dropped first
+PRIORITY_HEARTBEAT = 0
+PRIORITY_TREE_HEALTH = 1
+PRIORITY_DETECTION = 2
+
+# Evict down to this fraction of the limit so eviction is not run on every append
+EVICTION_TARGET = 0.9
+
+CURSOR_FILE = "cursor.json"
+
+
+def uplink_priority(data):
+    """
+    Classify an uplink record for eviction
+
+    Args:
+        data (dict): Record as passed to send_data_via_gsm/send_data_via_lora
+
+    Returns:
+        int: One of the PRIORITY_* constants
+    """
+    if data.get("type") == "tree_health":
+        return PRIORITY_TREE_HEALTH
+    if "event" in data or "is_chainsaw" in data:
+        return PRIORITY_DETECTION
+    return PRIORITY_HEARTBEAT
+
+
+class _Segment:
+    """Metadata for one segment file: (offset, length, priority) per record"""
+
+    def __init__(self, segment_id, path):
+        self.segment_id = segment_id
+        self.path = path
+        self.records = []
+        self.size = 0
+
+    def append(self, length, priority):
+        self.records.append((self.size, length, priority))
+        self.size += length
+
+
+class Outbox:
+    """
+    Append-only, size-bounded on-disk queue of uplink records
+    """
+
+    def __init__(self, directory=OUTBOX_DIR, max_bytes=OUTBOX_MAX_BYTES,
+                 segment_bytes=OUTBOX_SEGMENT_BYTES, fsync_batch=OUTBOX_FSYNC_BATCH):
+        """
+        Args:
+            directory (str): Directory holding the segment files
+            max_bytes (int): Upper bound on pending record bytes
+            segment_bytes (int): Size at which a new segment file is started
+            fsync_batch (int): Records appended between fsyncs
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_batch = fsync_batch
+
+        self._lock = threading.Lock()
+        self._segments = []
+        self._active = None
+        self._unsynced = 0
+        # Index of the first unacknowledged record in the oldest segment
+        self._cursor = 0
+        # Records at the cursor handed out by peek() and not yet acknowledged
+        self._in_flight = 0
+        self._pending_bytes = 0
+        self.evicted = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"segment-{segment_id:08d}.log")
+
+    def _recover(self):
+        """Rebuild the in-memory index from the segment files on disk"""
+        segment_ids = sorted(
+            int(name[8:16]) for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        cursor_segment, cursor_record = self._read_cursor()
+
+        for segment_id in segment_ids:
+            if segment_id < cursor_segment:
+                os.remove(self._segment_path(segment_id))
+                continue
+            segment = _Segment(segment_id, self._segment_path(segment_id))
+            with open(segment.path, "rb") as f:
+                for line in f:
+                    try:
+                        priority = json.loads(line)["p"]
+                    except (ValueError, KeyError):
+                        # Torn write from a power cut; truncate the partial record
+                        logger.warning(f"Truncating corrupt record in {segment.path}")
+                        with open(segment.path, "r+b") as tf:
+                            tf.truncate(segment.size)
+                        break
+                    segment.append(len(line), priority)
+            self._segments.append(segment)
+
+        if self._segments and self._segments[0].segment_id == cursor_segment:
+            self._cursor = min(cursor_record, len(self._segments[0].records))
+        self._pending_bytes = sum(segment.size for segment in self._segments)
+        if self._segments:
+            self._pending_bytes -= sum(length for _, length, _ in self._segments[0].records[:self._cursor])
+
+        # Always start a fresh segment, numbered past the persisted cursor so a
+        # stale cursor can never point into it
+        last_id = self._segments[-1].segment_id if self._segments else 0
+        self._open_segment(max(last_id, cursor_segment) + 1)
+        logger.info(f"Outbox {self.directory} recovered with {self.pending} pending records")
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                cursor = json.load(f)
+            return cursor["segment"], cursor["record"]
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    def _write_cursor(self):
+        segment_id = self._segments[0].segment_id if self._segments else 0
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": segment_id, "record": self._cursor}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _open_segment(self, segment_id):
+        if self._active is not None:
+            self._sync()
+            self._active.close()
+        segment = _Segment(segment_id, self._segment_path(segment_id))
+        self._segments.append(segment)
+        self._active = open(segment.path, "ab")
+
+    def _sync(self):
+        if self._unsynced:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._unsynced = 0
+
+    @property
+    def pending(self):
+        """Number of records waiting to be sent"""
+        with self._lock:
+            return sum(len(segment.records) for segment in self._segments) - self._cursor
+
+    @property
+    def pending_bytes(self):
+        """Bytes of records waiting to be sent"""
+        return self._pending_bytes
+
+    def append(self, payload, priority=PRIORITY_HEARTBEAT):
+        """
+        Durably queue one record
+
+        Args:
+            payload: JSON-serialisable record to send later
+            priority (int): One of the PRIORITY_* constants
+        """
+        line = json.dumps({"p": priority, "t": time.time(), "d": payload}, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            if self._segments[-1].size >= self.segment_bytes:
+                self._open_segment(self._segments[-1].segment_id + 1)
+
+            self._active.write(line)
+            self._segments[-1].append(len(line), priority)
+            self._pending_bytes += len(line)
+            self._unsynced += 1
+            if priority >= PRIORITY_DETECTION or self._unsynced >= self.fsync_batch:
+                self._sync()
+
+            if self._pending_bytes > self.max_bytes:
+                self._evict()
+
+    def flush(self):
+        """Force any batched records to disk"""
+        with self._lock:
+            self._sync()
+
+    def peek(self, max_records=OUTBOX_BATCH_SIZE):
+        """
+        Read the oldest pending records without removing them
+
+        Args:
+            max_records (int): Maximum number of records to return
+
+        Returns:
+            list: Record payloads in the order they were appended
+        """
+        with self._lock:
+            self._sync()
+            payloads = []
+            skip = self._cursor
+            for segment in self._segments:
+                if len(payloads) >= max_records:
+                    break
+                records = segment.records[skip:skip + max_records - len(payloads)]
+                skip = 0
+                if not records:
+                    continue
+                with open(segment.path, "rb") as f:
+                    f.seek(records[0][0])
+                    for _, length, _ in records:
+                        payloads.append(json.loads(f.read(length))["d"])
+            self._in_flight = len(payloads)
+            return payloads
+
+    def ack(self, count):
+        """
+        Remove the oldest `count` records after they were delivered
+
+        Args:
+            count (int): Number of records delivered
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - count)
+            while count > 0 and self._segments:
+                segment = self._segments[0]
+                taken = min(count, len(segment.records) - self._cursor)
+                self._pending_bytes -= sum(length for _, length, _ in
+                                           segment.records[self._cursor:self._cursor + taken])
+                self._cursor += taken
+                count -= taken
+
+                if self._cursor < len(segment.records) or segment is self._segments[-1]:
+                    break
+                # Segment fully delivered and no longer written to
+                self._segments.pop(0)
+                os.remove(segment.path)
+                self._cursor = 0
+            self._write_cursor()
+
+    def _evict(self):
+        """Drop the oldest lowest-priority records until under the size target"""
+        excess = self._pending_bytes - int(self.max_bytes * EVICTION_TARGET)
+        victims = {}
+
+        # Records being sent are never evicted: ack() counts them from the
+        # cursor, so dropping one would acknowledge a record never sent
+        firsts = []
+        in_flight = self._in_flight
+        for position, segment in enumerate(self._segments):
+            first = self._cursor if position == 0 else 0
+            kept = min(in_flight, len(segment.records) - first)
+            firsts.append(first + kept)
+            in_flight -= kept
+
+        for priority in (PRIORITY_HEARTBEAT, PRIORITY_TREE_HEALTH, PRIORITY_DETECTION):
+            for position, segment in enumerate(self._segments):
+                for index in range(firsts[position], len(segment.records)):
+                    if excess <= 0:
+                        break
+                    _, length, record_priority = segment.records[index]
+                    if record_priority == priority:
+                        victims.setdefault(position, set()).add(index)
+                        excess -= length
+            if excess <= 0:
+                break
+
+        for position, indexes in victims.items():
+            self._rewrite_segment(position, indexes)
+            self.evicted += len(indexes)
+        if not victims:
+            return
+        logger.warning(f"Outbox {self.directory} full, evicted {sum(map(len, victims.values()))} records")
+
+    def _rewrite_segment(self, position, drop):
+        """Rewrite a segment without the dropped and already-delivered records"""
+        segment = self._segments[position]
+        first = self._cursor if position == 0 else 0
+        is_active = segment is self._segments[-1]
+        if is_active:
+            self._sync()
+            self._active.close()
+
+        rewritten = _Segment(segment.segment_id, segment.path)
+        tmp_path = segment.path + ".tmp"
+        with open(segment.path, "rb") as src, open(tmp_path, "wb") as dst:
+            for index in range(first, len(segment.records)):
+                offset, length, priority = segment.records[index]
+                if index in drop:
+                    self._pending_bytes -= length
+                    continue
+                src.seek(offset)
+                dst.write(src.read(length))
+                rewritten.append(length, priority)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, segment.path)
+
+        self._segments[position] = rewritten
+        if position == 0:
+            self._cursor = 0
+            self._write_cursor()
+        if is_active:
+            self._active = open(segment.path, "ab")
+
+    def close(self):
+        """Sync and close the active segment"""
+        with self._lock:
+            if self._active is not None:
+                self._sync()
+                self._active.close()
+                self._active = None
+
+
+class OutboxSender:
+    """
+    Drains an Outbox in batches with exponential backoff on failure
+    """
+
+    def __init__(self, outbox, send_batch, batch_size=OUTBOX_BATCH_SIZE,
+                 retry_base=OUTBOX_RETRY_BASE, retry_max=OUTBOX_RETRY_MAX, name="uplink"):
+        """
+        Args:
+            outbox (Outbox): Queue to drain
+            send_batch (callable): Takes a list of payloads, returns True if delivered,
+                or the number of leading payloads delivered before a failure
+            batch_size (int): Records per send attempt
+            retry_base (float): Backoff after the first failure in seconds
+            retry_max (float): Upper bound on the backoff in seconds
+            name (str): Link name used in log messages
+        """
+        self.outbox = outbox
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.name = name
+        self.failures = 0
+        self.next_attempt = 0.0
+
+    def backoff(self):
+        """Delay before the next attempt after the current run of failures"""
+        delay = min(self.retry_max, self.retry_base * (2 ** (self.failures - 1)))
+        # Jitter so a fleet coming back online does not retry in lockstep
+        return delay * random.uniform(0.5, 1.0)
+
+    def drain(self, now=None):
+        """
+        Send pending batches until the outbox is empty or a send fails
+
+        Args:
+            now (float): Current time, defaults to time.time()
+
+        Returns:
+            int: Number of records delivered
+        """
+        now = time.time() if now is None else now
+        if now < self.next_attempt:
+            return 0
+
+        delivered = 0
+        while True:
+            batch = self.outbox.peek(self.batch_size)
+            if not batch:
+                break
+            try:
+                sent = self.send_batch(batch)
+            except Exception as e:
+                logger.error(f"Failed to send {self.name} batch: {e}")
+                sent = False
+            sent = len(batch) if sent is True else int(sent or 0)
+
+            if sent:
+                self.outbox.ack(sent)
+                delivered += sent
+            if sent < len(batch):
+                self.failures += 1
+                self.next_attempt = now + self.backoff()
+                logger.warning(
+                    f"{self.name} send failed ({self.failures} in a row), "
+                    f"{self.outbox.pending} records queued, retrying in {self.next_attempt - now:.0f} s"
+                )
+                break
+            self.failures = 0
+
+        if delivered:
+            logger.info(f"Delivered {delivered} records via {self.name}")
+        return delivered
@@ -10,6 +10,8 @@ import time
 import random
 from datetime import datetime
 
+from line_protocol import format_line
+
 # Sensor configuration
 DEVICE_ID = "AG-001"
 SENSOR_LOCATION = "Amazon-Brazil"
@@ -57,10 +59,17 @@ def simulate_chainsaw_detection():
     print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     # Create InfluxDB Line Protocol data
-    line_protocol = (
-        f"acoustic_guardian,device_id={DEVICE_ID},location={SENSOR_LOCATION} "
-        f"gps_coordinates=\"{gps_coordinates}\",threat_type=\"{threat_type}\","
-        f"confidence={confidence},threat_detected=true,time_safe=0 {timestamp}"
+    line_protocol = format_line(
+        "acoustic_guardian",
+        {"device_id": DEVICE_ID, "location": SENSOR_LOCATION},
+        {
+            "gps_coordinates": gps_coordinates,
+            "threat_type": threat_type,
+            "confidence": confidence,
+            "threat_detected": True,
+            "time_safe": 0,
+        },
+        timestamp,
     )
     
     # Simulate sending data to InfluxDB
@@ -98,10 +107,11 @@ def simulate_heartbeat():
     print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     # Create InfluxDB Line Protocol data for device status
-    line_protocol = (
-        f"device_status,device_id={DEVICE_ID} "
-        f"battery_level={battery_level},signal_strength={signal_strength},"
-        f"uptime={int(time.time())} {timestamp}"
+    line_protocol = format_line(
+        "device_status",
+        {"device_id": DEVICE_ID},
+        {"battery_level": battery_level, "signal_strength": signal_strength, "uptime": int(time.time())},
+        timestamp,
     )
     
     # Simulate sending data to InfluxDB
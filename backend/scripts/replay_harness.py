@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Replay harness for the Digital Hummingbird detection loop
+
+Feeds a WAV or NPY recording through the node's own capture -> log-mel ->
+inference -> event pipeline on a simulated clock, as fast as the CPU allows.
+Detection ticks fire every DETECTION_INTERVAL seconds of audio rather than
+of wall time, so a 10-minute recording replays in seconds with the same
+events and timestamps a live node would produce.
+
+Reports the events found, time to detection for each known chainsaw onset,
+and throughput in audio-seconds processed per wall-second. Without a
+recording, a synthetic scenario (forest background, 30 s of chainsaw,
+background again) is replayed, which makes this the regression and
+performance benchmark for the edge stack.
+
+Usage:
+    python replay_harness.py
+    python replay_harness.py recording.wav --onset 42.5 --expect-events 1
+    python replay_harness.py capture.npy --sample-rate 16000 --json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+# Replays must not touch the node's real outbox or claim its metrics port,
+# so point both elsewhere before the configuration is loaded. Nor may they
+# text rangers: the node gets a recording SMS transport and no Twilio
+# credentials, and no GPS reader on the real serial port
+_REPLAY_DIR = tempfile.mkdtemp(prefix="ecoguard-replay-")
+os.environ.setdefault("OUTBOX_DIR", os.path.join(_REPLAY_DIR, "outbox"))
+os.environ.setdefault("METRICS_PORT", "0")
+for _name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN"):
+    os.environ.pop(_name, None)
+
+import numpy as np
+
+from rpi_config import SAMPLE_RATE, DETECTION_INTERVAL, DETECTION_EVENT_GAP
+from audio_capture import WavFileSource, ArraySource
+from detection_events import EVENT_STARTED, EVENT_ENDED
+from rpi_main import DigitalHummingbird
+
+# Fixed start time so event IDs and timestamps are identical between runs
+REPLAY_EPOCH = 1_700_000_000.0
+
+
+class RecordingTransport:
+    """
+    SMS transport that keeps the alerts a replay would have sent
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, to, body):
+        self.messages.append(body)
+        return f"REPLAY{len(self.messages)}"
+
+
+def build_node(clock, source):
+    """
+    Build a node for replay: simulated clock, no capture thread, no GPS and no real SMS
+
+    Returns:
+        DigitalHummingbird: The node
+    """
+    node = DigitalHummingbird(clock=clock, audio_source=source, start_capture=False,
+                              sms_transport=RecordingTransport(), use_gps=False)
+    if node.gps_reader is not None or not isinstance(node.sms_dispatcher.transport, RecordingTransport):
+        node.shutdown()
+        raise RuntimeError("Replay node has a real GPS reader or SMS transport")
+    return node
+
+
+class ReplayClock:
+    """
+    Simulated Unix time, advanced by the amount of audio replayed
+    """
+
+    def __init__(self, start=REPLAY_EPOCH):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        """Move the clock forward"""
+        self.now += seconds
+
+
+def make_scenario(sample_rate=SAMPLE_RATE, lead_seconds=20, chainsaw_seconds=30, tail_seconds=40):
+    """
+    Synthesize forest background with one chainsaw run in the middle
+
+    Returns:
+        tuple: (float32 samples, list of chainsaw onset times in seconds)
+    """
+    rng = np.random.default_rng(7)
+    total = lead_seconds + chainsaw_seconds + tail_seconds
+    t = np.arange(int(total * sample_rate)) / sample_rate
+
+    # Low background hiss with short bird-like chirps every few seconds
+    audio = 0.004 * rng.standard_normal(len(t))
+    chirps = (np.sin(2 * np.pi * 0.35 * t) > 0.97) * np.sin(2 * np.pi * (3000 + 400 * np.sin(2 * np.pi * 9 * t)) * t)
+    audio += 0.05 * chirps
+
+    # Two-stroke engine: a harmonic-rich square wave whose pitch revs up and down
+    onset, end = lead_seconds, lead_seconds + chainsaw_seconds
+    engine = (t >= onset) & (t < end)
+    pitch = 110 + 25 * np.sin(2 * np.pi * 0.15 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    audio += engine * 0.3 * np.sign(np.sin(phase))
+    return np.clip(audio, -1.0, 1.0).astype(np.float32), [float(onset)]
+
+
+def open_source(path, sample_rate):
+    """
+    Build a non-realtime audio source for a WAV or NPY recording
+    """
+    if path.lower().endswith(".npy"):
+        return ArraySource(np.load(path), sample_rate=sample_rate)
+    return WavFileSource(path, realtime=False)
+
+
+def replay(node, clock, tick_interval=DETECTION_INTERVAL):
+    """
+    Pump the node's capture source to exhaustion, running detection on the simulated clock
+
+    Args:
+        node (DigitalHummingbird): Node built with the replay clock and start_capture=False
+        clock (ReplayClock): The node's clock
+        tick_interval (float): Audio seconds between detection ticks
+
+    Returns:
+        dict: Events with the offset they were reported at, audio seconds and wall seconds
+    """
+    capture = node.audio_capture
+    capture.start(background=False)
+    start = clock()
+    events = []
+    audio_seconds = 0.0
+    next_tick = start + tick_interval
+
+    wall_start = time.perf_counter()
+    while True:
+        written = capture.capture_block()
+        if not written:
+            break
+        seconds = written / capture.source.sample_rate
+        clock.advance(seconds)
+        audio_seconds += seconds
+        if clock() >= next_tick:
+            events.extend((clock() - start, event) for event in node.detection_tick())
+            next_tick += tick_interval
+
+    # Analyse the remaining audio, then let any open event time out so its
+    # ended summary is reported as well
+    events.extend((clock() - start, event) for event in node.detection_tick())
+    quiet_until = clock() + DETECTION_EVENT_GAP + tick_interval
+    while clock() < quiet_until:
+        clock.advance(tick_interval)
+        events.extend((clock() - start, event) for event in node.detection_tick())
+    wall_seconds = time.perf_counter() - wall_start
+
+    return {"start": start, "events": events, "audio_seconds": audio_seconds, "wall_seconds": wall_seconds}
+
+
+def summarise(node, result, onsets):
+    """
+    Turn a replay result into report figures
+
+    Returns:
+        dict: Events, time to detection per onset and throughput
+    """
+    start = result["start"]
+    events = []
+    for reported_at, event in result["events"]:
+        entry = {
+            "event_id": event["event_id"],
+            "event": event["event"],
+            "at": round(event["timestamp"] - start, 3),
+            "reported_at": round(reported_at, 3),
+            "confidence": round(event["confidence"], 4),
+        }
+        if event["event"] == EVENT_ENDED:
+            entry["duration"] = round(event["duration"], 3)
+        events.append(entry)
+
+    started = [event for event in events if event["event"] == EVENT_STARTED]
+    detections = []
+    for onset in onsets:
+        hit = next((event for event in started if event["reported_at"] >= onset), None)
+        detections.append({
+            "onset": onset,
+            "event_id": hit["event_id"] if hit else None,
+            "time_to_detection": round(hit["reported_at"] - onset, 3) if hit else None,
+        })
+
+    audio_seconds = result["audio_seconds"]
+    wall_seconds = result["wall_seconds"]
+    return {
+        "audio_seconds": round(audio_seconds, 3),
+        "wall_seconds": round(wall_seconds, 4),
+        "audio_seconds_per_wall_second": round(audio_seconds / wall_seconds, 1) if wall_seconds else None,
+        "windows": int(node.windows_counter.get()),
+        "windows_gated": node.energy_gate.gated,
+        "inference": node.acoustic_detector.stats() if node.acoustic_detector else None,
+        "events": events,
+        "detections": detections,
+    }
+
+
+def print_report(summary):
+    print(f"Replayed {summary['audio_seconds']:.1f} s of audio in {summary['wall_seconds']:.3f} s "
+          f"({summary['audio_seconds_per_wall_second']} audio-seconds per wall-second)")
+    print(f"Windows: {summary['windows']} analysed, {summary['windows_gated']} below the energy gate")
+    if summary["inference"]:
+        print(f"Inference: {summary['inference']['batches']} batches, "
+              f"{summary['inference']['mean_window_ms']:.3f} ms/window")
+
+    print(f"Events: {len(summary['events'])}")
+    for event in summary["events"]:
+        line = (f"  {event['event_id']:<28} {event['event']:<8} at {event['at']:7.1f} s, "
+                f"reported {event['reported_at']:7.1f} s, confidence {event['confidence']:.2f}")
+        if "duration" in event:
+            line += f", lasted {event['duration']:.1f} s"
+        print(line)
+
+    for detection in summary["detections"]:
+        if detection["time_to_detection"] is None:
+            print(f"Onset at {detection['onset']:.1f} s: MISSED")
+        else:
+            print(f"Onset at {detection['onset']:.1f} s: detected after {detection['time_to_detection']:.1f} s "
+                  f"({detection['event_id']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded audio through the detection pipeline")
+    parser.add_argument("recording", nargs="?", help="WAV or NPY recording; omit for the synthetic scenario")
+    parser.add_argument("--onset", type=float, action="append", default=None,
+                        help="Chainsaw onset in seconds from the start of the recording (repeatable)")
+    parser.add_argument("--sample-rate", type=int, default=SAMPLE_RATE, help="Sample rate of NPY recordings")
+    parser.add_argument("--expect-events", type=int, default=None,
+                        help="Exit with status 1 unless exactly this many events start")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Keep the node's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger("AcousticGuardian").setLevel(logging.WARNING)
+
+    if args.recording:
+        source = open_source(args.recording, args.sample_rate)
+        onsets = args.onset or []
+    else:
+        samples, onsets = make_scenario()
+        source = ArraySource(samples)
+        onsets = args.onset or onsets
+
+    clock = ReplayClock()
+    node = build_node(clock, source)
+    try:
+        summary = summarise(node, replay(node, clock), onsets)
+    finally:
+        node.shutdown()
+        shutil.rmtree(_REPLAY_DIR, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+
+    started = sum(1 for event in summary["events"] if event["event"] == EVENT_STARTED)
+    if args.expect_events is not None and started != args.expect_events:
+        print(f"Expected {args.expect_events} events, found {started}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
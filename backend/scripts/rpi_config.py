@@ -17,6 +17,11 @@ INFLUXDB_URL = os.getenv("INFLUXDB_URL", "https://your-instance.cloud.influxdata
 INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN", "your-token-here")
 INFLUXDB_ORG = os.getenv("INFLUXDB_ORG", "your-org")
 INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET", "your-bucket")
+INFLUX_BATCH_SIZE = int(os.getenv("INFLUX_BATCH_SIZE", "500"))  # Lines per write request
+INFLUX_FLUSH_INTERVAL = float(os.getenv("INFLUX_FLUSH_INTERVAL", "10"))  # Max seconds a line waits in the buffer
+INFLUX_GZIP = os.getenv("INFLUX_GZIP", "true").lower() == "true"  # Compress write request bodies
+INFLUX_MAX_RETRIES = int(os.getenv("INFLUX_MAX_RETRIES", "3"))  # Retries for 429/5xx responses
+INFLUX_RETRY_MAX = float(os.getenv("INFLUX_RETRY_MAX", "30"))  # Longest retry delay, Retry-After included
 
 # LoRa Configuration
 LORA_FREQUENCY = float(os.getenv("LORA_FREQUENCY", "868.1"))  # MHz
@@ -24,6 +29,7 @@ LORA_SPREADING_FACTOR = int(os.getenv("LORA_SPREADING_FACTOR", "7"))
 LORA_BANDWIDTH = int(os.getenv("LORA_BANDWIDTH", "125000"))  # Hz
 LORA_CODING_RATE = int(os.getenv("LORA_CODING_RATE", "5"))
 LORA_SYNC_WORD = int(os.getenv("LORA_SYNC_WORD", "0x12"), 16)
+LORA_MAX_PAYLOAD = int(os.getenv("LORA_MAX_PAYLOAD", "222"))  # Bytes per frame (EU868 SF7)
 
 # GSM Configuration (for SMS alerts)
 GSM_APN = os.getenv("GSM_APN", "your-apn")  # Replace with your mobile carrier's APN
@@ -34,18 +40,49 @@ GSM_GPRS_PASS = os.getenv("GSM_GPRS_PASS", "")
 SAMPLE_RATE = int(os.getenv("SAMPLE_RATE", "16000"))
 AUDIO_BUFFER_SIZE = int(os.getenv("AUDIO_BUFFER_SIZE", "512"))
 DETECTION_THRESHOLD = float(os.getenv("DETECTION_THRESHOLD", "0.9"))  # 90% confidence threshold
+DETECTION_VOTE_K = int(os.getenv("DETECTION_VOTE_K", "3"))  # Positive windows needed to start an event...
+DETECTION_VOTE_N = int(os.getenv("DETECTION_VOTE_N", "5"))  # ...out of this many consecutive windows
+DETECTION_EVENT_GAP = float(os.getenv("DETECTION_EVENT_GAP", "30"))  # Quiet seconds that end an event
+AUDIO_SOURCE = os.getenv("AUDIO_SOURCE", "microphone")  # "microphone" or path to a WAV file
+AUDIO_RING_SECONDS = float(os.getenv("AUDIO_RING_SECONDS", "30"))  # Audio history kept in the ring buffer
+AUDIO_WINDOW_SECONDS = float(os.getenv("AUDIO_WINDOW_SECONDS", "1.0"))  # Length of each detection window
+AUDIO_WINDOW_HOP_SECONDS = float(os.getenv("AUDIO_WINDOW_HOP_SECONDS", "0.5"))  # Step between overlapping windows
+FEATURE_FRAME_MS = float(os.getenv("FEATURE_FRAME_MS", "25"))  # Spectrogram frame length
+FEATURE_HOP_MS = float(os.getenv("FEATURE_HOP_MS", "10"))  # Spectrogram frame step
+FEATURE_MEL_BANDS = int(os.getenv("FEATURE_MEL_BANDS", "40"))  # Number of log-mel bands per frame
 
 # Camera Processing Parameters
 CAMERA_RESOLUTION_WIDTH = int(os.getenv("CAMERA_RESOLUTION_WIDTH", "640"))
 CAMERA_RESOLUTION_HEIGHT = int(os.getenv("CAMERA_RESOLUTION_HEIGHT", "480"))
 CAMERA_RESOLUTION = (CAMERA_RESOLUTION_WIDTH, CAMERA_RESOLUTION_HEIGHT)
 CAMERA_FPS = int(os.getenv("CAMERA_FPS", "30"))
+CAMERA_SOURCE = os.getenv("CAMERA_SOURCE", "camera")  # "camera" or a directory of test images
+CAMERA_PROCESS_WIDTH = int(os.getenv("CAMERA_PROCESS_WIDTH", "224"))  # Downscaled size when no visual model sets it
+CAMERA_PROCESS_HEIGHT = int(os.getenv("CAMERA_PROCESS_HEIGHT", "224"))
+CAMERA_ROI_MASK = os.getenv("CAMERA_ROI_MASK", "")  # Mask image, white where the monitored trees are
+CAMERA_CHANGE_THRESHOLD = float(os.getenv("CAMERA_CHANGE_THRESHOLD", "0.02"))  # Below this, skip inference
+CAMERA_WARMUP_FRAMES = int(os.getenv("CAMERA_WARMUP_FRAMES", "5"))  # Frames dropped while exposure settles
 
 # Timing Constants (in seconds)
 DETECTION_INTERVAL = int(os.getenv("DETECTION_INTERVAL", "5"))  # Time between detections
-SMS_COOLDOWN = int(os.getenv("SMS_COOLDOWN", "30"))  # Minimum time between SMS alerts
+SMS_COOLDOWN = int(os.getenv("SMS_COOLDOWN", "30"))  # Minimum time between SMS alerts for one device
 DATA_LOG_INTERVAL = int(os.getenv("DATA_LOG_INTERVAL", "60"))  # Regular data logging interval
 HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", "300"))  # Regular heartbeat (5 minutes)
+TREE_HEALTH_INTERVAL = int(os.getenv("TREE_HEALTH_INTERVAL", "300"))  # Camera tree health check (5 minutes)
+UPLINK_INTERVAL = int(os.getenv("UPLINK_INTERVAL", "10"))  # How often queued uplink data is drained
+
+# Adaptive Duty Cycling
+ENERGY_GATE_DBFS = float(os.getenv("ENERGY_GATE_DBFS", "-45"))  # Quieter windows skip features and model
+BATTERY_NORMAL_LEVEL = float(os.getenv("BATTERY_NORMAL_LEVEL", "50"))  # % above which cadence is not stretched
+BATTERY_CRITICAL_LEVEL = float(os.getenv("BATTERY_CRITICAL_LEVEL", "15"))  # % at which stretch is at its maximum
+CADENCE_MAX_STRETCH = float(os.getenv("CADENCE_MAX_STRETCH", "4"))  # Longest heartbeat/health period, x base
+CADENCE_ALERT_FACTOR = float(os.getenv("CADENCE_ALERT_FACTOR", "0.25"))  # Period multiple after a detection
+CADENCE_ALERT_WINDOW = float(os.getenv("CADENCE_ALERT_WINDOW", "900"))  # Seconds a detection keeps cadence tight
+
+# Task timeouts (in seconds): a run taking longer is abandoned and logged
+DETECTION_TIMEOUT = float(os.getenv("DETECTION_TIMEOUT", "30"))
+UPLINK_TIMEOUT = float(os.getenv("UPLINK_TIMEOUT", "120"))
+TREE_HEALTH_TIMEOUT = float(os.getenv("TREE_HEALTH_TIMEOUT", "60"))
 
 # Pin Definitions for Raspberry Pi
 # Audio pins (using USB microphone or I2S)
@@ -62,6 +99,8 @@ CAMERA_DEVICE = int(os.getenv("CAMERA_DEVICE", "0"))  # Default camera device
 # GPS Settings (if using GPS module)
 GPS_SERIAL_PORT = os.getenv("GPS_SERIAL_PORT", "/dev/ttyS0")
 GPS_BAUD_RATE = int(os.getenv("GPS_BAUD_RATE", "9600"))
+GPS_MAX_HDOP = float(os.getenv("GPS_MAX_HDOP", "5.0"))  # Fixes with a worse HDOP are ignored
+GPS_MAX_FIX_AGE = float(os.getenv("GPS_MAX_FIX_AGE", "300"))  # Seconds before the cached fix is stale
 
 # Bird Enclosure Design
 ENCLOSURE_TYPE = os.getenv("ENCLOSURE_TYPE", "Transparent Bird")
@@ -71,6 +110,8 @@ ENCLOSURE_COLOR = os.getenv("ENCLOSURE_COLOR", "Clear with Green Accents")
 # AI Model Paths
 ACOUSTIC_MODEL_PATH = os.getenv("ACOUSTIC_MODEL_PATH", "models/chainsaw_detection.tflite")
 VISUAL_MODEL_PATH = os.getenv("VISUAL_MODEL_PATH", "models/tree_health_classifier.tflite")
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "4"))  # Feature windows per interpreter invocation
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "2"))  # TFLite interpreter threads
 
 # Logging Configuration
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -80,6 +121,55 @@ LOG_FILE = os.getenv("LOG_FILE", "acoustic_guardian.log")
 GATEWAY_IP = os.getenv("GATEWAY_IP", "192.168.1.100")  # LoRa Gateway IP
 GATEWAY_PORT = int(os.getenv("GATEWAY_PORT", "1680"))  # LoRa Gateway Port
 
+# Ingest Gateway (ingest_gateway.py: line protocol over HTTP, LoRa frames over UDP on GATEWAY_PORT)
+GATEWAY_BIND = os.getenv("GATEWAY_BIND", "0.0.0.0")
+GATEWAY_HTTP_PORT = int(os.getenv("GATEWAY_HTTP_PORT", "8086"))  # Same port as InfluxDB, so nodes only change the host
+GATEWAY_TOKEN = os.getenv("GATEWAY_TOKEN", "")  # Required in the Authorization header when set
+GATEWAY_DATA_DIR = os.getenv("GATEWAY_DATA_DIR", "gateway_data")  # Local line protocol files
+GATEWAY_UPSTREAM_URL = os.getenv("GATEWAY_UPSTREAM_URL", "")  # InfluxDB write URL to forward to; empty keeps data local
+GATEWAY_BATCH_SIZE = int(os.getenv("GATEWAY_BATCH_SIZE", "5000"))  # Points per write to each storage sink
+GATEWAY_FLUSH_INTERVAL = float(os.getenv("GATEWAY_FLUSH_INTERVAL", "1.0"))  # Max seconds a point waits for a batch
+GATEWAY_MAX_PENDING = int(os.getenv("GATEWAY_MAX_PENDING", "200000"))  # Points buffered per sink before shedding load
+GATEWAY_MAX_FUTURE = float(os.getenv("GATEWAY_MAX_FUTURE", "3600"))  # Points stamped further ahead are rejected
+GATEWAY_FUSION_WINDOW = float(os.getenv("GATEWAY_FUSION_WINDOW", "10"))  # Seconds over which detections of one chainsaw are fused; 0 disables fusion
+GATEWAY_FUSION_RADIUS = float(os.getenv("GATEWAY_FUSION_RADIUS", "2000"))  # Max metres between nodes that hear the same chainsaw
+GATEWAY_DEDUP_CELL = float(os.getenv("GATEWAY_DEDUP_CELL", "2000"))  # Metres within which chainsaw detections are one chainsaw (dedup cell side); 0 disables dedup
+GATEWAY_DEDUP_BUCKET = int(os.getenv("GATEWAY_DEDUP_BUCKET", "10"))  # Seconds within which they are one chainsaw (dedup time bucket)
+GATEWAY_DEDUP_HORIZON = int(os.getenv("GATEWAY_DEDUP_HORIZON", "30"))  # Buckets kept; older detections are stored without a check
+GATEWAY_DEDUP_MAX_KEYS = int(os.getenv("GATEWAY_DEDUP_MAX_KEYS", "100000"))  # Cap on cells held across buckets; the oldest bucket goes first
+
+# Embedded Time-Series Store (ts_store.py: local stand-in for InfluxDB, fed by the ingest gateway)
+STORE_DIR = os.getenv("STORE_DIR", "store_data")  # Empty disables the gateway's store sink
+STORE_PARTITION_SECONDS = int(os.getenv("STORE_PARTITION_SECONDS", "86400"))  # One partition per UTC day
+STORE_HEAD_POINTS = int(os.getenv("STORE_HEAD_POINTS", "100000"))  # Points held in memory before writing chunks
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "60"))  # Max seconds a point stays in memory only
+STORE_COMPACT_INTERVAL = float(os.getenv("STORE_COMPACT_INTERVAL", "600"))  # Seconds between chunk compactions
+STORE_COMPRESSION = os.getenv("STORE_COMPRESSION", "true").lower() == "true"  # Delta-of-delta and XOR encoding of segment columns
+STORE_DETECTION_HOT_DAYS = int(os.getenv("STORE_DETECTION_HOT_DAYS", "30"))  # Days acoustic_guardian points stay in segments before moving to Parquet; 0 keeps them
+STORE_STATUS_HOT_DAYS = int(os.getenv("STORE_STATUS_HOT_DAYS", "7"))  # The same for device_status heartbeats
+
+# Metrics Endpoint (Prometheus text format at http://METRICS_BIND:METRICS_PORT/metrics)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 disables the endpoint
+METRICS_BIND = os.getenv("METRICS_BIND", "127.0.0.1")  # Local only unless exposed deliberately
+
+# Store-and-forward Outbox (uplink data is queued on disk while links are down)
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "outbox")
+OUTBOX_MAX_BYTES = int(os.getenv("OUTBOX_MAX_BYTES", str(5 * 1024 * 1024)))  # Bound on queued data per link
+OUTBOX_SEGMENT_BYTES = int(os.getenv("OUTBOX_SEGMENT_BYTES", str(256 * 1024)))  # Size of each segment file
+OUTBOX_FSYNC_BATCH = int(os.getenv("OUTBOX_FSYNC_BATCH", "16"))  # Records between fsyncs (detections sync at once)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))  # Records per bulk upload
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "5"))  # First retry delay after a failed upload
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "600"))  # Longest retry delay
+
 # Twilio Configuration
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "your_account_sid")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "your_auth_token")
\ No newline at end of file
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "your_auth_token")
+TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER", "+1234567890")  # Your Twilio number
+TWILIO_API_URL = os.getenv("TWILIO_API_URL", "https://api.twilio.com")  # Point at fake_twilio_server.py to test
+
+# SMS Alert Dispatcher
+NODE_SMS_ALERTS = os.getenv("NODE_SMS_ALERTS", "true").lower() == "true"  # false when the ingest gateway alerts rangers, one SMS per fused event
+SMS_QUEUE_SIZE = int(os.getenv("SMS_QUEUE_SIZE", "32"))  # Alerts waiting to be sent before new ones are dropped
+SMS_MAX_RETRIES = int(os.getenv("SMS_MAX_RETRIES", "5"))  # Retries of a failed message
+SMS_RETRY_BASE = float(os.getenv("SMS_RETRY_BASE", "2"))  # First retry delay in seconds
+SMS_RETRY_MAX = float(os.getenv("SMS_RETRY_MAX", "300"))  # Longest retry delay
\ No newline at end of file
@@ -9,18 +9,33 @@ and camera for visual tree health monitoring.
 """
 
 import time
-import json
-import threading
+
+# Taken before any other import so --profile-startup can report import time
+_PROCESS_START = time.perf_counter()
+
+import random
+import asyncio
+import argparse
+from contextlib import contextmanager
 import logging
 import os
 from datetime import datetime
-import numpy as np
-import requests
-from twilio.rest import Client
 
 # Import configuration
 from rpi_config import *
 
+# Standard-library-only modules; numpy and requests are imported on
+# first use so the audio capture thread starts as early as possible
+from detection_events import DetectionEventTracker, ACTIVE, EVENT_STARTED
+from duty_cycle import EnergyGate, AdaptiveCadence
+from outbox import Outbox, OutboxSender, uplink_priority
+from lora_codec import encode_frames, record_type, RECORD_DETECTION
+from line_protocol import format_line
+from node_scheduler import NodeScheduler
+from node_metrics import MetricsRegistry, MetricsServer
+
+_IMPORTS_DONE = time.perf_counter()
+
 # Import AI models (these would be implemented with TensorFlow Lite)
 # from acoustic_model import AcousticDetector
 # from visual_model import TreeHealthMonitor
@@ -42,32 +57,127 @@ logging.basicConfig(
 )
 logger = logging.getLogger("AcousticGuardian")
 
+class StartupTimer:
+    """
+    Records how long each startup phase takes
+    """
+    
+    def __init__(self):
+        self.phases = [("imports", _IMPORTS_DONE - _PROCESS_START)]
+    
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one named phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+    
+    def since_start(self):
+        """Seconds since this module started importing"""
+        return time.perf_counter() - _PROCESS_START
+    
+    def report(self):
+        """
+        Format the per-phase breakdown
+        
+        Returns:
+            str: One line per phase plus the total
+        """
+        lines = [f"{name:<28}{seconds * 1000:>10.1f} ms" for name, seconds in self.phases]
+        lines.append(f"{'total':<28}{sum(seconds for _, seconds in self.phases) * 1000:>10.1f} ms")
+        return "\n".join(lines)
+
 class DigitalHummingbird:
     """
     Main class for the Digital Hummingbird sensor node
     """
     
-    def __init__(self):
-        """Initialize the Digital Hummingbird sensor node"""
+    def __init__(self, clock=time.time, audio_source=None, start_capture=True, sms_transport=None, use_gps=True):
+        """
+        Initialize the Digital Hummingbird sensor node
+        
+        Args:
+            clock (callable): Returns the current Unix time; replay runs pass a simulated clock
+            audio_source: Audio source object, defaults to AUDIO_SOURCE
+            start_capture (bool): Start the capture thread; False leaves the caller to pump capture
+            sms_transport: SMS transport for alerts, defaults to Twilio with credentials
+                from the environment
+            use_gps (bool): Start the GPS reader on GPS_SERIAL_PORT
+        """
+        self.clock = clock
         self.device_id = DEVICE_ID
         self.device_name = DEVICE_NAME
         self.last_detection_time = 0
+        self.battery_level = None
+        self.scheduler = None
         self.last_heartbeat_time = 0
         self.time_safe = 0
         self.gps_coordinates = "0.000000,0.000000"  # Default coordinates
         
-        # Initialize components
-        self._init_acoustic_detector()
-        self._init_visual_monitor()
-        self._init_lora_communicator()
-        self._init_twilio_client()
+        # Turns per-window scores into one started/ended pair per logging event
+        self.event_tracker = DetectionEventTracker(self.device_id)
+        
+        # Quiet windows skip the feature and model path; heartbeat and tree
+        # health cadence follow battery level and recent detections
+        self.energy_gate = EnergyGate()
+        self.heartbeat_cadence = AdaptiveCadence(HEARTBEAT_INTERVAL)
+        self.tree_health_cadence = AdaptiveCadence(TREE_HEALTH_INTERVAL)
+        self.start_time = self.clock()
+        self.startup = StartupTimer()
+        self.metrics = MetricsRegistry()
+        
+        # Initialize components, starting capture first so audio recorded
+        # while the rest of the node comes up is still analysed
+        with self.startup.phase("audio capture"):
+            self._init_audio_capture(audio_source, start_capture)
+        with self.startup.phase("acoustic detector"):
+            self._init_acoustic_detector()
+        with self.startup.phase("uplink outboxes"):
+            self._init_uplink_outboxes()
+        with self.startup.phase("gps reader"):
+            self._init_gps_reader(use_gps)
+        with self.startup.phase("lora communicator"):
+            self._init_lora_communicator()
+        with self.startup.phase("visual monitor"):
+            self._init_visual_monitor()
+        with self.startup.phase("sms dispatcher"):
+            self._init_sms_dispatcher(sms_transport)
+        with self.startup.phase("metrics"):
+            self._init_metrics()
         
         logger.info(f"{self.device_name} initialized with ID: {self.device_id}")
     
+    def _init_audio_capture(self, audio_source=None, start_capture=True):
+        """Initialize and start the continuous audio capture thread and ring buffer"""
+        try:
+            from audio_capture import create_audio_capture
+            
+            self.audio_capture, self.audio_reader = create_audio_capture(audio_source, clock=self.clock)
+            if start_capture:
+                self.audio_capture.start()
+                logger.info(f"Audio capture started from source: {audio_source or AUDIO_SOURCE}")
+        except Exception as e:
+            logger.error(f"Failed to start audio capture: {e}")
+            self.audio_capture = None
+            self.audio_reader = None
+    
     def _init_acoustic_detector(self):
         """Initialize the acoustic detection model"""
         try:
-            # self.acoustic_detector = AcousticDetector(ACOUSTIC_MODEL_PATH)
+            from audio_features import LogMelExtractor
+            from inference_engine import InferenceEngine, NumpyModel, load_model
+            
+            self.feature_extractor = LogMelExtractor()
+            fallback = NumpyModel.reference_acoustic_model(
+                self.feature_extractor,
+                window_samples=int(AUDIO_WINDOW_SECONDS * SAMPLE_RATE)
+            )
+            model = load_model(ACOUSTIC_MODEL_PATH, fallback=fallback)
+            if model is fallback:
+                logger.warning("Using NumPy stand-in acoustic model")
+            self.acoustic_detector = InferenceEngine(model)
             logger.info("Acoustic detection model initialized")
         except Exception as e:
             logger.error(f"Failed to initialize acoustic detector: {e}")
@@ -76,14 +186,42 @@ class DigitalHummingbird:
     def _init_visual_monitor(self):
         """Initialize the visual tree health monitor"""
         try:
-            # self.visual_monitor = TreeHealthMonitor(VISUAL_MODEL_PATH)
+            from inference_engine import InferenceEngine, load_model
+            
+            model = load_model(VISUAL_MODEL_PATH)
+            self.visual_monitor = InferenceEngine(model) if model else None
             logger.info("Visual tree health monitor initialized")
         except Exception as e:
             logger.error(f"Failed to initialize visual monitor: {e}")
             self.visual_monitor = None
+        
+        try:
+            from camera_pipeline import create_camera_pipeline
+            
+            self.camera_pipeline = create_camera_pipeline(self.visual_monitor)
+            logger.info(f"Camera pipeline initialized from source: {CAMERA_SOURCE}")
+        except Exception as e:
+            logger.error(f"Failed to initialize camera pipeline: {e}")
+            self.camera_pipeline = None
+    
+    def _init_gps_reader(self, use_gps=True):
+        """Start the background GPS reader that caches the latest fix"""
+        if not use_gps:
+            self.gps_reader = None
+            return
+        try:
+            from gps_reader import GpsReader
+            
+            self.gps_reader = GpsReader()
+            self.gps_reader.start()
+            logger.info(f"GPS reader started on {GPS_SERIAL_PORT}")
+        except Exception as e:
+            logger.error(f"Failed to start GPS reader: {e}")
+            self.gps_reader = None
     
     def _init_lora_communicator(self):
         """Initialize LoRa communication"""
+        self.lora = None
         try:
             # self.lora = LoRaCommunicator(
             #     frequency=LORA_FREQUENCY,
@@ -97,53 +235,209 @@ class DigitalHummingbird:
             logger.error(f"Failed to initialize LoRa: {e}")
             self.lora = None
     
-    def _init_twilio_client(self):
-        """Initialize Twilio client for SMS alerts"""
-        try:
+    def _init_uplink_outboxes(self):
+        """Initialize the on-disk outboxes that queue uplink data while links are down"""
+        # The InfluxDB writer (and requests) is only loaded by the first GSM upload
+        self.influx_writer = None
+        
+        self.gsm_outbox = Outbox(os.path.join(OUTBOX_DIR, "gsm"))
+        self.lora_outbox = Outbox(os.path.join(OUTBOX_DIR, "lora"))
+        self.gsm_sender = OutboxSender(self.gsm_outbox, self._send_gsm_batch, name="GSM")
+        self.lora_sender = OutboxSender(self.lora_outbox, self._send_lora_batch, name="LoRa")
+    
+    def _get_influx_writer(self):
+        """
+        Create the InfluxDB writer on first use
+        
+        Returns:
+            InfluxLineWriter: Shared writer, or None without credentials
+        """
+        if self.influx_writer is None:
+            # Get InfluxDB credentials from environment variables
+            influxdb_url = os.environ.get('INFLUXDB_URL')
+            influxdb_token = os.environ.get('INFLUXDB_TOKEN')
+            if not (influxdb_url and influxdb_token):
+                logger.error("InfluxDB credentials not found in environment variables")
+                return None
+            
+            from influx_writer import InfluxLineWriter
+            
+            self.influx_writer = InfluxLineWriter(influxdb_url, influxdb_token)
+        return self.influx_writer
+    
+    def _init_sms_dispatcher(self, transport=None):
+        """Start the SMS alert worker; the Twilio session is opened by the first send"""
+        self.sms_dispatcher = None
+        
+        if transport is None and not NODE_SMS_ALERTS:
+            logger.info("Node SMS alerts disabled, the ingest gateway alerts rangers")
+            return
+        if transport is None:
             # Get credentials from environment variables for security
             account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
             auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
-            if account_sid and auth_token:
-                self.twilio_client = Client(account_sid, auth_token)
-                logger.info("Twilio client initialized")
-            else:
+            if not (account_sid and auth_token):
                 logger.warning("Twilio credentials not found in environment variables")
-                self.twilio_client = None
-        except Exception as e:
-            logger.error(f"Failed to initialize Twilio client: {e}")
-            self.twilio_client = None
+                return
+            
+            from sms_dispatcher import TwilioTransport
+            
+            transport = TwilioTransport(account_sid, auth_token)
+        
+        from sms_dispatcher import AlertDispatcher
+        
+        self.sms_dispatcher = AlertDispatcher(transport)
+        self.sms_dispatcher.start()
+        logger.info("SMS alert dispatcher initialized")
+    
+    def _init_metrics(self):
+        """Register the node's metrics and start the local metrics endpoint"""
+        metrics = self.metrics
+        metrics.counter("audio_reader_overruns_total", "Times detection fell a full ring buffer behind capture",
+                        func=lambda: self.audio_reader.overruns if self.audio_reader else 0)
+        metrics.counter("audio_input_overflows_total", "Blocks dropped by the audio driver",
+                        func=lambda: getattr(self.audio_capture.source, "overflows", 0) if self.audio_capture else 0)
+        metrics.counter("process_cpu_seconds_total", "CPU time used by the node process", func=time.process_time)
+        self.feature_histogram = metrics.histogram("feature_extraction_seconds", "Log-mel extraction time per window")
+        self.inference_histogram = metrics.histogram("inference_batch_seconds", "Acoustic model time per batch")
+        self.windows_counter = metrics.counter("detection_windows_total", "Audio windows analysed")
+        metrics.counter("energy_gated_windows_total", "Windows below the energy gate, not run through the model",
+                        func=lambda: self.energy_gate.gated)
+        metrics.gauge("battery_level_percent", "Last battery reading",
+                      func=lambda: self.battery_level if self.battery_level is not None else -1)
+        metrics.gauge("task_period_seconds", "Current adaptive period", {"task": "heartbeat"},
+                      func=self._heartbeat_period)
+        metrics.gauge("task_period_seconds", "Current adaptive period", {"task": "tree_health"},
+                      func=self._tree_health_period)
+        
+        for link, outbox, sender in (("gsm", self.gsm_outbox, self.gsm_sender),
+                                     ("lora", self.lora_outbox, self.lora_sender)):
+            labels = {"link": link}
+            metrics.gauge("uplink_queue_depth", "Records waiting in the outbox", labels,
+                          func=lambda outbox=outbox: outbox.pending)
+            metrics.gauge("uplink_queue_bytes", "Bytes waiting in the outbox", labels,
+                          func=lambda outbox=outbox: outbox.pending_bytes)
+            metrics.counter("uplink_evicted_total", "Records evicted from a full outbox", labels,
+                            func=lambda outbox=outbox: outbox.evicted)
+            metrics.gauge("uplink_consecutive_failures", "Failed sends since the last success", labels,
+                          func=lambda sender=sender: sender.failures)
+        metrics.counter("uplink_bytes_total", "Bytes sent over the uplink", {"link": "gsm"},
+                        func=lambda: self.influx_writer.bytes_sent if self.influx_writer else 0)
+        self.lora_bytes_counter = metrics.counter("uplink_bytes_total", labels={"link": "lora"})
+        
+        metrics.gauge("gps_fix_age_seconds", "Age of the cached GPS fix, -1 without a fix",
+                      func=lambda: self._gps_value(lambda fix: self.gps_reader.age()))
+        metrics.gauge("gps_hdop", "HDOP of the cached GPS fix, -1 if unknown",
+                      func=lambda: self._gps_value(lambda fix: fix.hdop))
+        metrics.gauge("gps_satellites", "Satellites used for the cached GPS fix",
+                      func=lambda: self._gps_value(lambda fix: fix.satellites))
+        
+        for name, help_text in (("sent", "SMS messages sent"),
+                                ("failed", "SMS messages given up on after retries"),
+                                ("dropped", "SMS alerts dropped because the queue was full"),
+                                ("coalesced", "SMS alerts merged into another message"),
+                                ("retries", "SMS send attempts that were retried")):
+            metrics.counter(f"sms_{name}_total", help_text,
+                            func=lambda name=name: getattr(self.sms_dispatcher, name) if self.sms_dispatcher else 0)
+        metrics.gauge("sms_queue_depth", "SMS alerts waiting to be sent",
+                      func=lambda: self.sms_dispatcher.queued if self.sms_dispatcher else 0)
+        
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = MetricsServer(metrics)
+                self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"Failed to start metrics endpoint: {e}")
+                self.metrics_server = None
+    
+    def _gps_value(self, read):
+        fix = self.gps_reader.fix if self.gps_reader else None
+        value = read(fix) if fix else None
+        return value if value is not None else -1
     
-    def detect_chainsaw(self, audio_data):
+    def _detection_result(self, score, timestamp, sound_level=None):
+        """Build a detection result dict from a model score and, if measured, the window's level"""
+        result = {
+            "is_chainsaw": score >= DETECTION_THRESHOLD,
+            "confidence": score,
+            "timestamp": timestamp
+        }
+        if sound_level is not None:
+            result["sound_level"] = sound_level
+        return result
+    
+    def detect_chainsaw(self, audio_data, timestamp=None):
         """
         Detect chainsaw sounds using the acoustic model
         
         Args:
             audio_data: Audio samples to analyze
+            timestamp (float): Capture time of the window, defaults to now
             
         Returns:
             dict: Detection result with confidence and timestamp
         """
-        # This is a placeholder implementation
-        # In a real implementation, you would:
-        # 1. Process the audio data
-        # 2. Run inference with the acoustic model
-        # 3. Return results
-        
-        # Simulate detection for testing
-        detection_result = {
-            "is_chainsaw": False,
-            "confidence": 0.0,
-            "timestamp": time.time()
-        }
+        timestamp = timestamp or self.clock()
+        if not self.acoustic_detector or not self._should_analyse(audio_data):
+            return self._detection_result(0.0, timestamp)
+        
+        # Log-mel features for the window; the returned array is reused
+        # by the extractor on the next call
+        with self.feature_histogram.time():
+            features = self.feature_extractor.transform(audio_data)
+        with self.inference_histogram.time():
+            score = self.acoustic_detector.predict(features)
+        self.windows_counter.inc()
+        return self._detection_result(score, timestamp, self.energy_gate.level(audio_data))
+    
+    def detect_chainsaw_batch(self, audio_windows):
+        """
+        Detect chainsaw sounds in several windows with batched inference
+        
+        Args:
+            audio_windows (list): (timestamp, audio samples) tuples
+            
+        Returns:
+            list: Detection results in window order
+        """
+        if not self.acoustic_detector:
+            return [self._detection_result(0.0, timestamp) for timestamp, _ in audio_windows]
         
-        # Simulate occasional detection for testing
-        if time.time() - self.last_detection_time > 60:  # Every minute
-            detection_result["is_chainsaw"] = True
-            detection_result["confidence"] = 0.95  # Above threshold
-            self.last_detection_time = time.time()
-            logger.info("SIMULATED: Chainsaw detected with 95% confidence")
+        scores = []
+        levels = {}
+        for timestamp, audio_data in audio_windows:
+            if not self._should_analyse(audio_data):
+                scores.append((timestamp, 0.0))
+                continue
+            with self.feature_histogram.time():
+                features = self.feature_extractor.transform(audio_data)
+            # The window view is overwritten by later capture, so take its level now
+            levels[timestamp] = self.energy_gate.level(audio_data)
+            scores.extend(self._record_batch(self.acoustic_detector.submit(features, timestamp)))
+        scores.extend(self._record_batch(self.acoustic_detector.run_batch()))
+        # Gated windows are counted by the energy gate, not here
+        self.windows_counter.inc(len(levels))
         
-        return detection_result
+        # Gated windows are scored immediately and batched ones later, so
+        # restore capture order before the results reach the event tracker
+        scores.sort(key=lambda result: result[0])
+        return [self._detection_result(score, timestamp, levels.get(timestamp)) for timestamp, score in scores]
+    
+    def _should_analyse(self, audio_data):
+        """
+        Decide whether a window needs the full feature and model path
+        
+        Every window is analysed during an event, so a chainsaw fading with
+        distance is still tracked until the event ends.
+        """
+        return self.event_tracker.state == ACTIVE or self.energy_gate.passes(audio_data)
+    
+    def _record_batch(self, results):
+        """Observe the latency of the batch that produced results, if one ran"""
+        if results:
+            self.inference_histogram.observe(self.acoustic_detector.last_batch_latency)
+        return results
     
     def monitor_tree_health(self):
         """
@@ -152,23 +446,46 @@ class DigitalHummingbird:
         Returns:
             dict: Tree health assessment
         """
-        # This is a placeholder implementation
-        # In a real implementation, you would:
-        # 1. Capture image from camera
-        # 2. Process image with visual model
-        # 3. Return health assessment
-        
-        # Simulate tree health data
+        # Sapling counting is not implemented yet, so these remain simulated
         tree_health = {
-            "health_score": np.random.uniform(0.7, 1.0),
-            "saplings_count": np.random.randint(10, 50),
-            "survival_rate": np.random.uniform(0.8, 0.95),
-            "timestamp": time.time()
+            "saplings_count": random.randint(10, 49),
+            "survival_rate": random.uniform(0.8, 0.95),
+            "timestamp": self.clock()
         }
         
+        # Capture and assess one frame; the pipeline skips the model when
+        # the view has not changed since the last assessment
+        assessment = self.camera_pipeline.assess() if self.camera_pipeline else None
+        if assessment:
+            tree_health["health_score"] = assessment["health_score"]
+        else:
+            logger.warning("No camera frame available, simulating tree health score")
+            tree_health["health_score"] = random.uniform(0.7, 1.0)
+        
         logger.info(f"Tree health assessment: {tree_health}")
         return tree_health
     
+    def read_battery_level(self):
+        """
+        Read the battery charge
+        
+        Returns:
+            float: Battery level in percent
+        """
+        # This is a placeholder implementation
+        # In a real implementation, you would read the fuel gauge or an ADC
+        return random.uniform(80, 100)  # Simulated battery level
+    
+    def _seconds_since_detection(self):
+        """Seconds since the last positive window, or None if there has been none"""
+        return self.clock() - self.last_detection_time if self.last_detection_time > 0 else None
+    
+    def _heartbeat_period(self):
+        return self.heartbeat_cadence.period(self.battery_level, self._seconds_since_detection())
+    
+    def _tree_health_period(self):
+        return self.tree_health_cadence.period(self.battery_level, self._seconds_since_detection())
+    
     def get_gps_coordinates(self):
         """
         Get current GPS coordinates
@@ -176,117 +493,164 @@ class DigitalHummingbird:
         Returns:
             str: GPS coordinates in format "lat,lng"
         """
-        # This is a placeholder implementation
-        # In a real implementation, you would read from a GPS module
-        return "0.000000,0.000000"  # Default coordinates
+        # The reader thread parses NMEA in the background; this only reads its cache
+        coordinates = self.gps_reader.coordinates() if self.gps_reader else None
+        
+        # Keep the last known position while the fix is missing or stale
+        return coordinates or self.gps_coordinates
     
     def send_sms_alert(self, detection_result):
         """
-        Send SMS alert to ranger via Twilio
+        Queue an SMS alert to the ranger; the dispatcher sends it via Twilio
+        
+        Alerts from this device within SMS_COOLDOWN of the last message are
+        coalesced into one follow-up message.
         
         Args:
             detection_result (dict): Detection result with coordinates and timestamp
         """
-        if not self.twilio_client:
-            logger.warning("Twilio client not initialized, cannot send SMS")
+        if not self.sms_dispatcher:
+            logger.warning("SMS dispatcher not initialized, cannot send SMS")
             return
         
         try:
-            message_body = (
-                f"🚨 ALERT! Chainsaw detected by {self.device_name} ({self.device_id}) "
-                f"at {self.gps_coordinates} with {detection_result['confidence']*100:.1f}% confidence "
-                f"at {datetime.fromtimestamp(detection_result['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-            
-            # message = self.twilio_client.messages.create(
-            #     body=message_body,
-            #     from_="+1234567890",  # Your Twilio number
-            #     to=RANGER_PHONE_NUMBER
-            # )
+            started = detection_result.get("event", EVENT_STARTED) == EVENT_STARTED
+            if started:
+                message_body = (
+                    f"🚨 ALERT! Chainsaw detected by {self.device_name} ({self.device_id}) "
+                    f"at {self.gps_coordinates} with {detection_result['confidence']*100:.1f}% confidence "
+                    f"at {datetime.fromtimestamp(detection_result['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}"
+                )
+            else:
+                message_body = (
+                    f"Chainsaw activity near {self.device_name} ({self.device_id}) at {self.gps_coordinates} "
+                    f"ended at {datetime.fromtimestamp(detection_result['timestamp']).strftime('%Y-%m-%d %H:%M:%S')} "
+                    f"after {detection_result['duration'] / 60:.0f} min, "
+                    f"peak confidence {detection_result['confidence']*100:.1f}%"
+                )
             
-            logger.info(f"SMS alert sent to {RANGER_PHONE_NUMBER}")
+            if self.sms_dispatcher.submit(self.device_id, message_body, urgent=started):
+                logger.info(f"SMS alert queued for {RANGER_PHONE_NUMBER}")
         except Exception as e:
-            logger.error(f"Failed to send SMS alert: {e}")
+            logger.error(f"Failed to queue SMS alert: {e}")
     
     def send_data_via_lora(self, data):
         """
-        Send data via LoRa to gateway
+        Queue data for sending via LoRa to gateway
         
         Args:
             data (dict): Data to send
         """
+        try:
+            if record_type(data) == RECORD_DETECTION:
+                data = {"gps_coordinates": self.gps_coordinates, **data}
+            self.lora_outbox.append(data, uplink_priority(data))
+        except Exception as e:
+            logger.error(f"Failed to queue data for LoRa: {e}")
+    
+    def _send_lora_batch(self, batch):
+        """
+        Send queued records via LoRa, packed into compact binary frames
+        
+        Args:
+            batch (list): Record payloads from the LoRa outbox
+            
+        Returns:
+            bool: True if the batch was sent
+        """
         if not self.lora:
             logger.warning("LoRa communicator not initialized, cannot send data")
-            return
+            return False
         
-        try:
-            # Convert data to JSON string
-            json_data = json.dumps(data)
-            
+        for frame in encode_frames(self.device_id, batch):
             # Send via LoRa
-            # self.lora.send(json_data)
+            # self.lora.send(frame)
             
-            logger.info(f"Data sent via LoRa: {len(json_data)} bytes")
-        except Exception as e:
-            logger.error(f"Failed to send data via LoRa: {e}")
+            self.lora_bytes_counter.inc(len(frame))
+            logger.info(f"Data sent via LoRa: {len(frame)} bytes")
+        return True
     
     def send_data_via_gsm(self, data):
         """
-        Send data via GSM/GPRS to InfluxDB
+        Queue data for sending via GSM/GPRS to InfluxDB
         
         Args:
             data (dict): Data to send
         """
         try:
-            # Get InfluxDB credentials from environment variables
-            influxdb_url = os.environ.get('INFLUXDB_URL')
-            influxdb_token = os.environ.get('INFLUXDB_TOKEN')
-            
-            if not influxdb_url or not influxdb_token:
-                logger.error("InfluxDB credentials not found in environment variables")
-                return
-            
-            # Prepare data in InfluxDB line protocol
-            line_protocol = (
-                f"acoustic_guardian,device_id={self.device_id} "
-                f"gps_coordinates=\"{self.gps_coordinates}\","
-                f"threat_type=\"chainsaw\","
-                f"confidence={data.get('confidence', 0.0)},"
-                f"threat_detected={str(data.get('is_chainsaw', False)).lower()},"
-                f"time_safe={self.time_safe} {int(time.time())}"
-            )
-            
-            # Send HTTP POST request to InfluxDB
-            headers = {
-                "Authorization": f"Token {influxdb_token}",
-                "Content-Type": "text/plain; charset=utf-8"
+            # Prepare data in InfluxDB line protocol, stamped now rather than
+            # when the outbox eventually delivers it
+            timestamp = int(data.get('timestamp', self.clock()))
+            tags = {"device_id": self.device_id}
+            fields = {
+                "gps_coordinates": self.gps_coordinates,
+                "threat_type": "chainsaw",
+                "confidence": float(data.get('confidence', 0.0)),
+                "threat_detected": bool(data.get('is_chainsaw', False)),
+                "time_safe": int(self.time_safe),
             }
+            # Event starts carry the onset the gateway locates the chainsaw from
+            for name in ("arrival_time", "sound_level"):
+                if data.get(name) is not None:
+                    fields[name] = float(data[name])
+            line_protocol = format_line("acoustic_guardian", tags, fields, timestamp)
+            self.gsm_outbox.append(line_protocol, uplink_priority(data))
             
-            response = requests.post(influxdb_url, headers=headers, data=line_protocol)
-            if response.status_code == 204:
-                logger.info("Data successfully sent to InfluxDB via GSM")
-            else:
-                logger.error(f"Failed to send data to InfluxDB. Status code: {response.status_code}")
-                
+            # Heartbeats carry the metrics summary as a separate measurement;
+            # all floats, so a field never changes type between heartbeats
+            if data.get('metrics'):
+                fields = {name: float(value) for name, value in data['metrics'].items()}
+                self.gsm_outbox.append(format_line("node_metrics", tags, fields, timestamp), uplink_priority(data))
         except Exception as e:
-            logger.error(f"Failed to send data via GSM: {e}")
+            logger.error(f"Failed to queue data for GSM: {e}")
+    
+    def _send_gsm_batch(self, batch):
+        """
+        Upload queued line protocol records to InfluxDB in one request
+        
+        The outbox already does the batching, so records go straight to the
+        writer's gzip/retry path over its persistent session.
+        
+        Args:
+            batch (list): Line protocol strings from the GSM outbox
+            
+        Returns:
+            int: Leading records InfluxDB accepted; the rest stay queued
+        """
+        influx_writer = self._get_influx_writer()
+        if not influx_writer:
+            return 0
+        
+        sent = influx_writer.post_prefix(batch)
+        if sent:
+            logger.info(f"{sent} records successfully sent to InfluxDB via GSM")
+        return sent
     
     def send_heartbeat(self):
         """
         Send regular heartbeat with device status
         """
+        self.battery_level = self.read_battery_level()
         heartbeat_data = {
             "device_id": self.device_id,
-            "timestamp": time.time(),
-            "battery_level": np.random.uniform(80, 100),  # Simulated battery level
-            "signal_strength": np.random.randint(-80, -60),  # Simulated signal strength
-            "uptime": int(time.time() - self.start_time),
+            "timestamp": self.clock(),
+            "battery_level": self.battery_level,
+            "signal_strength": random.randint(-80, -61),  # Simulated signal strength
+            "uptime": int(self.clock() - self.start_time),
             "time_safe": self.time_safe
         }
         
-        # Send via both LoRa and GSM for redundancy
+        # Send via both LoRa and GSM for redundancy; the metrics summary is
+        # too large for a LoRa frame, so only the GSM heartbeat carries it
         self.send_data_via_lora(heartbeat_data)
-        self.send_data_via_gsm(heartbeat_data)
+        self.send_data_via_gsm({**heartbeat_data, "metrics": self.metrics.summary()})
+        
+        if self.acoustic_detector:
+            stats = self.acoustic_detector.stats()
+            logger.info(
+                f"Acoustic inference: {stats['batches']} batches, "
+                f"{stats['mean_batch_ms']:.1f} ms/batch, {stats['mean_window_ms']:.1f} ms/window"
+            )
         
         logger.info("Heartbeat sent")
     
@@ -295,78 +659,185 @@ class DigitalHummingbird:
         Update the time safe counter
         """
         if self.last_detection_time > 0:
-            self.time_safe = int(time.time() - self.last_detection_time)
+            self.time_safe = int(self.clock() - self.last_detection_time)
         else:
             # If no detection yet, time safe is since startup
-            self.time_safe = int(time.time() - self.start_time)
+            self.time_safe = int(self.clock() - self.start_time)
+    
+    def detection_tick(self):
+        """
+        Analyse all audio captured since the last tick and queue event messages
+        
+        Returns:
+            list: Detection events started or ended during this tick
+        """
+        current_time = self.clock()
+        
+        # Update GPS coordinates
+        self.gps_coordinates = self.get_gps_coordinates()
+        
+        # Update time safe counter
+        self.update_time_safe()
+        
+        # Acoustic detection over every overlapping window captured
+        # since the previous tick, so no audio goes unanalysed
+        audio_windows = [
+            (self.audio_capture.timestamp_of(start), window)
+            for start, window in self.audio_reader.windows()
+        ] if self.audio_reader else []
+        
+        detection_events = []
+        for detection_result in self.detect_chainsaw_batch(audio_windows):
+            if detection_result["is_chainsaw"]:
+                # Update last detection time
+                self.last_detection_time = detection_result["timestamp"]
+            detection_events.extend(self.event_tracker.update(detection_result))
+        detection_events.extend(self.event_tracker.check_timeout(current_time))
+        
+        # Tighten heartbeat and tree health cadence as soon as an event starts
+        # rather than after their current, possibly stretched, wait
+        if self.scheduler and any(event["event"] == EVENT_STARTED for event in detection_events):
+            self.scheduler.reschedule("heartbeat")
+            self.scheduler.reschedule("tree_health")
+        
+        # One alert when an event starts and one summary when it ends,
+        # rather than one per positive window
+        for detection_event in detection_events:
+            logger.info(
+                f"Chainsaw event {detection_event['event_id']} {detection_event['event']} "
+                f"with confidence: {detection_event['confidence']}"
+            )
+            
+            # Only queues the alert; the dispatcher thread talks to Twilio so
+            # its latency never blocks detection
+            self.send_sms_alert(detection_event)
+            
+            # Queue data for both LoRa and GSM
+            self.send_data_via_lora(detection_event)
+            self.send_data_via_gsm(detection_event)
+        
+        return detection_events
+    
+    def uplink_tick(self):
+        """
+        Drain queued uplink data; each sender backs off while its link is down
+        """
+        current_time = self.clock()
+        self.gsm_sender.drain(current_time)
+        self.lora_sender.drain(current_time)
+    
+    def tree_health_tick(self):
+        """
+        Visual tree health monitoring (periodic)
+        """
+        tree_health = self.monitor_tree_health()
+        
+        # Send tree health data
+        self.send_data_via_lora({"type": "tree_health", **tree_health})
+        self.send_data_via_gsm({"type": "tree_health", **tree_health})
+        
+        self.last_health_check = self.clock()
+    
+    def heartbeat_tick(self):
+        """
+        Send heartbeat periodically
+        """
+        self.send_heartbeat()
+        self.last_heartbeat_time = self.clock()
+    
+    def _build_scheduler(self):
+        """
+        Register the node's periodic jobs as independent scheduler tasks
+        """
+        scheduler = NodeScheduler(self.metrics)
+        scheduler.add_task("detection", self.detection_tick, DETECTION_INTERVAL, timeout=DETECTION_TIMEOUT)
+        scheduler.add_task("uplink", self.uplink_tick, UPLINK_INTERVAL, timeout=UPLINK_TIMEOUT,
+                           initial_delay=UPLINK_INTERVAL)
+        scheduler.add_task("heartbeat", self.heartbeat_tick, self._heartbeat_period, timeout=UPLINK_TIMEOUT)
+        scheduler.add_task("tree_health", self.tree_health_tick, self._tree_health_period,
+                           timeout=TREE_HEALTH_TIMEOUT)
+        return scheduler
+    
+    async def run_async(self):
+        """
+        Run all periodic jobs on the asyncio scheduler until stopped
+        """
+        self.scheduler = self._build_scheduler()
+        await self.scheduler.run()
     
     def run(self):
         """
         Main execution loop
         """
-        self.start_time = time.time()
         logger.info(f"{self.device_name} starting main loop")
         
         try:
-            while True:
-                current_time = time.time()
-                
-                # Update GPS coordinates
-                self.gps_coordinates = self.get_gps_coordinates()
-                
-                # Update time safe counter
-                self.update_time_safe()
-                
-                # Acoustic detection
-                # In a real implementation, you would capture audio data here
-                # audio_data = self.capture_audio()
-                audio_data = None  # Placeholder
-                
-                if audio_data is not None:
-                    detection_result = self.detect_chainsaw(audio_data)
-                    
-                    if detection_result["is_chainsaw"] and detection_result["confidence"] > DETECTION_THRESHOLD:
-                        logger.info(f"Chainsaw detected with confidence: {detection_result['confidence']}")
-                        
-                        # Send SMS alert
-                        self.send_sms_alert(detection_result)
-                        
-                        # Send data via both LoRa and GSM
-                        self.send_data_via_lora(detection_result)
-                        self.send_data_via_gsm(detection_result)
-                        
-                        # Update last detection time
-                        self.last_detection_time = current_time
-                
-                # Visual tree health monitoring (periodic)
-                if current_time - getattr(self, 'last_health_check', 0) > 300:  # Every 5 minutes
-                    tree_health = self.monitor_tree_health()
-                    
-                    # Send tree health data
-                    self.send_data_via_lora({"type": "tree_health", **tree_health})
-                    self.send_data_via_gsm({"type": "tree_health", **tree_health})
-                    
-                    self.last_health_check = current_time
-                
-                # Send heartbeat periodically
-                if current_time - self.last_heartbeat_time > HEARTBEAT_INTERVAL:
-                    self.send_heartbeat()
-                    self.last_heartbeat_time = current_time
-                
-                # Sleep to prevent excessive CPU usage
-                time.sleep(DETECTION_INTERVAL)
-                
+            asyncio.run(self.run_async())
         except KeyboardInterrupt:
             logger.info("Received interrupt signal, shutting down...")
         except Exception as e:
             logger.error(f"Unexpected error in main loop: {e}")
         finally:
-            logger.info(f"{self.device_name} shutdown complete")
+            self.shutdown()
+    
+    def shutdown(self):
+        """
+        Stop capture and flush uplink state to disk
+        """
+        if self.audio_capture:
+            self.audio_capture.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.gps_reader:
+            self.gps_reader.stop()
+        if self.sms_dispatcher:
+            self.sms_dispatcher.stop()
+        if self.influx_writer:
+            self.influx_writer.close()
+        self.gsm_outbox.close()
+        self.lora_outbox.close()
+        logger.info(f"{self.device_name} shutdown complete")
+    
+    def profile_startup(self):
+        """
+        Time the lazily loaded clients and the first audio window, then print
+        the startup breakdown
+        """
+        with self.startup.phase("influx writer (lazy)"):
+            self._get_influx_writer()
+        if self.sms_dispatcher:
+            with self.startup.phase("sms transport (lazy)"):
+                self.sms_dispatcher.transport.connect()
+        
+        print("Startup phases:")
+        print(self.startup.report())
+        
+        # Audio was captured from the start of __init__, so the first window
+        # is ready one window length after capture began
+        if self.audio_reader:
+            ring = self.audio_reader.ring_buffer
+            if ring.wait_for(self.audio_reader.window_size, timeout=AUDIO_WINDOW_SECONDS + 5):
+                print(f"First audio window ready {self.startup.since_start() * 1000:.1f} ms after start")
+            else:
+                print("No audio window captured")
 
 def main():
     """
     Main function to run the Digital Hummingbird
     """
+    parser = argparse.ArgumentParser(description="EcoGuard Digital Hummingbird sensor node")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print a per-phase import/initialization time breakdown and exit")
+    args = parser.parse_args()
+    
+    if args.profile_startup:
+        hummingbird = DigitalHummingbird()
+        try:
+            hummingbird.profile_startup()
+        finally:
+            hummingbird.shutdown()
+        return
+    
     print("🐦 EcoGuard - Digital Hummingbird 🐦")
     print("=" * 50)
     print(f"Device ID: {DEVICE_ID}")
@@ -379,4 +850,4 @@ def main():
     hummingbird.run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -7,12 +7,14 @@ and sending it to InfluxDB and SMS alerts via Twilio, demonstrating the Digital
 functionality without requiring physical hardware.
 """
 
-import requests
 import time
 import random
 from datetime import datetime
 import os
-from twilio.rest import Client
+
+from influx_writer import InfluxLineWriter
+from line_protocol import format_line
+from sms_dispatcher import AlertDispatcher, TwilioTransport
 
 # Sensor configuration
 DEVICE_ID = os.getenv("DEVICE_ID", "AG-001")
@@ -34,41 +36,61 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER", "+1234567890")  # Your Tw
 SENSOR_LATITUDE = float(os.getenv("SENSOR_LATITUDE", "-3.4653"))
 SENSOR_LONGITUDE = float(os.getenv("SENSOR_LONGITUDE", "-62.2159"))
 
+# Shared writer so every point reuses one HTTP session
+influx_writer = None
+
+# Shared SMS dispatcher: one Twilio session, and alerts within SMS_COOLDOWN
+# of the last message are coalesced instead of each sending an SMS
+sms_dispatcher = None
+
+def get_influx_writer():
+    """
+    Create the shared InfluxDB writer on first use
+    """
+    global influx_writer
+    if influx_writer is None:
+        influx_writer = InfluxLineWriter(INFLUXDB_URL, INFLUXDB_TOKEN)
+    return influx_writer
+
 def send_to_influxdb(data):
     """
     Send data to InfluxDB using the Line Protocol
     """
-    headers = {
-        "Authorization": f"Token {INFLUXDB_TOKEN}",
-        "Content-Type": "text/plain; charset=utf-8"
-    }
-    
     try:
-        response = requests.post(INFLUXDB_URL, headers=headers, data=data)
-        if response.status_code == 204:
+        # Flush straight away: each simulated event is sent on its own
+        writer = get_influx_writer()
+        writer.write(data)
+        if writer.flush():
             print(f"Data successfully sent to InfluxDB: {data}")
             return True
         else:
-            print(f"Failed to send data to InfluxDB. Status code: {response.status_code}")
-            print(f"Response: {response.text}")
+            print("Failed to send data to InfluxDB, it will be retried with the next point")
             return False
     except Exception as e:
         print(f"Error sending data to InfluxDB: {str(e)}")
         return False
 
+def get_sms_dispatcher():
+    """
+    Create and start the shared SMS dispatcher on first use
+    """
+    global sms_dispatcher
+    if sms_dispatcher is None:
+        transport = TwilioTransport(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER)
+        sms_dispatcher = AlertDispatcher(transport, recipient=RANGER_PHONE_NUMBER)
+        sms_dispatcher.start()
+    return sms_dispatcher
+
 def send_sms_alert(message):
     """
-    Send SMS alert via Twilio
+    Queue SMS alert for sending via Twilio
     """
     try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        message = client.messages.create(
-            body=message,
-            from_=TWILIO_PHONE_NUMBER,
-            to=RANGER_PHONE_NUMBER
-        )
-        print(f"SMS alert sent successfully. SID: {message.sid}")
-        return True
+        if get_sms_dispatcher().submit(DEVICE_ID, message):
+            print("SMS alert queued for sending.")
+            return True
+        print("SMS queue full, alert dropped.")
+        return False
     except Exception as e:
         print(f"Error sending SMS: {str(e)}")
         return False
@@ -86,10 +108,17 @@ def simulate_chainsaw_detection():
     timestamp = int(time.time())
     
     # Create InfluxDB Line Protocol data
-    line_protocol = (
-        f"acoustic_guardian,device_id={DEVICE_ID},location={SENSOR_LOCATION} "
-        f"gps_coordinates=\"{gps_coordinates}\",threat_type=\"{threat_type}\","
-        f"confidence={confidence},threat_detected=true,time_safe=0 {timestamp}"
+    line_protocol = format_line(
+        "acoustic_guardian",
+        {"device_id": DEVICE_ID, "location": SENSOR_LOCATION},
+        {
+            "gps_coordinates": gps_coordinates,
+            "threat_type": threat_type,
+            "confidence": confidence,
+            "threat_detected": True,
+            "time_safe": 0,
+        },
+        timestamp,
     )
     
     # Send data to InfluxDB
@@ -117,10 +146,11 @@ def simulate_heartbeat():
     timestamp = int(time.time())
     
     # Create InfluxDB Line Protocol data for device status
-    line_protocol = (
-        f"device_status,device_id={DEVICE_ID} "
-        f"battery_level={battery_level},signal_strength={signal_strength},"
-        f"uptime={uptime} {timestamp}"
+    line_protocol = format_line(
+        "device_status",
+        {"device_id": DEVICE_ID},
+        {"battery_level": battery_level, "signal_strength": signal_strength, "uptime": uptime},
+        timestamp,
     )
     
     # Send data to InfluxDB
@@ -180,6 +210,9 @@ def main():
             simulate_heartbeat()
         elif choice == "3":
             print("Exiting simulation.")
+            if sms_dispatcher:
+                # Sends anything still waiting for its cooldown
+                sms_dispatcher.stop()
             break
         else:
             print("Invalid choice. Please enter 1, 2, or 3.")
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - SMS Alert Dispatcher
+
+Asynchronous, rate-limited SMS alerts for rangers.
+
+Callers submit an alert and return at once; a worker thread sends it through
+a pluggable transport. Alerts are grouped by key (a device or an area): the
+first alert for a key goes out immediately, and anything submitted for the
+same key within SMS_COOLDOWN seconds of the last send is coalesced into a
+single follow-up message carrying the alert count. The follow-up keeps the
+text of the first alert coalesced into it, unless that was a routine one
+(e.g. an event-ended summary) and an urgent one (an event start) followed,
+so a summary never hides a start alert. Failed sends are retried
+with exponential backoff and jitter, honouring Retry-After; alerts submitted
+while a retry is pending join the waiting message. The queue between callers
+and the worker is bounded, so a dead link cannot grow memory without limit.
+
+TwilioTransport talks to the Twilio REST API over one pooled HTTP session.
+Its base URL is configurable, so fake_twilio_server.py can stand in for
+Twilio when testing.
+"""
+
+import time
+import queue
+import random
+import logging
+import threading
+
+from rpi_config import (
+    RANGER_PHONE_NUMBER,
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    TWILIO_PHONE_NUMBER,
+    TWILIO_API_URL,
+    SMS_COOLDOWN,
+    SMS_QUEUE_SIZE,
+    SMS_MAX_RETRIES,
+    SMS_RETRY_BASE,
+    SMS_RETRY_MAX,
+)
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class SmsSendError(Exception):
+    """
+    A transport failed to send a message
+    """
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        """
+        Args:
+            message (str): Description of the failure
+            retryable (bool): Whether sending again may succeed
+            retry_after (float): Seconds the provider asked us to wait, if any
+        """
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        # HTTP-date form; fall back to our own backoff
+        return None
+
+
+class TwilioTransport:
+    """
+    Sends SMS through the Twilio REST API
+    """
+
+    def __init__(self, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN,
+                 from_number=TWILIO_PHONE_NUMBER, api_url=TWILIO_API_URL, timeout=15):
+        """
+        Args:
+            account_sid (str): Twilio account SID
+            auth_token (str): Twilio auth token
+            from_number (str): Twilio number messages are sent from
+            api_url (str): API base URL; point at a fake server for testing
+            timeout (float): Request timeout in seconds
+        """
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.url = f"{api_url.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.timeout = timeout
+        self.session = None
+
+    def connect(self):
+        """Create the HTTP session; called by the first send if not before"""
+        if self.session is None:
+            import requests
+
+            self.session = requests.Session()
+            self.session.auth = (self.account_sid, self.auth_token)
+
+    def send(self, to, body):
+        """
+        Send one message
+
+        Args:
+            to (str): Recipient phone number
+            body (str): Message text
+
+        Returns:
+            str: Message SID
+
+        Raises:
+            SmsSendError: If the message was not accepted
+        """
+        import requests
+
+        self.connect()
+        try:
+            response = self.session.post(
+                self.url, data={"To": to, "From": self.from_number, "Body": body}, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise SmsSendError(f"Twilio request failed: {e}")
+
+        if 200 <= response.status_code < 300:
+            return response.json().get("sid")
+        raise SmsSendError(
+            f"Twilio returned {response.status_code}: {response.text[:200]}",
+            retryable=response.status_code in RETRYABLE_STATUS,
+            retry_after=_parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+    def close(self):
+        """Close the HTTP session"""
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+
+class _PendingAlert:
+    """Alerts for one key waiting to be sent as a single message"""
+
+    __slots__ = ("body", "urgent", "count", "first_submitted", "attempts", "not_before")
+
+    def __init__(self, body, urgent, submitted):
+        self.body = body
+        self.urgent = urgent
+        self.count = 1
+        self.first_submitted = submitted
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class AlertDispatcher:
+    """
+    Coalesces, rate-limits and sends alerts from a worker thread
+    """
+
+    def __init__(self, transport, recipient=RANGER_PHONE_NUMBER, cooldown=SMS_COOLDOWN,
+                 max_queue=SMS_QUEUE_SIZE, max_retries=SMS_MAX_RETRIES, retry_base=SMS_RETRY_BASE,
+                 retry_max=SMS_RETRY_MAX, clock=time.monotonic):
+        """
+        Args:
+            transport: Object with send(to, body) raising SmsSendError on failure
+            recipient (str): Phone number alerts are sent to
+            cooldown (float): Minimum seconds between messages for the same key
+            max_queue (int): Alerts waiting for the worker before new ones are dropped
+            max_retries (int): Retries of a failed message before it is dropped
+            retry_base (float): Backoff before the first retry in seconds
+            retry_max (float): Longest backoff in seconds
+            clock (callable): Monotonic time source
+        """
+        self.transport = transport
+        self.recipient = recipient
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.clock = clock
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._last_sent = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.retries = 0
+
+    @property
+    def queued(self):
+        """Alerts waiting for the worker, plus messages waiting for cooldown or retry"""
+        return self._queue.qsize() + len(self._pending)
+
+    def start(self):
+        """Start the worker thread"""
+        self._thread = threading.Thread(target=self._run, name="sms-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, body, urgent=True):
+        """
+        Queue an alert without blocking
+
+        Args:
+            key (str): Coalescing key, e.g. a device ID or area
+            body (str): Message text
+            urgent (bool): False for routine alerts such as an event-ended
+                summary, whose text gives way to an urgent alert's when
+                both are coalesced into one message
+
+        Returns:
+            bool: False if the queue was full and the alert was dropped
+        """
+        try:
+            self._queue.put_nowait((key, body, urgent, self.clock()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.error(f"SMS queue full, dropped alert for {key}")
+            return False
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                key, body, urgent, submitted = self._queue.get(timeout=self._wait_time())
+            except queue.Empty:
+                pass
+            else:
+                self._add(key, body, urgent, submitted)
+            self._send_due(self.clock())
+
+        # Shutting down: one last attempt for everything still waiting
+        while True:
+            try:
+                self._add(*self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._send_due(self.clock(), ignore_schedule=True)
+
+    def _wait_time(self):
+        if not self._pending:
+            return 1.0
+        now = self.clock()
+        due = min(self._due_time(key, alert) for key, alert in self._pending.items())
+        return min(1.0, max(0.0, due - now))
+
+    def _due_time(self, key, alert):
+        last_sent = self._last_sent.get(key)
+        cooldown_end = last_sent + self.cooldown if last_sent is not None else 0.0
+        return max(cooldown_end, alert.not_before)
+
+    def _add(self, key, body, urgent, submitted):
+        alert = self._pending.get(key)
+        if alert is None:
+            self._pending[key] = _PendingAlert(body, urgent, submitted)
+        else:
+            # Keep the first alert's text; only an urgent one displaces a routine one
+            if urgent and not alert.urgent:
+                alert.body = body
+                alert.urgent = True
+            alert.count += 1
+            self.coalesced += 1
+
+    def _compose(self, alert):
+        if alert.count == 1:
+            return alert.body
+        window = self.clock() - alert.first_submitted
+        return f"{alert.body} (+{alert.count - 1} more alerts in the last {window:.0f} s)"
+
+    def _send_due(self, now, ignore_schedule=False):
+        for key in list(self._pending):
+            alert = self._pending[key]
+            if not ignore_schedule and now < self._due_time(key, alert):
+                continue
+            try:
+                sid = self.transport.send(self.recipient, self._compose(alert))
+            except SmsSendError as e:
+                alert.attempts += 1
+                if not e.retryable or alert.attempts > self.max_retries or ignore_schedule:
+                    self.failed += 1
+                    del self._pending[key]
+                    logger.error(f"Failed to send SMS alert for {key}, giving up: {e}")
+                else:
+                    self.retries += 1
+                    delay = e.retry_after if e.retry_after is not None else self._backoff(alert.attempts)
+                    alert.not_before = now + delay
+                    logger.warning(f"Failed to send SMS alert for {key}, retrying in {delay:.1f} s: {e}")
+                continue
+            except Exception as e:
+                self.failed += 1
+                del self._pending[key]
+                logger.error(f"Failed to send SMS alert for {key}: {e}")
+                continue
+
+            self.sent += 1
+            self._last_sent[key] = now
+            del self._pending[key]
+            logger.info(f"SMS alert sent to {self.recipient} for {key} "
+                        f"({alert.count} alert{'s' if alert.count > 1 else ''}, SID {sid})")
+
+    def _backoff(self, attempts):
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def stop(self, timeout=10.0):
+        """
+        Stop the worker after one last attempt to send waiting alerts
+
+        Args:
+            timeout (float): Seconds to wait for the worker to finish
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        close = getattr(self.transport, "close", None)
+        if close:
+            close()
+
+    def stats(self):
+        """
+        Summarise dispatcher activity
+
+        Returns:
+            dict: Sent, failed, dropped, coalesced and retried counts, plus queue depth
+        """
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "queued": self.queued,
+        }
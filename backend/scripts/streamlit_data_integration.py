@@ -9,9 +9,17 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import os
 import time
 import random
 
+from rpi_config import STORE_DIR
+from ts_store import STORE_FILE, TimeSeriesStore
+import flux_query
+
+# Embedded store that the ingest gateway writes (ts_store.py); opened read-only on first use
+local_store = None
+
 # Mock data generator to simulate InfluxDB data
 def generate_mock_data(hours=24, sensors=1):
     """
@@ -60,13 +68,72 @@ def generate_mock_data(hours=24, sensors=1):
     
     return pd.DataFrame(data)
 
+def get_local_store():
+    """
+    Open the gateway's embedded store, or return None if STORE_DIR has none
+    """
+    global local_store
+    if local_store is None:
+        if not os.path.exists(os.path.join(STORE_DIR, STORE_FILE)):
+            return None
+        local_store = TimeSeriesStore(STORE_DIR, read_only=True)
+    else:
+        # Pick up segments the gateway has written since the last query
+        local_store.refresh()
+    return local_store
+
+def query_local_store(store, query):
+    """
+    Run a dashboard's Flux query against the embedded store (flux_query.py)
+    """
+    return flux_query.execute(store, query)
+
+def detection_summary(store, hours=24):
+    """
+    Hourly fleet detections, top confidence and battery over the last hours,
+    from the store's rollups rather than the raw points
+    """
+    start = (int(time.time()) // 3600 - hours + 1) * 3600
+    summary = store.rollup(start, None, 3600, "fleet")
+    summary['max_confidence'] = (summary['max_confidence'] * 100).round(1)
+    return summary
+
+def show_rollup_summary(store):
+    """
+    The processing example's insights, from the store's hourly rollups
+    """
+    summary = detection_summary(store)
+    st.markdown("**Hourly Rollups (24h)**")
+    st.dataframe(summary)
+
+    st.markdown("**Processed Insights**")
+    st.metric(
+        label="Total Detections (24h)",
+        value=int(summary['detections'].sum()),
+    )
+    if summary['max_confidence'].notna().any():
+        st.metric(
+            label="Top Confidence",
+            value=f"{summary['max_confidence'].max():.1f}%",
+        )
+    if summary['min_battery'].notna().any():
+        st.metric(
+            label="Lowest Battery Level",
+            value=f"{summary['min_battery'].min():.1f}%",
+        )
+
 # Function to simulate InfluxDB query
 def query_influxdb_mock(query):
     """
     Mock function to simulate querying InfluxDB
-    In a real implementation, this would connect to InfluxDB and execute the query
+    Runs the Flux query on the ingest gateway's embedded store when there is
+    one, and answers from generated data otherwise
     """
-    if 'last_detection' in query:
+    store = get_local_store()
+    if store is not None:
+        return query_local_store(store, query)
+
+    if 'threat_detected' in query and 'last()' in query:
         # Return mock last detection
         return pd.DataFrame([{
             'sensor_id': 'AG-001',
@@ -76,10 +143,10 @@ def query_influxdb_mock(query):
             'threat_type': 'Chainsaw',
             'confidence': 95.2
         }])
-    elif 'detection_history' in query:
+    elif '"acoustic_guardian"' in query:
         # Return mock detection history
         return generate_mock_data(hours=168, sensors=3)  # Last 7 days, 3 sensors
-    elif 'sensor_status' in query:
+    elif '"device_status"' in query:
         # Return mock sensor status
         return pd.DataFrame([{
             'sensor_id': 'AG-001',
@@ -130,7 +197,7 @@ def main():
         if st.button("Execute Last Detection Query"):
             with st.spinner("Querying InfluxDB..."):
                 time.sleep(1)  # Simulate network delay
-                result = query_influxdb_mock("last_detection")
+                result = query_influxdb_mock(last_detection_query)
                 st.success("Query executed successfully!")
                 st.dataframe(result)
     
@@ -147,7 +214,7 @@ def main():
         if st.button("Execute Sensor Status Query"):
             with st.spinner("Querying InfluxDB..."):
                 time.sleep(1)  # Simulate network delay
-                result = query_influxdb_mock("sensor_status")
+                result = query_influxdb_mock(sensor_status_query)
                 st.success("Query executed successfully!")
                 st.dataframe(result)
     
@@ -197,38 +264,42 @@ def main():
     
     # Show data processing example
     if st.button("Show Data Processing Example"):
-        # Generate raw data
-        raw_data = generate_mock_data(hours=24, sensors=1)
+        store = get_local_store()
+        if store is not None:
+            show_rollup_summary(store)
+        else:
+            # Generate raw data
+            raw_data = generate_mock_data(hours=24, sensors=1)
         
-        st.markdown("**Raw Sensor Data**")
-        st.dataframe(raw_data.head(10))
+            st.markdown("**Raw Sensor Data**")
+            st.dataframe(raw_data.head(10))
         
-        # Process data
-        st.markdown("**Processed Insights**")
+            # Process data
+            st.markdown("**Processed Insights**")
         
-        # Detection summary
-        detections = raw_data[raw_data['event_type'] == 'detection']
-        if not detections.empty:
-            st.metric(
-                label="Total Detections (24h)", 
-                value=len(detections),
-                delta=f"{len(detections)} new"
-            )
+            # Detection summary
+            detections = raw_data[raw_data['event_type'] == 'detection']
+            if not detections.empty:
+                st.metric(
+                    label="Total Detections (24h)", 
+                    value=len(detections),
+                    delta=f"{len(detections)} new"
+                )
             
-            avg_confidence = detections['confidence'].mean()
+                avg_confidence = detections['confidence'].mean()
+                st.metric(
+                    label="Average Confidence", 
+                    value=f"{avg_confidence:.1f}%",
+                    delta="High accuracy"
+                )
+        
+            # Battery status
+            latest_status = raw_data[raw_data['event_type'] == 'heartbeat'].iloc[-1]
             st.metric(
-                label="Average Confidence", 
-                value=f"{avg_confidence:.1f}%",
-                delta="High accuracy"
+                label="Battery Level", 
+                value=f"{latest_status['battery_level']:.1f}%",
+                delta="Healthy"
             )
-        
-        # Battery status
-        latest_status = raw_data[raw_data['event_type'] == 'heartbeat'].iloc[-1]
-        st.metric(
-            label="Battery Level", 
-            value=f"{latest_status['battery_level']:.1f}%",
-            delta="Healthy"
-        )
     
     # Performance Considerations
     st.subheader("⚡ Performance Considerations")
@@ -239,7 +310,7 @@ def main():
     - **Pagination** - Limit data transfer
     - **Connection Pooling** - Reuse database connections
     - **Asynchronous Queries** - Non-blocking data fetching
-    - **Data Archiving** - Move old data to cold storage
+    - **Data Archiving** - Raw points past their retention move to Parquet; rollups stay hot
     """)
     
     # Footer
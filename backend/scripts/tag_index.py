@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Tag Index
+
+Inverted index from tag values to the series that carry them, for the
+embedded store (ts_store.py). A series is a measurement, a device and the
+values of the measurement's other tags, e.g. acoustic_guardian from AG-001
+at Karura Forest. Each series gets an integer ID in the order it was
+first seen.
+
+For every tag value there is a posting list: the IDs of the series with
+that value, as a sorted int64 array. The tags indexed are _measurement,
+device_id, the measurements' own tags (location), and forest, the
+location a device last reported, which covers all of the device's series.
+
+A lookup takes the posting list of each condition, unions the lists of
+values or-ed together, and intersects the results, smallest first, with a
+binary search of each ID in the next list. The cost follows the length of
+the shortest list, so finding the series of one forest does not depend on
+how many other series the fleet has.
+
+IDs only ever grow, so new series are appended to their lists and merged
+into the sorted arrays on the next lookup. A device that moves forest has
+its series moved between the two forest lists.
+"""
+
+import numpy as np
+
+# Posting list tag of the measurement
+MEASUREMENT_TAG = "_measurement"
+
+# Posting list tag of a device's current forest
+FOREST_TAG = "forest"
+
+_NONE = np.empty(0, dtype=np.int64)
+
+
+class _Postings:
+    """Series IDs of one tag value, as a sorted array with appended IDs not yet merged"""
+
+    def __init__(self):
+        self._ids = _NONE
+        self._added = []
+
+    def __len__(self):
+        return len(self._ids) + len(self._added)
+
+    def add(self, series_id):
+        self._added.append(series_id)
+
+    def remove(self, ids):
+        self._ids = np.setdiff1d(self.ids(), ids, assume_unique=True)
+
+    def ids(self):
+        """The IDs, sorted"""
+        if self._added:
+            added = np.array(self._added, dtype=np.int64)
+            self._added = []
+            if len(self._ids) and added.min() <= self._ids[-1]:
+                # A forest move can add IDs older than the list's last
+                self._ids = np.union1d(self._ids, added)
+            else:
+                self._ids = np.concatenate([self._ids, np.unique(added)])
+        return self._ids
+
+
+def intersect(lists):
+    """
+    IDs in every one of several sorted arrays
+
+    Args:
+        lists (list): Sorted int64 arrays of unique IDs
+
+    Returns:
+        np.ndarray: Sorted IDs in all of them
+    """
+    if not lists:
+        return _NONE
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        if not len(result):
+            break
+        index = np.searchsorted(other, result)
+        found = index < len(other)
+        found[found] = other[index[found]] == result[found]
+        result = result[found]
+    return result
+
+
+def union(lists):
+    """Sorted IDs in any of several sorted arrays"""
+    lists = [ids for ids in lists if len(ids)]
+    if not lists:
+        return _NONE
+    if len(lists) == 1:
+        return lists[0]
+    return np.unique(np.concatenate(lists))
+
+
+class TagIndex:
+    """
+    Series IDs by measurement, device, tag value and forest
+
+    Not thread-safe; the store calls it under its lock.
+    """
+
+    def __init__(self, tags):
+        """
+        Args:
+            tags (dict): Measurement -> names of its tags besides device_id,
+                in the order series give their values
+        """
+        self.tags = {measurement: tuple(names) for measurement, names in tags.items()}
+        # (measurement, device ID, tag values) -> series ID
+        self._ids = {}
+        # Series ID -> device ID
+        self._devices = []
+        # Device ID -> IDs of its series, and its forest
+        self._series_of = {}
+        self._forests = {}
+        # (tag, value) -> _Postings
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._devices)
+
+    def _posting(self, tag, value):
+        postings = self._postings.get((tag, value))
+        if postings is None:
+            postings = self._postings[(tag, value)] = _Postings()
+        return postings
+
+    def add(self, measurement, series):
+        """
+        Note series, skipping those already known
+
+        Args:
+            measurement (str): Measurement name
+            series (iterable): (device ID, tag values) pairs, with the values
+                in the order of the measurement's tags
+
+        Returns:
+            int: Series added
+        """
+        names = self.tags[measurement]
+        added = 0
+        for device, values in series:
+            key = (measurement, device, tuple(values))
+            if key in self._ids:
+                continue
+            series_id = len(self._devices)
+            self._ids[key] = series_id
+            self._devices.append(device)
+            self._series_of.setdefault(device, []).append(series_id)
+            self._posting(MEASUREMENT_TAG, measurement).add(series_id)
+            self._posting("device_id", device).add(series_id)
+            for name, value in zip(names, key[2]):
+                if value is not None:
+                    self._posting(name, value).add(series_id)
+            forest = self._forests.get(device)
+            if forest is not None:
+                self._posting(FOREST_TAG, forest).add(series_id)
+            added += 1
+        return added
+
+    def set_forest(self, device, forest):
+        """Move a device's series to the posting list of the forest it now reports from"""
+        previous = self._forests.get(device)
+        if previous == forest:
+            return
+        self._forests[device] = forest
+        ids = self._series_of.get(device, ())
+        if not ids:
+            return
+        if previous is not None:
+            self._postings[(FOREST_TAG, previous)].remove(np.array(ids, dtype=np.int64))
+        postings = self._posting(FOREST_TAG, forest)
+        for series_id in ids:
+            postings.add(series_id)
+
+    def postings(self, tag, value):
+        """Sorted IDs of the series with a tag value"""
+        postings = self._postings.get((tag, value))
+        return _NONE if postings is None else postings.ids()
+
+    def select(self, measurement, tags):
+        """
+        Series of a measurement whose tags match
+
+        Args:
+            measurement (str): Measurement name
+            tags (dict): Tag -> value, or list of values any of which
+                matches; tags are device_id, the measurement's own tags and
+                forest
+
+        Returns:
+            np.ndarray: Sorted series IDs
+        """
+        lists = [self.postings(MEASUREMENT_TAG, measurement)]
+        for tag, values in tags.items():
+            if isinstance(values, str):
+                lists.append(self.postings(tag, values))
+            else:
+                lists.append(union([self.postings(tag, value) for value in values]))
+        return intersect(lists)
+
+    def devices(self, ids):
+        """Device IDs of series, sorted and without repeats"""
+        if not len(ids):
+            return []
+        return sorted({self._devices[series_id] for series_id in ids.tolist()})
+
+    def stats(self):
+        """Counts for monitoring"""
+        return {
+            "series": len(self._devices),
+            "posting_lists": len(self._postings),
+            "postings": sum(len(postings) for postings in self._postings.values()),
+        }
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Test script for the audio capture ring buffer
+
+Runs with pytest or on its own: python test_audio_capture.py
+"""
+
+import numpy as np
+
+from audio_capture import AudioRingBuffer
+
+
+def test_oversized_blocks_keep_stream_positions():
+    """Blocks longer than the ring advance the absolute index by every sample received"""
+    rng = np.random.default_rng(7)
+    ring = AudioRingBuffer(1000)
+    stream = np.arange(200000, dtype=np.float32)
+    received = 0
+    while received < len(stream):
+        length = int(rng.integers(1, 1500))
+        ring.write(stream[received:received + length])
+        received = min(len(stream), received + length)
+        assert ring.total_written == received
+        start = max(ring.oldest_available, received - 300)
+        np.testing.assert_array_equal(ring.view(start, received - start), stream[start:received])
+
+
+if __name__ == "__main__":
+    for test in (test_oversized_blocks_keep_stream_positions,):
+        test()
+        print(f"PASS: {test.__name__}")
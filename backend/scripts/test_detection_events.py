@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test script for the detection event state machine
+
+Runs with pytest or on its own: python test_detection_events.py
+"""
+
+from detection_events import DetectionEventTracker, ACTIVE, IDLE, EVENT_STARTED, EVENT_ENDED
+
+
+def window(timestamp, confidence):
+    return {"timestamp": timestamp, "confidence": confidence, "is_chainsaw": confidence >= 0.5}
+
+
+def feed(tracker, scores, start=0.0, step=1.0):
+    events = []
+    for number, score in enumerate(scores):
+        events.extend(tracker.update(window(start + number * step, score)))
+    return events
+
+
+def tracker():
+    return DetectionEventTracker("AG-001", votes_required=3, vote_window=5, event_gap=10.0, threshold=0.9)
+
+
+def test_isolated_positives_do_not_start_an_event():
+    events = feed(tracker(), [0.95, 0.1, 0.1, 0.95, 0.1, 0.1, 0.95, 0.1])
+    assert events == []
+
+
+def test_k_of_n_starts_one_event():
+    detector = tracker()
+    events = feed(detector, [0.95, 0.1, 0.95, 0.2, 0.96, 0.97, 0.99])
+    assert [event["event"] for event in events] == [EVENT_STARTED]
+    assert events[0]["timestamp"] == 4.0 and events[0]["event_id"] == "AG-001-4-1"
+    assert detector.state == ACTIVE
+
+
+def test_below_threshold_is_not_a_vote():
+    """A window the model calls positive but below the threshold does not count"""
+    assert feed(tracker(), [0.8, 0.85, 0.89, 0.8, 0.85]) == []
+
+
+def test_event_ends_once_after_the_gap():
+    detector = tracker()
+    events = feed(detector, [0.95, 0.95, 0.95, 0.99, 0.1, 0.92])
+    assert [event["event"] for event in events] == [EVENT_STARTED]
+
+    # Quiet windows inside the gap keep the event open
+    assert feed(detector, [0.1] * 5, start=6.0) == []
+    ended = detector.check_timeout(15.0)
+    assert [event["event"] for event in ended] == [EVENT_ENDED]
+    summary = ended[0]
+    assert summary["event_id"] == events[0]["event_id"]
+    assert summary["start"] == 2.0 and summary["timestamp"] == 5.0 and summary["duration"] == 3.0
+    assert summary["positive_windows"] == 5 and summary["confidence"] == 0.99
+    assert abs(summary["mean_confidence"] - (0.95 * 3 + 0.99 + 0.92) / 5) < 1e-9
+    assert detector.state == IDLE and detector.check_timeout(100.0) == []
+
+
+def test_votes_reset_after_an_event():
+    """The next event needs k fresh positives, not the ones left from the last event"""
+    detector = tracker()
+    feed(detector, [0.95, 0.95, 0.95])
+    assert detector.check_timeout(20.0)
+    events = feed(detector, [0.95, 0.95, 0.95], start=30.0)
+    assert [event["event_id"] for event in events] == ["AG-001-32-2"]
+
+
+def test_started_event_carries_the_onset():
+    """The onset is the first positive window in the vote, not the window that completed it"""
+    detector = tracker()
+    events = []
+    for number, score in enumerate([0.1, 0.95, 0.2, 0.96, 0.97]):
+        result = dict(window(100.0 + number * 0.5, score), sound_level=-30.0 - number)
+        events.extend(detector.update(result))
+    assert [event["event"] for event in events] == [EVENT_STARTED]
+    assert events[0]["timestamp"] == 102.0
+    assert events[0]["arrival_time"] == 100.5 and events[0]["sound_level"] == -31.0
+
+
+if __name__ == "__main__":
+    for test in (test_isolated_positives_do_not_start_an_event, test_k_of_n_starts_one_event,
+                 test_below_threshold_is_not_a_vote, test_event_ends_once_after_the_gap,
+                 test_votes_reset_after_an_event, test_started_event_carries_the_onset):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test script for the gateway's detection dedup
+
+Runs with pytest or on its own: python test_event_dedup.py
+"""
+
+from event_dedup import DetectionDedup
+from event_fusion import METRES_PER_DEGREE
+
+NOW = 1760000040
+
+
+def at(metres_north, metres_east):
+    """Position that many metres from 0,0, where a degree of longitude is as long as one of latitude"""
+    return metres_north / METRES_PER_DEGREE, metres_east / METRES_PER_DEGREE
+
+
+def dedup(**kwargs):
+    clock = {"now": NOW}
+    return DetectionDedup(cell=100, bucket=60, horizon=10, clock=lambda: clock["now"], **kwargs), clock
+
+
+def test_same_cell_and_bucket_is_a_duplicate():
+    stage, _ = dedup()
+    assert not stage.check(*at(10, 10), NOW)
+    assert stage.check(*at(90, 90), NOW + 5)
+    assert stage.stats()["duplicates"] == 1 and stage.keys == 1
+
+
+def test_neighbouring_cell_within_a_cell_width_is_a_duplicate():
+    """Either side of a cell edge, a chainsaw is still one key"""
+    stage, _ = dedup()
+    assert not stage.check(*at(50, 95), NOW)
+    assert stage.check(*at(50, 105), NOW)
+    # A neighbouring cell, but further than a cell width from the first detection
+    assert not stage.check(*at(50, 199), NOW)
+
+
+def test_neighbouring_bucket_within_a_bucket_is_a_duplicate():
+    stage, _ = dedup()
+    bucket_end = NOW // 60 * 60 + 59
+    assert not stage.check(*at(10, 10), bucket_end)
+    assert stage.check(*at(10, 10), bucket_end + 2)
+    # The bucket after, but more than a bucket's time later
+    assert not stage.check(*at(10, 10), bucket_end + 61)
+
+
+def test_old_buckets_leave_the_wheel():
+    stage, clock = dedup()
+    assert not stage.check(*at(10, 10), NOW)
+    clock["now"] = NOW + 11 * 60
+    # Too old to check: stored, not keyed
+    assert not stage.check(*at(10, 10), NOW)
+    assert stage.stats()["unchecked"] == 1
+    assert stage.keys == 0 and stage.stats()["buckets"] == 0
+
+
+def test_max_keys_evicts_the_oldest_bucket():
+    stage, _ = dedup(max_keys=3)
+    assert not stage.check(*at(10, 10), NOW - 120)
+    assert not stage.check(*at(10, 1010), NOW - 60)
+    assert not stage.check(*at(10, 2010), NOW - 60)
+    assert not stage.check(*at(10, 3010), NOW)
+    assert stage.keys == 3 and stage.stats()["evicted"] == 1
+    # The evicted key is forgotten; the others are not
+    assert not stage.check(*at(10, 10), NOW - 120)
+    assert stage.check(*at(10, 3010), NOW)
+
+
+def test_detections_without_a_position_are_stored():
+    stage, _ = dedup()
+    assert not stage.duplicate({"device_id": "AG-001"}, {}, NOW)
+    assert not stage.duplicate({"device_id": "AG-001"}, {}, NOW)
+    assert stage.stats()["unchecked"] == 2
+
+
+if __name__ == "__main__":
+    for test in (test_same_cell_and_bucket_is_a_duplicate, test_neighbouring_cell_within_a_cell_width_is_a_duplicate,
+                 test_neighbouring_bucket_within_a_bucket_is_a_duplicate, test_old_buckets_leave_the_wheel,
+                 test_max_keys_evicts_the_oldest_bucket, test_detections_without_a_position_are_stored):
+        test()
+        print(f"PASS: {test.__name__}")
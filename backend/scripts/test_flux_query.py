@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Test script for the Flux query engine, checked against pandas over the same
+points
+
+Runs with pytest or on its own: python test_flux_query.py
+"""
+
+import os
+import ast
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import flux_query
+from line_protocol import format_line
+from ts_store import TimeSeriesStore
+
+# On the hour, so aggregateWindow() windows line up with the data
+NOW = 1760000400
+HOURS = 6
+BUCKET = 'from(bucket: "acoustic-guardian")'
+LOCATIONS = {"AG-001": "Karura Forest", "AG-002": "Karura Forest", "AG-003": "Ngong Forest"}
+
+
+def make_points():
+    """(measurement, tags, fields, timestamp) of six hours of heartbeats and detections"""
+    rng = np.random.default_rng(22)
+    points = []
+    for device, location in LOCATIONS.items():
+        for timestamp in range(NOW - HOURS * 3600, NOW, 300):
+            points.append(("device_status", {"device_id": device}, {
+                "battery_level": round(float(rng.uniform(10, 100)), 1),
+                "signal_strength": int(rng.integers(-110, -60)),
+                "uptime": timestamp - (NOW - HOURS * 3600),
+            }, timestamp))
+        for timestamp in range(NOW - HOURS * 3600 + 7, NOW, 600):
+            fields = {"threat_detected": bool(rng.random() < 0.4), "gps_coordinates": "-1.2,36.8"}
+            # Some detections carry no confidence, to exercise missing values
+            if rng.random() < 0.8:
+                fields["confidence"] = round(float(rng.random()), 3)
+            points.append(("acoustic_guardian", {"device_id": device, "location": location}, fields, timestamp))
+    return points
+
+
+def frames(points):
+    """One DataFrame per measurement, with a time column in seconds"""
+    rows = {}
+    for measurement, tags, fields, timestamp in points:
+        rows.setdefault(measurement, []).append({"time": timestamp, **tags, **fields})
+    return {measurement: pd.DataFrame(data) for measurement, data in rows.items()}
+
+
+class Fixture:
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="ecoguard-flux-")
+        self.points = make_points()
+        self.frames = frames(self.points)
+        self.store = TimeSeriesStore(self.directory, retention={})
+        half = len(self.points) // 2
+        # Part in segments, part still in the head
+        self.store.write_lines("\n".join(format_line(*point) for point in self.points[:half]))
+        self.store.flush()
+        self.store.write_lines("\n".join(format_line(*point) for point in self.points[half:]))
+
+    def run(self, text):
+        return flux_query.execute(self.store, text, now=NOW)
+
+    def close(self):
+        self.store.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def with_fixture(test):
+    def run():
+        fixture = Fixture()
+        try:
+            test(fixture)
+        finally:
+            fixture.close()
+    run.__name__ = test.__name__
+    run.__doc__ = test.__doc__
+    return run
+
+
+def seconds(frame):
+    return frame["_time"].dt.tz_convert(None).astype("datetime64[s]").astype("int64").tolist()
+
+
+def dashboard_queries():
+    """The Flux queries assigned in streamlit_data_integration.py, by variable name"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_data_integration.py")
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return {
+        node.targets[0].id: node.value.value
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name)
+        and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+        and "from(bucket" in node.value.value
+    }
+
+
+def latest(frame):
+    return frame.sort_values("time").groupby("device_id").tail(1).sort_values("device_id")
+
+
+@with_fixture
+def test_dashboard_queries_match_pandas(fixture):
+    queries = dashboard_queries()
+    detections = fixture.frames["acoustic_guardian"]
+    status = fixture.frames["device_status"]
+    references = {
+        "last_detection_query": latest(detections[(detections["time"] >= NOW - 3600) & detections["threat_detected"]]),
+        "sensor_status_query": latest(status[status["time"] >= NOW - 600]),
+    }
+    assert sorted(queries) == sorted(references)
+    for name, text in queries.items():
+        result = fixture.run(text).sort_values("device_id")
+        expected = references[name]
+        assert len(result) == len(expected) > 0, name
+        assert result["device_id"].tolist() == expected["device_id"].tolist(), name
+        assert seconds(result) == expected["time"].tolist(), name
+        for column in expected.columns.drop(["time", "device_id"]):
+            got = result[column].astype(object).where(result[column].notna(), None).tolist()
+            want = expected[column].astype(object).where(expected[column].notna(), None).tolist()
+            assert got == want, (name, column)
+
+
+@with_fixture
+def test_aggregate_window_matches_pandas(fixture):
+    """Windows are aligned to the epoch and stamped with their end"""
+    result = fixture.run(
+        f'{BUCKET} |> range(start: -{HOURS}h) |> filter(fn: (r) => r._measurement == "device_status" '
+        'and r._field == "battery_level") |> aggregateWindow(every: 1h, fn: mean, createEmpty: false)')
+    status = fixture.frames["device_status"]
+    expected = status.groupby(["device_id", (status["time"] // 3600 + 1) * 3600])["battery_level"].mean()
+    result = result.set_index(["device_id", pd.Index(seconds(result))])["battery_level"]
+    assert len(result) == len(expected) == len(LOCATIONS) * HOURS
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy())
+    assert result.index.tolist() == expected.index.tolist()
+
+
+@with_fixture
+def test_create_empty_fills_windows_without_rows(fixture):
+    result = fixture.run(
+        f'{BUCKET} |> range(start: -{HOURS + 2}h) |> filter(fn: (r) => r._measurement == "device_status" '
+        'and r.device_id == "AG-001" and r._field == "battery_level") '
+        '|> aggregateWindow(every: 1h, fn: mean)')
+    assert seconds(result) == [NOW - (HOURS + 2 - 1 - hour) * 3600 for hour in range(HOURS + 2)]
+    assert result["battery_level"].isna().tolist() == [True, True] + [False] * HOURS
+
+    counts = fixture.run(
+        f'{BUCKET} |> range(start: -{HOURS + 2}h) |> filter(fn: (r) => r._measurement == "device_status" '
+        'and r.device_id == "AG-001" and r._field == "battery_level") '
+        '|> aggregateWindow(every: 1h, fn: count)')
+    assert counts["battery_level"].tolist() == [0, 0] + [12] * HOURS
+
+
+@with_fixture
+def test_missing_values_are_neither_true_nor_false(fixture):
+    """A detection without a confidence passes neither a comparison nor its negation"""
+    query = (f'{BUCKET} |> range(start: -{HOURS}h) |> filter(fn: (r) => r._measurement == "acoustic_guardian") '
+             '|> filter(fn: (r) => {})')
+    above = fixture.run(query.replace("{}", "r.confidence > 0.5"))
+    not_above = fixture.run(query.replace("{}", "not r.confidence > 0.5"))
+    detections = fixture.frames["acoustic_guardian"]
+    assert len(above) == int((detections["confidence"] > 0.5).sum())
+    assert len(not_above) == int((detections["confidence"] <= 0.5).sum())
+    assert len(above) + len(not_above) == int(detections["confidence"].notna().sum()) < len(detections)
+
+
+@with_fixture
+def test_group_by_location_counts(fixture):
+    result = fixture.run(
+        f'{BUCKET} |> range(start: -{HOURS}h) '
+        '|> filter(fn: (r) => r._measurement == "acoustic_guardian" and r.threat_detected) '
+        '|> group(columns: ["location"]) |> count()')
+    detections = fixture.frames["acoustic_guardian"]
+    expected = detections[detections["threat_detected"]].groupby("location").count()
+    assert result["location"].tolist() == expected.index.tolist()
+    assert result["threat_detected"].tolist() == expected["threat_detected"].tolist()
+    assert result["confidence"].tolist() == expected["confidence"].tolist()
+    assert "_time" not in result.columns and "device_id" not in result.columns
+
+
+@with_fixture
+def test_tag_filters_match_pandas(fixture):
+    result = fixture.run(
+        f'{BUCKET} |> range(start: -{HOURS}h) |> filter(fn: (r) => r._measurement == "acoustic_guardian" '
+        'and r.location == "Ngong Forest" and r.confidence >= 0.3)')
+    detections = fixture.frames["acoustic_guardian"]
+    expected = detections[(detections["location"] == "Ngong Forest") & (detections["confidence"] >= 0.3)]
+    assert sorted(seconds(result)) == sorted(expected["time"].tolist())
+    assert set(result["device_id"]) == {"AG-003"}
+
+
+def test_filters_are_pushed_into_the_scan():
+    plan = flux_query.parse(
+        f'{BUCKET} |> range(start: -1h) |> filter(fn: (r) => r._measurement == "acoustic_guardian" '
+        'and (r.device_id == "AG-001" or r.device_id == "AG-002") and r.location == "Karura Forest" '
+        'and r._field == "confidence" and r._value > 0.5) |> last()')
+    assert plan.measurements == {"acoustic_guardian"}
+    assert plan.devices == {"AG-001", "AG-002"}
+    assert plan.fields == {"confidence"}
+    assert plan.tags == {"location": {"Karura Forest"}}
+    # Only the value test is left to run over the rows
+    assert plan.predicate is not None and "confidence" in repr(plan.predicate)
+    assert [function for function, _ in plan.stages] == ["last"]
+
+
+def test_queries_outside_the_subset_are_rejected():
+    for text in (
+        f'{BUCKET} |> filter(fn: (r) => r._measurement == "device_status")',
+        f'{BUCKET} |> range(start: -1h) |> map(fn: (r) => r)',
+        f'{BUCKET} |> range(start: -1h) |> filter(fn: (r) => r._value > 1)',
+        f'{BUCKET} |> range(start: -1h) |> aggregateWindow(every: 1h, fn: median)',
+    ):
+        try:
+            flux_query.parse(text)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {text}")
+
+
+if __name__ == "__main__":
+    for test in (test_dashboard_queries_match_pandas, test_aggregate_window_matches_pandas,
+                 test_create_empty_fills_windows_without_rows, test_missing_values_are_neither_true_nor_false,
+                 test_group_by_location_counts, test_tag_filters_match_pandas, test_filters_are_pushed_into_the_scan,
+                 test_queries_outside_the_subset_are_rejected):
+        test()
+        print(f"PASS: {test.__name__}")
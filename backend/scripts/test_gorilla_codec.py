@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test script for the Gorilla column codec: every column must come back bit for
+bit, whole or one run at a time
+
+Runs with pytest or on its own: python test_gorilla_codec.py
+"""
+
+import json
+
+import numpy as np
+
+from gorilla_codec import encode, decode
+
+INT64 = np.iinfo(np.int64)
+
+
+def round_trip(values, run_starts=None):
+    meta, arrays = encode(values, run_starts)
+    # Meta is stored as JSON in segment headers
+    meta = json.loads(json.dumps(meta))
+    decoded = decode(meta, arrays)
+    assert decoded.dtype == values.dtype
+    np.testing.assert_array_equal(decoded.view(np.uint64), values.view(np.uint64))
+
+    starts = list(run_starts or [0]) + [len(values)]
+    # An empty column has no runs
+    runs = list(range(len(meta["runs"])))
+    for index in runs:
+        piece = decode(meta, arrays, [index])
+        np.testing.assert_array_equal(piece.view(np.uint64), values[starts[index]:starts[index + 1]].view(np.uint64))
+    picked = runs[::-2]
+    expected = np.concatenate([values[starts[index]:starts[index + 1]] for index in picked] or [values[:0]])
+    np.testing.assert_array_equal(decode(meta, arrays, picked).view(np.uint64), expected.view(np.uint64))
+
+
+def random_runs(rng, count):
+    if count == 0:
+        return None
+    cuts = np.sort(rng.choice(np.arange(1, count), size=min(count - 1, int(rng.integers(0, 6))), replace=False))
+    return [0, *cuts.tolist()]
+
+
+def test_float_specials_round_trip():
+    specials = np.array([np.nan, 0.0, -0.0, np.inf, -np.inf, 5e-324, -1.7976931348623157e308,
+                         1.7976931348623157e308, 83.7, 83.7, np.nan, 0.1], dtype=np.float64)
+    round_trip(specials)
+    round_trip(specials, [0, 3, 7])
+    # A NaN with a payload other than the canonical one
+    odd = np.array([1.0, 2.0, 3.0]).view(np.uint64)
+    odd[1] = 0x7FF8000000000001
+    round_trip(odd.view(np.float64))
+    round_trip(np.array([-0.0, -0.0, 0.5, -0.0]))
+
+
+def test_integer_extremes_round_trip():
+    extremes = np.array([INT64.min, INT64.max, 0, -1, 1, INT64.max, INT64.min, INT64.min + 1, 0], dtype=np.int64)
+    round_trip(extremes)
+    round_trip(extremes, [0, 2, 5])
+    round_trip(np.arange(1760000000, 1760000000 + 6000, 60, dtype=np.int64))
+
+
+def test_random_columns_round_trip():
+    rng = np.random.default_rng(19)
+    for _ in range(200):
+        count = int(rng.integers(0, 300))
+        kind = rng.integers(0, 5)
+        if kind == 0:
+            values = rng.integers(INT64.min, INT64.max, size=count, dtype=np.int64, endpoint=True)
+        elif kind == 1:
+            values = 1760000000 + np.cumsum(rng.integers(0, 120, size=count)).astype(np.int64)
+        elif kind == 2:
+            values = np.round(rng.uniform(0, 100, size=count), int(rng.integers(0, 4)))
+        elif kind == 3:
+            values = rng.integers(0, 2**64, size=count, dtype=np.uint64).view(np.float64)
+        else:
+            values = np.repeat(rng.standard_normal(count // 8 + 1), 8)[:count]
+        if values.dtype == np.float64 and count:
+            values[rng.random(count) < 0.1] = np.nan
+            values[rng.random(count) < 0.05] = -0.0
+        round_trip(values, random_runs(rng, count))
+
+
+if __name__ == "__main__":
+    for test in (test_float_specials_round_trip, test_integer_extremes_round_trip, test_random_columns_round_trip):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for the NMEA GPS reader, using recorded sentences in a file and
+a pty as stand-ins for the GPS module
+
+Runs with pytest or on its own: python test_gps_reader.py
+"""
+
+import os
+import pty
+import time
+import shutil
+import tempfile
+from functools import reduce
+from operator import xor
+
+from gps_reader import GpsReader
+
+GOOD = ("0116.400", "S", "03649.200", "E")    # -1.273333, 36.820000
+BAD = ("0118.000", "S", "03651.000", "E")     # -1.300000, 36.850000
+
+
+def sentence(body):
+    """NMEA sentence with its checksum and line ending"""
+    return f"${body}*{reduce(xor, body.encode(), 0):02X}\r\n".encode()
+
+
+def gga(utc, position, hdop):
+    return sentence(f"GPGGA,{utc},{','.join(position)},1,08,{hdop},1650.0,M,0.0,M,,")
+
+
+def rmc(utc, position):
+    return sentence(f"GPRMC,{utc},A,{','.join(position)},0.0,0.0,171026,,,A")
+
+
+def read_file(*sentences):
+    """Reader after a recording of sentences has been read through"""
+    directory = tempfile.mkdtemp(prefix="ecoguard-gps-")
+    try:
+        path = os.path.join(directory, "nmea.log")
+        with open(path, "wb") as f:
+            f.write(b"".join(sentences))
+        reader = GpsReader(port=path, max_hdop=5.0)
+        reader.start()
+        assert reader.finished.wait(5)
+        return reader
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_rmc_of_rejected_gga_is_rejected():
+    reader = read_file(gga("120000.00", GOOD, 0.9), gga("120001.00", BAD, 9.9), rmc("120001.00", BAD))
+    assert reader.coordinates() == "-1.273333,36.820000"
+    assert reader.fix.hdop == 0.9
+    assert reader.rejected_fixes == 2
+
+
+def test_rmc_before_rejected_gga_is_withdrawn():
+    reader = read_file(gga("120000.00", GOOD, 0.9), rmc("120001.00", BAD), gga("120001.00", BAD, 9.9))
+    assert reader.coordinates() == "-1.273333,36.820000"
+
+
+def test_rmc_takes_hdop_of_its_gga_only():
+    reader = read_file(gga("120000.00", GOOD, 0.9), rmc("120000.00", GOOD))
+    assert reader.fix.hdop == 0.9 and reader.fix.satellites == 8
+    # An RMC of another fix has no HDOP to borrow
+    reader = read_file(gga("120000.00", GOOD, 0.9), rmc("120005.00", BAD))
+    assert reader.coordinates() == "-1.300000,36.850000"
+    assert reader.fix.hdop is None
+
+
+def test_pty():
+    master, slave = pty.openpty()
+    reader = GpsReader(port=os.ttyname(slave), max_hdop=5.0)
+    reader.start()
+    try:
+        os.write(master, gga("120000.00", GOOD, 0.9) + gga("120001.00", BAD, 9.9) + rmc("120001.00", BAD))
+        deadline = time.monotonic() + 5
+        while reader.sentences < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert reader.coordinates() == "-1.273333,36.820000"
+        assert reader.rejected_fixes == 2
+    finally:
+        reader.stop()
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    for test in (test_rmc_of_rejected_gga_is_rejected, test_rmc_before_rejected_gga_is_withdrawn,
+                 test_rmc_takes_hdop_of_its_gga_only, test_pty):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for the batched inference engine, with a fake int8 interpreter
+standing in for TensorFlow Lite
+
+Runs with pytest or on its own: python test_inference_engine.py
+"""
+
+import numpy as np
+
+import inference_engine
+from inference_engine import InferenceEngine, NumpyModel, TFLiteModel
+
+INPUT_SHAPE = (4, 3)
+INPUT_SCALE, INPUT_ZERO_POINT = 0.05, -10
+OUTPUT_SCALE, OUTPUT_ZERO_POINT = 1 / 256, -128
+
+
+def reference_model(batch_size):
+    return NumpyModel(INPUT_SHAPE, [1.0, -0.5, 0.25], -0.2, batch_size)
+
+
+class FakeInterpreter:
+    """Runs the NumPy model on dequantized int8 input and quantizes its output"""
+
+    def __init__(self, model_path, num_threads=1):
+        self.input = None
+        self.model = None
+
+    def get_input_details(self):
+        return [{"index": 0, "shape": np.array([1, *INPUT_SHAPE]), "dtype": np.int8,
+                 "quantization": (INPUT_SCALE, INPUT_ZERO_POINT)}]
+
+    def get_output_details(self):
+        return [{"index": 1, "quantization": (OUTPUT_SCALE, OUTPUT_ZERO_POINT)}]
+
+    def resize_tensor_input(self, index, shape):
+        self.model = reference_model(shape[0])
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        assert value.dtype == np.int8
+        self.input = value.copy()
+
+    def invoke(self):
+        scores = self.model.predict((self.input.astype(np.float32) - INPUT_ZERO_POINT) * INPUT_SCALE)
+        self.output = np.clip(np.round(scores / OUTPUT_SCALE + OUTPUT_ZERO_POINT), -128, 127).astype(np.int8)
+
+    def get_tensor(self, index):
+        return self.output.reshape(-1, 1)
+
+
+def quantized_model(batch_size=4):
+    original = inference_engine._load_interpreter_class
+    inference_engine._load_interpreter_class = lambda: FakeInterpreter
+    try:
+        return TFLiteModel("fake.tflite", batch_size)
+    finally:
+        inference_engine._load_interpreter_class = original
+
+
+def test_quantized_scores_match_float_model():
+    rng = np.random.default_rng(3)
+    batch = rng.uniform(-5, 5, size=(3, *INPUT_SHAPE)).astype(np.float32)
+    expected = reference_model(4).predict(batch.copy())
+    scores = quantized_model().predict(batch.copy())
+    np.testing.assert_allclose(scores, expected, atol=0.02)
+
+
+def test_loud_inputs_saturate_instead_of_wrapping():
+    """A window beyond the int8 range reaches the interpreter at the limit, not with its sign flipped"""
+    model = quantized_model()
+    loud = np.full((1, *INPUT_SHAPE), 100.0, dtype=np.float32)
+    quiet = np.full((1, *INPUT_SHAPE), -100.0, dtype=np.float32)
+    model.predict(loud)
+    assert (model.interpreter.input[0] == 127).all()
+    model.predict(quiet)
+    assert (model.interpreter.input[0] == -128).all()
+
+
+def test_engine_batches_in_submission_order():
+    model = reference_model(2)
+    engine = InferenceEngine(model)
+    windows = [np.full(INPUT_SHAPE, value, dtype=np.float32) for value in (1.0, 2.0, 3.0)]
+
+    assert engine.submit(windows[0], "a") == []
+    first = engine.submit(windows[1], "b")
+    assert [metadata for metadata, _ in first] == ["a", "b"]
+    assert engine.queued == 0
+    assert engine.submit(windows[2], "c") == []
+    rest = engine.run_batch()
+    assert [metadata for metadata, _ in rest] == ["c"]
+
+    singles = [engine.predict(window) for window in windows]
+    np.testing.assert_allclose([score for _, score in first + rest], singles, rtol=1e-6)
+    assert engine.stats()["batches"] == 2 and engine.stats()["windows"] == 3
+
+
+if __name__ == "__main__":
+    for test in (test_quantized_scores_match_float_model, test_loud_inputs_saturate_instead_of_wrapping,
+                 test_engine_batches_in_submission_order):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Test script for the batched InfluxDB writer, against a stub HTTP server on
+localhost that answers with scripted status codes
+
+Runs with pytest or on its own: python test_influx_writer.py
+"""
+
+import gzip
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from influx_writer import InfluxLineWriter, GZIP_MIN_BYTES
+
+
+class StubInflux:
+    """
+    Records the lines of each request and answers from a script
+
+    Each answer is a status, or a (status, headers) pair; once the script
+    runs out, every request gets 204. Requests of more than max_lines lines
+    get 413.
+    """
+
+    def __init__(self, answers=(), max_lines=None):
+        self.answers = list(answers)
+        self.max_lines = max_lines
+        self.requests = []
+        self.written = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                encoding = self.headers.get("Content-Encoding")
+                if encoding == "gzip":
+                    body = gzip.decompress(body)
+                lines = body.decode().split("\n")
+                stub.requests.append({"lines": lines, "encoding": encoding, "port": self.client_address[1]})
+
+                status, headers = 204, {}
+                if stub.max_lines is not None and len(lines) > stub.max_lines:
+                    status = 413
+                elif stub.answers:
+                    answer = stub.answers.pop(0)
+                    status, headers = answer if isinstance(answer, tuple) else (answer, {})
+                if status == 204:
+                    stub.written.extend(lines)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/v2/write?org=o&bucket=b&precision=s"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def points(count):
+    return [f"device_status,device_id=AG-{number:03d} battery_level=87.5,uptime={number}i 1760000000"
+            for number in range(count)]
+
+
+def test_gzip_and_connection_reuse():
+    stub = StubInflux()
+    writer = InfluxLineWriter(stub.url, "token", batch_size=50)
+    try:
+        lines = points(200)
+        assert writer.write(lines)
+        assert writer.post(points(1))
+        assert stub.written == lines + points(1)
+        assert [request["encoding"] for request in stub.requests] == ["gzip"] * 4 + [None]
+        assert len(stub.requests[-1]["lines"][0]) < GZIP_MIN_BYTES
+        # One connection for every request
+        assert len({request["port"] for request in stub.requests}) == 1
+    finally:
+        writer.close()
+        stub.close()
+
+
+def test_retries_429_and_5xx_honouring_retry_after():
+    stub = StubInflux([(429, {"Retry-After": "0.3"}), 503, 500])
+    writer = InfluxLineWriter(stub.url, "token", max_retries=3, retry_base=0.01)
+    try:
+        start = time.monotonic()
+        assert writer.post(points(10))
+        assert time.monotonic() - start >= 0.3
+        assert len(stub.requests) == 4
+        assert stub.written == points(10)
+    finally:
+        writer.close()
+        stub.close()
+
+
+def test_413_split_does_not_resend_written_half():
+    # 413 for the whole batch; the first half is written, the second fails every retry
+    stub = StubInflux([204, 500, 500], max_lines=50)
+    writer = InfluxLineWriter(stub.url, "token", batch_size=100, max_retries=1, retry_base=0.01)
+    try:
+        lines = points(100)
+        assert not writer.write(lines)
+        assert stub.written == lines[:50]
+
+        # Once InfluxDB is back, only the second half is sent
+        assert writer.flush()
+        assert stub.written == lines
+        assert writer.post_prefix(points(3)) == 3
+    finally:
+        writer.close()
+        stub.close()
+
+
+def test_single_line_413_is_dropped():
+    """A line too large on its own is dropped like a 400, so the batch after it still goes out"""
+    stub = StubInflux([413])
+    writer = InfluxLineWriter(stub.url, "token", max_retries=1, retry_base=0.01)
+    try:
+        assert writer.post_prefix(points(1)) == 1
+        assert writer.lines_dropped == 1
+        assert writer.post(points(2))
+        assert stub.written == points(2)
+    finally:
+        writer.close()
+        stub.close()
+
+
+def test_retry_after_is_capped():
+    stub = StubInflux([(503, {"Retry-After": "3600"})])
+    writer = InfluxLineWriter(stub.url, "token", max_retries=1, retry_max=0.2)
+    try:
+        start = time.monotonic()
+        assert writer.post(points(3))
+        assert time.monotonic() - start < 2
+        assert stub.written == points(3)
+    finally:
+        writer.close()
+        stub.close()
+
+
+def test_writes_do_not_wait_for_a_flush_in_progress():
+    stub = StubInflux([(503, {"Retry-After": "1"})])
+    writer = InfluxLineWriter(stub.url, "token", batch_size=10, max_retries=1)
+    try:
+        flushing = threading.Thread(target=writer.write, args=(points(10),))
+        flushing.start()
+        while not stub.requests:
+            time.sleep(0.01)
+
+        # The first flush is sleeping out the Retry-After; this write must not wait for it
+        start = time.monotonic()
+        assert writer.write(points(15)[10:])
+        assert time.monotonic() - start < 0.5
+        flushing.join()
+        assert writer.flush()
+        assert sorted(stub.written) == sorted(points(15))
+    finally:
+        writer.close()
+        stub.close()
+
+
+if __name__ == "__main__":
+    for test in (test_gzip_and_connection_reuse, test_retries_429_and_5xx_honouring_retry_after,
+                 test_413_split_does_not_resend_written_half, test_single_line_413_is_dropped,
+                 test_retry_after_is_capped, test_writes_do_not_wait_for_a_flush_in_progress):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test script for the ingest gateway
+
+Runs with pytest or on its own: python test_ingest_gateway.py
+"""
+
+import json
+import math
+import base64
+
+from lora_codec import encode_frames
+from event_dedup import DetectionDedup
+from event_fusion import DetectionFusion, METRES_PER_DEGREE
+from sms_dispatcher import AlertDispatcher
+from ingest_gateway import IngestGateway, SEMTECH_VERSION, PUSH_DATA, PUSH_ACK
+
+HEARTBEAT = {"battery_level": 87.5, "signal_strength": -71, "uptime": 3600, "time_safe": 1200,
+             "timestamp": 1760000000}
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, to, body):
+        self.messages.append(body)
+        return f"SM{len(self.messages)}"
+
+
+class ListSink:
+    name = "list"
+
+    def __init__(self):
+        self.lines = []
+
+    def write_batch(self, lines):
+        self.lines.extend(lines)
+        return True
+
+    def close(self):
+        pass
+
+
+def push_data(frames, token=b"\x12\x34"):
+    rxpk = [{"stat": 1, "data": base64.b64encode(frame).decode("ascii")} for frame in frames]
+    return bytes([SEMTECH_VERSION]) + token + bytes([PUSH_DATA]) + bytes(8) + json.dumps({"rxpk": rxpk}).encode()
+
+
+def test_truncated_frame_does_not_drop_the_datagram():
+    """A truncated rxpk frame is counted as invalid; the other frames are stored and the datagram is acked"""
+    sink = ListSink()
+    gateway = IngestGateway([sink], clock=lambda: HEARTBEAT["timestamp"] + 60)
+    good = encode_frames("AG-001", [HEARTBEAT])[0]
+    bad = encode_frames("AG-002", [HEARTBEAT])[0][:-1]
+
+    gateway.start()
+    ack = gateway.handle_datagram(push_data([bad, good]))
+    gateway.stop()
+
+    assert ack == bytes([SEMTECH_VERSION]) + b"\x12\x34" + bytes([PUSH_ACK])
+    stats = gateway.stats()
+    assert stats["lora_frames"] == 2
+    assert stats["lora_frames_invalid"] == 1
+    assert stats["accepted"]["lora"] == 2
+    assert len(sink.lines) == 2 and all("device_id=AG-001" in line for line in sink.lines)
+
+
+def test_push_data_that_is_not_an_object_is_a_bad_frame():
+    sink = ListSink()
+    gateway = IngestGateway([sink])
+    datagram = bytes([SEMTECH_VERSION]) + b"\x00\x01" + bytes([PUSH_DATA]) + bytes(8) + b"[1, 2]"
+
+    assert gateway.handle_datagram(datagram) is None
+    assert gateway.stats()["lora_frames_invalid"] == 1
+
+
+def test_one_alert_per_fused_chainsaw():
+    """Three nodes send their onsets over LoRa; the rangers get one SMS at the located chainsaw"""
+    source_lat, source_lng = -1.2400, 36.8500
+    start = HEARTBEAT["timestamp"]
+    sink = ListSink()
+    transport = RecordingTransport()
+    gateway = IngestGateway([sink], clock=lambda: start + 60, fusion=DetectionFusion(window=30.0),
+                            alerts=AlertDispatcher(transport, cooldown=0))
+
+    gateway.start()
+    for number, (north, east) in enumerate([(300.0, 0.0), (-200.0, 250.0), (-150.0, -320.0)], 1):
+        distance = math.hypot(north, east)
+        detection = {
+            "event": "started", "is_chainsaw": True, "confidence": 0.9, "timestamp": start + 2,
+            "gps_coordinates": f"{source_lat + north / METRES_PER_DEGREE:.6f},"
+                               f"{source_lng + east / (METRES_PER_DEGREE * math.cos(math.radians(source_lat))):.6f}",
+            "arrival_time": start + 0.25 + distance / 343.0,
+            "sound_level": -20 * math.log10(distance),
+        }
+        gateway.ingest_frame(encode_frames(f"AG-00{number}", [detection])[0])
+    gateway.stop()
+
+    detections = [line for line in sink.lines if line.startswith("acoustic_guardian")]
+    assert len(detections) == 3 and all("arrival_time=" in line and "sound_level=" in line for line in detections)
+    fused = [line for line in sink.lines if line.startswith("fused_detection")]
+    assert len(fused) == 1 and 'method="multilateration"' in fused[0]
+    assert len(transport.messages) == 1 and "3 nodes (AG-001,AG-002,AG-003)" in transport.messages[0]
+    lat, lng = (float(part) for part in transport.messages[0].split(" at ")[1].split(" ")[0].split(","))
+    assert abs(lat - source_lat) * METRES_PER_DEGREE < 20 and abs(lng - source_lng) * METRES_PER_DEGREE < 20
+    assert gateway.stats()["alerts"]["sent"] == 1
+
+
+def test_one_alert_per_deduplicated_chainsaw_without_fusion():
+    """Without fusion, the detection dedup stores is the only one alerted on"""
+    start = HEARTBEAT["timestamp"]
+    sink = ListSink()
+    transport = RecordingTransport()
+    gateway = IngestGateway([sink], clock=lambda: start + 60, dedup=DetectionDedup(clock=lambda: start + 60),
+                            alerts=AlertDispatcher(transport, cooldown=0))
+
+    gateway.start()
+    body = "\n".join(
+        f'acoustic_guardian,device_id=AG-00{number} gps_coordinates="-1.24{number},36.85{number}",'
+        f'threat_type="chainsaw",confidence=0.9,threat_detected=true {start + number}'
+        for number in range(1, 6)
+    )
+    gateway.ingest_lines(body)
+    gateway.stop()
+
+    assert len(sink.lines) == 1 and "device_id=AG-001" in sink.lines[0]
+    assert gateway.stats()["deduplicated"] == 4
+    assert len(transport.messages) == 1 and "AG-001" in transport.messages[0]
+
+
+if __name__ == "__main__":
+    for test in (test_truncated_frame_does_not_drop_the_datagram,
+                 test_push_data_that_is_not_an_object_is_a_bad_frame, test_one_alert_per_fused_chainsaw,
+                 test_one_alert_per_deduplicated_chainsaw_without_fusion):
+        test()
+        print(f"PASS: {test.__name__}")
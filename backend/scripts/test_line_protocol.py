@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script for the line protocol serializer and parsers
+
+Runs with pytest or on its own: python test_line_protocol.py
+"""
+
+from line_protocol import format_line, parse_line, parse_lines, parse_value
+
+# Inside a quoted string only \" and \\ are escapes
+LINE = r'm,t=a\,b s="x\,y\=z\ w \"q\" \\ end",n=1i 5'
+STRING = 'x\\,y\\=z\\ w "q" \\ end'
+
+
+def test_string_fields_keep_other_backslashes():
+    assert parse_line(LINE) == ("m", {"t": "a,b"}, {"s": STRING, "n": 1}, 5)
+    columns = parse_lines(LINE + "\n" + LINE)["m"]
+    assert columns.fields["s"].tolist() == [STRING, STRING]
+    assert columns.tags["t"].tolist() == ["a,b", "a,b"]
+    assert parse_value(r'"a\,b"') == "a\\,b"
+
+
+def test_string_fields_round_trip():
+    for value in ("a\\,b", "c:\\ new", 'say "hi"', "trailing \\", "-1.2,36.8"):
+        line = format_line("m", {"forest": "Karura Forest"}, {"s": value}, 1)
+        assert parse_line(line)[2]["s"] == value
+        assert parse_lines(line)["m"].fields["s"][0] == value
+
+
+PARITY_LINES = [
+    "foo=bar x=1 2",
+    "m=1,device_id=x f=1 1",
+    r"a\ b=c,t\=k=v\,w f=2.5,g=true 3",
+    r'm,t=v s="a=b,c" 4',
+    "m=x,t=1 f=1i,s=\"q\" 5",
+]
+
+
+def rows(batch):
+    """(measurement, tags, fields, time) per row of parse_lines output"""
+    result = []
+    for measurement, columns in batch.items():
+        for row in range(len(columns)):
+            tags = {name: values[row] for name, values in columns.tags.items() if values[row] is not None}
+            fields = {name: values[row].item() if hasattr(values[row], "item") else values[row]
+                      for name, values in columns.fields.items()}
+            result.append((measurement, tags, fields, int(columns.time[row])))
+    return result
+
+
+def test_batch_parser_agrees_with_parse_line():
+    """An equals sign in a measurement is literal to both parsers"""
+    for line in PARITY_LINES:
+        assert rows(parse_lines(line)) == [parse_line(line)], line
+    batch = parse_lines("m f=1 1\nm=x f=1 1")
+    assert sorted(batch) == ["m", "m=x"]
+    assert sorted(rows(parse_lines("\n".join(PARITY_LINES))), key=repr) == \
+        sorted((parse_line(line) for line in PARITY_LINES), key=repr)
+
+
+if __name__ == "__main__":
+    for test in (test_string_fields_keep_other_backslashes, test_string_fields_round_trip,
+                 test_batch_parser_agrees_with_parse_line):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for the LoRa payload codec
+
+Runs with pytest or on its own: python test_lora_codec.py
+"""
+
+import struct
+
+from lora_codec import encode_frames, decode_frame
+
+HEARTBEAT = {"battery_level": 87.5, "signal_strength": -71, "uptime": 3600, "time_safe": 1200,
+             "timestamp": 1760000000}
+
+
+def test_device_ids_survive_the_gateway():
+    """Nodes whose IDs share trailing digits stay apart, whatever the gateway's own ID"""
+    for device_id in ("AG-001", "AG-HB-001", "KF-NORTH-0001", "7"):
+        frames = encode_frames(device_id, [HEARTBEAT])
+        assert [record["device_id"] for record in decode_frame(frames[0])] == [device_id]
+
+
+def test_frames_are_not_taken_for_semtech_packets():
+    """The gateway hands a datagram to the codec only if its first byte is not the forwarder's version"""
+    from ingest_gateway import SEMTECH_VERSION
+
+    assert encode_frames("AG-001", [HEARTBEAT])[0][0] != SEMTECH_VERSION
+
+
+def test_version_1_frame_is_rejected():
+    frame = struct.pack(">BHIB", 1, 1, 1760000000, 0)
+    try:
+        decode_frame(frame)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a version 1 frame has no device ID to store points under")
+
+
+def test_truncated_header_is_rejected():
+    frame = encode_frames("AG-HB-001", [HEARTBEAT])[0]
+    for length in (1, 5, 12):
+        try:
+            decode_frame(frame[:length])
+        except ValueError:
+            continue
+        raise AssertionError(f"a {length}-byte frame decoded")
+
+
+def test_truncated_records_are_rejected():
+    """A frame cut off inside its records raises ValueError, never struct.error"""
+    later = dict(HEARTBEAT, timestamp=HEARTBEAT["timestamp"] + 60)
+    frame = encode_frames("AG-HB-001", [HEARTBEAT, later])[0]
+    header = 2 + len("AG-HB-001") + 5
+    for length in range(header + 1, len(frame)):
+        try:
+            decode_frame(frame[:length])
+        except ValueError:
+            continue
+        raise AssertionError(f"a frame cut to {length} of {len(frame)} bytes decoded")
+
+
+def test_detection_onset_round_trips():
+    """An event start's onset survives to millisecond and 0.01 dB precision; a record without one has none"""
+    started = {"event": "started", "is_chainsaw": True, "confidence": 0.93, "timestamp": 1760000002.4,
+               "gps_coordinates": "-1.240000,36.850000", "arrival_time": 1759999999.8764, "sound_level": -31.237}
+    ended = {"event": "ended", "is_chainsaw": False, "confidence": 0.97, "timestamp": 1760000300,
+             "duration": 298, "positive_windows": 40}
+    first, second = decode_frame(encode_frames("AG-001", [started, ended])[0])
+    assert first["timestamp"] == 1760000002 and first["event"] == "started"
+    assert abs(first["arrival_time"] - started["arrival_time"]) <= 0.0005
+    assert abs(first["sound_level"] - started["sound_level"]) <= 0.005
+    assert "arrival_time" not in second and "sound_level" not in second
+
+
+def test_version_3_frame_is_rejected():
+    """Version 3 detection bodies had no onset; their length no longer matches"""
+    frame = bytearray(encode_frames("AG-001", [HEARTBEAT])[0])
+    frame[0] = 3
+    try:
+        decode_frame(bytes(frame))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a version 3 frame decoded")
+
+
+if __name__ == "__main__":
+    for test in (test_device_ids_survive_the_gateway, test_frames_are_not_taken_for_semtech_packets,
+                 test_version_1_frame_is_rejected, test_detection_onset_round_trips, test_version_3_frame_is_rejected,
+                 test_truncated_header_is_rejected, test_truncated_records_are_rejected):
+        test()
+        print(f"PASS: {test.__name__}")
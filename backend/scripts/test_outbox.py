@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script for the store-and-forward outbox
+
+Runs with pytest or on its own: python test_outbox.py
+"""
+
+import shutil
+import tempfile
+
+from outbox import Outbox, OutboxSender, PRIORITY_HEARTBEAT, PRIORITY_DETECTION
+
+
+def heartbeat(number):
+    return {"device_id": "AG-001", "battery_level": 87.5, "n": number}
+
+
+def detection(number):
+    return {"device_id": "AG-001", "is_chainsaw": True, "confidence": 0.9, "n": number}
+
+
+def test_eviction_spares_records_in_flight():
+    """
+    Heartbeats appended while a batch is being sent must not evict records of
+    that batch, or the ack after it removes detections that were never sent
+    """
+    directory = tempfile.mkdtemp(prefix="ecoguard-outbox-")
+    try:
+        outbox = Outbox(directory, max_bytes=3500)
+        for number in range(40):
+            if number % 2:
+                outbox.append(detection(number), PRIORITY_DETECTION)
+            else:
+                outbox.append(heartbeat(number), PRIORITY_HEARTBEAT)
+
+        queued = [record["n"] for record in outbox.peek(1000) if "is_chainsaw" in record]
+
+        # The sender takes a batch; the executors keep appending heartbeats while it sends
+        sent = outbox.peek(10)
+        evicted = outbox.evicted
+        for number in range(40, 60):
+            outbox.append(heartbeat(number), PRIORITY_HEARTBEAT)
+        outbox.ack(len(sent))
+        assert outbox.evicted > evicted
+
+        # Heartbeats were there to evict, so every queued detection was sent or is still queued
+        delivered = [record["n"] for record in sent + outbox.peek(1000)]
+        lost = [number for number in queued if number not in delivered]
+        assert not lost, f"detections {lost} were acknowledged without being sent"
+        outbox.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_ack_survives_reopen():
+    directory = tempfile.mkdtemp(prefix="ecoguard-outbox-")
+    try:
+        outbox = Outbox(directory)
+        for number in range(5):
+            outbox.append(heartbeat(number))
+        outbox.ack(len(outbox.peek(3)))
+        outbox.close()
+
+        outbox = Outbox(directory)
+        assert [record["n"] for record in outbox.peek(10)] == [3, 4]
+        outbox.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_sender_acks_the_delivered_prefix():
+    """A link that delivered only the first records of a batch does not get them again"""
+    directory = tempfile.mkdtemp(prefix="ecoguard-outbox-")
+    try:
+        outbox = Outbox(directory)
+        for number in range(5):
+            outbox.append(heartbeat(number))
+        batches = []
+
+        def send_batch(batch):
+            batches.append([record["n"] for record in batch])
+            return 3 if len(batches) == 1 else True
+
+        sender = OutboxSender(outbox, send_batch, batch_size=5, retry_base=0.0, retry_max=0.0)
+        assert sender.drain(now=0.0) == 3 and sender.failures == 1
+        assert sender.drain(now=1.0) == 2
+        assert batches == [[0, 1, 2, 3, 4], [3, 4]]
+        outbox.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for test in (test_eviction_spares_records_in_flight, test_ack_survives_reopen,
+                 test_sender_acks_the_delivered_prefix):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test script for the SMS alert dispatcher: coalescing with a transport that
+records messages, and cooldown, retries and the queue bound against
+fake_twilio_server.py
+
+Runs with pytest or on its own: python test_sms_dispatcher.py
+"""
+
+import time
+
+from sms_dispatcher import AlertDispatcher, TwilioTransport
+from fake_twilio_server import FakeTwilioServer
+
+START = "ALERT! Chainsaw detected by AG-001 at 12:00:00"
+SECOND_START = "ALERT! Chainsaw detected by AG-001 at 12:01:00"
+ENDED = "Chainsaw activity near AG-001 ended at 12:05:00 after 5 min"
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, to, body):
+        self.messages.append(body)
+        return f"SM{len(self.messages)}"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for(condition, timeout=5.0):
+    """Poll until the worker thread has got somewhere"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the dispatcher"
+        time.sleep(0.02)
+
+
+def coalesced(*alerts):
+    """The one message sent for alerts of a key all waiting at once"""
+    transport = RecordingTransport()
+    dispatcher = AlertDispatcher(transport, recipient="+254700000000")
+    for body, urgent in alerts:
+        assert dispatcher.submit("AG-001", body, urgent=urgent)
+    # Stopped before it started, the worker drains the queue and sends once
+    dispatcher._stop_event.set()
+    dispatcher._run()
+    assert len(transport.messages) == 1
+    return transport.messages[0]
+
+
+def test_ended_summary_does_not_replace_start_alert():
+    message = coalesced((START, True), (ENDED, False))
+    assert message.startswith(START) and "+1 more alerts" in message
+
+
+def test_first_start_alert_is_kept():
+    message = coalesced((START, True), (SECOND_START, True), (ENDED, False))
+    assert message.startswith(START) and "+2 more alerts" in message
+
+
+def test_start_alert_displaces_pending_summary():
+    message = coalesced((ENDED, False), (START, True), (ENDED, False))
+    assert message.startswith(START) and "+2 more alerts" in message
+
+
+def test_retry_after_and_cooldown_against_fake_twilio():
+    """A 503 is retried after Retry-After, and alerts inside the cooldown wait for one follow-up"""
+    server = FakeTwilioServer(fail_first=1, retry_after=30).start()
+    clock = FakeClock()
+    transport = TwilioTransport(account_sid="AC123", auth_token="token", from_number="+15005550006",
+                                api_url=server.url)
+    dispatcher = AlertDispatcher(transport, recipient="+254700000000", cooldown=300, clock=clock)
+    dispatcher.start()
+    try:
+        assert dispatcher.submit("AG-001", START)
+        wait_for(lambda: dispatcher.retries == 1)
+        assert server.messages == []
+
+        # Not before the Retry-After the server asked for
+        clock.now = 10.0
+        time.sleep(1.5)
+        assert server.requests == 1 and dispatcher.sent == 0
+
+        clock.now = 31.0
+        wait_for(lambda: dispatcher.sent == 1)
+        assert [message["body"] for message in server.messages] == [START]
+        assert dispatcher.retries == 1
+
+        # Inside the cooldown: held and coalesced, not sent
+        clock.now = 60.0
+        assert dispatcher.submit("AG-001", SECOND_START)
+        assert dispatcher.submit("AG-001", ENDED, urgent=False)
+        wait_for(lambda: dispatcher.coalesced == 1)
+        time.sleep(1.5)
+        assert len(server.messages) == 1
+    finally:
+        dispatcher.stop()
+        server.stop()
+
+    assert len(server.messages) == 2
+    assert server.messages[1]["body"].startswith(SECOND_START) and "+1 more alerts" in server.messages[1]["body"]
+    assert dispatcher.stats()["sent"] == 2 and dispatcher.stats()["failed"] == 0
+
+
+def test_full_queue_drops_alerts():
+    transport = RecordingTransport()
+    dispatcher = AlertDispatcher(transport, recipient="+254700000000", max_queue=2)
+    assert dispatcher.submit("AG-001", START)
+    assert dispatcher.submit("AG-002", START)
+    assert not dispatcher.submit("AG-003", START)
+    assert dispatcher.stats()["dropped"] == 1 and dispatcher.queued == 2
+
+
+if __name__ == "__main__":
+    for test in (test_ended_summary_does_not_replace_start_alert, test_first_start_alert_is_kept,
+                 test_start_alert_displaces_pending_summary, test_retry_after_and_cooldown_against_fake_twilio,
+                 test_full_queue_drops_alerts):
+        test()
+        print(f"PASS: {test.__name__}")
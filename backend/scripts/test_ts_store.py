@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test script for the local time-series store
+
+Runs with pytest or on its own: python test_ts_store.py
+"""
+
+import shutil
+import tempfile
+
+from ts_store import TimeSeriesStore
+from flux_query import execute
+
+DAY = 1759968000
+DETECTION = ('acoustic_guardian,device_id=AG-001,location=Karura\\ Forest gps_coordinates="-1.2,36.8",'
+             'threat_type="chainsaw",confidence=0.9,threat_detected=true,time_safe=0i 1760000000')
+HEARTBEAT = "device_status,device_id=AG-001 battery_level=80.0,signal_strength=-70i,uptime=5i 1760000000"
+
+
+def test_resent_point_counts_once_in_rollups():
+    """A point delivered again, in the same batch, the head or a segment, is one detection"""
+    directory = tempfile.mkdtemp(prefix="ecoguard-store-")
+    try:
+        store = TimeSeriesStore(directory, retention={})
+        store.write_lines(DETECTION)
+        store.write_lines("\n".join([DETECTION, DETECTION, HEARTBEAT, HEARTBEAT]))
+        assert len(store.scan("acoustic_guardian")) == 1
+        store.flush()
+        assert len(store.scan("acoustic_guardian")) == 1
+        store.write_lines("\n".join([DETECTION, HEARTBEAT]))
+        assert len(store.scan("acoustic_guardian")) == 1
+        assert len(store.scan("device_status")) == 1
+        store.close()
+
+        store = TimeSeriesStore(directory, retention={})
+        store.write_lines(DETECTION)
+        assert len(store.scan("acoustic_guardian")) == 1
+        fleet = store.rollup(DAY, DAY + 86400, 86400, "fleet")
+        assert fleet["detections"].tolist() == [1]
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_raw_rows_keep_one_point_per_device_and_time():
+    """Two lines of one device and timestamp in a batch are one raw row in every read path"""
+    directory = tempfile.mkdtemp(prefix="ecoguard-store-")
+    resent = DETECTION.replace("confidence=0.9", "confidence=0.8")
+    query = ('from(bucket: "ecoguard") |> range(start: 2025-10-01T00:00:00Z, stop: 2025-10-31T00:00:00Z) '
+             '|> filter(fn: (r) => r._measurement == "acoustic_guardian" and r._field == "confidence") |> count()')
+    try:
+        store = TimeSeriesStore(directory, retention={})
+        store.write_lines(DETECTION + "\n" + resent)
+        assert store.scan("acoustic_guardian").columns["confidence"].tolist() == [0.8]
+        store.close()
+
+        store = TimeSeriesStore(directory, retention={})
+        store.compact()
+        assert store.scan("acoustic_guardian").columns["confidence"].tolist() == [0.8]
+        assert execute(store, query)["confidence"].tolist() == [1]
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_failed_flush_does_not_count_written_rollups_twice():
+    """A partition that fails to write is kept in memory; the ones already written are not"""
+    directory = tempfile.mkdtemp(prefix="ecoguard-store-")
+    try:
+        store = TimeSeriesStore(directory, retention={})
+        store.write_lines("\n".join(DETECTION.replace("1760000000", str(1760000000 + 60 * n)) for n in range(5)))
+
+        write_segment = store._write_segment
+        failures = []
+
+        def fail_rollup_1d_once(measurement, partition, block):
+            if measurement == "rollup_1d" and not failures:
+                failures.append(partition)
+                raise OSError("disk full")
+            return write_segment(measurement, partition, block)
+
+        store._write_segment = fail_rollup_1d_once
+        try:
+            store.flush()
+        except OSError:
+            pass
+        assert failures
+        store.flush()
+
+        assert len(store.scan("acoustic_guardian")) == 5
+        for step in (60, 3600, 86400):
+            assert store.rollup(DAY, DAY + 86400, step, "fleet")["detections"].sum() == 5, step
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for test in (test_resent_point_counts_once_in_rollups, test_raw_rows_keep_one_point_per_device_and_time,
+                 test_failed_flush_does_not_count_written_rollups_twice):
+        test()
+        print(f"PASS: {test.__name__}")
@@ -0,0 +1,1842 @@
+#!/usr/bin/env python3
+"""
+EcoGuard - Embedded Time-Series Store
+
+Local stand-in for InfluxDB holding the acoustic_guardian, device_status
+and fused_detection measurements, so the dashboards have a real store to
+query on rigs that cannot run InfluxDB. The ingest gateway writes into it (see StoreSink).
+
+Layout on disk:
+
+    STORE_DIR/<measurement>/<partition>/segment-<seq>.col
+
+A partition covers STORE_PARTITION_SECONDS of time. A segment file holds
+points of one partition as columns, sorted by device and then time, so
+each device's points form one contiguous chunk of rows; a table in the
+header gives each device's rows and time range. The file is a JSON header
+followed by the NumPy arrays, which are memory-mapped when read. Strings
+are dictionary-encoded. With STORE_COMPRESSION, times, numbers and
+dictionary codes are stored as delta-of-delta or XOR streams (see
+gorilla_codec), with each device's chunk decodable on its own, and
+booleans as packed bits.
+
+New points go to an in-memory head block. The head is written out, one
+segment per partition, when it holds STORE_HEAD_POINTS points or its
+oldest point is STORE_FLUSH_INTERVAL old. Compaction merges the segments
+of each partition into one every STORE_COMPACT_INTERVAL. As in InfluxDB, a
+point with the same device and timestamp as an earlier one replaces it
+once the two are compacted.
+
+Every write also adds to rollups at 1 minute, 1 hour and 1 day: detection
+counts, the top detection confidence, and the lowest and mean battery
+level, per device, per forest (the location a device last reported) and
+for the fleet. They are kept as the measurements rollup_1m, rollup_1h and
+rollup_1d. Each write adds partial rows for its buckets, and compaction and
+queries combine them, so charts over long ranges read rollup rows instead
+of raw points (see rollup()).
+
+Raw points do not stay in segments for ever. Once a partition is older
+than its measurement's retention (RETENTION_DAYS), archive() moves it to a
+zstd-compressed Parquet file, sorted by device and time like a segment:
+
+    STORE_DIR/archive/<measurement>/<partition>/archive-<seq>.parquet
+
+Queries read archived partitions as they read segments, so a range that
+spans both tiers comes back as one block. Rollups are never archived.
+
+Each segment and archive header also lists the file's series: the devices
+with their tag values, such as each (device, location) of
+acoustic_guardian. On opening, the store loads them into a tag index
+(tag_index.py) that maps each device, tag value and forest to its series.
+A query by tag, such as every detection in Karura Forest, looks up the
+matching devices there and reads only their chunks.
+
+A query only opens the segments of partitions in its time range. Without
+a device filter it masks whole columns by time; with one it binary-searches
+each device's chunk for the range. Only the columns asked for are read.
+Rows come back partition by partition, by device and then time within a
+partition, so every device's points are in time order without a sort.
+
+Points in the head block are only in memory. After a crash they are still
+in the gateway's line protocol files, and `import` loads those.
+
+Usage:
+    python ts_store.py import gateway_data/points-*.lp
+    python ts_store.py query device_status --device AG-HB-001 --start -1h
+    python ts_store.py query acoustic_guardian --location "Karura Forest" --start -1h
+    python ts_store.py rollup --by forest --start 2025-01-01 --step 1d
+    python ts_store.py compact
+    python ts_store.py archive
+"""
+
+import os
+import json
+import time
+import struct
+import logging
+import argparse
+import calendar
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+import numpy as np
+
+from rpi_config import (
+    STORE_DIR,
+    STORE_PARTITION_SECONDS,
+    STORE_HEAD_POINTS,
+    STORE_FLUSH_INTERVAL,
+    STORE_COMPACT_INTERVAL,
+    STORE_COMPRESSION,
+    STORE_DETECTION_HOT_DAYS,
+    STORE_STATUS_HOT_DAYS,
+)
+from line_protocol import MeasurementColumns, parse_lines
+from tag_index import FOREST_TAG, TagIndex
+import gorilla_codec
+
+logger = logging.getLogger("AcousticGuardian")
+
+# Measurement -> tag columns besides device_id, and field columns with their
+# NumPy types ("str" for strings). Other measurements, tags and fields are
+# not stored.
+MEASUREMENTS = {
+    "acoustic_guardian": {
+        "tags": ("location",),
+        "fields": {
+            "gps_coordinates": "str",
+            "threat_type": "str",
+            "confidence": "float64",
+            "threat_detected": "bool",
+            "time_safe": "int64",
+            "arrival_time": "float64",
+            "sound_level": "float64",
+        },
+    },
+    "fused_detection": {
+        "tags": ("location",),
+        "fields": {
+            "gps_coordinates": "str",
+            "threat_type": "str",
+            "confidence": "float64",
+            "nodes": "int64",
+            "devices": "str",
+            "error_m": "float64",
+            "method": "str",
+        },
+    },
+    "device_status": {
+        "tags": (),
+        "fields": {
+            "battery_level": "float64",
+            "signal_strength": "int64",
+            "uptime": "int64",
+        },
+    },
+}
+
+# Rollup measurement -> (bucket seconds, partition seconds), finest first
+ROLLUPS = {
+    "rollup_1m": (60, 86400),
+    "rollup_1h": (3600, 30 * 86400),
+    "rollup_1d": (86400, 360 * 86400),
+}
+
+# Rollup fields, with how two partial rows of one bucket combine
+ROLLUP_FIELDS = {
+    "detections": ("int64", np.add),
+    "max_confidence": ("float64", np.fmax),
+    "min_battery": ("float64", np.fmin),
+    "battery_sum": ("float64", np.add),
+    "battery_count": ("int64", np.add),
+}
+
+# Measurements whose points are counted in the rollups
+ROLLUP_SOURCES = ("acoustic_guardian", "device_status")
+
+# Device ID of rollup rows for a whole forest (forest set) or the fleet (no forest)
+ALL_DEVICES = "*"
+
+# Shortest rollup bucket kept per device. A device's minute buckets hold a
+# heartbeat or two, so they are worked out from its points when asked for.
+DEVICE_ROLLUP_SECONDS = 3600
+
+MEASUREMENTS.update({
+    name: {"tags": ("forest",), "fields": {field: kind for field, (kind, _) in ROLLUP_FIELDS.items()}}
+    for name in ROLLUPS
+})
+
+# Raw measurement -> days its points stay in segments before they move to
+# the Parquet archive; 0 keeps them in segments
+RETENTION_DAYS = {
+    "acoustic_guardian": STORE_DETECTION_HOT_DAYS,
+    "fused_detection": STORE_DETECTION_HOT_DAYS,
+    "device_status": STORE_STATUS_HOT_DAYS,
+}
+
+# Measurement -> tags besides device_id kept in the tag index; rollups are not indexed
+SERIES_TAGS = {name: spec["tags"] for name, spec in MEASUREMENTS.items() if name not in ROLLUPS}
+
+# Value in the rows a column is missing from
+FILL_VALUES = {"float64": np.nan, "int64": 0, "bool": False, "str": None}
+
+SEGMENT_MAGIC = b"EGSEGMT1"
+_PREAMBLE = struct.Struct("<8sQ")
+PARTITION_FORMAT = "%Y%m%dT%H%M%SZ"
+STORE_FILE = "store.json"
+ARCHIVE_DIR = "archive"
+
+# Rows per Parquet row group in archive files, rounded up to whole devices.
+# One device's rows are read by row group, so smaller groups read less for
+# device queries; each group also adds metadata to the file.
+ARCHIVE_ROW_GROUP_ROWS = 8192
+
+# Segment files kept memory-mapped between queries; each mapping holds a file descriptor
+MAX_OPEN_SEGMENTS = 256
+
+
+def column_types(measurement):
+    """
+    Stored columns of a measurement
+
+    Args:
+        measurement (str): Measurement name
+
+    Returns:
+        dict: Column name -> NumPy type, tags first
+    """
+    try:
+        spec = MEASUREMENTS[measurement]
+    except KeyError:
+        raise ValueError(f"{measurement} is not kept in the store")
+    types = {name: "str" for name in spec["tags"]}
+    types.update(spec["fields"])
+    return types
+
+
+def _empty(kind, count):
+    if kind == "str":
+        return np.full(count, None, dtype=object)
+    return np.full(count, FILL_VALUES[kind], dtype=kind)
+
+
+def _align(offset):
+    return -(-offset // 8) * 8
+
+
+class Block:
+    """
+    Rows of one measurement as columns
+
+    Attributes:
+        time (np.ndarray): int64 timestamps in seconds
+        device_id (np.ndarray): Object array of device IDs
+        columns (dict): Column name -> array. Missing floats are NaN and
+            missing strings are None.
+        valid (dict): Column name -> bool mask, only for columns that are
+            missing from some rows
+    """
+
+    def __init__(self, time, device_id, columns, valid=None):
+        self.time = time
+        self.device_id = device_id
+        self.columns = columns
+        self.valid = valid or {}
+
+    def __len__(self):
+        return len(self.time)
+
+    @classmethod
+    def empty(cls, types):
+        """A block with no rows and the given columns"""
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=object),
+                   {name: _empty(kind, 0) for name, kind in types.items()})
+
+    @classmethod
+    def concat(cls, blocks, types):
+        """
+        Stack blocks that have the same columns
+
+        Args:
+            blocks (list): Blocks to stack, in order
+            types (dict): Column types, for the result when blocks is empty
+
+        Returns:
+            Block: All rows
+        """
+        if not blocks:
+            return cls.empty(types)
+        if len(blocks) == 1:
+            return blocks[0]
+        valid = {}
+        for name in {name for block in blocks for name in block.valid}:
+            valid[name] = np.concatenate([
+                block.valid[name] if name in block.valid else np.ones(len(block), dtype=bool)
+                for block in blocks
+            ])
+        return cls(
+            np.concatenate([block.time for block in blocks]),
+            np.concatenate([block.device_id for block in blocks]),
+            {name: np.concatenate([block.columns[name] for block in blocks]) for name in blocks[0].columns},
+            valid,
+        )
+
+    def take(self, index):
+        """Rows picked by a slice, an index array or a boolean mask"""
+        return Block(
+            self.time[index],
+            self.device_id[index],
+            {name: values[index] for name, values in self.columns.items()},
+            {name: mask[index] for name, mask in self.valid.items()},
+        )
+
+    def select(self, names):
+        """The same rows with only the named columns"""
+        return Block(
+            self.time,
+            self.device_id,
+            {name: self.columns[name] for name in names},
+            {name: self.valid[name] for name in names if name in self.valid},
+        )
+
+    def sorted_by_device(self):
+        """The rows ordered by device and then time, keeping write order for equal times"""
+        _, codes = np.unique(self.device_id, return_inverse=True)
+        return self.take(np.lexsort((self.time, codes)))
+
+    def to_dataframe(self):
+        """
+        Rows as a pandas DataFrame with a UTC "time" column
+
+        Integer and boolean columns with missing values use pandas' nullable
+        types.
+
+        Returns:
+            pd.DataFrame: One row per point
+        """
+        import pandas as pd
+
+        data = {"time": pd.to_datetime(self.time, unit="s", utc=True), "device_id": self.device_id}
+        for name, values in self.columns.items():
+            valid = self.valid.get(name)
+            if valid is not None and values.dtype.kind == "i":
+                values = pd.arrays.IntegerArray(values, ~valid)
+            elif valid is not None and values.dtype.kind == "b":
+                values = pd.arrays.BooleanArray(values, ~valid)
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+def _cast(values, kind, valid):
+    """A parsed column as the stored type, with fill values where rows are not valid"""
+    if kind == "str":
+        if values.dtype != object:
+            values = values.astype(str).astype(object)
+        if valid is not None:
+            values = values.copy()
+            values[~valid] = None
+        return values
+    if values.dtype != kind:
+        values = values.astype(kind)
+    if valid is not None:
+        values = np.where(valid, values, FILL_VALUES[kind])
+    return values
+
+
+def _to_block(measurement, columns):
+    """
+    Block from line_protocol.MeasurementColumns
+
+    Returns:
+        Block: Rows that have a device_id, or None if none has
+    """
+    devices = columns.tags.get("device_id")
+    if devices is None:
+        return None
+    count = len(columns)
+    data = {}
+    valid = {}
+    for name, kind in column_types(measurement).items():
+        if name in columns.tags:
+            values = columns.tags[name]
+            mask = np.not_equal(values, None)
+        elif name in columns.fields:
+            values = columns.fields[name]
+            mask = columns.present.get(name)
+        else:
+            data[name] = _empty(kind, count)
+            valid[name] = np.zeros(count, dtype=bool)
+            continue
+        if mask is not None and mask.all():
+            mask = None
+        try:
+            data[name] = _cast(values, kind, mask)
+        except (TypeError, ValueError):
+            raise ValueError(f"{measurement}.{name} cannot be stored as {kind}")
+        if mask is not None:
+            valid[name] = mask
+
+    block = Block(columns.time.astype(np.int64), devices, data, valid)
+    has_device = np.not_equal(devices, None)
+    return block if has_device.all() else block.take(has_device)
+
+
+def _key_codes(values):
+    """Integer codes of an object column in sorted order, -1 for None; and the values coded"""
+    present = np.not_equal(values, None)
+    codes = np.full(len(values), -1, dtype=np.int64)
+    names = np.empty(0, dtype=object)
+    if present.any():
+        names, codes[present] = np.unique(values[present].astype(str), return_inverse=True)
+        names = names.astype(object)
+    return codes, names
+
+
+def _reduce_rollup_rows(time, device_codes, forest_codes, fields):
+    """
+    Combine rollup rows of the same device, forest and bucket
+
+    Returns:
+        tuple: (index of one row of each group, in device and time order; combined fields)
+    """
+    if not len(time):
+        return np.empty(0, dtype=np.int64), fields
+    order = np.lexsort((forest_codes, time, device_codes))
+    time, device_codes, forest_codes = time[order], device_codes[order], forest_codes[order]
+    starts = np.flatnonzero(np.append(True, (time[1:] != time[:-1])
+                                      | (device_codes[1:] != device_codes[:-1])
+                                      | (forest_codes[1:] != forest_codes[:-1])))
+    combined = {name: ROLLUP_FIELDS[name][1].reduceat(values[order], starts) for name, values in fields.items()}
+    return order[starts], combined
+
+
+def _reduce_rollups(block):
+    """A block of rollup rows with the partial rows of each bucket combined"""
+    if len(block) < 2:
+        return block
+    first, combined = _reduce_rollup_rows(
+        block.time, _key_codes(block.device_id)[0], _key_codes(block.columns["forest"])[0],
+        {name: block.columns[name] for name in ROLLUP_FIELDS},
+    )
+    reduced = block.take(first)
+    reduced.columns.update(combined)
+    return reduced
+
+
+def _rollup_points(blocks, forests, rollups=ROLLUPS, device_seconds=DEVICE_ROLLUP_SECONDS):
+    """
+    Partial rollup rows for newly written points
+
+    Each device's rows carry the forest it last reported from. Rows under
+    ALL_DEVICES total each forest and the whole fleet.
+
+    Args:
+        blocks (list): (measurement, Block) pairs
+        forests (dict): Device ID -> forest
+        rollups (dict): Rollups to fill, as in ROLLUPS
+        device_seconds (int): Shortest bucket to give rows per device
+
+    Returns:
+        list: (rollup measurement, Block) pairs
+    """
+    parts = []
+    for measurement, block in blocks:
+        if measurement == "acoustic_guardian":
+            block = block.take(block.columns["threat_detected"])
+            count = len(block)
+            parts.append((block.time, block.device_id, np.ones(count, dtype=np.int64),
+                          block.columns["confidence"], np.full(count, np.nan)))
+        elif measurement == "device_status":
+            count = len(block)
+            parts.append((block.time, block.device_id, np.zeros(count, dtype=np.int64),
+                          np.full(count, np.nan), block.columns["battery_level"]))
+    if not parts or not sum(len(part[0]) for part in parts):
+        return []
+    time, devices, detections, confidence, battery = (np.concatenate(column) for column in zip(*parts))
+
+    device_codes, names = _key_codes(devices)
+    forest_codes, forest_names = _key_codes(np.array([forests.get(name) for name in names], dtype=object)[device_codes])
+    known = np.flatnonzero(forest_codes >= 0)
+    everyone = np.arange(len(time))
+    # Each point counts towards its device, its forest if known, and the fleet
+    rows = np.concatenate([everyone, known, everyone])
+    device_codes = np.concatenate([device_codes, np.full(len(known) + len(time), len(names))])
+    forest_codes = np.concatenate([forest_codes, forest_codes[known], np.full(len(time), -1)])
+    device_names = np.append(names, ALL_DEVICES)
+    forest_names = np.append(forest_names, None)
+    has_battery = ~np.isnan(battery)
+    fields = {
+        "detections": detections[rows],
+        "max_confidence": confidence[rows],
+        "min_battery": battery[rows],
+        "battery_sum": np.where(has_battery, battery, 0.0)[rows],
+        "battery_count": has_battery.astype(np.int64)[rows],
+    }
+
+    times = time[rows]
+    totals = slice(len(time), None)
+    result = []
+    for name, (bucket, _) in rollups.items():
+        keep = slice(None) if bucket >= device_seconds else totals
+        buckets = times[keep] // bucket * bucket
+        first, combined = _reduce_rollup_rows(buckets, device_codes[keep], forest_codes[keep],
+                                              {field: values[keep] for field, values in fields.items()})
+        columns = {"forest": forest_names[forest_codes[keep][first]]}
+        columns.update(combined)
+        result.append((name, Block(buckets[first], device_names[device_codes[keep][first]], columns)))
+    return result
+
+
+def _block_series(measurement, block):
+    """
+    Series in a block of an indexed measurement
+
+    Returns:
+        list: (device ID, tuple of the measurement's tag values) of each series
+    """
+    tags = SERIES_TAGS[measurement]
+    if not tags:
+        return [(device, ()) for device in set(block.device_id.tolist())]
+    keys = set(zip(block.device_id.tolist(), *(block.columns[name].tolist() for name in tags)))
+    return [(key[0], key[1:]) for key in keys]
+
+
+def _write_segment_file(path, header, block, compression=True):
+    """
+    Write a block as a segment file, atomically
+
+    Args:
+        path (str): Segment file path
+        header (dict): Header fields; the device table, columns and arrays are filled in here
+        block (Block): Rows of one partition, sorted by device and then time
+        compression (bool): Encode the columns with gorilla_codec, a chunk per device
+
+    Returns:
+        tuple: (header, offset of the column data)
+    """
+    starts = np.flatnonzero(np.append(True, block.device_id[1:] != block.device_id[:-1]))
+    ends = np.append(starts[1:], len(block))
+    devices = [
+        [block.device_id[start], int(start), int(end), int(block.time[start]), int(block.time[end - 1])]
+        for start, end in zip(starts.tolist(), ends.tolist())
+    ]
+
+    arrays = {"time": block.time}
+    columns = {}
+    for name, values in block.columns.items():
+        entry = {}
+        if values.dtype == object:
+            present = np.not_equal(values, None)
+            dictionary, codes = np.unique(values[present].astype(str), return_inverse=True)
+            encoded = np.full(len(values), -1, dtype=np.int32)
+            encoded[present] = codes
+            arrays[name] = encoded
+            entry["dictionary"] = dictionary.tolist()
+        else:
+            arrays[name] = values
+            if name in block.valid:
+                arrays[f"{name}.valid"] = block.valid[name]
+                entry["valid"] = f"{name}.valid"
+        columns[name] = entry
+
+    encodings = {}
+    if compression:
+        arrays, encodings = _encode_arrays(arrays, starts)
+    layout = {}
+    offset = 0
+    for key, values in arrays.items():
+        layout[key] = [offset, values.dtype.str, len(values)]
+        offset += _align(values.nbytes)
+    header = dict(header, devices=devices, columns=columns, arrays=layout)
+    if encodings:
+        header["encodings"] = encodings
+    encoded_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(encoded_header))
+
+    temp = f"{path}.tmp"
+    with open(temp, "wb") as f:
+        f.write(_PREAMBLE.pack(SEGMENT_MAGIC, len(encoded_header)))
+        f.write(encoded_header)
+        f.write(b"\0" * (data_start - f.tell()))
+        for values in arrays.values():
+            f.write(np.ascontiguousarray(values).tobytes())
+            f.write(b"\0" * (_align(values.nbytes) - values.nbytes))
+    os.replace(temp, path)
+    return header, data_start
+
+
+def _encode_arrays(arrays, starts):
+    """
+    Compress segment arrays
+
+    Numbers and dictionary codes are encoded with a run per device chunk,
+    so that one device's rows decode on their own, unless that would not
+    make them smaller. Booleans are packed eight to a byte.
+
+    Returns:
+        tuple: (arrays to store, array key -> encoding)
+    """
+    stored = {}
+    encodings = {}
+    for key, values in arrays.items():
+        if values.dtype == bool:
+            stored[key] = np.packbits(values)
+            encodings[key] = {"kind": "bits", "count": len(values)}
+        elif values.dtype in (np.int64, np.int32, np.float64):
+            if values.dtype == np.int32:
+                values = values.astype(np.int64)
+            meta, encoded = gorilla_codec.encode(values, starts)
+            if gorilla_codec.encoded_size(encoded) >= values.nbytes:
+                # Noise-like values, e.g. detection confidences, do not shrink
+                stored[key] = values
+                continue
+            for part, array in encoded.items():
+                stored[f"{key}.{part}"] = array
+            encodings[key] = meta
+        else:
+            stored[key] = values
+    return stored, encodings
+
+
+class _Segment:
+    """One segment file: a partition's points, in a chunk per device"""
+
+    def __init__(self, path, header, data_start):
+        self.path = path
+        self.header = header
+        self.data_start = data_start
+        self.seq = header["seq"]
+        self.measurement = header["measurement"]
+        self.partition = header["partition"]
+        self.count = header["count"]
+        self.min_time = header["min_time"]
+        self.max_time = header["max_time"]
+        # Device ID -> (first row, row after the last, min time, max time)
+        self.chunks = {device: tuple(rows) for device, *rows in header["devices"]}
+        # Device ID -> index of its chunk, which is also its run in encoded arrays
+        self.index = {device[0]: index for index, device in enumerate(header["devices"])}
+        # Array key -> gorilla_codec meta, or packed bits; absent in segments written raw
+        self.encodings = header.get("encodings", {})
+        # [device ID, tag values...] of each series, for measurements with tags
+        self.series = header.get("series")
+
+    @classmethod
+    def open(cls, path):
+        """Read a segment's header"""
+        with open(path, "rb") as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) != _PREAMBLE.size:
+                raise ValueError("truncated header")
+            magic, length = _PREAMBLE.unpack(preamble)
+            if magic != SEGMENT_MAGIC:
+                raise ValueError("not a segment file")
+            header = json.loads(f.read(length))
+        return cls(path, header, _align(_PREAMBLE.size + length))
+
+    def array(self, data, key):
+        """One stored array as a view into the mapped file"""
+        offset, dtype, length = self.header["arrays"][key]
+        dtype = np.dtype(dtype)
+        start = self.data_start + offset
+        return data[start:start + length * dtype.itemsize].view(dtype)
+
+    def column(self, data, key, rows):
+        """
+        The selected rows of one stored array, decoded
+
+        Args:
+            data (np.memmap): The mapped segment file
+            key (str): Array key
+            rows: Row selection from rows()
+        """
+        encoding = self.encodings.get(key)
+        if encoding is None:
+            return _take(self.array(data, key), rows)
+        if encoding["kind"] == "bits":
+            values = np.unpackbits(self.array(data, key), count=encoding["count"]).view(bool)
+            return _take(values, rows)
+
+        parts = {part: self.array(data, f"{key}.{part}") for part in gorilla_codec.ARRAYS
+                 if f"{key}.{part}" in self.header["arrays"]}
+        if not isinstance(rows, list):
+            return gorilla_codec.decode(encoding, parts)[rows]
+        # Decode only the chunks of the devices asked for
+        pieces = []
+        for index, lo, hi in rows:
+            first = encoding["runs"][index][0]
+            pieces.append(gorilla_codec.decode(encoding, parts, [index])[lo - first:hi - first])
+        return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+    def device_column(self, rows=slice(None)):
+        """The device ID of the selected rows"""
+        devices = self.header["devices"]
+        if isinstance(rows, list):
+            names = np.empty(len(rows), dtype=object)
+            names[:] = [devices[index][0] for index, _, _ in rows]
+            return np.repeat(names, [hi - lo for _, lo, hi in rows])
+        names = np.empty(len(devices), dtype=object)
+        names[:] = [device[0] for device in devices]
+        return np.repeat(names, [device[2] - device[1] for device in devices])[rows]
+
+    def rows(self, data, start, stop, devices):
+        """
+        Rows in [start, stop) of the given devices
+
+        Returns:
+            tuple: (row selection, or None if no row matches; the selected
+            rows' times if finding them decoded them, else None). A
+            selection is slice(None), a boolean mask, or a list of (chunk
+            index, first row, row after the last) in row order.
+        """
+        if devices is None:
+            if start <= self.min_time and self.max_time < stop:
+                return slice(None), None
+            times = self.column(data, "time", slice(None))
+            mask = (times >= start) & (times < stop)
+            return (mask, times[mask]) if mask.any() else (None, None)
+
+        ranges = []
+        for device in devices:
+            chunk = self.chunks.get(device)
+            if chunk is None:
+                continue
+            lo, hi, min_time, max_time = chunk
+            if max_time < start or min_time >= stop:
+                continue
+            index = self.index[device]
+            # Decoded here either way, so that read() does not decode them again
+            times = self.column(data, "time", [(index, lo, hi)])
+            if min_time < start or max_time >= stop:
+                first, last = np.searchsorted(times, [start, stop]).tolist()
+                times, lo, hi = times[first:last], lo + first, lo + last
+            if lo < hi:
+                ranges.append((index, lo, hi, times))
+        if not ranges:
+            return None, None
+        ranges.sort(key=lambda entry: entry[0])
+        return [entry[:3] for entry in ranges], np.concatenate([entry[3] for entry in ranges])
+
+    def read(self, data, rows, types, times=None):
+        """
+        The given rows and columns
+
+        Args:
+            data (np.memmap): The mapped segment file
+            rows: Row selection from rows()
+            types (dict): Column name -> type
+            times (np.ndarray): The rows' times, if rows() returned them
+
+        Returns:
+            Block: The rows
+        """
+        if times is None:
+            times = self.column(data, "time", rows)
+        count = len(times)
+        columns = {}
+        valid = {}
+        for name, kind in types.items():
+            entry = self.header["columns"].get(name)
+            if entry is None:
+                # Column added to the schema after this segment was written
+                columns[name] = _empty(kind, count)
+                valid[name] = np.zeros(count, dtype=bool)
+                continue
+            values = self.column(data, name, rows)
+            if "dictionary" in entry:
+                # Code -1 (missing) picks the None on the end
+                lookup = np.empty(len(entry["dictionary"]) + 1, dtype=object)
+                lookup[:-1] = entry["dictionary"]
+                if (values < 0).any():
+                    valid[name] = values >= 0
+                values = lookup[values]
+            elif "valid" in entry:
+                valid[name] = self.column(data, entry["valid"], rows)
+            columns[name] = values
+        return Block(times, self.device_column(rows), columns, valid)
+
+
+def _take(values, rows):
+    """Apply a row selection from _Segment.rows() to a full column"""
+    if not isinstance(rows, list):
+        return values[rows]
+    if len(rows) == 1:
+        return values[rows[0][1]:rows[0][2]]
+    return np.concatenate([values[lo:hi] for _, lo, hi in rows])
+
+
+def _latest(block):
+    """The rows sorted by device and time, keeping the last written of each device and timestamp"""
+    block = block.sorted_by_device()
+    last = np.append((block.time[1:] != block.time[:-1]) | (block.device_id[1:] != block.device_id[:-1]), True)
+    return block if last.all() else block.take(last)
+
+
+def _write_archive_file(path, header, block):
+    """
+    Write a block as a Parquet file, atomically
+
+    Row groups hold whole devices. The header, with a table of each
+    device's row group, rows in it and time range, goes in the file's
+    metadata. Times and integers are stored as deltas and floats byte by
+    byte, which zstd compresses better.
+
+    Args:
+        path (str): Archive file path
+        header (dict): Header fields; the device table is filled in here
+        block (Block): Rows of one partition, sorted by device and then time
+
+    Returns:
+        pyarrow.parquet.FileMetaData: The file's metadata
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    starts = np.flatnonzero(np.append(True, block.device_id[1:] != block.device_id[:-1]))
+    ends = np.append(starts[1:], len(block))
+    groups = [0]
+    devices = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if start - groups[-1] >= ARCHIVE_ROW_GROUP_ROWS:
+            groups.append(start)
+        devices.append([block.device_id[start], len(groups) - 1, start - groups[-1], end - groups[-1],
+                        int(block.time[start]), int(block.time[end - 1])])
+    groups.append(len(block))
+    header = dict(header, devices=devices)
+
+    arrays = {
+        "time": pa.array(block.time, pa.timestamp("s", tz="UTC")),
+        "device_id": pa.array(block.device_id, pa.string()),
+    }
+    for name, values in block.columns.items():
+        valid = block.valid.get(name)
+        kind = pa.string() if values.dtype == object else pa.from_numpy_dtype(values.dtype)
+        arrays[name] = pa.array(values, kind, mask=None if valid is None else ~valid)
+    table = pa.Table.from_pydict(arrays, metadata={"ecoguard": json.dumps(header, separators=(",", ":"))})
+    strings = [name for name, values in arrays.items() if values.type == pa.string()]
+    encodings = {name: "DELTA_BINARY_PACKED" for name, values in arrays.items() if values.type == pa.int64()}
+    encodings["time"] = "DELTA_BINARY_PACKED"
+    encodings.update({name: "BYTE_STREAM_SPLIT" for name, values in arrays.items() if values.type == pa.float64()})
+
+    temp = f"{path}.tmp"
+    with pq.ParquetWriter(temp, table.schema, compression="zstd", compression_level=9,
+                          use_dictionary=strings, column_encoding=encodings) as writer:
+        for start, end in zip(groups[:-1], groups[1:]):
+            writer.write_table(table.slice(start, end - start))
+    os.replace(temp, path)
+    return pq.read_metadata(path)
+
+
+def _from_arrow(column, kind):
+    """
+    A column read from Parquet as stored in a Block
+
+    Returns:
+        tuple: (NumPy array with fill values for nulls; valid mask, or None
+        if no row is null)
+    """
+    import pyarrow.compute as pc
+
+    valid = pc.is_valid(column).to_numpy(zero_copy_only=False) if column.null_count else None
+    if kind != "str":
+        if valid is not None:
+            column = column.fill_null(FILL_VALUES[kind])
+        return column.to_numpy(zero_copy_only=False), valid
+    # Strings are read dictionary-encoded; index -1 (null) picks the None on the end
+    pieces = []
+    for chunk in column.chunks:
+        lookup = np.empty(len(chunk.dictionary) + 1, dtype=object)
+        lookup[:-1] = chunk.dictionary.to_numpy(zero_copy_only=False)
+        pieces.append(lookup[chunk.indices.fill_null(-1).to_numpy(zero_copy_only=False)])
+    return np.concatenate(pieces) if pieces else np.empty(0, dtype=object), valid
+
+
+class _Archive:
+    """One archived partition: a Parquet file of rows sorted by device and time"""
+
+    def __init__(self, path, metadata):
+        header = json.loads(metadata.metadata[b"ecoguard"])
+        self.path = path
+        self.metadata = metadata
+        self.seq = header["seq"]
+        self.measurement = header["measurement"]
+        self.partition = header["partition"]
+        self.count = header["count"]
+        self.min_time = header["min_time"]
+        self.max_time = header["max_time"]
+        # Device ID -> (row group, first row in it, row after the last, min time, max time)
+        self.chunks = {device: tuple(rows) for device, *rows in header["devices"]}
+        self.series = header.get("series")
+        self.names = set(metadata.schema.names)
+
+    @classmethod
+    def open(cls, path):
+        """Read an archive file's metadata"""
+        import pyarrow.parquet as pq
+
+        metadata = pq.read_metadata(path)
+        if b"ecoguard" not in (metadata.metadata or {}):
+            raise ValueError("not an archive file")
+        return cls(path, metadata)
+
+    def read(self, start, stop, devices, types):
+        """
+        Rows in [start, stop) of the given devices
+
+        Args:
+            start (int): First second
+            stop (int): Second after the last
+            devices (list): Device IDs, or None for all
+            types (dict): Column name -> type
+
+        Returns:
+            Block: The rows, by device and then time; None if no row matches
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        chunks = self.chunks.values() if devices is None else filter(None, map(self.chunks.get, devices))
+        chunks = sorted(chunk for chunk in chunks if chunk[4] >= start and chunk[3] < stop)
+        if not chunks:
+            return None
+        groups = sorted({chunk[0] for chunk in chunks})
+        names = ["time", "device_id"] + [name for name in types if name in self.names]
+        strings = ["device_id"] + [name for name in names if types.get(name) == "str"]
+        with pq.ParquetFile(self.path, metadata=self.metadata, read_dictionary=strings) as f:
+            table = f.read_row_groups(groups, columns=names)
+        if devices is not None:
+            # Only the devices' rows of the groups read
+            first = dict(zip(groups, np.cumsum([0] + [self.metadata.row_group(index).num_rows
+                                                      for index in groups[:-1]]).tolist()))
+            rows = np.concatenate([np.arange(first[group] + lo, first[group] + hi) for group, lo, hi, _, _ in chunks])
+            table = table.take(rows)
+
+        columns = {}
+        valid = {}
+        for name, kind in types.items():
+            if name not in self.names:
+                # Column added to the schema after this partition was archived
+                columns[name] = _empty(kind, table.num_rows)
+                valid[name] = np.zeros(table.num_rows, dtype=bool)
+                continue
+            columns[name], mask = _from_arrow(table.column(name), kind)
+            if mask is not None:
+                valid[name] = mask
+        # Parquet keeps timestamps in milliseconds at the coarsest
+        times = table.column("time").cast(pa.timestamp("s", tz="UTC")).cast(pa.int64()).to_numpy()
+        block = Block(times, _from_arrow(table.column("device_id"), "str")[0], columns, valid)
+        if start <= self.min_time and self.max_time < stop:
+            return block
+        mask = (times >= start) & (times < stop)
+        return block.take(mask) if mask.any() else None
+
+
+class TimeSeriesStore:
+    """
+    Columnar store for acoustic_guardian, device_status and fused_detection points
+    """
+
+    def __init__(self, directory=STORE_DIR, partition_seconds=STORE_PARTITION_SECONDS,
+                 head_points=STORE_HEAD_POINTS, flush_interval=STORE_FLUSH_INTERVAL,
+                 compact_interval=STORE_COMPACT_INTERVAL, read_only=False, compression=STORE_COMPRESSION,
+                 retention=None):
+        """
+        Args:
+            directory (str): Store directory
+            partition_seconds (int): Time covered by a partition; an existing
+                store keeps the length it was created with
+            head_points (int): Points held in memory before they are written out
+            flush_interval (float): Max seconds a point stays in memory only
+            compact_interval (float): Seconds between compactions
+            read_only (bool): Query only, e.g. from a dashboard while the
+                gateway writes; call refresh() to see newly written segments
+            compression (bool): Encode new segments with gorilla_codec;
+                segments written either way stay readable
+            retention (dict): Measurement -> days its points stay in
+                segments before archive() moves them to Parquet; None for
+                RETENTION_DAYS
+        """
+        self.directory = directory
+        self.head_points = head_points
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.read_only = read_only
+        self.compression = compression
+        self.retention = dict(RETENTION_DAYS if retention is None else retention)
+        self.partition_seconds = self._load_settings(partition_seconds)
+
+        self._lock = threading.Lock()
+        # One flush or compaction at a time
+        self._write_lock = threading.Lock()
+        # Measurement -> partition start -> segments, oldest first; and the sorted starts
+        self._segments = {measurement: {} for measurement in MEASUREMENTS}
+        self._starts = {measurement: [] for measurement in MEASUREMENTS}
+        # Measurement -> partition start -> archived partition; and the sorted starts
+        self._archived = {measurement: {} for measurement in MEASUREMENTS}
+        self._archived_starts = {measurement: [] for measurement in MEASUREMENTS}
+        self._head = {measurement: [] for measurement in MEASUREMENTS}
+        self._flushing = {measurement: [] for measurement in MEASUREMENTS}
+        self._head_size = 0
+        self._head_since = None
+        self._maps = OrderedDict()
+        self._seq = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.points_written = 0
+        self.segments_written = 0
+        self.compactions = 0
+        self.partitions_archived = 0
+
+        # Device ID -> forest it last reported from, for the rollups and the tag index
+        self._forests = {}
+        self._index = TagIndex(SERIES_TAGS)
+        self.refresh()
+
+    def _load_settings(self, partition_seconds):
+        path = os.path.join(self.directory, STORE_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)["partition_seconds"]
+            if stored != partition_seconds:
+                logger.info(f"Store {self.directory} keeps its partitions of {stored} s")
+            return stored
+        if not self.read_only:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump({"partition_seconds": partition_seconds}, f)
+        return partition_seconds
+
+    def refresh(self):
+        """Rebuild the segment catalogue and the tag index from the files on disk"""
+        segments = {measurement: {} for measurement in MEASUREMENTS}
+        seq = 0
+        for measurement in MEASUREMENTS:
+            for root, _, names in os.walk(os.path.join(self.directory, measurement)):
+                for name in names:
+                    path = os.path.join(root, name)
+                    if name.endswith(".tmp"):
+                        # Left by a write that did not finish
+                        if not self.read_only:
+                            os.remove(path)
+                        continue
+                    if not (name.startswith("segment-") and name.endswith(".col")):
+                        continue
+                    try:
+                        segment = _Segment.open(path)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Skipping unreadable segment {path}: {e}")
+                        continue
+                    segments[measurement].setdefault(segment.partition, []).append(segment)
+                    seq = max(seq, segment.seq)
+        for partitions in segments.values():
+            for group in partitions.values():
+                group.sort(key=lambda segment: segment.seq)
+        archived = self._load_archive()
+        seq = max([seq] + [archive.seq for partitions in archived.values() for archive in partitions.values()])
+        with self._lock:
+            self._segments = segments
+            self._starts = {measurement: sorted(partitions) for measurement, partitions in segments.items()}
+            self._archived = archived
+            self._archived_starts = {measurement: sorted(partitions) for measurement, partitions in archived.items()}
+            self._seq = max(self._seq, seq)
+
+        if self.read_only or not self._forests:
+            self._forests = self._load_forests()
+        index = TagIndex(SERIES_TAGS)
+        for measurement in SERIES_TAGS:
+            for group in segments[measurement].values():
+                for segment in group:
+                    index.add(measurement, self._file_series(segment))
+            for archive in archived[measurement].values():
+                index.add(measurement, self._file_series(archive))
+        with self._lock:
+            for measurement in SERIES_TAGS:
+                for block in self._head[measurement] + self._flushing[measurement]:
+                    index.add(measurement, _block_series(measurement, block))
+            for device, forest in self._forests.items():
+                index.set_forest(device, forest)
+            self._index = index
+
+    def _file_series(self, part):
+        """(device ID, tag values) of each series in a segment or archive"""
+        tags = SERIES_TAGS[part.measurement]
+        if not tags:
+            return [(device, ()) for device in part.chunks]
+        if part.series is not None:
+            return [(device, tuple(values)) for device, *values in part.series]
+        # Written before headers listed their series
+        types = {name: "str" for name in tags}
+        if isinstance(part, _Archive):
+            block = part.read(-2**63, 2**63 - 1, None, types)
+        else:
+            block = self._read(part, slice(None), types)
+        return [] if block is None else _block_series(part.measurement, block)
+
+    def _load_archive(self):
+        """Archived partitions on disk, by measurement and partition start"""
+        archived = {measurement: {} for measurement in MEASUREMENTS}
+        for measurement in MEASUREMENTS:
+            for root, _, names in os.walk(os.path.join(self.directory, ARCHIVE_DIR, measurement)):
+                for name in names:
+                    path = os.path.join(root, name)
+                    if name.endswith(".tmp"):
+                        if not self.read_only:
+                            os.remove(path)
+                        continue
+                    if not (name.startswith("archive-") and name.endswith(".parquet")):
+                        continue
+                    try:
+                        archive = _Archive.open(path)
+                    except (OSError, ValueError, ImportError) as e:
+                        logger.warning(f"Skipping unreadable archive {path}: {e}")
+                        continue
+                    previous = archived[measurement].get(archive.partition)
+                    if previous is not None and previous.seq > archive.seq:
+                        previous, archive = archive, previous
+                    archived[measurement][archive.partition] = archive
+                    if previous is not None and not self.read_only:
+                        # Replaced by a newer archive of the partition before it could be removed
+                        os.remove(previous.path)
+        return archived
+
+    def _add_segment(self, segment):
+        partitions = self._segments[segment.measurement]
+        group = partitions.get(segment.partition)
+        if group is None:
+            partitions[segment.partition] = [segment]
+            insort(self._starts[segment.measurement], segment.partition)
+        else:
+            group.append(segment)
+
+    # Writing
+
+    def write_columns(self, batch):
+        """
+        Add parsed points to the head block
+
+        Args:
+            batch (dict): Measurement -> line_protocol.MeasurementColumns, as from parse_lines
+
+        Returns:
+            int: Points stored; other measurements and points without a device_id are skipped
+
+        Raises:
+            ValueError: If a column cannot be converted to its stored type
+        """
+        blocks = []
+        series = []
+        for measurement, columns in batch.items():
+            if measurement in MEASUREMENTS and measurement not in ROLLUPS and len(columns):
+                block = _to_block(measurement, columns)
+                if block is not None and len(block):
+                    blocks.append((measurement, block))
+                    series.append((measurement, _block_series(measurement, block)))
+                    if "location" in block.columns:
+                        self._learn_forests(block)
+        # Delivery is at least once, so a point may arrive again; the raw rows
+        # keep one per device and timestamp, and the rollups count it once
+        fresh = [(measurement, self._unseen(measurement, block)) for measurement, block in blocks
+                 if measurement in ROLLUP_SOURCES]
+        return self._append(blocks, _rollup_points(fresh, self._forests), series)
+
+    def _unseen(self, measurement, block):
+        """Rows of a block whose device and timestamp are not stored yet, once each"""
+        time = block.time
+        stored = self.scan(measurement, int(time.min()), int(time.max()) + 1, np.unique(block.device_id), columns=[])
+        codes, _ = _key_codes(np.concatenate([block.device_id, stored.device_id]))
+        keys = codes * (int(time.max()) - int(time.min()) + 1) + (np.concatenate([time, stored.time]) - time.min())
+        keys, stored_keys = keys[:len(block)], keys[len(block):]
+        # The last of repeats within the block, as the raw rows keep
+        _, last = np.unique(keys[::-1], return_index=True)
+        rows = np.sort(len(block) - 1 - last)
+        if len(stored_keys):
+            rows = rows[~np.isin(keys[rows], stored_keys, kind="sort")]
+        return block if len(rows) == len(block) else block.take(rows)
+
+    def _learn_forests(self, block):
+        """Note the last location each device reported"""
+        located = np.flatnonzero(np.not_equal(block.columns["location"], None))
+        if len(located):
+            devices, last = np.unique(block.device_id[located[::-1]], return_index=True)
+            latest = dict(zip(devices.tolist(), block.columns["location"][located[::-1][last]].tolist()))
+            with self._lock:
+                self._forests.update(latest)
+                for device, forest in latest.items():
+                    self._index.set_forest(device, forest)
+
+    def _load_forests(self):
+        """Each device's forest, from its latest daily rollup with one"""
+        block = self.scan("rollup_1d", columns=["forest"])
+        # Rows of points written before the device's first location have none
+        block = block.take(np.not_equal(block.columns["forest"], None) & (block.device_id != ALL_DEVICES))
+        # First occurrence in the reversed rows is each device's last row
+        devices, first = np.unique(block.device_id[::-1], return_index=True)
+        return dict(zip(devices.tolist(), block.columns["forest"][::-1][first].tolist()))
+
+    def write_lines(self, text):
+        """
+        Add a batch of line protocol; lines without a timestamp get the current time
+
+        Returns:
+            int: Points stored
+        """
+        return self.write_columns(parse_lines(text, default_time=int(time.time())))
+
+    def write_point(self, measurement, tags, fields, timestamp):
+        """
+        Add one point
+
+        Args:
+            measurement (str): Measurement name
+            tags (dict): Tag values, including device_id
+            fields (dict): Field values
+            timestamp (int): Seconds since the epoch
+
+        Returns:
+            int: 1 if the point was stored, else 0
+        """
+        columns = MeasurementColumns(
+            measurement,
+            np.array([int(timestamp)], dtype=np.int64),
+            {name: np.array([value], dtype=object) for name, value in tags.items()},
+            {name: np.array([value]) for name, value in fields.items() if value is not None},
+        )
+        return self.write_columns({measurement: columns})
+
+    def _append(self, blocks, rollups=(), series=()):
+        if self.read_only:
+            raise RuntimeError(f"Store {self.directory} is read-only")
+        count = 0
+        with self._lock:
+            for measurement, keys in series:
+                self._index.add(measurement, keys)
+            for measurement, block in blocks:
+                self._head[measurement].append(block)
+                count += len(block)
+            for measurement, block in rollups:
+                self._head[measurement].append(block)
+                self._head_size += len(block)
+            if count and self._head_since is None:
+                self._head_since = time.monotonic()
+            self._head_size += count
+            full = self._head_size >= self.head_points
+        self.points_written += count
+        if full:
+            self.flush()
+        return count
+
+    def _partition_length(self, measurement):
+        return ROLLUPS[measurement][1] if measurement in ROLLUPS else self.partition_seconds
+
+    def _write_segment(self, measurement, partition, block):
+        """Write rows of one partition, sorted by device and time, as a new segment"""
+        directory = os.path.join(self.directory, measurement, time.strftime(PARTITION_FORMAT, time.gmtime(partition)))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        header = {
+            "seq": seq,
+            "measurement": measurement,
+            "partition": partition,
+            "count": len(block),
+            "min_time": int(block.time.min()),
+            "max_time": int(block.time.max()),
+        }
+        if SERIES_TAGS.get(measurement):
+            header["series"] = [[device, *values] for device, values in _block_series(measurement, block)]
+        path = os.path.join(directory, f"segment-{seq:08d}.col")
+        header, data_start = _write_segment_file(path, header, block, self.compression)
+        self.segments_written += 1
+        return _Segment(path, header, data_start)
+
+    def flush(self):
+        """
+        Write the head block out, one segment per partition
+
+        Returns:
+            int: Segments written
+        """
+        with self._write_lock:
+            with self._lock:
+                if not self._head_size:
+                    return 0
+                # Still visible to queries until the segments are in the catalogue
+                flushing = self._flushing = self._head
+                self._head = {measurement: [] for measurement in MEASUREMENTS}
+                self._head_size = 0
+                self._head_since = None
+
+            pieces = []
+            for measurement, blocks in flushing.items():
+                if not blocks:
+                    continue
+                block = Block.concat(blocks, column_types(measurement))
+                length = self._partition_length(measurement)
+                partitions = block.time // length * length
+                for partition in np.unique(partitions).tolist():
+                    rows = block.take(partitions == partition)
+                    # A point sent twice is one raw row; rollup partials are combined on read
+                    rows = rows.sorted_by_device() if measurement in ROLLUPS else _latest(rows)
+                    pieces.append((measurement, partition, rows))
+
+            written = []
+            try:
+                for measurement, partition, rows in pieces:
+                    written.append(self._write_segment(measurement, partition, rows))
+            except OSError:
+                # Keep the partitions not written in memory to try again; the
+                # written ones are in segments, and rollup partials kept in
+                # both places would be counted twice
+                unwritten = {measurement: [] for measurement in MEASUREMENTS}
+                for measurement, _, rows in pieces[len(written):]:
+                    unwritten[measurement].append(rows)
+                with self._lock:
+                    for measurement, blocks in unwritten.items():
+                        self._head[measurement][:0] = blocks
+                        self._head_size += sum(len(block) for block in blocks)
+                    self._head_since = time.monotonic()
+                raise
+            finally:
+                with self._lock:
+                    for segment in written:
+                        self._add_segment(segment)
+                    self._flushing = {measurement: [] for measurement in MEASUREMENTS}
+            return len(written)
+
+    def compact(self):
+        """
+        Merge the segments of each partition into one
+
+        Rows of a device with the same timestamp are reduced to the last one
+        written. Partial rollup rows of the same bucket are combined.
+
+        Returns:
+            int: Partitions compacted
+        """
+        with self._write_lock:
+            with self._lock:
+                groups = [
+                    list(group)
+                    for partitions in self._segments.values()
+                    for group in partitions.values()
+                    if len(group) > 1
+                ]
+            for group in groups:
+                first = group[0]
+                types = column_types(first.measurement)
+                block = Block.concat([self._read(segment, slice(None), types) for segment in group], types)
+                if first.measurement in ROLLUPS:
+                    block = _reduce_rollups(block)
+                else:
+                    block = _latest(block)
+                merged = self._write_segment(first.measurement, first.partition, block)
+                with self._lock:
+                    partitions = self._segments[first.measurement]
+                    partitions[first.partition] = [
+                        segment for segment in partitions[first.partition] if segment not in group
+                    ]
+                    partitions[first.partition].insert(0, merged)
+                    for segment in group:
+                        self._maps.pop(segment.path, None)
+                for segment in group:
+                    os.remove(segment.path)
+            self.compactions += len(groups)
+            return len(groups)
+
+    def archive(self, now=None):
+        """
+        Move raw points past their measurement's retention to Parquet
+
+        A partition moves whole once it ended more than the retention ago.
+        Points that arrive later for an archived partition go to segments
+        as usual, and the next run merges them into the archive, keeping
+        the last written of a device and timestamp as compaction does.
+
+        Args:
+            now (float): Current time in seconds, or None for the clock
+
+        Returns:
+            int: Partitions archived
+        """
+        retention = {measurement: days for measurement, days in self.retention.items()
+                     if days and measurement not in ROLLUPS}
+        if not retention:
+            return 0
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning("pyarrow is not installed, so raw points stay in segments")
+            self.retention = {}
+            return 0
+        now = time.time() if now is None else now
+
+        with self._write_lock:
+            moved = 0
+            for measurement, days in retention.items():
+                cutoff = now - days * 86400
+                types = column_types(measurement)
+                with self._lock:
+                    due = [
+                        (partition, list(self._segments[measurement][partition]),
+                         self._archived[measurement].get(partition))
+                        for partition in self._starts[measurement]
+                        if partition + self.partition_seconds <= cutoff
+                    ]
+                for partition, group, previous in due:
+                    blocks = [self._read(segment, slice(None), types) for segment in group]
+                    if previous is not None:
+                        blocks.insert(0, previous.read(-2**63, 2**63 - 1, None, types))
+                    archive = self._write_archive(measurement, partition, _latest(Block.concat(blocks, types)))
+                    with self._lock:
+                        del self._segments[measurement][partition]
+                        self._starts[measurement].remove(partition)
+                        if previous is None:
+                            insort(self._archived_starts[measurement], partition)
+                        self._archived[measurement][partition] = archive
+                        for segment in group:
+                            self._maps.pop(segment.path, None)
+                    for segment in group:
+                        os.remove(segment.path)
+                    if previous is not None:
+                        os.remove(previous.path)
+                    try:
+                        os.rmdir(os.path.dirname(group[0].path))
+                    except OSError:
+                        pass
+                    moved += 1
+            self.partitions_archived += moved
+            return moved
+
+    def _write_archive(self, measurement, partition, block):
+        """Write the rows of one partition, sorted by device and time, as its archive file"""
+        directory = os.path.join(self.directory, ARCHIVE_DIR, measurement,
+                                 time.strftime(PARTITION_FORMAT, time.gmtime(partition)))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        header = {
+            "seq": seq,
+            "measurement": measurement,
+            "partition": partition,
+            "count": len(block),
+            "min_time": int(block.time.min()),
+            "max_time": int(block.time.max()),
+        }
+        if SERIES_TAGS.get(measurement):
+            header["series"] = [[device, *values] for device, values in _block_series(measurement, block)]
+        path = os.path.join(directory, f"archive-{seq:08d}.parquet")
+        return _Archive(path, _write_archive_file(path, header, block))
+
+    # Background maintenance
+
+    def start(self):
+        """Flush and compact on a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ts-store", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last_compaction = time.monotonic()
+        while not self._stop.wait(1.0):
+            try:
+                since = self._head_since
+                if since is not None and time.monotonic() - since >= self.flush_interval:
+                    self.flush()
+                if time.monotonic() - last_compaction >= self.compact_interval:
+                    last_compaction = time.monotonic()
+                    self.archive()
+                    self.compact()
+            except OSError as e:
+                logger.error(f"Store maintenance failed: {e}")
+
+    def close(self):
+        """Stop the background thread and write out the head block"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if not self.read_only:
+            self.flush()
+        with self._lock:
+            self._maps.clear()
+
+    # Reading
+
+    def _map(self, segment):
+        with self._lock:
+            data = self._maps.get(segment.path)
+            if data is not None:
+                self._maps.move_to_end(segment.path)
+                return data
+        data = np.memmap(segment.path, dtype=np.uint8, mode="r")
+        with self._lock:
+            self._maps[segment.path] = data
+            while len(self._maps) > MAX_OPEN_SEGMENTS:
+                self._maps.popitem(last=False)
+        return data
+
+    def _read(self, segment, rows, types):
+        return segment.read(self._map(segment), rows, types)
+
+    def scan(self, measurement, start=None, stop=None, devices=None, columns=None, tags=None):
+        """
+        Points of one measurement with start <= time < stop
+
+        Args:
+            measurement (str): acoustic_guardian, device_status or fused_detection
+            start (int): First second, or None for no lower bound
+            stop (int): Second after the last, or None for no upper bound
+            devices: Device ID or iterable of IDs to keep, or None for all
+            columns (iterable): Columns to read, or None for all
+            tags (dict): Tag -> value or list of values to keep: one of the
+                measurement's tags, or forest for the devices whose last
+                location is one of them. Looked up in the tag index, so only
+                the matching devices' chunks are read.
+
+        Returns:
+            Block: Matching rows, in time order for each device
+
+        Raises:
+            ValueError: If the measurement has no such column or tag
+        """
+        types = column_types(measurement)
+        if columns is not None:
+            unknown = set(columns) - set(types)
+            if unknown:
+                raise ValueError(f"{measurement} has no column {', '.join(sorted(unknown))}")
+            types = {name: types[name] for name in columns}
+        if isinstance(devices, str):
+            devices = [devices]
+        elif devices is not None:
+            devices = list(devices)
+        start = -2**63 if start is None else int(start)
+        stop = 2**63 - 1 if stop is None else int(stop)
+
+        read = types
+        filters = {}
+        if tags:
+            if measurement not in SERIES_TAGS:
+                raise ValueError(f"{measurement} is not in the tag index")
+            unknown = set(tags) - set(SERIES_TAGS[measurement]) - {FOREST_TAG}
+            if unknown:
+                raise ValueError(f"{measurement} has no tag {', '.join(sorted(unknown))}")
+            with self._lock:
+                matched = self._index.devices(self._index.select(measurement, tags))
+            if devices is not None:
+                wanted = set(devices)
+                matched = [device for device in matched if device in wanted]
+            if not matched:
+                return Block.empty(types)
+            devices = matched
+            # A device's chunk holds all its series, so its rows are filtered
+            # by the tag values as well; forest belongs to the device
+            filters = {name: [values] if isinstance(values, str) else list(values)
+                       for name, values in tags.items() if name != FOREST_TAG}
+            read = dict(types, **{name: "str" for name in filters})
+
+        for attempt in range(3):
+            try:
+                block = self._scan(measurement, start, stop, devices, read)
+                break
+            except FileNotFoundError:
+                # A compaction replaced segments during the scan
+                if attempt == 2:
+                    raise
+                if self.read_only:
+                    self.refresh()
+        if filters:
+            keep = np.ones(len(block), dtype=bool)
+            for name, values in filters.items():
+                column = block.columns[name]
+                matches = np.zeros(len(block), dtype=bool)
+                for value in values:
+                    matches |= column == value
+                keep &= matches
+            block = block.select(types) if keep.all() else block.take(keep).select(types)
+        return block
+
+    def _scan(self, measurement, start, stop, devices, types):
+        length = self._partition_length(measurement)
+        first = start // length * length
+        with self._lock:
+            starts = self._starts[measurement]
+            partitions = self._segments[measurement]
+            selected = {
+                partition: list(partitions[partition])
+                for partition in starts[bisect_left(starts, first):bisect_left(starts, stop)]
+            }
+            archived = self._archived[measurement]
+            cold = {
+                partition: archived[partition]
+                for partition in self._archived_starts[measurement][
+                    bisect_left(self._archived_starts[measurement], first):
+                    bisect_left(self._archived_starts[measurement], stop)]
+            }
+            memory = self._head[measurement] + self._flushing[measurement]
+
+        # Head rows in the range, by partition
+        recent = {}
+        # Time first, block by block, so a narrow scan does not copy the whole head
+        memory = [block.select(types).take(mask) for block in memory
+                  for mask in [(block.time >= start) & (block.time < stop)] if mask.any()]
+        if memory:
+            block = Block.concat(memory, types)
+            mask = np.ones(len(block), dtype=bool)
+            if devices is not None:
+                mask &= np.isin(block.device_id, devices)
+            if mask.any():
+                block = block.take(mask)
+                keys = block.time // length * length
+                for partition in np.unique(keys).tolist():
+                    recent[partition] = block.take(keys == partition)
+
+        parts = []
+        for partition in sorted(selected.keys() | recent.keys() | cold.keys()):
+            pieces = []
+            if partition in cold:
+                block = cold[partition].read(start, stop, devices, types)
+                if block is not None:
+                    pieces.append(block)
+            for segment in selected.get(partition, ()):
+                if segment.max_time < start or segment.min_time >= stop:
+                    continue
+                data = self._map(segment)
+                rows, times = segment.rows(data, start, stop, devices)
+                if rows is not None:
+                    pieces.append(segment.read(data, rows, types, times))
+            if partition in recent:
+                pieces.append(recent[partition])
+            if len(pieces) == 1 and partition not in recent:
+                # A single segment or archive is already in device and time order
+                parts.append(pieces[0])
+            elif pieces:
+                block = Block.concat(pieces, types)
+                parts.append(block.sorted_by_device() if measurement in ROLLUPS else _latest(block))
+        return Block.concat(parts, types)
+
+    def last(self, measurement, start=None, stop=None, devices=None, columns=None, tags=None):
+        """
+        The latest point of each device in the range
+
+        Args are as for scan().
+
+        Returns:
+            Block: One row per device
+        """
+        block = self.scan(measurement, start, stop, devices, columns, tags)
+        if len(block) < 2:
+            return block
+        # First occurrence in the reversed rows is each device's last row
+        _, first = np.unique(block.device_id[::-1], return_index=True)
+        return block.take(np.sort(len(block) - 1 - first))
+
+    def query(self, measurement, start=None, stop=None, devices=None, columns=None, tags=None):
+        """
+        scan() as a pandas DataFrame
+
+        Returns:
+            pd.DataFrame: time, device_id, then the columns
+        """
+        return self.scan(measurement, start, stop, devices, columns, tags).to_dataframe()
+
+    def rollup(self, start=None, stop=None, step=None, by="device", devices=None, forests=None):
+        """
+        Detection counts, top confidence and battery levels per time bucket
+
+        Reads the coarsest rollup whose buckets tile the request: step and
+        both ends must be multiples of its bucket length. A year of daily
+        totals is then a few hundred rows, however many points went in. Ends
+        between minute boundaries move to the next one.
+
+        Args:
+            start (int): First second, or None for no lower bound
+            stop (int): Second after the last, or None for no upper bound
+            step (int): Bucket length wanted, in whole minutes; None for the
+                buckets of the rollup read
+            by (str): "device", "forest" or "fleet"
+            devices: Device ID or IDs to keep (by device)
+            forests: Forest or forests to keep (by device or forest)
+
+        Returns:
+            pd.DataFrame: time, then device_id and forest (by device) or
+            forest (by forest), then detections, max_confidence, min_battery
+            and mean_battery
+
+        Raises:
+            ValueError: If by or step is not one of the above
+        """
+        if by not in ("device", "forest", "fleet"):
+            raise ValueError(f"cannot roll up by {by}")
+        if step is not None and (step <= 0 or step % 60):
+            raise ValueError("step must be a whole number of minutes")
+        measurement = next(
+            (name for name, (bucket, _) in reversed(ROLLUPS.items())
+             if all(value is None or value % bucket == 0 for value in (step, start, stop))),
+            "rollup_1m",
+        )
+
+        if by == "device" and ROLLUPS[measurement][0] < DEVICE_ROLLUP_SECONDS:
+            block = self._device_rollup(measurement, start, stop, devices)
+        else:
+            block = _reduce_rollups(self.scan(measurement, start, stop, devices if by == "device" else ALL_DEVICES))
+        forest = block.columns["forest"]
+        if by == "device":
+            keep = block.device_id != ALL_DEVICES
+        elif by == "forest":
+            keep = np.not_equal(forest, None)
+        else:
+            keep = np.equal(forest, None)
+        if forests is not None and by != "fleet":
+            keep &= np.isin(forest, [forests] if isinstance(forests, str) else list(forests))
+        block = block.take(keep)
+        if step is not None and step != ROLLUPS[measurement][0]:
+            block = _reduce_rollups(Block(block.time // step * step, block.device_id, block.columns))
+
+        frame = block.to_dataframe()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frame["mean_battery"] = frame.pop("battery_sum") / frame.pop("battery_count")
+        if by == "forest":
+            frame = frame.drop(columns="device_id")
+        elif by == "fleet":
+            frame = frame.drop(columns=["device_id", "forest"])
+        return frame
+
+    def _device_rollup(self, measurement, start, stop, devices):
+        """Rollup rows per device for buckets too short to keep, from the points"""
+        blocks = [
+            ("acoustic_guardian", self.scan("acoustic_guardian", start, stop, devices, ["threat_detected", "confidence"])),
+            ("device_status", self.scan("device_status", start, stop, devices, ["battery_level"])),
+        ]
+        rollups = dict(_rollup_points(blocks, self._forests, {measurement: ROLLUPS[measurement]}, 0))
+        block = rollups.get(measurement, Block.empty(column_types(measurement)))
+        return block.take(block.device_id != ALL_DEVICES)
+
+    def devices(self, measurement):
+        """Device IDs with points in the store"""
+        with self._lock:
+            names = set()
+            for group in self._segments[measurement].values():
+                for segment in group:
+                    names.update(segment.chunks)
+            for archive in self._archived[measurement].values():
+                names.update(archive.chunks)
+            for block in self._head[measurement] + self._flushing[measurement]:
+                names.update(block.device_id.tolist())
+        return sorted(names)
+
+    def stats(self):
+        """Counts for monitoring"""
+        with self._lock:
+            segments = sum(len(group) for partitions in self._segments.values() for group in partitions.values())
+            head_points = self._head_size
+            archived = [archive for partitions in self._archived.values() for archive in partitions.values()]
+            index = self._index.stats()
+        return {
+            "head_points": head_points,
+            "segments": segments,
+            "archived_partitions": len(archived),
+            "archived_points": sum(archive.count for archive in archived),
+            "points_written": self.points_written,
+            "segments_written": self.segments_written,
+            "compactions": self.compactions,
+            "partitions_archived": self.partitions_archived,
+            "series": index["series"],
+            "posting_lists": index["posting_lists"],
+        }
+
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def _parse_time(text, now):
+    """Seconds since the epoch, a relative time such as -1h, or an ISO date"""
+    if text is None:
+        return None
+    if text[:1] == "-" and text[-1:] in _UNITS:
+        return int(now - float(text[1:-1]) * _UNITS[text[-1]])
+    try:
+        return int(float(text))
+    except ValueError:
+        return calendar.timegm(time.strptime(text[:19], "%Y-%m-%dT%H:%M:%S" if "T" in text else "%Y-%m-%d"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EcoGuard embedded time-series store")
+    parser.add_argument("--dir", default=STORE_DIR, help="Store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="Load line protocol files, e.g. the gateway's")
+    load.add_argument("files", nargs="+")
+
+    query = commands.add_parser("query", help="Print points")
+    query.add_argument("measurement", choices=sorted(MEASUREMENTS))
+    query.add_argument("--device", action="append", help="Device ID; repeat for several")
+    query.add_argument("--location", action="append", help="Location tag; repeat for several")
+    query.add_argument("--forest", action="append", help="Forest devices last reported from; repeat for several")
+    query.add_argument("--start", help="Epoch seconds, ISO date or relative such as -1h")
+    query.add_argument("--stop", help="As --start; default now")
+    query.add_argument("--last", action="store_true", help="Only the latest point of each device")
+
+    rollup = commands.add_parser("rollup", help="Print detection and battery rollups")
+    rollup.add_argument("--by", choices=["device", "forest", "fleet"], default="fleet")
+    rollup.add_argument("--device", action="append", help="Device ID; repeat for several")
+    rollup.add_argument("--forest", action="append", help="Forest; repeat for several")
+    rollup.add_argument("--start", help="As for query")
+    rollup.add_argument("--stop", help="As for query")
+    rollup.add_argument("--step", help="Bucket length such as 15m, 1h or 1d")
+
+    commands.add_parser("compact", help="Merge each partition's segments")
+    commands.add_parser("archive", help="Move raw points past their retention to Parquet")
+    commands.add_parser("stats", help="Print segment counts")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.command == "import":
+        store = TimeSeriesStore(args.dir)
+        total = 0
+        for path in args.files:
+            with open(path, encoding="utf-8") as f:
+                stored = store.write_lines(f.read())
+            logger.info(f"{path}: {stored} points")
+            total += stored
+        store.close()
+        store.compact()
+        print(f"Imported {total} points into {args.dir}")
+    elif args.command == "query":
+        import pandas as pd
+
+        store = TimeSeriesStore(args.dir, read_only=True)
+        now = time.time()
+        scan = store.last if args.last else store.scan
+        tags = {name: values for name, values in (("location", args.location), ("forest", args.forest)) if values}
+        block = scan(args.measurement, _parse_time(args.start, now), _parse_time(args.stop, now), args.device,
+                     tags=tags)
+        with pd.option_context("display.max_rows", 200, "display.width", 200):
+            print(block.to_dataframe())
+    elif args.command == "rollup":
+        import pandas as pd
+
+        store = TimeSeriesStore(args.dir, read_only=True)
+        now = time.time()
+        step = None if args.step is None else int(float(args.step[:-1]) * _UNITS[args.step[-1]])
+        frame = store.rollup(_parse_time(args.start, now), _parse_time(args.stop, now), step, args.by,
+                             args.device, args.forest)
+        with pd.option_context("display.max_rows", 200, "display.width", 200):
+            print(frame)
+    elif args.command == "compact":
+        store = TimeSeriesStore(args.dir)
+        print(f"Compacted {store.compact()} partitions")
+    elif args.command == "archive":
+        store = TimeSeriesStore(args.dir)
+        print(f"Archived {store.archive()} partitions")
+    else:
+        store = TimeSeriesStore(args.dir, read_only=True)
+        print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()